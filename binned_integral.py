@@ -0,0 +1,66 @@
+from numpy import *
+
+# Integrate (or average) a field over bins of any coordinate: longitude,
+# latitude, depth, etc. Each point's bin is found for all points at once with
+# digitize, and the weighted values are summed into the bins with a single
+# bincount, rather than looping over points and searching the bin edges for
+# each one. Works for any grid where the field, its integrand, and the
+# coordinate can be given as arrays of the same shape: ROMS/CICE grids (lat x
+# lon), FESOM elements or nodes (1D), regular observation grids, or 3D fields
+# with depth as the coordinate.
+
+
+# Find the bin that each value of a coordinate falls into.
+# Input:
+# coord = array of coordinate values, any shape
+# bin_edges = 1D array of bin edges, increasing
+# Output: integer array of the same shape as coord, containing i such that
+#         bin_edges[i] <= coord < bin_edges[i+1], or -1 if coord is outside
+#         all the bins
+def bin_index (coord, bin_edges):
+
+    index = digitize(ma.getdata(coord), bin_edges) - 1
+    index[(index < 0) + (index >= size(bin_edges)-1)] = -1
+    return index
+
+
+# Integrate a field over bins of a coordinate.
+# Input:
+# data = array of values, with the same shape as coord or with extra leading
+#        dimensions (e.g. time); masked values are left out
+# coord = array of the coordinate to bin by (e.g. longitude), the shape of
+#         the trailing dimensions of data
+# bin_edges = 1D array of bin edges, increasing
+# weights = optional array of integrands (e.g. dA, dV, element areas),
+#           broadcastable to data; masked values are left out (default 1, so
+#           values are just summed)
+# mask = optional boolean array, broadcastable to data: True at points to
+#        leave out (e.g. outside the continental shelf)
+# average = optional boolean: divide each bin by the sum of weights in it,
+#           for a weighted average rather than an integral (default False)
+# Output: array of dimension (leading dimensions of data) x bin; for averages,
+#         masked where a bin is empty
+def binned_integral (data, coord, bin_edges, weights=None, mask=None, average=False):
+
+    data_shape = shape(data)
+    lead_shape = data_shape[:len(data_shape)-ndim(coord)]
+    num_lead = int(prod(lead_shape))
+    num_bins = size(bin_edges) - 1
+    index = broadcast_to(bin_index(coord, bin_edges), data_shape)
+    leave = (index < 0) + ma.getmaskarray(data)
+    if weights is None:
+        weights = ones(data_shape)
+    else:
+        leave = leave + ma.getmaskarray(weights)
+        weights = broadcast_to(ma.filled(weights, 0), data_shape)
+    if mask is not None:
+        leave = leave + mask
+    keep = invert(leave)
+    # Offset the bins for each leading index so one bincount does them all
+    offsets = (arange(num_lead)*num_bins).reshape(lead_shape + (1,)*ndim(coord))
+    labels = (index + offsets)[keep]
+    total = bincount(labels, weights=(ma.filled(data, 0)*weights)[keep], minlength=num_lead*num_bins).reshape(lead_shape + (num_bins,))
+    if average:
+        weight_sum = bincount(labels, weights=weights[keep], minlength=num_lead*num_bins).reshape(lead_shape + (num_bins,))
+        return ma.masked_where(weight_sum == 0, total/where(weight_sum == 0, 1, weight_sum))
+    return total
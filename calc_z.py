@@ -7,14 +7,18 @@ from numpy import *
 # h, zice = 2D arrays containing values for bathymetry and ice shelf draft.
 #           Both have dimension latitude x longitude.
 # theta_s, theta_b, hc, N = scalar parameters
-# zeta = optional 2D array containing values for sea surface height
+# zeta = optional 2D array containing values for sea surface height, or 3D
+#        array (time x latitude x longitude) containing a timeseries of sea
+#        surface height
 # Vstretching = optional integer showing stretching transfomration, 2 or 4
+# dtype = optional data type for z, eg float32 to halve memory use
 # Output:
 # z = 3D array containing negative z-coordinate values for depth on the rho 
-#     grid; dimension depth x latitude x longitude
+#     grid; dimension depth x latitude x longitude, or 4D array (time x depth
+#     x latitude x longitude) if zeta is 3D
 # s = 1D array of s-coordinate values
 # C = 1D array of stretching curve values
-def calc_z (h, zice, theta_s, theta_b, hc, N, zeta=None, Vstretching=4):
+def calc_z (h, zice, theta_s, theta_b, hc, N, zeta=None, Vstretching=4, dtype=float64):
 
     # Follows the method of scoord_zice.m and stretching.m on katabatic
     # (in /ds/projects/iomp/matlab_scripts/ROMS_NetCDF/iomp_IAF/)
@@ -36,16 +40,19 @@ def calc_z (h, zice, theta_s, theta_b, hc, N, zeta=None, Vstretching=4):
         C = (1-cosh(theta_s*s))/(cosh(theta_s)-1)
         C = (exp(theta_b*C)-1)/(1-exp(-theta_b))
         
-    h = h - abs(zice)
+    zice = abs(ma.getdata(zice)).astype(dtype)
+    h = ma.getdata(h).astype(dtype) - zice
 
-    num_lon = size(h, 1)
-    num_lat = size(h, 0)
-    z = zeros((N, num_lat, num_lon))
-    for k in range(N):
-        z0 = (h*C[k] + hc*s[k])/(h + hc)
-        if zeta is None:
-            z[k,:,:] = h*z0 - abs(zice)
-        else:
-            z[k,:,:] = (zeta+h)*z0 + zeta - abs(zice)
+    # Broadcast over all depth levels at once: z0 is depth x lat x lon
+    z0 = (h*C[:,None,None].astype(dtype) + hc*s[:,None,None].astype(dtype))/(h + hc)
+    if zeta is None:
+        z = h*z0 - zice
+    else:
+        # Masked (land) points count as zero, rather than their fill value
+        zeta = ma.filled(zeta, 0).astype(dtype)
+        if zeta.ndim == 3:
+            # Add a depth axis so each time index broadcasts over depth
+            zeta = zeta[:,None,:,:]
+        z = (zeta+h)*z0 + zeta - zice
 
     return z, s, C
@@ -10,35 +10,43 @@ from calc_z import *
 #                     latitude x longitude.
 # theta_s, theta_b, hc, N = scalar parameters (check your grid file and roms.in)
 # zeta = optional 2D array containing values for sea surface height at the
-#        desired timestep
+#        desired timestep, or 3D array (time x latitude x longitude) containing
+#        sea surface height at many timesteps
+# broadcast = optional boolean; if True, dx and dy are read-only broadcast
+#             views instead of tiled copies, so they take no extra memory
+# dtype = optional data type for dz and z, eg float32 to halve memory use
 # Output:
 # dx, dy, dz, z = 3D arrays (dimension depth x latitude x longitude) containing
-#                 Cartesian integrands (dx, dy, dz) and z-coordinates (z).
-def cartesian_grid_3d (lon, lat, h, zice, theta_s, theta_b, hc, N, zeta=None):
+#                 Cartesian integrands (dx, dy, dz) and z-coordinates (z). If
+#                 zeta is 3D, these are 4D arrays (time x depth x latitude x
+#                 longitude).
+def cartesian_grid_3d (lon, lat, h, zice, theta_s, theta_b, hc, N, zeta=None, broadcast=False, dtype=float64):
+
+    # Get a 3D (or 4D) array of z-coordinates; sc_r and Cs_r are unused
+    z, sc_r, Cs_r = calc_z(h, zice, theta_s, theta_b, hc, N, zeta, dtype=dtype)
 
     # Calculate 2D dx and dy in another script
     dx, dy = cartesian_grid_2d(lon, lat)
-    # Copy into 3D arrays, same at each depth level
-    dx = tile(dx, (N,1,1))
-    dy = tile(dy, (N,1,1))
-    # Save horizontal dimensions
-    num_lat = size(lon, 0)
-    num_lon = size(lon, 1)
+    # Copy into 3D arrays, same at each depth level (and time index)
+    if broadcast:
+        dx = broadcast_to(dx, z.shape)
+        dy = broadcast_to(dy, z.shape)
+    else:
+        dx = tile(dx, z.shape[:-2] + (1,1))
+        dy = tile(dy, z.shape[:-2] + (1,1))
 
-    # Get a 3D array of z-coordinates; sc_r and Cs_r are unused
-    z, sc_r, Cs_r = calc_z(h, zice, theta_s, theta_b, hc, N, zeta)
     # We have z at the midpoint of each cell, now find it on the top and
-    # bottom edges of each cell
-    z_edges = zeros((N+1, num_lat, num_lon))
-    z_edges[1:-1,:,:] = 0.5*(z[0:-1,:,:] + z[1:,:,:])
+    # bottom edges of each cell; depth is always the third-last axis
+    z_edges = zeros(z.shape[:-3] + (N+1,) + z.shape[-2:], dtype=dtype)
+    z_edges[...,1:-1,:,:] = 0.5*(z[...,0:-1,:,:] + z[...,1:,:,:])
     # At surface, z=zice
-    z_edges[-1,:,:] = zice[:,:]
+    z_edges[...,-1,:,:] = zice
     # Add zeta if it exists
     if zeta is not None:
-        z_edges[-1,:,:] += zeta[:,:]
+        z_edges[...,-1,:,:] += ma.filled(zeta, 0)
     # At bottom, extrapolate
-    z_edges[0,:,:] = 2*z[0,:,:] - z_edges[1,:,:]
+    z_edges[...,0,:,:] = 2*z[...,0,:,:] - z_edges[...,1,:,:]
     # Now find dz
-    dz = z_edges[1:,:,:] - z_edges[0:-1,:,:]    
+    dz = z_edges[...,1:,:,:] - z_edges[...,0:-1,:,:]
 
     return dx, dy, dz, z
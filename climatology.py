@@ -0,0 +1,235 @@
+from netCDF4 import Dataset
+from numpy import *
+from os import rename
+from os.path import exists
+from time_bins import *
+
+# Build monthly or seasonal climatologies of any variables from a list of ROMS
+# or CICE output files containing 5-day averages, without holding whole
+# variables in memory. Records are streamed from each file in blocks and added
+# to float64 sums, split between months/seasons by days as in time_bins.py, so
+# only one block of records and the sums are ever in memory. Alongside each sum
+# is a count of the days which were unmasked at each point, so points which are
+# only sometimes masked are averaged over the days they aren't. Optionally, the
+# sums and counts are saved to a checkpoint file after each input file, so a run
+# which is stopped (e.g. by a walltime limit) can be restarted with the same
+# arguments and will carry on from the last file it finished.
+
+# Names of the bins for each type of climatology
+period_names = {'season':season_names, 'month':month_names}
+
+
+# Find the bins (all years together) for a file.
+# Input:
+# index = dictionary from time_bin_index
+# period = 'season' or 'month'
+# start_year = optional integer: only count records whose date is in this year
+#              or later
+# Output: list of bins, one for each season or month in order (None for any
+#         which aren't in the file)
+def climatology_bins (index, period, start_year=None):
+
+    use = None
+    if start_year is not None:
+        use = array([time.year >= start_year for time in index['time']])
+    if period == 'season':
+        bins = season_climatology_bins(index, use)
+        keys = range(4)
+    else:
+        bins = month_climatology_bins(index, use)
+        keys = range(1, 12+1)
+    return [bins.get(key) for key in keys]
+
+
+# Add one file to climatology sums and counts.
+# Input:
+# file_path = path to ROMS or CICE output file
+# fields = list of fields, as in read_bin_field in time_bins.py
+# bins = list of bins from climatology_bins
+# sums, counts = dictionaries mapping each field to an array (bin x ...) to add
+#                to (in place)
+# block_size = optional number of records to read at once (default 10)
+def accumulate_climatology (file_path, fields, bins, sums, counts, block_size=10):
+
+    id = Dataset(file_path, 'r')
+    num_records = size(id.variables[read_field_var(fields[0])], 0)
+    # Days of each record in each bin
+    weights = zeros([len(bins), num_records])
+    for n in range(len(bins)):
+        if bins[n] is not None:
+            weights[n, bins[n]['records']] = bins[n]['days']
+
+    for t in range(0, num_records, block_size):
+        t_end = minimum(t+block_size, num_records)
+        w = weights[:,t:t_end]
+        touched = nonzero(amax(w, axis=1) > 0)[0]
+        if size(touched) > 0:
+            for field in fields:
+                data = read_bin_field(id, field, t, t_end)
+                valid = invert(ma.getmaskarray(data)).astype(float)
+                sums[field][touched] += tensordot(w[touched,:], ma.filled(data, 0), axes=1)
+                counts[field][touched] += tensordot(w[touched,:], valid, axes=1)
+    id.close()
+
+
+# Accumulate climatology sums and counts over a list of files.
+# Input:
+# file_list = list of paths to ROMS or CICE output files, in any order
+# fields = list of fields, as in read_bin_field in time_bins.py
+# period = optional 'season' (default) or 'month'
+# start_year = optional integer, as in climatology_bins
+# cice = optional boolean: the files are CICE history files (default False)
+# block_size = optional number of records to read at once (default 10)
+# checkpoint_file = optional path to a .npz file to save the sums and counts to
+#                   after each file. If it already exists (from a run with the
+#                   same file_list, fields, period, start_year and cice),
+#                   carry on from there.
+# Output: sums, counts = dictionaries mapping each field to an array (bin x ...)
+#                        of day-weighted sums and of unmasked days
+def build_climatology (file_list, fields, period='season', start_year=None, cice=False, block_size=10, checkpoint_file=None):
+
+    num_bins = len(period_names[period])
+    start_file = 0
+    sums = {}
+    counts = {}
+    settings = checkpoint_settings(file_list, fields, period, start_year, cice)
+    if checkpoint_file is not None and exists(checkpoint_file):
+        checkpoint = load(checkpoint_file)
+        for key in settings:
+            if key not in checkpoint.files or not array_equal(checkpoint[key], settings[key]):
+                print 'Error: ' + checkpoint_file + ' is from a run with a different ' + key
+                return None, None
+        start_file = int(checkpoint['num_done'])
+        for field in fields:
+            sums[field] = checkpoint['sums_' + field_name(field)]
+            counts[field] = checkpoint['counts_' + field_name(field)]
+        print 'Resuming after ' + str(start_file) + ' of ' + str(len(file_list)) + ' files'
+    else:
+        # Get the shape of each field from the first file
+        id = Dataset(file_list[0], 'r')
+        for field in fields:
+            field_shape = [num_bins] + list(shape(read_bin_field(id, field, 0, 1))[1:])
+            sums[field] = zeros(field_shape)
+            counts[field] = zeros(field_shape)
+        id.close()
+
+    for n in range(start_file, len(file_list)):
+        print 'Processing ' + file_list[n]
+        bins = climatology_bins(time_bin_index(file_list[n], cice), period, start_year)
+        accumulate_climatology(file_list[n], fields, bins, sums, counts, block_size)
+        if checkpoint_file is not None:
+            save_checkpoint(checkpoint_file, settings, n+1, fields, sums, counts)
+    return sums, counts
+
+
+# The arguments of build_climatology which a checkpoint has to match to be
+# carried on from.
+# Input: file_list, fields, period, start_year, cice = as in build_climatology
+# Output: dictionary of arrays to save in the checkpoint
+def checkpoint_settings (file_list, fields, period, start_year, cice):
+
+    return {'file_list':array(file_list), 'fields':array([field_name(field) for field in fields]), 'period':array(period), 'start_year':array(str(start_year)), 'cice':array(bool(cice))}
+
+
+# Save climatology sums and counts so far to a .npz file. It is written to a
+# temporary file first and then renamed, so if the job is killed partway
+# through, the last checkpoint is still intact.
+# Input:
+# checkpoint_file = path to .npz file
+# settings = dictionary from checkpoint_settings
+# num_done = number of files (from the start of file_list) included so far
+# fields, sums, counts = as in build_climatology
+def save_checkpoint (checkpoint_file, settings, num_done, fields, sums, counts):
+
+    arrays = dict(settings)
+    arrays['num_done'] = num_done
+    for field in fields:
+        arrays['sums_' + field_name(field)] = sums[field]
+        arrays['counts_' + field_name(field)] = counts[field]
+    # Pass an open file so savez doesn't add its own extension
+    f = open(checkpoint_file + '.tmp', 'wb')
+    savez(f, **arrays)
+    f.close()
+    rename(checkpoint_file + '.tmp', checkpoint_file)
+
+
+# Write a climatology to a NetCDF file, one bin at a time. Dimensions,
+# units, and long names are copied from a template file.
+# Input:
+# out_file = path to desired output file
+# template_file = path to one of the input files
+# fields, sums, counts = as in build_climatology; each field is saved with its
+#                        variable name
+# period = optional 'season' (default) or 'month'
+# coord_vars = optional list of coordinate variables to copy from the template
+#              file (e.g. ['lon_rho', 'lat_rho'])
+def write_climatology (out_file, template_file, fields, sums, counts, period='season', coord_vars=[]):
+
+    print 'Writing ' + out_file
+    names = period_names[period]
+    num_bins = len(names)
+    template = Dataset(template_file, 'r')
+    id = Dataset(out_file, 'w')
+
+    def copy_dims (dims):
+        for dim in dims:
+            if dim not in id.dimensions:
+                id.createDimension(dim, len(template.dimensions[dim]))
+
+    def copy_attrs (var_in, var_out):
+        for attr in ['long_name', 'units']:
+            if attr in var_in.ncattrs():
+                var_out.setncattr(attr, var_in.getncattr(attr))
+
+    for var in coord_vars:
+        var_in = template.variables[var]
+        copy_dims(var_in.dimensions)
+        id.createVariable(var, 'f8', var_in.dimensions)
+        copy_attrs(var_in, id.variables[var])
+        id.variables[var][:] = var_in[:]
+    id.createDimension('time', num_bins)
+    id.createVariable('time', 'f8', ('time'))
+    id.variables['time'].units = period
+    id.variables['time'].long_name = ', '.join(names)
+    id.variables['time'][:] = arange(1, num_bins+1)
+    for field in fields:
+        var = read_field_var(field)
+        var_in = template.variables[var]
+        # Drop the time dimension, and the depth dimension for single levels
+        if isinstance(field, tuple):
+            dims = (var_in.dimensions[0],) + var_in.dimensions[2:]
+        else:
+            dims = var_in.dimensions
+        copy_dims(dims[1:])
+        id.createVariable(var, 'f8', ('time',) + dims[1:])
+        copy_attrs(var_in, id.variables[var])
+        for n in range(num_bins):
+            id.variables[var][n,:] = ma.masked_where(counts[field][n] == 0, sums[field][n]/maximum(counts[field][n], 1e-12))
+    template.close()
+    id.close()
+
+
+# Build a climatology and write it to a NetCDF file; see build_climatology and
+# write_climatology for input.
+def make_climatology (file_list, fields, out_file, period='season', start_year=None, cice=False, block_size=10, checkpoint_file=None, coord_vars=[]):
+
+    sums, counts = build_climatology(file_list, fields, period, start_year, cice, block_size, checkpoint_file)
+    if sums is None:
+        return
+    write_climatology(out_file, file_list[0], fields, sums, counts, period, coord_vars)
+
+
+# Name of the variable to read for a field.
+def read_field_var (field):
+
+    if isinstance(field, tuple):
+        return field[0]
+    return field
+
+
+# Name to use in file names for a field, e.g. 'temp' or 'temp_-1'.
+def field_name (field):
+
+    if isinstance(field, tuple):
+        return field[0] + '_' + str(field[1])
+    return field
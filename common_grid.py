@@ -1,10 +1,12 @@
 from numpy import *
 from netCDF4 import Dataset, num2date
-from scipy.interpolate import griddata
+from os.path import exists
+from scipy.spatial import Delaunay
+from scipy.sparse import csr_matrix
 from rotate_vector_roms import *
 from rotate_vector_cice import *
-from monthly_avg_roms import *
-from monthly_avg_cice import *
+from time_bins import *
+from output_schema import *
 
 # Interpolate ROMS output to a regular quarter-degree grid for easy comparison
 # with FESOM. Write monthly averages of surface temperature, salinity, surface
@@ -26,7 +28,6 @@ def common_grid (roms_file, cice_file, out_file):
     r = 6.371e6
     # Degrees to radians conversion factor
     deg2rad = pi/180.0
-    N = 31
 
     print 'Calculating grids'
 
@@ -46,9 +47,6 @@ def common_grid (roms_file, cice_file, out_file):
     # We only need lat and lon on the rho grid
     lon_rho = id.variables['lon_rho'][:,:]
     lat_rho = id.variables['lat_rho'][:,:]
-    # Get shape of u and v grids
-    u_shape = id.variables['lon_u'].shape
-    v_shape = id.variables['lon_v'].shape
     # Read land mask 
     mask_roms = id.variables['mask_rho'][:,:]
     # Mask out ice shelves too
@@ -90,194 +88,87 @@ def common_grid (roms_file, cice_file, out_file):
         # the very end of a month. Just ignore the month.
     num_months = 12*num_full_years + num_extra_months
 
+    print 'Calculating interpolation weights'
+    # Triangulate each source grid once; every field is then interpolated
+    # with a sparse matrix multiplication
+    roms_weights = common_grid_weights(lon_common, lat_common, lon_rho, lat_rho)
+    cice_weights = common_grid_weights(lon_common, lat_common, lon_cice, lat_cice)
+
     print 'Interpolating land mask to new grid'
-    mask_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, mask_roms)
+    mask_common = apply_common_weights(roms_weights, mask_roms)
     mask_common[isnan(mask_common)] = 0
     # Cut it off at 1
     mask_common[mask_common < 0.5] = 0
     mask_common[mask_common >= 0.5] = 1
 
-#    print 'Setting up ' + out_file
-#    id = Dataset(out_file, 'w')
-#    id.createDimension('longitude', size(lon_common))
-#    id.createDimension('latitude', size(lat_common))
-#    id.createDimension('time', None)
-#    id.createVariable('longitude', 'f8', ('longitude'))
-#    id.variables['longitude'].units = 'degrees'
-#    id.variables['longitude'][:] = lon_common
-#    id.createVariable('latitude', 'f8', ('latitude'))
-#    id.variables['latitude'].units = 'degrees'
-#    id.variables['latitude'][:] = lat_common
-#    id.createVariable('time', 'f8', ('time'))
-#    id.variables['time'].units = 'months'
-#    id.createVariable('mask', 'f8', ('latitude', 'longitude'))
-#    id.variables['mask'].units = '1'
-#    id.variables['mask'][:,:] = mask_common
-#    id.createVariable('sst', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['sst'].long_name = 'sea surface temperature'
-#    id.variables['sst'].units = 'C'
-#    id.createVariable('sss', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['sss'].long_name = 'sea surface salinity'
-#    id.variables['sss'].units = 'psu'
-#    id.createVariable('shflux', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['shflux'].long_name = 'surface heat flux into ocean'
-#    id.variables['shflux'].units = 'W/m^2'
-#    id.createVariable('ssflux', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['ssflux'].long_name = 'surface virtual salinity flux into ocean'
-#    id.variables['ssflux'].units = 'psu m/s'
-#    id.createVariable('aice', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['aice'].long_name = 'sea ice concentration'
-#    id.variables['aice'].units = '1'
-#    id.createVariable('hice', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['hice'].long_name = 'sea ice thickness'
-#    id.variables['hice'].units = 'm'
-#    id.createVariable('uocn', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['uocn'].long_name = 'ocean surface velocity eastward'
-#    id.variables['uocn'].units = 'm/s'
-#    id.createVariable('vocn', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['vocn'].long_name = 'ocean surface velocity northward'
-#    id.variables['vocn'].units = 'm/s'
-#    id.createVariable('uice', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['uice'].long_name = 'sea ice velocity eastward'
-#    id.variables['uice'].units = 'm/s'
-#    id.createVariable('vice', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['vice'].long_name = 'sea ice velocity northward'
-#    id.variables['vice'].units = 'm/s'
-#    id.createVariable('sustr', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['sustr'].long_name = 'zonal surface stress'
-#    id.variables['sustr'].units = 'N/m^2'
-#    id.createVariable('svstr', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['svstr'].long_name = 'meridional surface stress'
-#    id.variables['svstr'].units = 'N/m^2'
-#    id.createVariable('curl_str', 'f8', ('time', 'latitude', 'longitude'))
-#    id.variables['curl_str'].long_name = 'curl of surface stress'
-#    id.variables['curl_str'].units = 'N/m^3'
-#    id.close()
+    # Variables to save each month, besides curl_str and time
+    var_names = ['sst', 'sss', 'shflux', 'ssflux', 'aice', 'hice', 'uocn', 'vocn', 'uice', 'vice', 'sustr', 'svstr']
+
+    if exists(out_file):
+        id = Dataset(out_file, 'a')
+    else:
+        print 'Setting up ' + out_file
+        id = Dataset(out_file, 'w')
+        id.createDimension('longitude', size(lon_common))
+        id.createDimension('latitude', size(lat_common))
+        id.createDimension('time', None)
+        create_var(id, 'longitude', ('longitude'))
+        id.variables['longitude'][:] = lon_common
+        create_var(id, 'latitude', ('latitude'))
+        id.variables['latitude'][:] = lat_common
+        create_var(id, 'time', ('time'), units='months')
+        create_var(id, 'mask', ('latitude', 'longitude'))
+        id.variables['mask'][:,:] = mask_common
+        for var in var_names + ['curl_str']:
+            create_var(id, var, ('time', 'latitude', 'longitude'))
+    # Pick up from the first month which hasn't been written yet, and write
+    # half a year at a time (time last, so only complete months count)
+    start = num_records_written(id)
+    buffer = record_buffer(id, var_names + ['curl_str', 'time'], start=start, slab_size=6)
+
+    # Index the records in each month of each file
+    roms_bins = month_bins(time_bin_index(roms_file))
+    cice_bins = month_bins(time_bin_index(cice_file, cice=True))
 
     # Loop over months
-    for month in range(18,num_months):
+    for month in range(start, num_months):
         print 'Processing month ' + str(month+1) + ' of ' + str(num_months)
-        id = Dataset(out_file, 'a')
-        # Write time value for this month
-        id.variables['time'][month] = month+1
-
-        print '...sea surface temperature'
-        # Get monthly average of 3D variable
-        temp_roms = monthly_avg_roms(roms_file, 'temp', [N, size(lon_rho,0), size(lon_rho,1)], month%12, instance=month/12+1)
-        # Select surface layer
-        sst_roms = temp_roms[-1,:,:]
-        # Interpolate to common grid
-        sst_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, sst_roms)
-        # Apply land mask
-        sst = ma.masked_where(mask_common==0, sst_common)
-        # Write to file
-        id.variables['sst'][month,:,:] = sst
-
-        print '...sea surface salinity'
-        # Get monthly average of 3D variable
-        salt_roms = monthly_avg_roms(roms_file, 'salt', [N, size(lon_rho,0), size(lon_rho,1)], month%12, instance=month/12+1)
-        # Select surface layer
-        sss_roms = salt_roms[-1,:,:]
-        # Interpolate to common grid
-        sss_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, sss_roms)
-        # Apply land mask
-        sss = ma.masked_where(mask_common==0, sss_common)
-        # Write to file
-        id.variables['sss'][month,:,:] = sss
-
-        print '...surface heat flux'
-        # Get monthly average
-        shflux_roms = monthly_avg_roms(roms_file, 'shflux', shape(lon_rho), month%12, instance=month/12+1)
-        # Interpolate to common grid
-        shflux_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, shflux_roms)
-        # Apply land mask
-        shflux = ma.masked_where(mask_common==0, shflux_common)
-        # Write to file
-        id.variables['shflux'][month,:,:] = shflux
-
-        print '...surface salt flux'
-        # Get monthly average
-        ssflux_roms = monthly_avg_roms(roms_file, 'ssflux', shape(lon_rho), month%12, instance=month/12+1)
-        # Interpolate to common grid
-        ssflux_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, ssflux_roms)
-        # Apply land mask
-        ssflux = ma.masked_where(mask_common==0, ssflux_common)
-        # Write to file
-        id.variables['ssflux'][month,:,:] = ssflux
-
-        print '...sea ice concentration'
-        # Get monthly average (use CICE file)
-        aice_cice = monthly_avg_cice(cice_file, 'aice', shape(lon_cice), month%12, instance=month/12+1)
-        # Interpolate to common grid (note CICE grid not ROMS)
-        aice_common = interp_roms2common(lon_common, lat_common, lon_cice, lat_cice, aice_cice)
-        # Apply land mask
-        aice = ma.masked_where(mask_common==0, aice_common)
-        # Write to file
-        id.variables['aice'][month,:,:] = aice
-
-        print '...sea ice thickness'
-        # Get monthly average (use CICE file)
-        hice_cice = monthly_avg_cice(cice_file, 'hi', shape(lon_cice), month%12, instance=month/12+1)
-        # Interpolate to common grid (note CICE grid not ROMS)
-        hice_common = interp_roms2common(lon_common, lat_common, lon_cice, lat_cice, hice_cice)
-        # Apply land mask
-        hice = ma.masked_where(mask_common==0, hice_common)
-        # Write to file
-        id.variables['hice'][month,:,:] = hice
-
-        print '...surface ocean velocity vector'
-        # Surface ocean velocity
-        # Get monthly averages of both 3D vector components
-        uocn_3d_tmp = monthly_avg_roms(roms_file, 'u', [N, u_shape[0], u_shape[1]], month%12, instance=month/12+1)
-        vocn_3d_tmp = monthly_avg_roms(roms_file, 'v', [N, v_shape[0], v_shape[1]], month%12, instance=month/12+1)
-        # Select surface layer
-        uocn_tmp = uocn_3d_tmp[-1,:,:]
-        vocn_tmp = vocn_3d_tmp[-1,:,:]
-        # Rotate to lon-lat space (note they are on the rho grid now)
-        uocn_roms, vocn_roms = rotate_vector_roms(uocn_tmp, vocn_tmp, angle_roms)
-        # Interpolate to common grid
-        uocn_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, uocn_roms)
-        vocn_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, vocn_roms)
-        # Apply land mask
-        uocn = ma.masked_where(mask_common==0, uocn_common)
-        vocn = ma.masked_where(mask_common==0, vocn_common)
-        # Write to file
-        id.variables['uocn'][month,:,:] = uocn
-        id.variables['vocn'][month,:,:] = vocn
-
-        print '...sea ice velocity vector'
-        # Sea ice velocity (CICE variable not ROMS)
-        # Get monthly averages of both vector components
-        uice_tmp = monthly_avg_cice(cice_file, 'uvel', shape(lon_cice), month%12, instance=month/12+1)
-        vice_tmp = monthly_avg_cice(cice_file, 'vvel', shape(lon_cice), month%12, instance=month/12+1)
-        # Rotate to lon-lat space
-        uice_cice, vice_cice = rotate_vector_cice(uice_tmp, vice_tmp, angle_cice)
-        # Interpolate to common grid (note CICE grid not ROMS)
-        uice_common = interp_roms2common(lon_common, lat_common, lon_cice, lat_cice, uice_cice)
-        vice_common = interp_roms2common(lon_common, lat_common, lon_cice, lat_cice, vice_cice)
-        # Apply land mask
-        uice = ma.masked_where(mask_common==0, uice_common)
-        vice = ma.masked_where(mask_common==0, vice_common)
-        # Write to file
-        id.variables['uice'][month,:,:] = uice
-        id.variables['vice'][month,:,:] = vice
-
-        print '...surface stress vector'
-        # Surface stresses
-        # Get monthly averages of both vector components
-        sustr_tmp = monthly_avg_roms(roms_file, 'sustr', u_shape, month%12, instance=month/12+1)
-        svstr_tmp = monthly_avg_roms(roms_file, 'svstr', v_shape, month%12, instance=month/12+1)
-        # Rotate to lon-lat space (note they are on the rho grid now)
-        sustr_roms, svstr_roms = rotate_vector_roms(sustr_tmp, svstr_tmp, angle_roms)
-        # Interpolate to common grid
-        sustr_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, sustr_roms)
-        svstr_common = interp_roms2common(lon_common, lat_common, lon_rho, lat_rho, svstr_roms)
+
+        print '...monthly averages'
+        # Read each record in this month once, for every variable
+        roms_key = find_month(roms_bins, month%12, instance=month/12+1)
+        cice_key = find_month(cice_bins, month%12, instance=month/12+1)
+        if roms_key is None or cice_key is None:
+            print 'Error: month ' + str(month+1) + ' is not complete'
+            flush_buffer(buffer)
+            id.close()
+            return
+        roms_fields = [('temp',-1), ('salt',-1), 'shflux', 'ssflux', ('u',-1), ('v',-1), 'sustr', 'svstr']
+        roms_avg = bin_averages(roms_file, roms_fields, [roms_bins[roms_key]])
+        cice_avg = bin_averages(cice_file, ['aice', 'hi', 'uvel', 'vvel'], [cice_bins[cice_key]])
+        # Surface temperature and salinity, surface heat and salt fluxes, sea
+        # ice concentration and thickness
+        sst_roms = roms_avg[('temp',-1)][0,:,:]
+        sss_roms = roms_avg[('salt',-1)][0,:,:]
+        shflux_roms = roms_avg['shflux'][0,:,:]
+        ssflux_roms = roms_avg['ssflux'][0,:,:]
+        aice_cice = cice_avg['aice'][0,:,:]
+        hice_cice = cice_avg['hi'][0,:,:]
+        # Rotate surface ocean velocity to lon-lat space (note they are on the
+        # rho grid now)
+        uocn_roms, vocn_roms = rotate_vector_roms(roms_avg[('u',-1)][0,:,:], roms_avg[('v',-1)][0,:,:], angle_roms)
+        # Rotate sea ice velocity to lon-lat space
+        uice_cice, vice_cice = rotate_vector_cice(cice_avg['uvel'][0,:,:], cice_avg['vvel'][0,:,:], angle_cice)
+        # Rotate surface stress to lon-lat space
+        sustr_roms, svstr_roms = rotate_vector_roms(roms_avg['sustr'][0,:,:], roms_avg['svstr'][0,:,:], angle_roms)
+
+        print '...interpolating to common grid'
+        # All the ROMS variables at once, then all the CICE variables
+        sst_common, sss_common, shflux_common, ssflux_common, uocn_common, vocn_common, sustr_common, svstr_common = apply_common_weights(roms_weights, [sst_roms, sss_roms, shflux_roms, ssflux_roms, uocn_roms, vocn_roms, sustr_roms, svstr_roms])
+        aice_common, hice_common, uice_common, vice_common = apply_common_weights(cice_weights, [aice_cice, hice_cice, uice_cice, vice_cice])
         # Apply land mask
-        sustr = ma.masked_where(mask_common==0, sustr_common)
-        svstr = ma.masked_where(mask_common==0, svstr_common)
-        # Write to file
-        id.variables['sustr'][month,:,:] = sustr
-        id.variables['svstr'][month,:,:] = svstr
+        var_common = [sst_common, sss_common, shflux_common, ssflux_common, aice_common, hice_common, uocn_common, vocn_common, uice_common, vice_common, sustr_common, svstr_common]
+        record = [ma.masked_where(mask_common==0, data_common) for data_common in var_common]
 
         print '...curl of surface stress vector'
         # Curl of surface stress = d/dx (svstr) - d/dy (sustr)
@@ -292,25 +183,30 @@ def common_grid (roms_file, cice_file, out_file):
         dsustr_dy[-1,:] = (sustr_common[-1,:] - sustr_common[-2,:])/dy[-1,:]
         curl_str = dsvstr_dx - dsustr_dy
         curl_str = ma.masked_where(mask_common==0, curl_str)
-        # Write to file
-        id.variables['curl_str'][month,:,:] = curl_str
-
-        id.close()
+        # Save to buffer, with the time value for this month
+        buffer_record(buffer, record + [curl_str, month+1])
 
+    flush_buffer(buffer)
+    id.close()
     print 'Finished'
     
 
-# Interpolate from the ROMS grid to the common grid.
-# This works for the CICE grid too.
+# Calculate the weights for interpolating from the ROMS grid to the common
+# grid: linear interpolation on a Delaunay triangulation of the ROMS points,
+# exactly as in griddata, but saved as a sparse matrix so the triangulation
+# only has to be built once per grid. This works for the CICE grid too.
 # Input:
 # lon_1d = 1D array of longitude on the common grid, -180 to 180 (size n)
 # lat_1d = 1D array of latitude on the common grid (size m)
 # lon_roms = 2D array of longitude on the ROMS grid, -180 to 180 (size pxq)
 # lat_roms = 2D array of latitude on the ROMS grid (size pxq)
-# data_roms = 2D array of any variable on the ROMS grid (size pxq)
-# Output:
-# data_common = 2D array of data_roms interpolated to the common grid (size mxn)
-def interp_roms2common (lon_1d, lat_1d, lon_roms, lat_roms, data_roms):
+# Output: dictionary containing
+# matrix = sparse matrix (size mn x pq) of the weights of the 3 corners of the
+#          triangle containing each common grid point
+# outside = 1D boolean array (size mn), True for common grid points outside
+#           the triangulation (which interpolate to NaN)
+# shape = shape of the common grid (m,n)
+def common_grid_weights (lon_1d, lat_1d, lon_roms, lat_roms):
 
     # Get a 2D field of common latitude and longitude
     lon_2d, lat_2d = meshgrid(lon_1d, lat_1d)
@@ -319,18 +215,62 @@ def interp_roms2common (lon_1d, lat_1d, lon_roms, lat_roms, data_roms):
     points = empty([size(lon_roms), 2])
     points[:,0] = ravel(lon_roms)
     points[:,1] = ravel(lat_roms)
-    # Also flatten the ROMS data
-    values = ravel(data_roms)
     # Now make an array of all the common grid coordinates, flattened
     xi = empty([size(lon_2d), 2])
     xi[:,0] = ravel(lon_2d)
     xi[:,1] = ravel(lat_2d)
-    # Now call griddata
-    result = griddata(points, values, xi)
-    # Un-flatten the result
-    data_common = reshape(result, shape(lon_2d))
 
-    return data_common
+    # Find the triangle containing each common grid point
+    tri = Delaunay(points)
+    simplex = tri.find_simplex(xi)
+    outside = simplex == -1
+    inside = nonzero(invert(outside))[0]
+    simplex = simplex[inside]
+    # Barycentric coordinates within the triangle
+    transform = tri.transform[simplex,:,:]
+    b = einsum('ijk,ik->ij', transform[:,:2,:], xi[inside,:] - transform[:,2,:])
+    weights = concatenate((b, 1-sum(b, axis=1)[:,None]), axis=1)
+    matrix = csr_matrix((ravel(weights), (repeat(inside, 3), ravel(tri.simplices[simplex,:]))), shape=(size(lon_2d), size(lon_roms)))
+
+    return {'matrix':matrix, 'outside':outside, 'shape':shape(lon_2d)}
+
+
+# Interpolate from the ROMS grid (or CICE grid) to the common grid, using
+# weights from common_grid_weights. Several fields on the same grid (e.g.
+# different variables or months) can be done in one go.
+# Input:
+# weights = dictionary from common_grid_weights
+# data_roms = 2D array of any variable on the ROMS grid, or a list of them
+# Output:
+# data_common = 2D array of data_roms interpolated to the common grid (NaN
+#               outside the ROMS grid), or a list of them
+def apply_common_weights (weights, data_roms):
+
+    if isinstance(data_roms, list):
+        # Stack the fields as the columns of one matrix; masked values are
+        # used as they are, like griddata
+        values = array([ravel(ma.getdata(data)) for data in data_roms], dtype=float).T
+        result = weights['matrix'].dot(values)
+        result[weights['outside'],:] = nan
+        return [reshape(result[:,n], weights['shape']) for n in range(len(data_roms))]
+    return apply_common_weights(weights, [data_roms])[0]
+
+
+# Interpolate from the ROMS grid to the common grid.
+# This works for the CICE grid too. If you are interpolating more than one
+# field on the same grid, call common_grid_weights once and then
+# apply_common_weights for each field instead.
+# Input:
+# lon_1d = 1D array of longitude on the common grid, -180 to 180 (size n)
+# lat_1d = 1D array of latitude on the common grid (size m)
+# lon_roms = 2D array of longitude on the ROMS grid, -180 to 180 (size pxq)
+# lat_roms = 2D array of latitude on the ROMS grid (size pxq)
+# data_roms = 2D array of any variable on the ROMS grid (size pxq)
+# Output:
+# data_common = 2D array of data_roms interpolated to the common grid (size mxn)
+def interp_roms2common (lon_1d, lat_1d, lon_roms, lat_roms, data_roms):
+
+    return apply_common_weights(common_grid_weights(lon_1d, lat_1d, lon_roms, lat_roms), data_roms)
 
 
 # Command-line interface
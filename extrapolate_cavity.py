@@ -0,0 +1,127 @@
+from numpy import *
+from scipy.spatial import cKDTree
+from grid_stencils import ice_shelf_front
+
+# Extrapolate a field on the 3D ROMS grid into the ice shelf cavities, for
+# initial conditions interpolated from datasets which don't have cavities
+# (romscice_ini_woa.py, romscice_ini_ecco.py). Working south one latitude row
+# at a time, each ice shelf point at each depth takes the value of the nearest
+# point (in Cartesian distance, including depth) which is either at the ice
+# shelf front or in a row that has already been filled. Rather than
+# calculating the distance to every one of these points for every ice shelf
+# point, each row is done with batched queries of a KD-tree, which find every
+# point that could be the nearest; these candidates are then ranked with the
+# exact distance, so the result is the same as checking every point.
+
+# Radius of the Earth in metres
+r = 6.371e6
+# Degrees to radians conversion factor
+deg2rad = pi/180.0
+
+
+# Extrapolate under the ice shelves, as described above.
+# Input:
+# B = array (depth x latitude x longitude) of values on the ROMS grid, which
+#     will be overwritten at ice shelf points
+# lon_roms_3d, lat_roms_3d, z_roms_3d = arrays (depth x latitude x longitude)
+#                                       of longitude (0 to 360), latitude, and
+#                                       depth on the ROMS grid
+# mask_rho, mask_zice = 2D land and ice shelf masks
+# num_candidates = optional number of nearest points in the KD-tree used to
+#                  bound the search (default 8)
+# Output: B with ice shelf points filled in
+def extrapolate_cavity (B, lon_roms_3d, lat_roms_3d, z_roms_3d, mask_rho, mask_zice, num_candidates=8):
+
+    N = size(B,0)
+    num_lon = size(mask_zice,1)
+    points_per_level = size(mask_zice)
+    # Find northernmost latitude with ice shelves
+    nbdry_zice = where(sum(mask_zice, axis=1) > 0)[-1][-1] + 2
+    # Find the ice shelf front, south of this latitude
+    front = ice_shelf_front(mask_rho, mask_zice)
+    front[nbdry_zice:,:] = False
+
+    # Keep track of the points we can extrapolate from as indices into the
+    # flattened 3D arrays. Sorting them means ties are broken the same way as
+    # taking argmin over the points in array order.
+    j_front, i_front = nonzero(front)
+    columns = j_front*num_lon + i_front
+    source = sort((arange(N)[:,None]*points_per_level + columns[None,:]).ravel())
+    lon_flat = lon_roms_3d.ravel()
+    lat_flat = lat_roms_3d.ravel()
+    z_flat = z_roms_3d.ravel()
+    B_flat = B.ravel()
+
+    for j in range(nbdry_zice, -1, -1):
+        print '...latitude index ' + str(nbdry_zice-j+1) + ' of ' + str(nbdry_zice+1)
+        i_zice = nonzero(mask_zice[j,:] == 1)[0]
+        if size(i_zice) == 0:
+            continue
+        # Every depth of every ice shelf point in this row
+        target = (arange(N)[:,None]*points_per_level + (j*num_lon + i_zice)[None,:]).ravel()
+        lon_source = lon_flat[source]
+        lat_source = lat_flat[source]
+        z_source = z_flat[source]
+        B_source = B_flat[source]
+        # Longitude differences of more than 300 degrees wrap around the
+        # periodic boundary, so add copies of the points near it shifted by
+        # 360 degrees
+        lon_target = lon_flat[target]
+        west = nonzero(lon_source > amin(lon_target) + 300)[0]
+        east = nonzero(lon_source < amax(lon_target) - 300)[0]
+        copies = concatenate((arange(size(source)), west, east))
+        lon_copies = concatenate((lon_source, lon_source[west]-360, lon_source[east]+360))
+        lat_target = lat_flat[target]
+        z_target = z_flat[target]
+        # The distance in longitude depends on the latitude of the target.
+        # Build the KD-tree with the smallest longitude scale of all the
+        # targets in this row (on a regular grid they are all the same), so
+        # distances in the tree are never more than the true distances.
+        scale = r*amin(cos(lat_target*deg2rad))*deg2rad
+        tree = cKDTree(array([scale*lon_copies, r*lat_source[copies]*deg2rad, z_source[copies]]).T)
+        target_coords = array([scale*lon_target, r*lat_target*deg2rad, z_target]).T
+        # The smallest true distance to the nearest few points in the tree is
+        # an upper bound on the distance to the nearest neighbour,
+        k = minimum(num_candidates, size(copies))
+        candidates = copies[tree.query(target_coords, k=k)[1].reshape(size(target), k)]
+        bound = amin(exact_distance(lon_source[candidates], lat_source[candidates], z_source[candidates], lon_target[:,None], lat_target[:,None], z_target[:,None]), axis=1)
+        # so every point within this distance in the tree is a candidate
+        balls = tree.query_ball_point(target_coords, bound*(1+1e-10))
+        num_candidates_each = array([len(ball) for ball in balls])
+        candidates = copies[concatenate(balls).astype(int)]
+        owner = repeat(arange(size(target)), num_candidates_each)
+        dist = exact_distance(lon_source[candidates], lat_source[candidates], z_source[candidates], lon_target[owner], lat_target[owner], z_target[owner])
+        # Nearest neighbour for each target; for equal distances, the first in
+        # array order
+        order = lexsort((candidates, dist, owner))
+        first = concatenate(([0], cumsum(num_candidates_each)[:-1]))
+        B_flat[target] = B_source[candidates[order[first]]]
+        # Update the points we can extrapolate from to include the new points
+        # we've just extrapolated to
+        source = union1d(source, target)
+
+    return B_flat.reshape(shape(B))
+
+
+# Cartesian distance between points, as used in extrapolate_cavity: the
+# longitude difference is wrapped around the periodic boundary if it is more
+# than 300 degrees, and converted to metres at the latitude of the target.
+# Input:
+# lon, lat, z = longitude, latitude, and depth of the points we could
+#               extrapolate from
+# lon0, lat0, z0 = longitude, latitude, and depth of the targets (broadcastable
+#                  to the shape of lon)
+# Output: dist = distance in metres
+def exact_distance (lon, lat, z, lon0, lat0, z0):
+
+    dlon = lon - lon0
+    index = dlon > 300
+    dlon[index] -= 360
+    index = dlon < -300
+    dlon[index] += 360
+    dlon = abs(dlon)
+    dlat = abs(lat - lat0)
+    dz = abs(z - z0)
+    dx = r*cos(lat0*deg2rad)*dlon*deg2rad
+    dy = r*dlat*deg2rad
+    return sqrt(dx**2 + dy**2 + dz**2)
@@ -0,0 +1,221 @@
+from numpy import *
+from collections import OrderedDict
+from hashlib import md5
+from os import access, W_OK
+from os.path import exists, getmtime, join
+from binned_integral import *
+# Import FESOM scripts (have to modify path first)
+import sys
+sys.path.insert(0, '/short/y99/kaa561/fesomtools')
+from fesom_grid import *
+
+# Cache of FESOM mesh geometry as flat NumPy arrays, so that scripts comparing
+# with FESOM don't have to rebuild the fesom_grid objects every time and then
+# loop over millions of elements and nodes in Python. The objects are walked
+# once per mesh, and the connectivity, coordinates, areas, cavity flags, and
+# node depths are saved to an npz file next to the mesh (or in a given
+# directory), and kept in memory for the most recently used few meshes.
+# Element reductions (node to element averages, selecting elements in a
+# region, binning by longitude, prisms below each element) are then single
+# array operations; see element_mean, elements_in_box, element_lon_bins, and
+# element_prisms.
+
+# Maximum number of meshes to keep in memory at once
+max_cached_meshes = 2
+# In-memory cache, most recently used last
+mesh_cache = OrderedDict()
+
+
+# Get the geometry of a FESOM mesh, from the cache if possible.
+# Input:
+# mesh_path = path to FESOM mesh directory (ending in /)
+# circumpolar, cross_180 = optional booleans passed to fesom_grid (defaults
+#                          False and True, as in fesom_grid)
+# cache_dir = optional path to a directory in which to save and look for the
+#             geometry as an npz file, so it persists between sessions. By
+#             default this is the mesh directory if it is writeable;
+#             otherwise the geometry is only kept in memory.
+# Output: dictionary from element_arrays. These arrays are shared with the
+#         cache so shouldn't be modified in place.
+def fesom_mesh (mesh_path, circumpolar=False, cross_180=True, cache_dir=None):
+
+    # Include the modification times of the mesh files in the key so that a
+    # regenerated mesh isn't matched to stale geometry
+    key = (mesh_path, bool(circumpolar), bool(cross_180), getmtime(mesh_path + 'elem2d.out'), getmtime(mesh_path + 'nod3d.out'))
+    if key in mesh_cache:
+        # Move to the end (most recently used)
+        mesh = mesh_cache.pop(key)
+        mesh_cache[key] = mesh
+        return mesh
+
+    if cache_dir is None and access(mesh_path, W_OK):
+        cache_dir = mesh_path
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = join(cache_dir, 'mesh_arrays_' + md5(str(key)).hexdigest()[:10] + '.npz')
+    if cache_file is not None and exists(cache_file):
+        npz = load(cache_file)
+        mesh = {}
+        for var in npz.files:
+            mesh[var] = npz[var]
+        npz.close()
+    else:
+        print 'Building arrays for FESOM mesh ' + mesh_path
+        mesh = element_arrays(fesom_grid(mesh_path, circumpolar, cross_180))
+        if cache_file is not None:
+            savez(cache_file, **mesh)
+
+    mesh_cache[key] = mesh
+    while len(mesh_cache) > max_cached_meshes:
+        mesh_cache.popitem(last=False)
+    return mesh
+
+
+# Walk a list of FESOM elements (from fesom_grid, make_patches, etc.) once and
+# save everything the element reductions need as arrays.
+# Input: elements = list of Element objects
+# Output: dictionary containing
+# nodes = ids of the 3 surface nodes of each element (element x 3)
+# lon, lat = coordinates of each corner of each element (element x 3)
+# x, y = polar coordinates of each corner (element x 3), if the elements have
+#        them (circumpolar=True)
+# lon_c, lat_c, (x_c, y_c) = coordinates of the centroid of each element
+# area = area of each element in m^2
+# cavity = boolean flag for each element in an ice shelf cavity
+# columns = 3D node ids down the water column below each surface node, from
+#           the surface node itself to the bottom node (2D node x level),
+#           padded with -1
+# bottom = 3D node id of the bottom of each water column (2D node)
+# depth = depth of each 3D node in metres (positive), NaN for nodes which
+#         aren't below any element
+def element_arrays (elements):
+
+    num_elm = len(elements)
+    nodes = empty([num_elm, 3], dtype=int)
+    lon = empty([num_elm, 3])
+    lat = empty([num_elm, 3])
+    area = empty(num_elm)
+    cavity = empty(num_elm, dtype=bool)
+    polar = hasattr(elements[0], 'x')
+    if polar:
+        x = empty([num_elm, 3])
+        y = empty([num_elm, 3])
+    # Surface node objects, so each water column is only walked once
+    surface = {}
+    for e in range(num_elm):
+        elm = elements[e]
+        for n in range(3):
+            nodes[e,n] = elm.nodes[n].id
+            surface[elm.nodes[n].id] = elm.nodes[n]
+        lon[e,:] = elm.lon
+        lat[e,:] = elm.lat
+        if polar:
+            x[e,:] = elm.x
+            y[e,:] = elm.y
+        area[e] = elm.area()
+        cavity[e] = elm.cavity
+
+    # Walk down each water column
+    column_list = {}
+    node_depth = {}
+    for id, node in surface.iteritems():
+        column = []
+        while node is not None:
+            column.append(node.id)
+            node_depth[node.id] = node.depth
+            node = node.below
+        column_list[id] = column
+    num_nodes = amax(surface.keys()) + 1
+    max_levels = max([len(column) for column in column_list.values()])
+    columns = -1*ones([num_nodes, max_levels], dtype=int)
+    bottom = -1*ones(num_nodes, dtype=int)
+    for id, column in column_list.iteritems():
+        columns[id,:len(column)] = column
+        bottom[id] = column[-1]
+    depth = nan*ones(amax(node_depth.keys()) + 1)
+    depth[node_depth.keys()] = node_depth.values()
+
+    mesh = {'nodes':nodes, 'lon':lon, 'lat':lat, 'lon_c':mean(lon, axis=1), 'lat_c':mean(lat, axis=1), 'area':area, 'cavity':cavity, 'columns':columns, 'bottom':bottom, 'depth':depth}
+    if polar:
+        mesh['x'] = x
+        mesh['y'] = y
+        mesh['x_c'] = mean(x, axis=1)
+        mesh['y_c'] = mean(y, axis=1)
+    return mesh
+
+
+# Average a field on the nodes over the 3 corners of every element.
+# Input:
+# mesh = dictionary from fesom_mesh or element_arrays
+# node_data = array of values on the nodes, of any dimension ... x node (3D
+#             node ids, or 2D node ids for surface fields)
+# bottom = optional boolean: use the bottom node below each corner instead of
+#          the surface node (default False), e.g. for bottom temperature
+# Output: array of dimension ... x element
+def element_mean (mesh, node_data, bottom=False):
+
+    ids = mesh['nodes']
+    if bottom:
+        ids = mesh['bottom'][ids]
+    return mean(node_data[...,ids], axis=-1)
+
+
+# Find the elements in a box in polar coordinates, as selected in the
+# intercomparison figures: the box needs to overlap the range of each
+# element's x and y coordinates.
+# Input:
+# mesh = dictionary from fesom_mesh (circumpolar=True) or element_arrays
+# x_min, x_max, y_min, y_max = bounds on polar coordinates
+# Output: boolean array, True for each element in the box
+def elements_in_box (mesh, x_min, x_max, y_min, y_max):
+
+    return any(mesh['x'] >= x_min, axis=1)*any(mesh['x'] <= x_max, axis=1)*any(mesh['y'] >= y_min, axis=1)*any(mesh['y'] <= y_max, axis=1)
+
+
+# Integrate a field on the elements over longitude bins.
+# Input:
+# mesh = dictionary from fesom_mesh or element_arrays
+# elm_data = array of values on each element (e.g. from element_mean)
+# bin_edges = 1D array of longitude bin edges, increasing, between -180 and
+#             180
+# use = optional boolean array: only count these elements (default all)
+# Output: 1D array of the area integral of elm_data over the elements whose
+#         centroid is in each bin
+def element_lon_bins (mesh, elm_data, bin_edges, use=None):
+
+    elm_lon = mesh['lon_c']
+    # Centroids of elements crossing the periodic boundary can be just outside
+    # -180 to 180
+    elm_lon = where(elm_lon < -180, elm_lon+360, elm_lon)
+    elm_lon = where(elm_lon > 180, elm_lon-360, elm_lon)
+    mask = None
+    if use is not None:
+        mask = invert(use)
+    return binned_integral(elm_data, elm_lon, bin_edges, weights=mesh['area'], mask=mask)
+
+
+# Find the 3D triangular prisms below a set of elements: each pair of
+# consecutive levels in the water columns below the 3 corners, down to the
+# first level where any of the 3 columns reaches the bottom.
+# Input:
+# mesh = dictionary from fesom_mesh or element_arrays
+# use = optional boolean array: only these elements (default all)
+# Output: dictionary containing
+# element = index of the element each prism is below
+# volume = volume of each prism (element area times the mean thickness of
+#          the 3 corners)
+# top, bottom = 3D node ids (prism x 3) at the top and bottom of each prism
+def element_prisms (mesh, use=None):
+
+    elm_index = arange(size(mesh['area']))
+    if use is not None:
+        elm_index = elm_index[use]
+    # Water columns below each corner (element x 3 x level)
+    columns = mesh['columns'][mesh['nodes'][elm_index]]
+    # Levels which have a node below them in all 3 columns
+    valid = all(columns[:,:,1:] >= 0, axis=1)
+    elm_prism, level = nonzero(valid)
+    top = columns[elm_prism,:,level]
+    bottom = columns[elm_prism,:,level+1]
+    thickness = mean(abs(mesh['depth'][top] - mesh['depth'][bottom]), axis=1)
+    return {'element':elm_index[elm_prism], 'volume':mesh['area'][elm_index[elm_prism]]*thickness, 'top':top, 'bottom':bottom}
@@ -0,0 +1,131 @@
+from netCDF4 import Dataset
+from numpy import *
+from collections import OrderedDict
+from hashlib import md5
+from os.path import basename, exists, getmtime, getsize, join
+from cartesian_grid_2d import *
+from calc_z import *
+
+# Cache of ROMS grid geometry, so that scripts which need z-coordinates,
+# Cartesian integrands, and cell areas/volumes don't have to recompute them
+# with calc_z and cartesian_grid_3d every time (or every timestep). Geometry
+# is keyed on the grid file and the vertical grid parameters, and kept in
+# memory (the most recently used few grids) and optionally on disk.
+
+# Maximum number of grids to keep in memory at once
+max_cached_grids = 4
+# In-memory cache, most recently used last
+geometry_cache = OrderedDict()
+
+
+# Get the geometry of a ROMS grid with zero sea surface height, from the cache
+# if possible.
+# Input:
+# grid_path = path to ROMS grid file
+# theta_s, theta_b, hc, N = vertical grid parameters (check roms.in)
+# Vstretching = optional integer, stretching transformation (2 or 4, default 4
+#               as in calc_z)
+# cache_dir = optional path to a directory in which to save and look for the
+#             geometry as an npz file, so it persists between sessions
+# Output: dictionary containing
+# lon, lat, h, zice, mask = 2D grid fields (latitude x longitude) straight out
+#                           of the grid file (mask is all ones if the file
+#                           has no mask_rho, e.g. some history files)
+# wct = 2D water column thickness h - |zice| at rest
+# dx, dy, dA = 2D Cartesian integrands and cell area
+# z_rho = 3D z-coordinates of cell midpoints (depth x latitude x longitude)
+# z_w = 3D z-coordinates of cell edges (depth+1 x latitude x longitude)
+# dz, dV = 3D cell thickness and volume
+# s, C = 1D s-coordinates and stretching curves
+# Callers which only need part of the grid should slice these arrays; they
+# are shared with the cache so shouldn't be modified in place.
+def grid_geometry (grid_path, theta_s, theta_b, hc, N, Vstretching=4, cache_dir=None):
+
+    # Include the file's size and modification time in the key so that a
+    # regenerated grid file isn't matched to stale geometry
+    key = (grid_path, getsize(grid_path), getmtime(grid_path), float(theta_s), float(theta_b), float(hc), int(N), int(Vstretching))
+    if key in geometry_cache:
+        # Move to the end (most recently used)
+        geom = geometry_cache.pop(key)
+        geometry_cache[key] = geom
+        return geom
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = join(cache_dir, basename(grid_path).replace('.nc', '') + '_geometry_' + md5(str(key)).hexdigest()[:10] + '.npz')
+    if cache_file is not None and exists(cache_file):
+        npz = load(cache_file)
+        geom = {}
+        for var in npz.files:
+            geom[var] = npz[var]
+        npz.close()
+    else:
+        geom = calc_grid_geometry(grid_path, theta_s, theta_b, hc, N, Vstretching)
+        if cache_file is not None:
+            savez(cache_file, **geom)
+
+    geometry_cache[key] = geom
+    while len(geometry_cache) > max_cached_grids:
+        geometry_cache.popitem(last=False)
+    return geom
+
+
+# Calculate the geometry of a ROMS grid from scratch; see grid_geometry for
+# input and output.
+def calc_grid_geometry (grid_path, theta_s, theta_b, hc, N, Vstretching=4):
+
+    id = Dataset(grid_path, 'r')
+    lon = array(id.variables['lon_rho'][:,:])
+    lat = array(id.variables['lat_rho'][:,:])
+    h = array(id.variables['h'][:,:])
+    zice = array(id.variables['zice'][:,:])
+    if 'mask_rho' in id.variables:
+        mask = array(id.variables['mask_rho'][:,:])
+    else:
+        # Some history files don't have the land mask; count everything as
+        # ocean
+        mask = ones(shape(h))
+    id.close()
+
+    # cartesian_grid_2d modifies longitude in place, so give it a copy
+    dx, dy = cartesian_grid_2d(copy(lon), lat)
+    z_rho, s, C = calc_z(h, zice, theta_s, theta_b, hc, N, None, Vstretching)
+    # Cell edges are halfway between midpoints; at the surface, z=zice, and
+    # at the bottom, extrapolate (as in cartesian_grid_3d)
+    z_w = zeros((N+1, size(lon,0), size(lon,1)))
+    z_w[1:-1,:,:] = 0.5*(z_rho[0:-1,:,:] + z_rho[1:,:,:])
+    z_w[-1,:,:] = zice
+    z_w[0,:,:] = 2*z_rho[0,:,:] - z_w[1,:,:]
+    dz = z_w[1:,:,:] - z_w[0:-1,:,:]
+    dA = dx*dy
+
+    geom = {'lon':lon, 'lat':lat, 'h':h, 'zice':zice, 'mask':mask, 'wct':h-abs(zice), 'dx':dx, 'dy':dy, 'dA':dA, 'z_rho':z_rho, 'z_w':z_w, 'dz':dz, 'dV':dA*dz, 's':s, 'C':C}
+    return geom
+
+
+# Update geometry from grid_geometry for a nonzero sea surface height. With
+# Vtransform=2, every z-coordinate moves so that its height above the
+# seafloor (-h) is scaled by (1 + zeta/wct), so this is just a rescaling of
+# the static geometry rather than a full rebuild.
+# Input:
+# geom = dictionary from grid_geometry (or a copy sliced to a subregion, as
+#        long as h, wct, z_rho, z_w, dz, dA are all sliced the same way)
+# zeta = 2D array of sea surface height (latitude x longitude), or 3D array
+#        (time x latitude x longitude) for many timesteps at once
+# Output:
+# z_rho, z_w, dz, dV = 3D arrays as in grid_geometry, for this zeta; 4D (time
+#                      x depth x latitude x longitude) if zeta is 3D
+def geometry_zeta (geom, zeta):
+
+    # Stretching factor for each water column; land points where wct=0, and
+    # masked zeta, are left alone
+    wct = geom['wct']
+    factor = 1 + where(wct > 0, ma.filled(zeta, 0)/where(wct > 0, wct, 1), 0)
+    if factor.ndim == 3:
+        # Add a depth axis so each time index broadcasts over depth
+        factor = factor[:,None,:,:]
+    z_rho = (geom['z_rho'] + geom['h'])*factor - geom['h']
+    z_w = (geom['z_w'] + geom['h'])*factor - geom['h']
+    dz = geom['dz']*factor
+    dV = geom['dA']*dz
+    return z_rho, z_w, dz, dV
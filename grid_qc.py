@@ -0,0 +1,222 @@
+from netCDF4 import Dataset
+from numpy import *
+from grid_stencils import *
+
+# Quality control for the land and ice shelf masks of a ROMS grid. Finds, over
+# the whole grid at once, cells which will cause problems in CICE or ROMS:
+# isolated ocean: open ocean cells with fewer than 2 open ocean neighbours
+#                 (the points flagged by find_isolated_points.py, where sea ice
+#                 can grow but can't escape)
+# isolated ice shelf: ice shelf cells with no ice shelf neighbours
+# isolated land: land cells with no land neighbours
+# channel: open ocean cells whose only open ocean neighbours are on opposite
+#          sides, i.e. channels one cell wide
+# and repairs them in bulk, repeating until no repairable problems are left
+# (fixing one cell can create a problem next to it). This replaces the
+# find_isolated_points.py / edit fix_isolated_points.py / rerun cycle.
+# Neighbours are the 4 cells sharing an edge, computed on the CICE grid (the
+# ROMS grid without its halo) with a periodic boundary in longitude. Indices
+# are reported as in find_isolated_points.py, i.e. counting from 1 on the CICE
+# grid, which is the same as counting from 0 on the ROMS grid.
+
+# Bathymetry given to land points (the fill value in the grid file)
+land_h = 50.0
+# Default repair for each problem:
+# 'auto' = set an isolated ocean point to ice shelf or land, whichever most of
+#          its neighbours are (ice shelf if tied)
+# 'ice_shelf' = set to ice shelf, with zice the average of the neighbouring
+#               ice shelf points
+# 'land' = set to land
+# 'ocean' = remove the ice shelf, or set a land point to ocean with h the
+#           average of the neighbouring ocean points
+# None = report the problem but don't change anything
+default_repairs = {'isolated ocean':'auto', 'isolated ice shelf':'ocean', 'isolated land':'ocean', 'channel':None}
+# Order in which problems are reported
+problem_names = ['isolated ocean', 'isolated ice shelf', 'isolated land', 'channel']
+
+
+# Find problem cells in the masks.
+# Input: mask_rho, mask_zice = 2D land and ice shelf masks on the CICE grid
+#                              (i.e. the ROMS grid with the halo removed)
+# Output: dictionary of 2D boolean arrays, one for each name in problem_names,
+#         True at problem cells
+def grid_problems (mask_rho, mask_zice):
+
+    ocean = (mask_rho == 1)*(mask_zice == 0)
+    ice = (mask_rho == 1)*(mask_zice == 1)
+    land = mask_rho == 0
+    num_ocean = neighbour_count(ocean)
+    problems = {}
+    problems['isolated ocean'] = ocean*(num_ocean < 2)
+    problems['isolated ice shelf'] = ice*(neighbour_count(ice) == 0)
+    problems['isolated land'] = land*(neighbour_count(land) == 0)
+    # Open ocean neighbours to the north and south, or east and west, and
+    # nowhere else
+    north_south = neighbour(ocean, -1, 0, True, False)*neighbour(ocean, 1, 0, True, False)
+    east_west = neighbour(ocean, 0, -1, True, False)*neighbour(ocean, 0, 1, True, False)
+    problems['channel'] = ocean*(num_ocean == 2)*(north_south + east_west)
+    return problems
+
+
+# Average of a field over the neighbours of each cell where a mask is True.
+# Input:
+# field, mask = 2D arrays on the CICE grid
+# Output: mean = 2D array (0 where there are no such neighbours), count = 2D
+#         array of the number of neighbours averaged
+def masked_neighbour_mean (field, mask):
+
+    total = zeros(shape(field))
+    for dj, di in edge_neighbours:
+        total += neighbour(field*mask, dj, di, True, 0)
+    count = neighbour_count(mask)
+    return total/maximum(count, 1), count
+
+
+# Repair the problems found by grid_problems, editing the fields in place.
+# Input:
+# mask_rho, h, mask_zice, zice = 2D fields on the CICE grid (pass slices of the
+#                                ROMS fields, e.g. [1:-1,1:-1], so they are
+#                                edited in place)
+# repairs = optional dictionary of the repair for each problem (see
+#           default_repairs); problems left out are only reported
+# max_iter = optional maximum number of passes (default 50)
+# Output: changes = list of (pass, problem, action, i, j, description) for
+#         every repair in order, followed by every problem which is left (with
+#         action None); remaining = dictionary of the problems left, as in
+#         grid_problems
+def repair_grid (mask_rho, h, mask_zice, zice, repairs=default_repairs, max_iter=50):
+
+    changes = []
+    num_repaired = 0
+    for n in range(max_iter):
+        problems = grid_problems(mask_rho, mask_zice)
+        # Averages from the neighbours before this pass, so the order of the
+        # repairs within the pass doesn't matter
+        ice = (mask_rho == 1)*(mask_zice == 1)
+        zice_mean, num_ice = masked_neighbour_mean(zice, ice)
+        h_mean, num_ocean = masked_neighbour_mean(h, mask_rho == 1)
+        num_land = neighbour_count(mask_rho == 0)
+        num_repaired = 0
+        for name in problem_names:
+            action = repairs.get(name)
+            j_vals, i_vals = nonzero(problems[name])
+            for j, i in zip(j_vals, i_vals):
+                if action == 'auto':
+                    if num_ice[j,i] > 0 and num_ice[j,i] >= num_land[j,i]:
+                        this_action = 'ice_shelf'
+                    else:
+                        this_action = 'land'
+                else:
+                    this_action = action
+                if this_action == 'ice_shelf' and mask_rho[j,i] == 1:
+                    if num_ice[j,i] == 0:
+                        # Nothing to average from
+                        continue
+                    mask_zice[j,i] = 1
+                    zice[j,i] = zice_mean[j,i]
+                    description = 'set to ice shelf, zice=' + str(round(zice[j,i],2))
+                elif this_action == 'land' and mask_rho[j,i] == 1:
+                    mask_rho[j,i] = 0
+                    h[j,i] = land_h
+                    mask_zice[j,i] = 0
+                    zice[j,i] = 0.0
+                    description = 'set to land'
+                elif this_action == 'ocean' and mask_rho[j,i] == 0:
+                    if num_ocean[j,i] == 0:
+                        continue
+                    mask_rho[j,i] = 1
+                    h[j,i] = h_mean[j,i]
+                    description = 'set to ocean, h=' + str(round(h[j,i],2))
+                elif this_action == 'ocean' and mask_zice[j,i] == 1:
+                    mask_zice[j,i] = 0
+                    zice[j,i] = 0.0
+                    description = 'ice shelf removed'
+                else:
+                    continue
+                changes.append((n+1, name, this_action, i+1, j+1, description))
+                num_repaired += 1
+        if num_repaired == 0:
+            break
+    if num_repaired > 0:
+        print 'Warning: still repairing problems after ' + str(max_iter) + ' passes'
+    # Record the problems which are left
+    remaining = grid_problems(mask_rho, mask_zice)
+    for name in problem_names:
+        j_vals, i_vals = nonzero(remaining[name])
+        for j, i in zip(j_vals, i_vals):
+            changes.append((n+1, name, None, i+1, j+1, 'not changed'))
+    return changes, remaining
+
+
+# Write the list of changes from repair_grid to a text file.
+# Input:
+# changes = list from repair_grid
+# log_file = path to desired text file
+def write_changelog (changes, log_file):
+
+    f = open(log_file, 'w')
+    for n, name, action, i, j, description in changes:
+        f.write('pass ' + str(n) + ': i=' + str(i) + ', j=' + str(j) + ': ' + name + ', ' + description + '\n')
+    f.close()
+
+
+# Find and repair all the problems in a ROMS grid file, and update the u, v,
+# and psi land masks to match. After running this, rerun cice_grid.py to
+# update the CICE grid.
+# Input:
+# grid_file = path to ROMS grid file to edit
+# log_file = optional path to a text file to write the changes to
+# repairs = optional dictionary of repairs, as in repair_grid
+# max_iter = optional maximum number of passes, as in repair_grid
+# dry_run = optional boolean: report the problems but don't save anything to
+#           the grid file (default False)
+def grid_qc (grid_file, log_file=None, repairs=default_repairs, max_iter=50, dry_run=False):
+
+    id = Dataset(grid_file, 'r')
+    mask_rho = array(id.variables['mask_rho'][:,:])
+    h = array(id.variables['h'][:,:])
+    mask_zice = array(id.variables['mask_zice'][:,:])
+    zice = array(id.variables['zice'][:,:])
+    id.close()
+
+    if dry_run:
+        repairs = {}
+    found = grid_problems(mask_rho[1:-1,1:-1], mask_zice[1:-1,1:-1])
+    # Work on the CICE grid; these slices are views, so the ROMS fields are
+    # edited in place
+    changes, remaining = repair_grid(mask_rho[1:-1,1:-1], h[1:-1,1:-1], mask_zice[1:-1,1:-1], zice[1:-1,1:-1], repairs, max_iter)
+    for name in problem_names:
+        print name + ': ' + str(count_nonzero(found[name])) + ' found, ' + str(count_nonzero(remaining[name])) + ' left'
+    if log_file is not None:
+        write_changelog(changes, log_file)
+
+    if dry_run:
+        return
+    # The repairs were only made on the CICE grid, so copy them to the
+    # periodic boundary columns
+    for A in [mask_rho, h, mask_zice, zice]:
+        A[:,0] = A[:,-2]
+        A[:,-1] = A[:,1]
+    # Calculate new land mask for u, v, psi grids
+    mask_u = mask_rho[:,1:]*mask_rho[:,:-1]
+    mask_v = mask_rho[1:,:]*mask_rho[:-1,:]
+    mask_psi = mask_rho[1:,1:]*mask_rho[:-1,1:]*mask_rho[1:,:-1]*mask_rho[:-1,:-1]
+    # Save new fields
+    id = Dataset(grid_file, 'a')
+    id.variables['mask_rho'][:,:] = mask_rho
+    id.variables['mask_u'][:,:] = mask_u
+    id.variables['mask_v'][:,:] = mask_v
+    id.variables['mask_psi'][:,:] = mask_psi
+    id.variables['h'][:,:] = h
+    id.variables['mask_zice'][:,:] = mask_zice
+    id.variables['zice'][:,:] = zice
+    id.close()
+
+
+# Command-line interface
+if __name__ == "__main__":
+
+    grid_file = raw_input("Path to ROMS grid file: ")
+    log_file = raw_input("Path to desired changelog file: ")
+    action = raw_input("Repair the grid (r) or only report problems (p)? ")
+    grid_qc(grid_file, log_file, dry_run=(action == 'p'))
@@ -0,0 +1,151 @@
+from numpy import *
+
+# Stencil operations on 2D grid masks and fields, done with whole-array
+# shifts rather than looping over every cell. Fields can have any number of
+# leading dimensions (e.g. depth or time); the stencil is applied to the last
+# two (latitude x longitude). The longitude (xi) direction can be periodic,
+# wrapping around from the last column to the first as in the CICE grid.
+
+
+# Shift a field so that each cell sees the value of one of its neighbours.
+# Input:
+# A = array (... x latitude x longitude)
+# dj, di = offset of the neighbour in latitude and longitude (e.g. -1, 0 for
+#          the neighbour to the south)
+# periodic = optional boolean: wrap around in longitude (default True)
+# fill = optional value for neighbours outside the grid (default 0)
+# Output: array of the same shape, containing A[...,j+dj,i+di] at [...,j,i]
+def neighbour (A, dj, di, periodic=True, fill=0):
+
+    A = asarray(A)
+    num_lat = size(A,-2)
+    num_lon = size(A,-1)
+    B = full(shape(A), fill, dtype=A.dtype)
+    # Latitude indices which have a neighbour inside the grid
+    j_out = slice(maximum(-dj,0), num_lat-maximum(dj,0))
+    j_in = slice(maximum(dj,0), num_lat-maximum(-dj,0))
+    if periodic:
+        B[...,j_out,:] = roll(A[...,j_in,:], -di, axis=-1)
+    else:
+        i_out = slice(maximum(-di,0), num_lon-maximum(di,0))
+        i_in = slice(maximum(di,0), num_lon-maximum(-di,0))
+        B[...,j_out,i_out] = A[...,j_in,i_in]
+    return B
+
+
+# Offsets of the 4 neighbours sharing an edge with each cell, and of all 8
+# neighbours including diagonals
+edge_neighbours = [(-1,0), (0,-1), (1,0), (0,1)]
+all_neighbours = [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)]
+
+
+# Count the neighbours of each cell where a mask is True.
+# Input:
+# mask = boolean array (... x latitude x longitude)
+# diagonals = optional boolean: count all 8 neighbours rather than the 4
+#             sharing an edge (default False)
+# periodic = optional boolean: wrap around in longitude (default True)
+# Output: integer array of the same shape
+def neighbour_count (mask, diagonals=False, periodic=True):
+
+    if diagonals:
+        offsets = all_neighbours
+    else:
+        offsets = edge_neighbours
+    count = zeros(shape(mask), dtype=int)
+    for dj, di in offsets:
+        count += neighbour(mask, dj, di, periodic, False)
+    return count
+
+
+# Find the ice shelf front: ocean points which aren't ice shelf points, but
+# have at least one neighbour (including diagonals) that is.
+# Input:
+# mask_rho, mask_zice = 2D land and ice shelf masks on the rho-grid
+# periodic = optional boolean: wrap around in longitude (default False, as
+#            the ROMS grid already has overlapping periodic boundary columns)
+# Output: front = 2D boolean array, True at the ice shelf front
+def ice_shelf_front (mask_rho, mask_zice, periodic=False):
+
+    return (mask_rho == 1)*(mask_zice == 0)*(neighbour_count(mask_zice == 1, True, periodic) > 0)
+
+
+# Find ocean points which are land on at least 3 sides, e.g. in the CICE land
+# mask (kmt). Sea ice can grow in these points but can't escape.
+# Input:
+# kmt = 2D land mask (1 for ocean, 0 for land)
+# periodic = optional boolean: wrap around in longitude (default True)
+# Output: isolated = 2D boolean array, True at isolated points
+def isolated_points (kmt, periodic=True):
+
+    ocean = kmt == 1
+    return ocean*(neighbour_count(ocean, False, periodic) < 2)
+
+
+# Fill masked cells which have at least one unmasked neighbour (of the 4
+# sharing an edge) with the average of their unmasked neighbours, e.g. to
+# extend velocity into the land mask before interpolating to another grid.
+# Only the original unmasked values are used, so the result doesn't depend on
+# the order of the cells.
+# Input:
+# data = masked array (... x latitude x longitude)
+# periodic = optional boolean: wrap around in longitude (default False)
+# edges = optional boolean: also fill cells on the edges of the grid, which
+#         are missing some of their neighbours (default False)
+# Output: masked array of the same shape, with the filled cells unmasked
+def neighbour_mean_fill (data, periodic=False, edges=False):
+
+    mask = ma.getmaskarray(data)
+    values = ma.filled(data, 0)
+    total = zeros(shape(values))
+    count = zeros(shape(values), dtype=int)
+    for dj, di in edge_neighbours:
+        total += neighbour(values, dj, di, periodic, 0)
+        count += neighbour(invert(mask), dj, di, periodic, False)
+    fill = mask*(count > 0)
+    if not edges:
+        fill[...,0,:] = False
+        fill[...,-1,:] = False
+        if not periodic:
+            fill[...,:,0] = False
+            fill[...,:,-1] = False
+    filled = ma.array(values, mask=mask*invert(fill))
+    filled[fill] = total[fill]/count[fill]
+    return filled
+
+
+# Fill all masked cells by solving Laplace's equation with the unmasked cells
+# as boundary conditions, so the filled values vary smoothly between them.
+# Masked cells are first filled outwards with neighbour_mean_fill, then
+# relaxed towards the average of their 4 neighbours.
+# Input:
+# data = masked array (... x latitude x longitude)
+# num_iter = optional maximum number of relaxation iterations (default 500)
+# tol = optional tolerance: stop when no filled value changes by more than
+#       this (default 1e-6)
+# periodic = optional boolean: wrap around in longitude (default True)
+# Output: array of the same shape with no masked values (cells with no unmasked
+#         cells anywhere in their 2D slice are set to 0)
+def laplacian_fill (data, num_iter=500, tol=1e-6, periodic=True):
+
+    mask = ma.getmaskarray(data)
+    # Initial guess: grow the unmasked region until everything is filled
+    filled = ma.array(data, copy=True)
+    while True:
+        num_masked = ma.count_masked(filled)
+        filled = neighbour_mean_fill(filled, periodic, edges=True)
+        if ma.count_masked(filled) in [0, num_masked]:
+            break
+    # Work in floating point, even for integer fields
+    values = ma.filled(filled, 0).astype(float)
+    # Number of neighbours inside the grid
+    count = neighbour_count(ones(shape(values), dtype=bool), False, periodic)
+    for n in range(num_iter):
+        total = zeros(shape(values))
+        for dj, di in edge_neighbours:
+            total += neighbour(values, dj, di, periodic, 0)
+        change = where(mask, total/count - values, 0)
+        values += change
+        if amax(abs(change)) < tol:
+            break
+    return values
@@ -0,0 +1,277 @@
+from netCDF4 import Dataset
+from numpy import *
+from grid_cache import *
+from section_transport import transect_geometry, barotropic_transport
+from ice_shelf_regions import region_integrals
+from mld import *
+from scipy.sparse import csr_matrix, issparse
+
+# Calculate many timeseries from a ROMS history/averages file (or CICE history
+# file) in one pass. The file is read one slab of time records at a time, each
+# variable is read once per slab no matter how many diagnostics need it, and
+# the slab is passed to a list of reducers, each of which turns it into one or
+# more timeseries. Reducers are dictionaries containing
+# names = list of the names of the timeseries it calculates
+# fields = list of (variable name, level) which the reducer needs: level is
+#          None for the whole variable, or the index of a single depth level
+#          (e.g. -1 for the surface) of a 3D variable. The special field
+#          ('dV', None) is the time-dependent cell volume.
+# reduce = function of the slab (a dictionary mapping each field to its
+#          values, time x ...) giving a list of (timeseries name, 1D array)
+# geom = only for reducers which need dV: dictionary from grid_geometry,
+#        sliced to the region that read_field returns
+# Use the functions below to build reducers for volume-weighted means, area
+# integrals over regions, mixed layer depth, and section transports.
+# Input:
+# file_path = path to ROMS history/averages file or CICE history file
+# reducers = list of reducers
+# time_var = optional name of time variable (default 'ocean_time'; 'time' for
+#            CICE files)
+# block_size = optional number of time records to read at once (default 10)
+# Output:
+# time = 1D array of time values, straight out of the file
+# data = list of (timeseries name, 1D array) from all the reducers
+def scan_history (file_path, reducers, time_var='ocean_time', block_size=10):
+
+    id = Dataset(file_path, 'r')
+    time = id.variables[time_var][:]
+    num_time = size(time)
+    data = []
+    start_t = 0
+    while start_t < num_time:
+        end_t = minimum(start_t+block_size, num_time)
+        print 'Processing time indices ' + str(start_t+1) + ' to ' + str(end_t)
+        new_data = scan_slab(id, reducers, start_t, end_t)
+        if len(data) == 0:
+            data = new_data
+        else:
+            data = [(name, concatenate((values, new_values))) for (name, values), (new_name, new_values) in zip(data, new_data)]
+        start_t = end_t
+    id.close()
+    return time, data
+
+
+# Read one slab of time records and pass it to every reducer.
+# Input:
+# id = open Dataset
+# reducers = list of reducers
+# t_start, t_end = range of time records to read
+# Output: list of (timeseries name, 1D array) from all the reducers
+def scan_slab (id, reducers, t_start, t_end):
+
+    slab = read_slab(id, slab_fields(reducers), t_start, t_end, slab_geometry(reducers))
+    return reduce_slab(slab, reducers)
+
+
+# Find all the fields which a list of reducers needs.
+# Input: reducers = list of reducers
+# Output: list of (variable name, level) with no duplicates
+def slab_fields (reducers):
+
+    fields = []
+    for reducer in reducers:
+        for field in reducer['fields']:
+            if field not in fields:
+                fields.append(field)
+    return fields
+
+
+# Find the grid geometry to calculate dV with, if any reducer needs it.
+# Input: reducers = list of reducers
+# Output: geometry dictionary, or None
+def slab_geometry (reducers):
+
+    for reducer in reducers:
+        if 'geom' in reducer:
+            return reducer['geom']
+    return None
+
+
+# Read a slab of time records for the given fields. Each variable is read
+# from the file only once: if one field needs a whole 3D variable and another
+# just one level of it, the level is sliced out of the whole variable.
+# Input:
+# id = open Dataset
+# fields = list of (variable name, level)
+# t_start, t_end = range of time records to read
+# geom = geometry to calculate dV with (only needed if ('dV', None) is in
+#        fields)
+# Output: dictionary mapping each field to its values
+def read_slab (id, fields, t_start, t_end, geom=None):
+
+    if ('dV', None) in fields and ('zeta', None) not in fields:
+        fields = fields + [('zeta', None)]
+    slab = {}
+    # Read whole variables first
+    for var, level in fields:
+        if level is None and var != 'dV':
+            slab[(var, None)] = read_field(id, var, t_start, t_end)
+    for var, level in fields:
+        if level is not None:
+            if (var, None) in slab:
+                slab[(var, level)] = slab[(var, None)][:,level,:,:]
+            else:
+                slab[(var, level)] = read_field(id, var, t_start, t_end, level)
+    if ('dV', None) in fields:
+        # Rescale static geometry for the sea surface height at each record
+        z_rho, z_w, dz, dV = geometry_zeta(geom, slab[('zeta', None)])
+        slab[('dV', None)] = dV
+    return slab
+
+
+# Pass a slab to every reducer.
+# Input:
+# slab = dictionary from read_slab
+# reducers = list of reducers
+# Output: list of (timeseries name, 1D array) from all the reducers
+def reduce_slab (slab, reducers):
+
+    data = []
+    for reducer in reducers:
+        data += reducer['reduce'](slab)
+    return data
+
+
+# Read a range of time records of a variable, throwing away the northern
+# sponge layer, and the overlapping periodic boundary for variables on the
+# rho-grid. Variables on the u- and v-grids keep the periodic boundary so
+# they can be rotated with rotate_vector_roms.
+# Input:
+# id = open Dataset
+# var = variable name
+# t_start, t_end = range of time records to read
+# level = optional index of a single depth level to read, for 3D variables
+# Output: array of values (time x depth x latitude x longitude, or time x
+#         latitude x longitude)
+def read_field (id, var, t_start, t_end, level=None):
+
+    dims = id.variables[var].dimensions
+    if dims[-1] == 'xi_rho':
+        i_range = slice(1,-1)
+    else:
+        i_range = slice(None)
+    if len(dims) == 4:
+        if level is None:
+            return id.variables[var][t_start:t_end,:,:-15,i_range]
+        else:
+            return id.variables[var][t_start:t_end,level,:-15,i_range]
+    return id.variables[var][t_start:t_end,:-15,i_range]
+
+
+# Reducer for the volume-weighted mean of a 3D variable, as in timeseries_3D.
+# Input:
+# name = name of timeseries
+# var = variable to average
+# geom = geometry dictionary from grid_geometry sliced as in read_field,
+#        including the land mask
+# weight_var = optional variable to weight with as well as volume (e.g. 'rho')
+# weight_offset = optional constant to add to weight_var (e.g. 1000 for
+#                 density anomalies)
+# Output: reducer
+def volume_mean_reducer (name, var, geom, weight_var=None, weight_offset=0):
+
+    fields = [(var, None), ('dV', None)]
+    if weight_var is not None:
+        fields.append((weight_var, None))
+
+    def calc (slab):
+        dV = slab[('dV', None)]
+        # Mask with land mask (broadcast, not copied, over time and depth)
+        dV = ma.masked_where(broadcast_to(geom['mask']==0, dV.shape), dV)
+        if weight_var is not None:
+            dV = (slab[(weight_var, None)] + weight_offset)*dV
+        axes = (1,2,3)
+        return [(name, sum(slab[(var, None)]*dV, axis=axes)/sum(dV, axis=axes))]
+
+    return {'names':[name], 'fields':fields, 'reduce':calc, 'geom':geom}
+
+
+# Reducer for the area integral (or area average) over each of a set of
+# regions of a 2D field, or the product of several 2D fields. Masked values
+# count as zero.
+# Input:
+# names = list of timeseries names, one for each region
+# fields = list of (variable name, level) to multiply together
+# dA_regions = array (region x latitude x longitude) of cell areas, zero
+#              outside each region, or a sparse matrix (region x cell) from
+#              region_matrix in ice_shelf_regions.py
+# factor = optional constant to multiply the integrals by (e.g. for units)
+# average = optional boolean: divide by the area of each region
+# Output: reducer
+def area_integral_reducer (names, fields, dA_regions, factor=1, average=False):
+
+    if issparse(dA_regions):
+        R = csr_matrix(dA_regions)
+    else:
+        dA_regions = ma.filled(dA_regions, 0)
+        R = csr_matrix(dA_regions.reshape(size(dA_regions,0), -1))
+    if average:
+        factor = factor/R.dot(ones(R.shape[1]))
+
+    def calc (slab):
+        integrand = ma.filled(slab[fields[0]], 0)
+        for field in fields[1:]:
+            integrand = integrand*ma.filled(slab[field], 0)
+        # Integrate over every region for every record at once
+        integrals = factor*region_integrals(R, integrand).T
+        return [(names[n], integrals[:,n]) for n in range(len(names))]
+
+    return {'names':names, 'fields':fields, 'reduce':calc}
+
+
+# Reducer for the area average over each of a set of regions of mixed layer
+# depth (from the potential density threshold in mld.py), for every record.
+# Input:
+# names = list of timeseries names, one for each region
+# dA_regions = as in area_integral_reducer
+# geom = geometry dictionary from grid_geometry sliced as in read_field
+# anom, interpolate = optional, as in mld_columns in mld.py
+# Output: reducer
+def mld_reducer (names, dA_regions, geom, anom=density_anom, interpolate=False):
+
+    average = area_integral_reducer(names, [('mld', None)], dA_regions, average=True)
+
+    def calc (slab):
+        temp = slab[('temp', None)]
+        salt = slab[('salt', None)]
+        density = unesco(temp, salt, zeros(shape(temp)))
+        return average['reduce']({('mld', None):mld_roms(density, geom['z_rho'], anom, interpolate)})
+
+    return {'names':names, 'fields':[('temp', None), ('salt', None)], 'reduce':calc}
+
+
+# Reducer for the barotropic transport through a zonal section, as in
+# timeseries_dpt. Velocity is only rotated in the window around the section.
+# Input:
+# name = name of timeseries
+# section = dictionary from zonal_section
+# Output: reducer
+def section_transport_reducer (name, section):
+
+    j0 = section['j0']
+    j1 = section['j1']
+    c0 = section['c0']
+    c1 = section['c1']
+
+    def calc (slab):
+        # Cut out the window (see read_window in section_transport.py); zeta
+        # has had the overlapping periodic boundary thrown away, so its
+        # columns are shifted by one
+        zeta = slab[('zeta', None)][:,j0:j1,c0-1:c1-1]
+        ubar = slab[('ubar', None)][:,j0:j1,c0-1:c1]
+        vbar = slab[('vbar', None)][:,j0-1:j1,c0:c1]
+        return [(name, barotropic_transport(section, zeta, ubar, vbar))]
+
+    return {'names':[name], 'fields':[('zeta', None), ('ubar', None), ('vbar', None)], 'reduce':calc}
+
+
+# Find the geometry of a zonal section at a given longitude, between the given
+# latitudes, for section_transport_reducer.
+# Input:
+# grid_path = path to ROMS grid file
+# lon0 = longitude of section
+# lat_min, lat_max = latitude bounds of section
+# Output: dictionary from transect_geometry in section_transport.py
+def zonal_section (grid_path, lon0, lat_min, lat_max):
+
+    return transect_geometry(grid_path, lon0, lat_min, lat_max)
@@ -0,0 +1,156 @@
+from netCDF4 import Dataset
+from numpy import *
+from collections import OrderedDict
+from os.path import getmtime, getsize
+from scipy.sparse import csr_matrix
+
+# Region masks for the major ice shelves on the ROMS grid, so that scripts
+# don't have to rebuild them from the longitude and latitude boxes (with the
+# special case for the Ross region crossing 180W) one ice shelf at a time.
+# The membership of each cell in each ice shelf is calculated once per grid
+# and cached; from it you can get an integer label map (for maps, or anything
+# else which needs one region per cell) or a sparse matrix which integrates a
+# field over every ice shelf at once. Some of the boxes overlap, and the
+# sparse matrix counts cells in the overlaps towards both ice shelves, just
+# like masking each box in turn.
+
+# Maximum number of grids to keep in memory at once
+max_cached_grids = 4
+# In-memory cache, most recently used last
+members_cache = OrderedDict()
+
+
+# Titles of major ice shelves, and the longitude and latitude boxes which
+# define them. These depend on the source geometry, in this case RTopo 1.05.
+# Output:
+# names = list of ice shelf titles; the first is the entire continent
+# lon_min, lon_max, lat_min, lat_max = lists of box limits for each ice shelf.
+#                                      Note there is one extra index at the end
+#                                      of each list; this is because the Ross
+#                                      region crosses the line 180W and
+#                                      therefore is split into two
+def ice_shelf_boxes ():
+
+    names = ['All Ice Shelves', 'Larsen D Ice Shelf', 'Larsen C Ice Shelf', 'Wilkins & George VI & Stange Ice Shelves', 'Ronne-Filchner Ice Shelf', 'Abbot Ice Shelf', 'Pine Island Glacier Ice Shelf', 'Thwaites Ice Shelf', 'Dotson Ice Shelf', 'Getz Ice Shelf', 'Nickerson Ice Shelf', 'Sulzberger Ice Shelf', 'Mertz Ice Shelf', 'Totten & Moscow University Ice Shelves', 'Shackleton Ice Shelf', 'West Ice Shelf', 'Amery Ice Shelf', 'Prince Harald Ice Shelf', 'Baudouin & Borchgrevink Ice Shelves', 'Lazarev Ice Shelf', 'Nivl Ice Shelf', 'Fimbul & Jelbart & Ekstrom Ice Shelves', 'Brunt & Riiser-Larsen Ice Shelves', 'Ross Ice Shelf']
+    lon_min = [-180, -62.67, -65.5, -79.17, -85, -104.17, -102.5, -108.33, -114.5, -135.67, -149.17, -155, 144, 115, 94.17, 80.83, 65, 33.83, 19, 12.9, 9.33, -10.05, -28.33, -180, 158.33]
+    lon_max = [180, -59.33, -60, -66.67, -28.33, -88.83, -99.17, -103.33, -111.5, -114.33, -140, -145, 146.62, 123.33, 102.5, 89.17, 75, 37.67, 33.33, 16.17, 12.88, 7.6, -10.33, -146.67, 180]
+    lat_min = [-90, -73.03, -69.35, -74.17, -83.5, -73.28, -75.5, -75.5, -75.33, -74.9, -76.42, -78, -67.83, -67.17, -66.67, -67.83, -73.67, -69.83, -71.67, -70.5, -70.75, -71.83, -76.33, -85, -84.5]
+    lat_max = [-30, -69.37, -66.13, -69.5, -74.67, -71.67, -74.17, -74.67, -73.67, -73, -75.17, -76.41, -66.67, -66.5, -64.83, -66.17, -68.33, -68.67, -68.33, -69.33, -69.83, -69.33, -71.5, -77.77, -77]
+    return names, lon_min, lon_max, lat_min, lat_max
+
+
+# Get the membership of each cell on the rho-grid in each ice shelf in
+# ice_shelf_boxes, from the cache if possible.
+# Input: grid_path = path to ROMS grid file (or any file containing lon_rho,
+#                    lat_rho, and zice, e.g. a history file)
+# Output: members = boolean array (ice shelf x latitude x longitude) on the
+#                   whole rho-grid, True where the cell is ice shelf (zice != 0)
+#                   and inside the box for that ice shelf. Slice the last two
+#                   dimensions to match your fields, e.g. [:,:-15,1:-1]. It's
+#                   shared with the cache so don't modify it in place.
+def ice_shelf_members (grid_path):
+
+    # Include the file's size and modification time in the key so that a
+    # regenerated grid file isn't matched to stale masks
+    key = (grid_path, getsize(grid_path), getmtime(grid_path))
+    if key in members_cache:
+        # Move to the end (most recently used)
+        members = members_cache.pop(key)
+        members_cache[key] = members
+        return members
+
+    id = Dataset(grid_path, 'r')
+    lon = array(id.variables['lon_rho'][:,:])
+    lat = array(id.variables['lat_rho'][:,:])
+    zice = array(id.variables['zice'][:,:])
+    id.close()
+    # Make longitude values go from -180 to 180, not 0 to 360
+    index = lon > 180
+    lon[index] = lon[index] - 360
+
+    names, lon_min, lon_max, lat_min, lat_max = ice_shelf_boxes()
+    num_shelves = len(names)
+    members = zeros([num_shelves, size(lon,0), size(lon,1)], dtype=bool)
+    for index in range(num_shelves):
+        members[index,:,:] = (lon >= lon_min[index])*(lon <= lon_max[index])*(lat >= lat_min[index])*(lat <= lat_max[index])
+    # Ross region is split into two
+    index = num_shelves-1
+    members[index,:,:] += (lon >= lon_min[index+1])*(lon <= lon_max[index+1])*(lat >= lat_min[index+1])*(lat <= lat_max[index+1])
+    # Only ice shelf points
+    members *= (zice != 0)
+
+    members_cache[key] = members
+    while len(members_cache) > max_cached_grids:
+        members_cache.popitem(last=False)
+    return members
+
+
+# Make an integer label map from ice shelf membership.
+# Input: members = boolean array from ice_shelf_members (possibly sliced)
+# Output: labels = integer array (latitude x longitude): 0 where the cell is
+#                  not in any individual ice shelf, otherwise the index of the
+#                  ice shelf in ice_shelf_boxes (from 1; the entire continent
+#                  isn't labelled). Where boxes overlap the later ice shelf
+#                  wins.
+def ice_shelf_labels (members):
+
+    labels = zeros([size(members,1), size(members,2)], dtype=int)
+    for index in range(1, size(members,0)):
+        labels[members[index,:,:]] = index
+    return labels
+
+
+# Make a sparse matrix which integrates a field over a set of regions.
+# Input:
+# members = boolean array (region x latitude x longitude), e.g. from
+#           ice_shelf_members, sliced to match dA
+# dA = differential of area (latitude x longitude); masked values count as
+#      zero
+# Output: csr_matrix (region x cell) containing dA for the cells in each
+#         region; use with region_integrals
+def region_matrix (members, dA):
+
+    num_regions = size(members,0)
+    region, cell = nonzero(members.reshape(num_regions, -1))
+    dA = ma.filled(dA, 0).ravel()
+    return csr_matrix((dA[cell], (region, cell)), shape=(num_regions, dA.size))
+
+
+# Integrate a field over every region for every time index at once.
+# Input:
+# R = sparse matrix from region_matrix
+# field = array (time x latitude x longitude, or latitude x longitude);
+#         masked values count as zero
+# Output: integrals = array (region x time, or region)
+def region_integrals (R, field):
+
+    field = ma.filled(field, 0)
+    if field.ndim == 2:
+        return R.dot(field.ravel())
+    return R.dot(field.reshape(size(field,0), -1).T)
+
+
+# Sum a field (times an optional weight) over each label of an integer label
+# map, for every time index at once. For regions which don't overlap this is
+# cheaper than building a sparse matrix.
+# Input:
+# labels = integer array (latitude x longitude, or the same shape as field)
+#          with values from 0 to num_labels-1
+# field = array (time x ... , or the same shape as labels); masked values
+#         count as zero
+# num_labels = number of labels
+# weights = optional array to multiply field by, broadcastable to its shape
+# Output: sums = array (time x label, or label)
+def label_sums (labels, field, num_labels, weights=None):
+
+    field = ma.filled(field, 0)
+    if weights is not None:
+        field = field*ma.filled(weights, 0)
+    if field.shape == labels.shape:
+        return bincount(labels.ravel(), weights=field.ravel(), minlength=num_labels)
+    # Offset the labels for each time index so one bincount does them all
+    num_time = size(field,0)
+    labels = broadcast_to(labels, field.shape[1:]).ravel()
+    offsets = (arange(num_time)*num_labels)[:,None]
+    sums = bincount((labels[None,:] + offsets).ravel(), weights=field.reshape(num_time, -1).ravel(), minlength=num_time*num_labels)
+    return sums.reshape(num_time, num_labels)
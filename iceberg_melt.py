@@ -1,6 +1,7 @@
 from netCDF4 import Dataset
 from numpy import *
 from scipy.interpolate import griddata
+from output_schema import *
 
 # Read Martin and Adcroft's monthly climatology of freshwater fluxes
 # from iceberg melt, interpolate to the ROMS grid, and save as a
@@ -42,20 +43,14 @@ def iceberg_melt (out_file):
     out_id.createDimension('eta_rho', num_lat)
     out_id.createDimension('time', None)
     # Define variables
-    out_id.createVariable('lon_rho', 'f8', ('eta_rho', 'xi_rho'))
-    out_id.variables['lon_rho'].long_name = 'longitude of rho-points'
-    out_id.variables['lon_rho'].units = 'degree_east'
+    create_var(out_id, 'lon_rho', ('eta_rho', 'xi_rho'))
     out_id.variables['lon_rho'][:,:] = lon_roms
-    out_id.createVariable('lat_rho', 'f8', ('eta_rho', 'xi_rho'))
-    out_id.variables['lat_rho'].long_name = 'latitude of rho-points'
-    out_id.variables['lat_rho'].units = 'degree_north'
+    create_var(out_id, 'lat_rho', ('eta_rho', 'xi_rho'))
     out_id.variables['lat_rho'][:,:] = lat_roms
-    out_id.createVariable('time', 'f8', ('time'))
-    out_id.variables['time'].units = 'days since 1992-01-01 00:00:0.0'
-    out_id.variables['time'].cycle_length = 365.25
-    out_id.createVariable('icebergs', 'f8', ('time', 'eta_rho', 'xi_rho'))
-    out_id.variables['icebergs'].long_name = 'freshwater flux from iceberg melt'
-    out_id.variables['icebergs'].units = 'kg/m^2/s'
+    create_var(out_id, 'time', ('time'), cycle_length=365.25)
+    create_var(out_id, 'icebergs', ('time', 'eta_rho', 'xi_rho'), forcing=True)
+    # Save the whole year in one slab at the end
+    buffer = record_buffer(out_id, ['icebergs', 'time'])
 
     # Loop over months
     for month in range(12):
@@ -72,10 +67,9 @@ def iceberg_melt (out_file):
         id.close()
         # Interpolate to ROMS grid
         melt_roms = interp_iceberg2roms(melt_iceberg, lon_iceberg, lat_iceberg, lon_roms, lat_roms)
-        # Calculate time values centered in the middle of each month
-        out_id.variables['time'][month] = 365.25/12*(month+0.5)
-        # Save data
-        out_id.variables['icebergs'][month,:,:] = melt_roms
+        # Save data, with time values centered in the middle of each month
+        buffer_record(buffer, [melt_roms, 365.25/12*(month+0.5)])
+    flush_buffer(buffer)
     out_id.close()
 
 
@@ -1,5 +1,9 @@
+from netCDF4 import Dataset
 from numpy import *
+from os.path import exists
 from scipy.interpolate import LinearNDInterpolator, RectBivariateSpline
+from scipy.sparse import csr_matrix
+from scipy.spatial import Delaunay
 
 # Given an array on the ERA-Interim grid, interpolate any missing values, and
 # then interpolate to the ROMS grid.
@@ -52,3 +56,237 @@ def interp_era2roms (A, lon_era, lat_era, lon_roms, lat_roms):
     B[:,-1] = B[:,1]
 
     return B
+
+
+# Precompute the sparse matrix which interpolates any field on the ERA-Interim
+# grid to the ROMS grid, so that it can be applied to whole fields (or stacks
+# of fields) at once with a single matrix-vector product. This replaces the
+# point-by-point spline evaluation in interp_era2roms, which is very slow.
+# The source grid is assumed to be global and periodic in longitude.
+# Input:
+# lon_era = array of length n containing ERA-Interim longitude values
+# lat_era = array of length m containing ERA-Interim latitude values (either
+#           ascending or descending)
+# lon_roms = array of size pxq containing ROMS longitude values
+# lat_roms = array of size pxq containing ROMS latitude values
+# method = optional string, 'bilinear' or 'bicubic' (default; cubic
+#          convolution using the 4x4 surrounding ERA-Interim points)
+# weight_file = optional path to a NetCDF file in which to save the weights.
+#               If it already exists and matches the given grids and method,
+#               the weights will be read from it instead of recalculated.
+# Output:
+# W = sparse matrix of size (p*q) x (m*n) such that W.dot(A.ravel()) gives
+#     the values of an mxn ERA-Interim field A (dimension latitude x
+#     longitude, i.e. not transposed) on the flattened ROMS grid. The ROMS
+#     periodic boundary (first and last columns) is built into the weights.
+def era2roms_weights (lon_era, lat_era, lon_roms, lat_roms, method='bicubic', weight_file=None):
+
+    lon_era = array(lon_era, dtype=float)
+    lat_era = array(lat_era, dtype=float)
+    lon_roms = array(lon_roms, dtype=float)
+    lat_roms = array(lat_roms, dtype=float)
+    num_lon_era = size(lon_era)
+    num_lat_era = size(lat_era)
+    num_lon = size(lon_roms, 1)
+    num_lat = size(lon_roms, 0)
+    # Checksum of both grids, so we can tell if a saved weight file is stale
+    grid_sum = sum(lon_era) + 2*sum(lat_era) + 3*sum(lon_roms) + 4*sum(lat_roms)
+
+    if weight_file is not None and exists(weight_file):
+        id = Dataset(weight_file, 'r')
+        match = (id.method == method and id.num_lon_era == num_lon_era and id.num_lat_era == num_lat_era and id.num_lon_roms == num_lon and id.num_lat_roms == num_lat and abs(id.grid_sum - grid_sum) <= 1e-6*abs(grid_sum))
+        id.close()
+        if match:
+            return read_era2roms_weights(weight_file)
+
+    # Find the fractional index of each ROMS point along each ERA-Interim axis
+    # Longitude is periodic: sort into [lon_era[0], lon_era[0]+360)
+    x = mod(lon_roms.ravel() - lon_era[0], 360) + lon_era[0]
+    lon_ext = append(lon_era, lon_era[0]+360)
+    i0 = clip(searchsorted(lon_ext, x, side='right') - 1, 0, num_lon_era-1)
+    fx = (x - lon_ext[i0])/(lon_ext[i0+1] - lon_ext[i0])
+    # Latitude might be descending; flip it for the search and then map the
+    # indices back onto the original axis
+    flip = lat_era[0] > lat_era[-1]
+    if flip:
+        lat_asc = lat_era[::-1]
+    else:
+        lat_asc = lat_era
+    y = lat_roms.ravel()
+    j0 = clip(searchsorted(lat_asc, y, side='right') - 1, 0, num_lat_era-2)
+    fy = (y - lat_asc[j0])/(lat_asc[j0+1] - lat_asc[j0])
+
+    # Build the 1D stencil offsets and weights in each direction
+    if method == 'bilinear':
+        offsets = [0, 1]
+        wx = [1-fx, fx]
+        wy = [1-fy, fy]
+    elif method == 'bicubic':
+        offsets = [-1, 0, 1, 2]
+        wx = cubic_conv_weights(fx)
+        wy = cubic_conv_weights(fy)
+    else:
+        print 'Error: unknown interpolation method ' + method
+        return None
+
+    num_pts = size(x)
+    row = []
+    col = []
+    S = []
+    for a in range(len(offsets)):
+        # Longitude wraps around the periodic boundary
+        i = mod(i0 + offsets[a], num_lon_era)
+        for b in range(len(offsets)):
+            # Latitude is clamped at the poles
+            j = clip(j0 + offsets[b], 0, num_lat_era-1)
+            if flip:
+                j = num_lat_era-1-j
+            row.append(arange(num_pts))
+            col.append(j*num_lon_era + i)
+            S.append(wx[a]*wy[b])
+    row = concatenate(row)
+    col = concatenate(col)
+    S = concatenate(S)
+
+    # Enforce the ROMS periodic boundary by copying rows of the matrix:
+    # B[:,0] = B[:,-2] and B[:,-1] = B[:,1]
+    col_index = mod(row, num_lon)
+    keep = (col_index != 0)*(col_index != num_lon-1)
+    west = nonzero(col_index == num_lon-2)[0]
+    east = nonzero(col_index == 1)[0]
+    row = concatenate((row[keep], row[west]-(num_lon-2), row[east]+(num_lon-2)))
+    col = concatenate((col[keep], col[west], col[east]))
+    S = concatenate((S[keep], S[west], S[east]))
+
+    if weight_file is not None:
+        id = Dataset(weight_file, 'w')
+        id.createDimension('n_s', size(S))
+        id.method = method
+        id.num_lon_era = num_lon_era
+        id.num_lat_era = num_lat_era
+        id.num_lon_roms = num_lon
+        id.num_lat_roms = num_lat
+        id.grid_sum = grid_sum
+        id.createVariable('row', 'i4', ('n_s'))
+        id.variables['row'].long_name = 'index of ROMS point (flattened eta_rho x xi_rho)'
+        id.variables['row'][:] = row
+        id.createVariable('col', 'i4', ('n_s'))
+        id.variables['col'].long_name = 'index of ERA-Interim point (flattened latitude x longitude)'
+        id.variables['col'][:] = col
+        id.createVariable('S', 'f8', ('n_s'))
+        id.variables['S'].long_name = 'interpolation weight'
+        id.variables['S'][:] = S
+        id.close()
+
+    return csr_matrix((S, (row, col)), shape=(num_pts, num_lat_era*num_lon_era))
+
+
+# Read interpolation weights saved by era2roms_weights, without checking them
+# against the grids.
+# Input: weight_file = path to NetCDF file created by era2roms_weights
+# Output: W = sparse weight matrix (see era2roms_weights)
+def read_era2roms_weights (weight_file):
+
+    id = Dataset(weight_file, 'r')
+    num_src = id.num_lat_era*id.num_lon_era
+    num_dst = id.num_lat_roms*id.num_lon_roms
+    row = id.variables['row'][:]
+    col = id.variables['col'][:]
+    S = id.variables['S'][:]
+    id.close()
+    return csr_matrix((S, (row, col)), shape=(num_dst, num_src))
+
+
+# Cubic convolution weights (Keys 1981, a=-0.5) for the 4 points at offsets
+# -1, 0, 1, 2 from a fractional position f between points 0 and 1.
+# Input: f = array of fractional positions between 0 and 1
+# Output: list of 4 arrays of weights, each the same size as f
+def cubic_conv_weights (f):
+
+    a = -0.5
+    weights = []
+    for offset in [-1, 0, 1, 2]:
+        d = abs(f - offset)
+        near = ((a+2)*d - (a+3))*d**2 + 1
+        far = ((a*d - 5*a)*d + 8*a)*d - 4*a
+        weights.append(where(d <= 1, near, where(d < 2, far, 0.0)))
+    return weights
+
+
+# Fill missing values of ERA-Interim fields by linear interpolation from the
+# surrounding valid points (as in interp_era2roms), and then with the mean of
+# the field where that fails. The triangulation is cached and reused for every
+# record with the same pattern of missing values, so a stack of fields
+# usually only needs one triangulation, or none if nothing is missing.
+# Input: A = masked array of size mxn (latitude x longitude) or txmxn (a stack
+#            of fields) containing ERA-Interim data; missing values are masked
+# Output: Afill = array of the same size as A with missing values filled
+def fill_era_missing (A):
+
+    mask = ma.getmaskarray(A)
+    Afill = ma.getdata(A).astype(float)
+    if not mask.any():
+        return Afill
+    stack = Afill.ndim == 3
+    if not stack:
+        Afill = Afill[None,:,:]
+        mask = mask[None,:,:]
+    # Cache of triangulation weights, keyed on the pattern of missing values
+    fill_weights = {}
+    for t in range(size(Afill,0)):
+        if not mask[t,:,:].any():
+            continue
+        key = mask[t,:,:].tobytes()
+        if key not in fill_weights:
+            fill_weights[key] = era_fill_weights(mask[t,:,:])
+        F = fill_weights[key]
+        values = Afill[t,:,:].ravel()
+        values[mask[t,:,:].ravel()] = F.dot(values[~mask[t,:,:].ravel()])
+        # Fill any still-missing values with the mean
+        values[isnan(values)] = nanmean(values)
+        Afill[t,:,:] = values.reshape(shape(Afill[t,:,:]))
+    if not stack:
+        Afill = Afill[0,:,:]
+    return Afill
+
+
+# Build the sparse matrix which linearly interpolates from the valid points of
+# an ERA-Interim field to the missing points, in index space.
+# Input: mask = boolean array of size mxn, True where values are missing
+# Output: F = sparse matrix of size (number of missing points) x (number of
+#             valid points); rows outside the triangulation are NaN
+def era_fill_weights (mask):
+
+    valid = array(nonzero(~mask)).T
+    missing = array(nonzero(mask)).T
+    tri = Delaunay(valid)
+    simplex = tri.find_simplex(missing)
+    # Barycentric coordinates of each missing point in its triangle
+    T = tri.transform[simplex,:,:]
+    b = einsum('ijk,ik->ij', T[:,:2,:], missing - T[:,2,:])
+    bary = concatenate((b, 1 - sum(b, axis=1, keepdims=True)), axis=1)
+    bary[simplex < 0,:] = nan
+    row = repeat(arange(size(missing,0)), 3)
+    col = tri.simplices[simplex,:].ravel()
+    return csr_matrix((bary.ravel(), (row, col)), shape=(size(missing,0), size(valid,0)))
+
+
+# Interpolate an ERA-Interim field, or a stack of fields, to the ROMS grid
+# using weights from era2roms_weights. Missing values are filled first with
+# fill_era_missing.
+# Input:
+# W = sparse weight matrix from era2roms_weights
+# A = array of size mxn (latitude x longitude, i.e. as read straight out of
+#     the ERA-Interim file) or txmxn
+# num_lat, num_lon = dimensions of the ROMS grid
+# Output:
+# B = array of size pxq or txpxq containing values on the ROMS grid
+def apply_era2roms (W, A, num_lat, num_lon):
+
+    Afill = fill_era_missing(A)
+    if Afill.ndim == 2:
+        return W.dot(Afill.ravel()).reshape(num_lat, num_lon)
+    num_time = size(Afill, 0)
+    # One sparse matrix-matrix product for the whole stack
+    B = W.dot(Afill.reshape(num_time, -1).T).T
+    return B.reshape(num_time, num_lat, num_lon)
@@ -2,28 +2,20 @@ from netCDF4 import Dataset
 from numpy import *
 from matplotlib.pyplot import *
 from matplotlib import rcParams
+from timeseries_store import *
+from ice_shelf_regions import *
+from timeseries_massloss import calc_grid
 
 # Make a map of unexplained percent error in annually averaged simulated melt
 # rate from each ice shelf that is over 5,000 km^2 in Rignot et al., 2013.
 # Input:
 # grid_path = path to ROMS grid file
-# log_path = path to log file created by timeseries_massloss.py
+# log_path = path to timeseries store created by timeseries_massloss.py
 # save = optional boolean to save the figure to a file, rather than displaying
 #        it on the screen
 # fig_name = if save=True, path to the desired filename for the figure
 def ismr_map (grid_path, log_path, save=False, fig_name=None):
 
-    # Limits on longitude and latitude for each ice shelf
-    # These depend on the source geometry, in this case RTopo 1.05
-    # Note there is one extra index at the end of each array; this is because
-    # the Ross region crosses the line 180W and therefore is split into two
-    lon_min = [-62.67, -65.5, -79.17, -85, -104.17, -102.5, -108.33, -114.5, -135.67, -149.17, -155, 144, 115, 94.17, 80.83, 65, 33.83, 19, 12.9, 9.33, -10.05, -28.33, -180, 158.33]
-    lon_max = [-59.33, -60, -66.67, -28.33, -88.83, -99.17, -103.33, -111.5, -114.33, -140, -145, 146.62, 123.33, 102.5, 89.17, 75, 37.67, 33.33, 16.17, 12.88, 7.6, -10.33, -146.67, 180]
-    lat_min = [-73.03, -69.35, -74.17, -83.5, -73.28, -75.5, -75.5, -75.33, -74.9, -76.42, -78, -67.83, -67.17, -66.67, -67.83, -73.67, -69.83, -71.67, -70.5, -70.75, -71.83, -76.33, -85, -84.5]
-    lat_max = [-69.37, -66.13, -69.5, -74.67, -71.67, -74.17, -74.67, -73.67, -73, -75.17, -76.41, -66.67, -66.5, -64.83, -66.17, -68.33, -68.67, -68.33, -69.33, -69.83, -69.33, -71.5, -77.77, -77]
-    # Area of each ice shelf in m^2 (printed to screen during
-    # timeseries_massloss.py, update if the grid changes)
-    area = [12754001970.4, 52008964915.9, 47287926558.6, 353435138251.0, 31290573250.5, 5162051654.52, 3990382861.08, 4680996769.75, 32446806852.2, 7694313052.38, 13537287121.0, 4918446447.87, 6482036686.01, 30521756982.6, 15158334399.6, 64359735004.9, 4575785549.65, 45327465354.5, 8110511960.62, 7088165282.99, 54898163328.1, 68006982027.4, 429252991746.0]
     # Observed melt rate (Rignot 2013) and uncertainty for each ice shelf, in Gt/y
     obs_ismr = [0.1, 0.4, 3.1, 0.3, 1.7, 16.2, 17.7, 7.8, 4.3, 0.6, 1.5, 1.4, 7.7, 2.8, 1.7, 0.6, -0.4, 0.4, 0.7, 0.5, 0.5, 0.1, 0.1]
     obs_ismr_error = [0.6, 1, 0.8, 0.1, 0.6, 1, 1, 0.6, 0.4, 0.3, 0.3, 0.6, 0.7, 0.6, 0.7, 0.4, 0.6, 0.4, 0.2, 0.2, 0.2, 0.2, 0.1]
@@ -42,38 +34,19 @@ def ismr_map (grid_path, log_path, save=False, fig_name=None):
     # Minimum zice
     min_zice = -10
 
-    # Read log file
-    time = []
-    f = open(log_path, 'r')
-    # Skip the first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break
-    # Skip the values for the entire continent
-    for line in f:
-        try:
-            tmp = float(line)
-        except(ValueError):
-            break
-    # Set up array for melt rate values at each ice shelf
-    ismr_ts = empty([len(obs_ismr), len(time)])
-    index = 0
-    # Loop over ice shelves
-    while index < len(obs_ismr):
-        t = 0
-        for line in f:
-            try:
-                # Convert from mass loss to melt rate
-                ismr_ts[index, t] = float(line)*1e12/(rho_ice*area[index])
-                t += 1
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-        index +=1
+    # Calculate the area of each ice shelf from the grid, as in
+    # timeseries_massloss.py
+    dA = calc_grid(grid_path)[0]
+    members = ice_shelf_members(grid_path)
+    area = region_matrix(members[1:,:-15,1:-1], dA).dot(ones(size(dA)))
+
+    # Read timeseries store
+    time, data = read_timeseries(log_path)
+    data = dict(data)
+    # One timeseries for each ice shelf (skipping the entire continent).
+    # Convert from mass loss to melt rate.
+    names = ice_shelf_boxes()[0][1:]
+    ismr_ts = array([data[names[index] + ' Basal Mass Loss']*1e12/(rho_ice*area[index]) for index in range(len(obs_ismr))])
 
     # Find the time indices we care about: last year of simulation
     time = array(time)
@@ -102,10 +75,8 @@ def ismr_map (grid_path, log_path, save=False, fig_name=None):
     open_ocn[mask_zice==1] = 0
     land_zice = ma.masked_where(open_ocn==1, open_ocn)
 
-    # Initialise a field of ice shelf melt rate unexplained error
-    error = ma.empty(shape(lon))
-    error[:,:] = ma.masked
-
+    # Find the unexplained percent error in melt rate for each ice shelf
+    errors = zeros(len(obs_ismr))
     # Loop over ice shelves
     for index in range(len(obs_ismr)):
         # Find the range of observations
@@ -114,20 +85,18 @@ def ismr_map (grid_path, log_path, save=False, fig_name=None):
         # Find the unexplained percent error in melt rate
         if ismr[index] < ismr_low:
             # Simulated melt rate too low
-            error_tmp = (ismr[index] - ismr_low)/ismr_low*100
+            errors[index] = (ismr[index] - ismr_low)/ismr_low*100
         elif ismr[index] > ismr_high:
             # Simulated melt rate too high
-            error_tmp = (ismr[index] - ismr_high)/ismr_high*100
+            errors[index] = (ismr[index] - ismr_high)/ismr_high*100
         else:
             # Simulated mass loss within observational error estimates
-            error_tmp = 0
-        # Modify error field for this region
-        if index == len(obs_ismr)-1:
-            # Ross region is split into two
-            region = (lon >= lon_min[index])*(lon <= lon_max[index])*(lat >= lat_min[index])*(lat <= lat_max[index])*(mask_zice == 1) + (lon >= lon_min[index+1])*(lon <= lon_max[index+1])*(lat >= lat_min[index+1])*(lat <= lat_max[index+1])*(mask_zice == 1)
-        else:
-            region = (lon >= lon_min[index])*(lon <= lon_max[index])*(lat >= lat_min[index])*(lat <= lat_max[index])*(mask_zice == 1)
-        error[region] = error_tmp
+            errors[index] = 0
+    # Label each ice shelf point with its index in ice_shelf_boxes (so 0 is
+    # outside all the ice shelves, and the first ice shelf is 1) and look up
+    # the error for every point at once
+    labels = ice_shelf_labels(members[:,:-15,:-1])
+    error = ma.masked_where(labels==0, concatenate(([0], errors))[labels])
 
     # Edit zice so tiny ice shelves won't be contoured
     #zice[error.mask] = 0.0
@@ -182,7 +151,7 @@ def ismr_map (grid_path, log_path, save=False, fig_name=None):
 if __name__ == "__main__":
 
     grid_path = raw_input("Path to grid file: ")
-    log_path = raw_input("Path to mass loss logfile: ")
+    log_path = raw_input("Path to mass loss timeseries store: ")
     action = raw_input("Save figure (s) or display in window (d)? ")
     if action == 's':
         save = True
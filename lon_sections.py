@@ -0,0 +1,161 @@
+from numpy import *
+
+# Zonal sections (depth vs latitude) of ROMS fields, either interpolated to a
+# given longitude or averaged between two longitudes. The indices and weights
+# for every latitude row are found at once from the longitude grid, and can
+# then be applied to any number of fields (of any number of leading dimensions,
+# e.g. time x depth x lat x lon) with a single gather each, rather than looping
+# over rows. Longitude is handled mod 360 throughout, so it doesn't matter
+# whether the grid or the target longitude is in -180 to 180 or 0 to 360, or
+# where the periodic boundary is.
+
+# Largest spacing in longitude (degrees) between neighbouring points in a row;
+# anything bigger is the jump at the periodic boundary
+max_dlon = 5.0
+
+
+# Find the indices and coefficients to linearly interpolate every row of a
+# longitude grid to the given longitude.
+# Input:
+# lon_2d = array of longitude values, dimension lat x lon
+# lon0 = longitude to interpolate to
+# Output: dictionary containing
+# rows = indices of latitude rows (all of them)
+# ie, iw = for each row, indices of the nearest points to the east and west of
+#          lon0
+# coeffe, coeffw = for each row, coefficients such that
+#                  coeffe*lon[ie] + coeffw*lon[iw] = lon0 (mod 360), which will
+#                  also hold for any variable on this grid
+# dlon = for each row, spacing in longitude between iw and ie
+def lon_section (lon_2d, lon0):
+
+    lon_2d = ma.filled(lon_2d, 0)
+    num_lat = size(lon_2d, 0)
+    num_lon = size(lon_2d, 1)
+    # Spacing from each point to the next one east, wrapping around at the end
+    # of the row
+    step = mod(roll(lon_2d, -1, axis=1) - lon_2d, 360)
+    # Distance east from each point to lon0
+    dist = mod(lon0 - lon_2d, 360)
+    # Pairs of points which lon0 falls between
+    inside = (dist < step)*(step < max_dlon)
+    if not all(any(inside, axis=1)):
+        print 'Error: longitude ' + str(lon0) + ' is not between two points in every row'
+        return None
+    rows = arange(num_lat)
+    # Take the last pair in each row (if the grid has overlapping periodic
+    # boundary columns there can be two, which are equivalent)
+    iw = num_lon - 1 - argmax(inside[:,::-1], axis=1)
+    ie = mod(iw+1, num_lon)
+    dlon = step[rows,iw]
+    coeffe = dist[rows,iw]/dlon
+    return {'rows':rows, 'ie':ie, 'iw':iw, 'coeffe':coeffe, 'coeffw':1-coeffe, 'dlon':dlon}
+
+
+# Interpolate a field to the longitude of a section.
+# Input:
+# section = dictionary from lon_section
+# data = array of any dimension ... x lat x lon
+# Output: array of dimension ... x rows
+def apply_lon_section (section, data):
+
+    rows = section['rows']
+    return section['coeffe']*data[...,rows,section['ie']] + section['coeffw']*data[...,rows,section['iw']]
+
+
+# Find the weights to average every row of a longitude grid between two
+# longitudes. The ends (from each longitude bound to the nearest point inside)
+# are integrated with the trapezoidal rule, and the points in between with the
+# regular spacing of the row. Each weight is "gated" by the points which have
+# to be unmasked for it to count, so land points drop out of the average: the
+# points in between by themselves, and each end by both of the points it is
+# interpolated from.
+# Input:
+# lon_2d = array of longitude values, dimension lat x lon
+# lon_bounds = longitudes to average between, stored as an array of size 2 with
+#              the western bound first (can cross the periodic boundary)
+# Output: dictionary containing
+# rows = indices of latitude rows (all of them)
+# index = points (lat x n) contributing to each row, padded with zero weights
+# weight = weight of each point
+# gate, gate2 = points which must be unmasked for each weight to count
+# length = distance in longitude covered by each weight, whose sum (over the
+#          weights that count) the weighted sum is divided by
+def lon_band (lon_2d, lon_bounds):
+
+    west = lon_section(lon_2d, lon_bounds[0])
+    east = lon_section(lon_2d, lon_bounds[1])
+    if west is None or east is None:
+        return None
+    lon_2d = ma.filled(lon_2d, 0)
+    num_lat = size(lon_2d, 0)
+    num_lon = size(lon_2d, 1)
+    rows = arange(num_lat)
+    # Regular spacing of each row, not counting the periodic boundary
+    step = mod(roll(lon_2d, -1, axis=1) - lon_2d, 360)
+    dlon = nanmedian(where(step < max_dlon, step, nan), axis=1)
+    # Points in between the two ends: from the first point east of the western
+    # bound, up to but not including the first point east of the eastern bound
+    istart = west['ie']
+    num_mid = mod(east['ie'] - istart, num_lon)
+    num_weights = amax(num_mid) + 4
+    index = zeros([num_lat, num_weights], dtype=int)
+    weight = zeros([num_lat, num_weights])
+    gate = zeros([num_lat, num_weights], dtype=int)
+    gate2 = zeros([num_lat, num_weights], dtype=int)
+    length = zeros([num_lat, num_weights])
+
+    # Western end: trapezoid between the western bound (interpolated) and the
+    # first point east of it
+    dlon_w = west['dlon']*west['coeffw']
+    index[:,0] = west['ie']
+    weight[:,0] = 0.5*dlon_w*(1 + west['coeffe'])
+    length[:,0] = dlon_w
+    index[:,1] = west['iw']
+    weight[:,1] = 0.5*dlon_w*west['coeffw']
+    gate[:,:2] = west['ie'][:,None]
+    gate2[:,:2] = west['iw'][:,None]
+    # Eastern end: trapezoid between the last point west of the eastern bound
+    # and the eastern bound (interpolated)
+    dlon_e = east['dlon']*east['coeffe']
+    index[:,2] = east['iw']
+    weight[:,2] = 0.5*dlon_e*(1 + east['coeffw'])
+    length[:,2] = dlon_e
+    index[:,3] = east['ie']
+    weight[:,3] = 0.5*dlon_e*east['coeffe']
+    gate[:,2:4] = east['iw'][:,None]
+    gate2[:,2:4] = east['ie'][:,None]
+    # Points in between, wrapping around the periodic boundary if needed
+    k = arange(num_weights-4)
+    mid = k[None,:] < num_mid[:,None]
+    index[:,4:] = where(mid, mod(istart[:,None] + k[None,:], num_lon), 0)
+    gate[:,4:] = index[:,4:]
+    gate2[:,4:] = index[:,4:]
+    weight[:,4:] = where(mid, dlon[:,None], 0)
+    length[:,4:] = weight[:,4:]
+    return {'rows':rows, 'index':index, 'weight':weight, 'gate':gate, 'gate2':gate2, 'length':length}
+
+
+# Average a field between the longitude bounds of a band.
+# Input:
+# band = dictionary from lon_band
+# data = array of any dimension ... x lat x lon
+# gate_mask = optional boolean array of the same dimension as data (or
+#             broadcastable to it), True at points to leave out (default: the
+#             mask of data). Pass the mask of another variable to average
+#             unmasked fields (e.g. z) over the same points.
+# Output: masked array of dimension ... x rows, masked where there are no
+#         points to average, or where a point which counts is masked
+def apply_lon_band (band, data, gate_mask=None):
+
+    rows = band['rows'][:,None]
+    values = data[...,rows,band['index']]
+    if gate_mask is None:
+        gate_mask = ma.getmaskarray(data)
+    gate_mask = broadcast_to(gate_mask, shape(data))
+    count = invert(gate_mask[...,rows,band['gate']] + gate_mask[...,rows,band['gate2']])
+    weight = band['weight']*count
+    length = sum(band['length']*count, axis=-1)
+    total = sum(ma.filled(values, 0)*weight, axis=-1)
+    mask = any(ma.getmaskarray(values)*(weight != 0), axis=-1) + (length == 0)
+    return ma.array(total/where(length == 0, 1, length), mask=mask)
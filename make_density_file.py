@@ -1,15 +1,24 @@
 from netCDF4 import Dataset
 from numpy import *
-from calc_z import *
+from grid_cache import *
 from unesco import *
+from output_schema import *
 
 # Given an ocean history or averages file with temperature and salinity data,
 # calculate density fields at each timestep using the 1980 UNESCO seawater
-# equation of state. Save in a new file.
+# equation of state. Save in a new file. Records are processed a block at a
+# time, and the pressure on the grid is only calculated once.
 # Input:
 # input_file = path to ocean history/averages file
 # output_file = desired path to new density file
-def make_density_file (input_file, output_file):
+# sigma_theta = optional boolean: save potential density anomaly (pressure
+#               zero, minus 1000 kg/m^3) instead of in-situ density (default
+#               False)
+# single_precision = optional boolean: save in single precision, which is
+#                    plenty for density and half the size (default False)
+# block_size = optional number of time records to process at once (default
+#              10)
+def make_density_file (input_file, output_file, sigma_theta=False, single_precision=False, block_size=10):
 
     # Grid parameters
     theta_s = 7.0
@@ -17,19 +26,11 @@ def make_density_file (input_file, output_file):
     hc = 250
     N = 31
 
-    # Read grid variables
-    in_id = Dataset(input_file, 'r')
-    h = in_id.variables['h'][:,:]
-    zice = in_id.variables['zice'][:,:]
-    lon = in_id.variables['lon_rho'][:,:]
-    lat = in_id.variables['lat_rho'][:,:]
-    num_lon = size(lon, 1)
-    num_lat = size(lon, 0)
-
-    # Get a 3D array of z-coordinates (metres)
-    z, sc_r, Cs_r = calc_z(h, zice, theta_s, theta_b, hc, N)
-    # Pressure is approximately equal to |z|/10
-    press = abs(z)/10.0
+    # Read grid variables (the history file contains the grid)
+    geom = grid_geometry(input_file, theta_s, theta_b, hc, N)
+    press = grid_pressure(geom)
+    num_lon = size(geom['lon'], 1)
+    num_lat = size(geom['lon'], 0)
 
     # Set up output file
     out_id = Dataset(output_file, 'w')
@@ -39,43 +40,84 @@ def make_density_file (input_file, output_file):
     out_id.createDimension('s_rho', N)
     out_id.createDimension('ocean_time', None)
     # Define variables
-    out_id.createVariable('lon_rho', 'f8', ('eta_rho', 'xi_rho'))
-    out_id.variables['lon_rho'][:,:] = lon
-    out_id.createVariable('lat_rho', 'f8', ('eta_rho', 'xi_rho'))
-    out_id.variables['lat_rho'][:,:] = lat
-    out_id.createVariable('sc_r', 'f8', ('s_rho'))
-    out_id.variables['sc_r'].long_name = 'S-coordinate at rho-points'
-    out_id.variables['sc_r'][:] = sc_r
-    out_id.createVariable('ocean_time', 'f8', ('ocean_time'))
-    out_id.variables['ocean_time'].units = 'seconds'
-    out_id.createVariable('rho', 'f8', ('ocean_time', 's_rho', 'eta_rho', 'xi_rho'))
-    out_id.variables['rho'].long_name = 'density'
-    out_id.variables['rho'].units = 'kg/m^3'
+    create_var(out_id, 'lon_rho', ('eta_rho', 'xi_rho'))
+    out_id.variables['lon_rho'][:,:] = geom['lon']
+    create_var(out_id, 'lat_rho', ('eta_rho', 'xi_rho'))
+    out_id.variables['lat_rho'][:,:] = geom['lat']
+    create_var(out_id, 'sc_r', ('s_rho'))
+    out_id.variables['sc_r'][:] = geom['s']
+    create_var(out_id, 'ocean_time', ('ocean_time'))
+    if single_precision:
+        dtype = 'f4'
+    else:
+        dtype = 'f8'
+    if sigma_theta:
+        create_var(out_id, 'rho', ('ocean_time', 's_rho', 'eta_rho', 'xi_rho'), dtype=dtype, long_name='potential density anomaly (sigma-theta)')
+    else:
+        create_var(out_id, 'rho', ('ocean_time', 's_rho', 'eta_rho', 'xi_rho'), dtype=dtype)
 
+    in_id = Dataset(input_file, 'r')
     # Read time values from input file
     time = in_id.variables['ocean_time'][:]
+    num_time = size(time)
 
-    # Process each timestep individually to conserve memory
-    for t in range(size(time)):
-        print 'Processing timestep '+str(t+1)+' of '+str(size(time))
-        # Set a new time value in the output file
-        out_id.variables['ocean_time'][t] = time[t]
-        # Read temperature and salinity (convert to float128 to prevent
-        # overflow in UNESCO calculations)
-        temp = ma.asarray(in_id.variables['temp'][t,:,:,:], dtype=float128)
-        salt = ma.asarray(in_id.variables['salt'][t,:,:,:], dtype=float128)
+    # Process a block of timesteps at a time to conserve memory
+    start_t = 0
+    while start_t < num_time:
+        end_t = minimum(start_t+block_size, num_time)
+        print 'Processing timesteps '+str(start_t+1)+' to '+str(end_t)+' of '+str(num_time)
+        out_id.variables['ocean_time'][start_t:end_t] = time[start_t:end_t]
         # Magic happens here
-        rho = unesco(temp, salt, press)
-        # Save the results for this timestep
-        out_id.variables['rho'][t,:,:,:] = rho
+        out_id.variables['rho'][start_t:end_t,:,:,:] = roms_density(in_id, press, start_t, end_t, sigma_theta=sigma_theta)
+        start_t = end_t
 
     in_id.close()
     out_id.close()
 
 
+# Get the pressure (approximately |z|/10, in bar) at the cell midpoints of a
+# ROMS grid. It is saved in the geometry dictionary so it is only calculated
+# once for each grid in the cache.
+# Input: geom = dictionary from grid_geometry in grid_cache.py
+# Output: 3D array of pressure (depth x latitude x longitude)
+def grid_pressure (geom):
+
+    if 'press' not in geom:
+        geom['press'] = abs(geom['z_rho'])/10.0
+    return geom['press']
+
+
+# Calculate density for a range of time records of a ROMS history/averages
+# file, for the whole grid or just part of it (e.g. the surface, the bottom,
+# or a section), without saving it anywhere. Only the temperature and
+# salinity needed are read.
+# Input:
+# id = open Dataset
+# press = 3D array of pressure on the whole grid, from grid_pressure
+# t_start, t_end = range of time records to read
+# k, j, i = optional indices (integers or slices) of depth, latitude, and
+#           longitude to calculate density at, e.g. k=-1 for the surface, k=0
+#           for the bottom, j=j0 for a zonal section (default all)
+# sigma_theta = optional boolean: calculate potential density anomaly
+#               (pressure zero, minus 1000 kg/m^3) instead of in-situ density
+#               (default False)
+# Output: array of density (time x whatever dimensions k, j, i leave)
+def roms_density (id, press, t_start, t_end, k=slice(None), j=slice(None), i=slice(None), sigma_theta=False):
+
+    temp = id.variables['temp'][t_start:t_end,k,j,i]
+    salt = id.variables['salt'][t_start:t_end,k,j,i]
+    if sigma_theta:
+        return unesco(temp, salt, 0) - 1000
+    return unesco(temp, salt, press[k,j,i])
+
+
 # Command-line interface
 if __name__ == "__main__":
 
     input_file = raw_input("Path to ocean history/averages file: ")
     output_file = raw_input("Desired path to new density file: ")
-    make_density_file(input_file, output_file)
+    action = raw_input("Save in-situ density (r) or sigma-theta (s)? ")
+    sigma_theta = action == 's'
+    action = raw_input("Save in single precision (y/n)? ")
+    single_precision = action == 'y'
+    make_density_file(input_file, output_file, sigma_theta, single_precision)
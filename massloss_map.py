@@ -2,25 +2,19 @@ from netCDF4 import Dataset
 from numpy import *
 from matplotlib.pyplot import *
 from matplotlib import rcParams
+from timeseries_store import *
+from ice_shelf_regions import *
 
 # Make a map of unexplained percent error in annually averaged simulated basal
 # mass loss from each ice shelf that is over 5,000 km^2 in Rignot et al., 2013.
 # Input:
 # grid_path = path to ROMS grid file
-# log_path = path to log file created by timeseries_massloss.py
+# log_path = path to timeseries store created by timeseries_massloss.py
 # save = optional boolean to save the figure to a file, rather than displaying
 #        it on the screen
 # fig_name = if save=True, path to the desired filename for the figure
 def massloss_map (grid_path, log_path, save=False, fig_name=None):
 
-    # Limits on longitude and latitude for each ice shelf
-    # These depend on the source geometry, in this case RTopo 1.05
-    # Note there is one extra index at the end of each array; this is because
-    # the Ross region crosses the line 180W and therefore is split into two
-    lon_min = [-62.67, -65.5, -79.17, -85, -104.17, -102.5, -108.33, -114.5, -135.67, -149.17, -155, 144, 115, 94.17, 80.83, 65, 33.83, 19, 12.9, 9.33, -10.05, -28.33, -181, 158.33]
-    lon_max = [-59.33, -60, -66.67, -28.33, -88.83, -99.17, -103.33, -111.5, -114.33, -140, -145, 146.62, 123.33, 102.5, 89.17, 75, 37.67, 33.33, 16.17, 12.88, 7.6, -10.33, -146.67, 181]
-    lat_min = [-73.03, -69.35, -74.17, -83.5, -73.28, -75.5, -75.5, -75.33, -74.9, -76.42, -78, -67.83, -67.17, -66.67, -67.83, -73.67, -69.83, -71.67, -70.5, -70.75, -71.83, -76.33, -85, -84.5]
-    lat_max = [-69.37, -66.13, -69.5, -74.67, -71.67, -74.17, -74.67, -73.67, -73, -75.17, -76.41, -66.67, -66.5, -64.83, -66.17, -68.33, -68.67, -68.33, -69.33, -69.83, -69.33, -71.5, -77.77, -77]
     # Observed mass loss (Rignot 2013) and uncertainty for each ice shelf, in Gt/y
     obs_massloss = [1.4, 20.7, 135.4, 155.4, 51.8, 101.2, 97.5, 45.2, 144.9, 4.2, 18.2, 7.9, 90.6, 72.6, 27.2, 35.5, -2, 21.6, 6.3, 3.9, 26.8, 9.7, 47.7]
     obs_massloss_error = [14, 67, 40, 45, 19, 8, 7, 4, 14, 2, 3, 3, 8, 15, 10, 23, 3, 18, 2, 2, 14, 16, 34]
@@ -37,37 +31,12 @@ def massloss_map (grid_path, log_path, save=False, fig_name=None):
     # Minimum zice
     min_zice = -10
 
-    # Read log file
-    time = []
-    f = open(log_path, 'r')
-    # Skip the first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break
-    # Skip the values for the entire continent
-    for line in f:
-        try:
-            tmp = float(line)
-        except(ValueError):
-            break
-    # Set up array for mass loss values at each ice shelf
-    massloss_ts = empty([len(obs_massloss), len(time)])
-    index = 0
-    # Loop over ice shelves
-    while index < len(obs_massloss):
-        t = 0
-        for line in f:
-            try:
-                massloss_ts[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                # Reached the header for the next ice shelf
-                break
-        index +=1
+    # Read timeseries store
+    time, data = read_timeseries(log_path)
+    data = dict(data)
+    # One timeseries for each ice shelf (skipping the entire continent)
+    names = ice_shelf_boxes()[0][1:]
+    massloss_ts = array([data[names[index] + ' Basal Mass Loss'] for index in range(len(obs_massloss))])
 
     # Find the time indices we care about: last year of simulation
     time = array(time)
@@ -96,10 +65,8 @@ def massloss_map (grid_path, log_path, save=False, fig_name=None):
     open_ocn[mask_zice==1] = 0
     land_zice = ma.masked_where(open_ocn==1, open_ocn)
 
-    # Initialise a field of ice shelf mass loss unexplained percent error
-    error = ma.empty(shape(lon))
-    error[:,:] = ma.masked
-
+    # Find the unexplained percent error in mass loss for each ice shelf
+    errors = zeros(len(obs_massloss))
     # Loop over ice shelves
     for index in range(len(obs_massloss)):
         # Find the range of observations
@@ -108,20 +75,18 @@ def massloss_map (grid_path, log_path, save=False, fig_name=None):
         # Find the unexplained percent error in mass loss
         if massloss[index] < massloss_low:
             # Simulated mass loss too low
-            error_tmp = (massloss[index] - massloss_low)/massloss_low*100
+            errors[index] = (massloss[index] - massloss_low)/massloss_low*100
         elif massloss[index] > massloss_high:
             # Simulated mass loss too high
-            error_tmp = (massloss[index] - massloss_high)/massloss_high*100
+            errors[index] = (massloss[index] - massloss_high)/massloss_high*100
         else:
             # Simulated mass loss within observational error estimates
-            error_tmp = 0
-        # Modify error field for this region
-        if index == len(obs_massloss)-1:
-            # Ross region is split into two
-            region = (lon >= lon_min[index])*(lon <= lon_max[index])*(lat >= lat_min[index])*(lat <= lat_max[index])*(mask_zice == 1) + (lon >= lon_min[index+1])*(lon <= lon_max[index+1])*(lat >= lat_min[index+1])*(lat <= lat_max[index+1])*(mask_zice == 1)
-        else:
-            region = (lon >= lon_min[index])*(lon <= lon_max[index])*(lat >= lat_min[index])*(lat <= lat_max[index])*(mask_zice == 1)
-        error[region] = error_tmp
+            errors[index] = 0
+    # Label each ice shelf point with its index in ice_shelf_boxes (so 0 is
+    # outside all the ice shelves, and the first ice shelf is 1) and look up
+    # the error for every point at once
+    labels = ice_shelf_labels(ice_shelf_members(grid_path)[:,:-15,:-1])
+    error = ma.masked_where(labels==0, concatenate(([0], errors))[labels])
 
     # Edit zice so tiny ice shelves won't be contoured
     zice[error.mask] = 0.0
@@ -176,7 +141,7 @@ def massloss_map (grid_path, log_path, save=False, fig_name=None):
 if __name__ == "__main__":
 
     grid_path = raw_input("Path to grid file: ")
-    log_path = raw_input("Path to mass loss logfile: ")
+    log_path = raw_input("Path to mass loss timeseries store: ")
     action = raw_input("Save figure (s) or display in window (d)? ")
     if action == 's':
         save = True
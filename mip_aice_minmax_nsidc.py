@@ -8,6 +8,7 @@ import sys
 sys.path.insert(0, '/short/y99/kaa561/fesomtools')
 from patches import *
 from monthly_avg import *
+from timeseries_store import *
 
 # Make a 4x2 plot showing February (top) and September (bottom) sea ice
 # concentration (1992-2015 average) for NSIDC, MetROMS, and FESOM. The fourth
@@ -16,7 +17,7 @@ from monthly_avg import *
 # Input:
 # cice_file = path to CICE output file containing 5-day averages for the entire
 #             simulation
-# cice_log = path to CICE logfile from timeseries_seaice_extent.py
+# cice_log = path to CICE timeseries store from timeseries_seaice_extent.py
 # fesom_mesh_path_lr, fesom_mesh_path_hr = paths to FESOM mesh directories for
 #                     low-res and high-res mesh respectively
 # fesom_output_dir_lr, fesom_output_dir_hr = paths to FESOM output directories
@@ -174,19 +175,9 @@ def mip_aice_minmax_nsidc (cice_file, cice_log, fesom_mesh_path_lr, fesom_output
     cice_y = (cice_lat+90)*sin(cice_lon*deg2rad+pi/2)
 
     # Now get extent timeseries
-    # Read 5-day logfile
-    cice_time_vals = []
-    cice_extent_5day = []
-    f = open(cice_log, 'r')
-    f.readline()
-    for line in f:
-        try:
-            cice_time_vals.append(float(line))
-        except(ValueError):
-            break
-    for line in f:
-        cice_extent_5day.append(float(line))
-    f.close()
+    # Read 5-day timeseries store
+    cice_time_vals, data = read_timeseries(cice_log)
+    cice_extent_5day = dict(data)['Sea Ice Extent (million km^2)']
     # Convert time to Date objects
     cice_time = num2date(array(cice_time_vals)*365.25, units='days since 1992-01-01 00:00:00', calendar='gregorian')
     # Initialise integral arrays for monthly averages
@@ -459,7 +450,7 @@ def mip_aice_minmax_nsidc (cice_file, cice_log, fesom_mesh_path_lr, fesom_output
 if __name__ == "__main__":
 
     cice_file = raw_input("Path to CICE output file containing data for the entire simulation: ")
-    cice_log = raw_input("Path to CICE sea ice extent logfile: ")
+    cice_log = raw_input("Path to CICE sea ice extent timeseries store: ")
     fesom_mesh_path_lr = raw_input("Path to FESOM low-res mesh directory: ")
     fesom_output_dir_lr = raw_input("Path to FESOM low-res output directory containing one ice.mean.nc file for each year: ")
     fesom_log_lr = raw_input("Path to FESOM low-res sea ice extent logfile: ")
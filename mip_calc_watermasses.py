@@ -1,9 +1,7 @@
 from netCDF4 import Dataset
 from numpy import *
 from cartesian_grid_3d import *
-import sys
-sys.path.insert(0, '/short/y99/kaa561/fesomtools')
-from fesom_grid import *
+from fesom_mesh import *
 
 def mip_calc_watermasses (roms_grid, roms_file, fesom_mesh_lr, fesom_mesh_hr, fesom_file_lr, fesom_file_hr):
 
@@ -23,248 +21,31 @@ def mip_calc_watermasses (roms_grid, roms_file, fesom_mesh_lr, fesom_mesh_hr, fe
     cross_180 = False
 
     print 'Processing MetROMS'
-    # Read ROMS grid variables we need
-    id = Dataset(roms_grid, 'r')
-    roms_lon = id.variables['lon_rho'][:,:]
-    roms_lat = id.variables['lat_rho'][:,:]
-    roms_h = id.variables['h'][:,:]
-    roms_zice = id.variables['zice'][:,:]
-    id.close()
-    num_lat = size(roms_lat, 0)
-    num_lon = size(roms_lon, 1)
-    # Get integrands on 3D grid
-    roms_dx, roms_dy, roms_dz, roms_z = cartesian_grid_3d(roms_lon, roms_lat, roms_h, roms_zice, theta_s, theta_b, hc, N)
-    # Get volume integrand
-    dV = roms_dx*roms_dy*roms_dz
-    # Read ROMS output
-    id = Dataset(roms_file, 'r')
-    roms_temp = id.variables['temp'][0,:,:,:]
-    roms_salt = id.variables['salt'][0,:,:,:]
-    id.close()
-    # Initialise volume of each water mass in each sector
-    roms_vol_watermass = zeros([num_watermasses, num_sectors])
-    # Calculate water mass breakdown
-    for j in range(num_lat):
-        for i in range(num_lon):
-            # Select ice shelf points
-            if roms_zice[j,i] < 0:
-                # Figure out which sector this point falls into
-                lon = roms_lon[j,i]
-                if lon > 180:
-                    lon -= 360
-                lat = roms_lat[j,i]
-                if lon >= -85 and lon < -30 and lat < -74:
-                    # Filchner-Ronne
-                    sector = 0
-                elif lon >= -30 and lon < 65:
-                    # Eastern Weddell region
-                    sector = 1
-                elif lon >= 65 and lon < 76:
-                    # Amery
-                    sector = 2
-                elif lon >= 76 and lon < 165 and lat >= -74:
-                    # Australian sector
-                    sector = 3
-                elif (lon >= 155 and lon < 165 and lat < -74) or (lon >= 165) or (lon < -140):
-                    # Ross Sea
-                    sector = 4
-                elif (lon >= -140 and lon < -105) or (lon >= -105 and lon < -98 and lat < -73.1):
-                    # Amundsen Sea
-                    sector = 5
-                elif (lon >= -104 and lon < -98 and lat >= -73.1) or (lon >= -98 and lon < -66 and lat >= -75):
-                    # Bellingshausen Sea
-                    sector = 6
-                elif lon >= -66 and lon < -59 and lat >= -74:
-                    # Larsen Ice Shelves
-                    sector = 7
-                else:
-                    print 'No region found for lon=',str(lon),', lat=',str(lat)
-                    break #return
-                # Loop downward
-                for k in range(N):
-                    curr_temp = roms_temp[k,j,i]
-                    curr_salt = roms_salt[k,j,i]
-                    curr_volume = dV[k,j,i]
-                    # Get surface freezing point at this salinity
-                    curr_tfrz = curr_salt/(-18.48 + 18.48/1e3*curr_salt)
-                    # Figure out what water mass this is
-                    if curr_temp < curr_tfrz:
-                        # ISW
-                        wm_key = 0
-                    elif curr_salt < 34:
-                        # AASW
-                        wm_key = 1
-                    elif curr_temp > 0:
-                        # CDW
-                        wm_key = 2
-                    elif curr_temp > -1:
-                        # MCDW
-                        wm_key = 3
-                    elif curr_salt < 34.5:
-                        # WW
-                        wm_key = 4
-                    else:
-                        # HSSW
-                        wm_key = 5
-                    # Integrate volume for the right water mass and sector
-                    roms_vol_watermass[wm_key, sector] += curr_volume
-                    # Also integrate total Antarctica
-                    roms_vol_watermass[wm_key, -1] += curr_volume
-    # Find total volume of each sector by adding up the volume of each
-    # water mass
-    roms_vol_sectors = sum(roms_vol_watermass, axis=0)
+    # Volume of each water mass in each sector, for the first record
+    roms_vol_watermass = roms_watermass_volumes(roms_grid, roms_file, theta_s, theta_b, hc, N, num_watermasses, num_sectors, t_end=1)[0,:,:]
     # Calculate percentage of each water mass in each sector
-    roms_percent_watermass = zeros([num_watermasses, num_sectors])
-    for wm_key in range(num_watermasses):
-        for sector in range(num_sectors):
-            roms_percent_watermass[wm_key, sector] = roms_vol_watermass[wm_key, sector]/roms_vol_sectors[sector]*100                
+    roms_percent_watermass = watermass_percent(roms_vol_watermass)
 
     print 'Processing low-res FESOM'
     # Build mesh
-    elements_lr = fesom_grid(fesom_mesh_lr, circumpolar, cross_180)
+    mesh_lr = fesom_mesh(fesom_mesh_lr, circumpolar, cross_180)
+    prisms_lr = fesom_cavity_prisms(mesh_lr)
     id = Dataset(fesom_file_lr, 'r')
     temp_nodes_lr = id.variables['temp'][0,:]
     salt_nodes_lr = id.variables['salt'][0,:]
     id.close()
-    fesom_vol_watermass_lr = zeros([num_watermasses, num_sectors])
-    for i in range(len(elements_lr)):
-        elm = elements_lr[i]
-        if elm.cavity:
-            lon = mean(elm.lon)
-            lat = mean(elm.lat)
-            if lon >= -85 and lon < -30 and lat < -74:
-                sector = 0
-            elif lon >= -30 and lon < 65:
-                sector = 1
-            elif lon >= 65 and lon < 76:
-                sector = 2
-            elif lon >= 76 and lon < 165 and lat >= -74:
-                sector = 3
-            elif (lon >= 155 and lon < 165 and lat < -74) or (lon >= 165) or (lon < -140):
-                sector = 4
-            elif (lon >= -140 and lon < -105) or (lon >= -105 and lon < -98 and lat < -73.1):
-                sector = 5
-            elif (lon >= -104 and lon < -98 and lat >= -73.1) or (lon >= -98 and lon < -66 and lat >= -75):
-                sector = 6
-            elif lon >= -66 and lon < -59 and lat >= -74:
-                sector = 7
-            else:
-                print 'No region found for lon=',str(lon),', lat=',str(lat)
-                break #return
-            # Get area of 2D element
-            area = elm.area()
-            nodes = [elm.nodes[0], elm.nodes[1], elm.nodes[2]]
-            # Loop downward
-            while True:
-                if nodes[0].below is None or nodes[1].below is None or nodes[2].below is None:
-                    # Reached the bottom
-                    break
-                # Calculate average temperature, salinity, and
-                # layer thickness for this 3D triangular prism
-                temp_vals = []
-                salt_vals = []
-                dz_vals = []
-                for n in range(3):
-                    temp_vals.append(temp_nodes_lr[nodes[n].id])
-                    salt_vals.append(salt_nodes_lr[nodes[n].id])
-                    temp_vals.append(temp_nodes_lr[nodes[n].below.id])
-                    salt_vals.append(salt_nodes_lr[nodes[n].below.id])
-                    dz_vals.append(abs(nodes[n].depth - nodes[n].below.depth))
-                    # Get ready for next iteration of loop
-                    nodes[n] = nodes[n].below
-                curr_temp = mean(array(temp_vals))
-                curr_salt = mean(array(salt_vals))
-                curr_volume = area*mean(array(dz_vals))
-                curr_tfrz = -0.0575*curr_salt + 1.7105e-3*sqrt(curr_salt**3) - 2.155e-4*curr_salt**2
-                if curr_temp < curr_tfrz:
-                    wm_key = 0
-                elif curr_salt < 34:
-                    wm_key = 1
-                elif curr_temp > 0:
-                    wm_key = 2
-                elif curr_temp > -1:
-                    wm_key = 3
-                elif curr_salt < 34.5:
-                    wm_key = 4
-                else:
-                    wm_key = 5
-                fesom_vol_watermass_lr[wm_key, sector] += curr_volume
-                fesom_vol_watermass_lr[wm_key, -1] += curr_volume
-    fesom_vol_sectors_lr = sum(fesom_vol_watermass_lr, axis=0)
-    fesom_percent_watermass_lr = zeros([num_watermasses, num_sectors])
-    for wm_key in range(num_watermasses):
-        for sector in range(num_sectors):
-            fesom_percent_watermass_lr[wm_key, sector] = fesom_vol_watermass_lr[wm_key, sector]/fesom_vol_sectors_lr[sector]*100
+    fesom_vol_watermass_lr = fesom_watermass_volumes(prisms_lr, temp_nodes_lr, salt_nodes_lr, num_watermasses, num_sectors)
+    fesom_percent_watermass_lr = watermass_percent(fesom_vol_watermass_lr)
 
     print 'Processing high-res FESOM'
-    elements_hr = fesom_grid(fesom_mesh_hr, circumpolar, cross_180)
-    fesom_vol_watermass_hr = zeros([num_watermasses, num_sectors])
+    mesh_hr = fesom_mesh(fesom_mesh_hr, circumpolar, cross_180)
+    prisms_hr = fesom_cavity_prisms(mesh_hr)
     id = Dataset(fesom_file_hr, 'r')
     temp_nodes_hr = id.variables['temp'][0,:]
     salt_nodes_hr = id.variables['salt'][0,:]
     id.close()
-    for i in range(len(elements_hr)):
-        elm = elements_hr[i]
-        if elm.cavity:
-            lon = mean(elm.lon)
-            lat = mean(elm.lat)
-            if lon >= -85 and lon < -30 and lat < -74:
-                sector = 0
-            elif lon >= -30 and lon < 65:
-                sector = 1
-            elif lon >= 65 and lon < 76:
-                sector = 2
-            elif lon >= 76 and lon < 165 and lat >= -74:
-                sector = 3
-            elif (lon >= 155 and lon < 165 and lat < -74) or (lon >= 165) or (lon < -140):
-                sector = 4
-            elif (lon >= -140 and lon < -105) or (lon >= -105 and lon < -98 and lat < -73.1):
-                sector = 5
-            elif (lon >= -104 and lon < -98 and lat >= -73.1) or (lon >= -98 and lon < -66 and lat >= -75):
-                sector = 6
-            elif lon >= -66 and lon < -59 and lat >= -74:
-                sector = 7
-            else:
-                print 'No region found for lon=',str(lon),', lat=',str(lat)
-                break #return
-            area = elm.area()
-            nodes = [elm.nodes[0], elm.nodes[1], elm.nodes[2]]
-            while True:
-                if nodes[0].below is None or nodes[1].below is None or nodes[2].below is None:
-                    break
-                temp_vals = []
-                salt_vals = []
-                dz_vals = []
-                for n in range(3):
-                    temp_vals.append(temp_nodes_hr[nodes[n].id])
-                    salt_vals.append(salt_nodes_hr[nodes[n].id])
-                    temp_vals.append(temp_nodes_hr[nodes[n].below.id])
-                    salt_vals.append(salt_nodes_hr[nodes[n].below.id])
-                    dz_vals.append(abs(nodes[n].depth - nodes[n].below.depth))
-                    nodes[n] = nodes[n].below
-                curr_temp = mean(array(temp_vals))
-                curr_salt = mean(array(salt_vals))
-                curr_volume = area*mean(array(dz_vals))
-                curr_tfrz = -0.0575*curr_salt + 1.7105e-3*sqrt(curr_salt**3) - 2.155e-4*curr_salt**2
-                if curr_temp < curr_tfrz:
-                    wm_key = 0
-                elif curr_salt < 34:
-                    wm_key = 1
-                elif curr_temp > 0:
-                    wm_key = 2
-                elif curr_temp > -1:
-                    wm_key = 3
-                elif curr_salt < 34.5:
-                    wm_key = 4
-                else:
-                    wm_key = 5
-                fesom_vol_watermass_hr[wm_key, sector] += curr_volume
-                fesom_vol_watermass_hr[wm_key, -1] += curr_volume
-    fesom_vol_sectors_hr = sum(fesom_vol_watermass_hr, axis=0)
-    fesom_percent_watermass_hr = zeros([num_watermasses, num_sectors])
-    for wm_key in range(num_watermasses):
-        for sector in range(num_sectors):
-            fesom_percent_watermass_hr[wm_key, sector] = fesom_vol_watermass_hr[wm_key, sector]/fesom_vol_sectors_hr[sector]*100
+    fesom_vol_watermass_hr = fesom_watermass_volumes(prisms_hr, temp_nodes_hr, salt_nodes_hr, num_watermasses, num_sectors)
+    fesom_percent_watermass_hr = watermass_percent(fesom_vol_watermass_hr)
 
     # Print results
     for sector in range(num_sectors):
@@ -280,6 +61,177 @@ def mip_calc_watermasses (roms_grid, roms_file, fesom_mesh_lr, fesom_mesh_hr, fe
             print str(fesom_percent_watermass_hr[wm_key, sector]) + '% ' + wm_names[wm_key]
 
 
+# Find the sector of every ice shelf cavity point at once.
+# Input: lon, lat = arrays of longitude (from -180 to 180) and latitude
+# Output: sector = integer array of the same shape: 0 for Filchner-Ronne, 1 for
+#                  the Eastern Weddell region, 2 for Amery, 3 for the
+#                  Australian sector, 4 for the Ross Sea, 5 for the Amundsen
+#                  Sea, 6 for the Bellingshausen Sea, 7 for the Larsen Ice
+#                  Shelves, or -1 if the point isn't in any of them. Where the
+#                  conditions overlap the first one wins.
+def cavity_sectors (lon, lat):
+
+    conditions = [(lon >= -85)*(lon < -30)*(lat < -74), (lon >= -30)*(lon < 65), (lon >= 65)*(lon < 76), (lon >= 76)*(lon < 165)*(lat >= -74), (lon >= 155)*(lon < 165)*(lat < -74) + (lon >= 165) + (lon < -140), (lon >= -140)*(lon < -105) + (lon >= -105)*(lon < -98)*(lat < -73.1), (lon >= -104)*(lon < -98)*(lat >= -73.1) + (lon >= -98)*(lon < -66)*(lat >= -75), (lon >= -66)*(lon < -59)*(lat >= -74)]
+    return select(conditions, range(len(conditions)), default=-1)
+
+
+# Classify water masses at every point (and every time index) at once.
+# Input:
+# temp, salt = arrays of temperature and salinity, any shape
+# tfrz = array of surface freezing point at this salinity, same shape
+# Output: wm_key = integer array of the same shape: 0 for ISW, 1 for AASW, 2
+#                  for CDW, 3 for MCDW, 4 for WW, 5 for HSSW
+def watermass_classes (temp, salt, tfrz):
+
+    temp = ma.getdata(temp)
+    salt = ma.getdata(salt)
+    tfrz = ma.getdata(tfrz)
+    return select([temp < tfrz, salt < 34, temp > 0, temp > -1, salt < 34.5], [0, 1, 2, 3, 4], default=5)
+
+
+# Integrate volume for every water mass and sector at once.
+# Input:
+# wm_key = integer array (time x point) of water mass classes from
+#          watermass_classes
+# sector = integer array (point) of sectors from cavity_sectors; points with
+#          sector -1 are left out
+# volume = array of volumes (point, or time x point)
+# num_watermasses = number of water masses
+# num_sectors = number of sectors, including the last one for all cavities
+# Output: vol_watermass = array (time x water mass x sector) of volume
+def watermass_sector_volumes (wm_key, sector, volume, num_watermasses, num_sectors):
+
+    num_time = size(wm_key,0)
+    index = sector >= 0
+    wm_key = wm_key[:,index]
+    sector = sector[index]
+    volume = broadcast_to(volume, (num_time, size(index)))[:,index]
+    # One label for each combination of time index, water mass, and sector
+    # (apart from all cavities), so a single bincount does everything
+    num_labels = num_watermasses*(num_sectors-1)
+    labels = wm_key*(num_sectors-1) + sector + (arange(num_time)*num_labels)[:,None]
+    vol_watermass = zeros([num_time, num_watermasses, num_sectors])
+    vol_watermass[:,:,:-1] = bincount(labels.ravel(), weights=volume.ravel(), minlength=num_time*num_labels).reshape(num_time, num_watermasses, num_sectors-1)
+    # Also integrate total Antarctica
+    vol_watermass[:,:,-1] = sum(vol_watermass[:,:,:-1], axis=2)
+    return vol_watermass
+
+
+# Convert volume of each water mass in each sector to percentages of the
+# total volume of each sector.
+# Input: vol_watermass = array (water mass x sector, or time x water mass x
+#                        sector)
+# Output: array of the same shape
+def watermass_percent (vol_watermass):
+
+    # Find total volume of each sector by adding up the volume of each
+    # water mass
+    vol_sectors = sum(vol_watermass, axis=-2)
+    return vol_watermass/expand_dims(vol_sectors, -2)*100
+
+
+# Calculate the volume of each water mass in each sector of the ROMS ice shelf
+# cavities, for a range of time indices (e.g. for a water mass census
+# timeseries).
+# Input:
+# roms_grid = path to ROMS grid file
+# roms_file = path to ROMS file containing temp and salt
+# theta_s, theta_b, hc, N = ROMS vertical grid parameters
+# num_watermasses, num_sectors = as in watermass_sector_volumes
+# t_start, t_end = optional range of time indices (default all)
+# block_size = optional number of time indices to read at once (default 5)
+# Output: roms_vol_watermass = array (time x water mass x sector) of volume
+def roms_watermass_volumes (roms_grid, roms_file, theta_s, theta_b, hc, N, num_watermasses, num_sectors, t_start=0, t_end=None, block_size=5):
+
+    # Read ROMS grid variables we need
+    id = Dataset(roms_grid, 'r')
+    roms_lon = id.variables['lon_rho'][:,:]
+    roms_lat = id.variables['lat_rho'][:,:]
+    roms_h = id.variables['h'][:,:]
+    roms_zice = id.variables['zice'][:,:]
+    id.close()
+    # Get integrands on 3D grid
+    roms_dx, roms_dy, roms_dz, roms_z = cartesian_grid_3d(roms_lon, roms_lat, roms_h, roms_zice, theta_s, theta_b, hc, N)
+    # Select ice shelf points, and only read the rows which contain them
+    j, i = nonzero(roms_zice < 0)
+    j_start = amin(j)
+    j_end = amax(j)+1
+    # Get volume integrand at these points (depth x point)
+    dV = (roms_dx*roms_dy*roms_dz)[:,j,i]
+    # Figure out which sector each point falls into
+    lon = roms_lon[j,i]
+    index = lon > 180
+    lon[index] = lon[index] - 360
+    sector = cavity_sectors(lon, roms_lat[j,i])
+    if count_nonzero(sector < 0) > 0:
+        print 'Warning: ' + str(count_nonzero(sector < 0)) + ' ice shelf points are not in any sector'
+    # Each water column has the same sector at every depth
+    sector = tile(sector, N)
+
+    id = Dataset(roms_file, 'r')
+    if t_end is None:
+        t_end = id.variables['temp'].shape[0]
+    roms_vol_watermass = zeros([t_end-t_start, num_watermasses, num_sectors])
+    t = t_start
+    while t < t_end:
+        t_next = minimum(t+block_size, t_end)
+        # Read ROMS output (time x depth x point)
+        roms_temp = id.variables['temp'][t:t_next,:,j_start:j_end,:][:,:,j-j_start,i]
+        roms_salt = id.variables['salt'][t:t_next,:,j_start:j_end,:][:,:,j-j_start,i]
+        # Get surface freezing point at this salinity
+        roms_tfrz = roms_salt/(-18.48 + 18.48/1e3*roms_salt)
+        wm_key = watermass_classes(roms_temp, roms_salt, roms_tfrz)
+        roms_vol_watermass[t-t_start:t_next-t_start,:,:] = watermass_sector_volumes(wm_key.reshape(t_next-t, -1), sector, dV.ravel(), num_watermasses, num_sectors)
+        t = t_next
+    id.close()
+    return roms_vol_watermass
+
+
+# Find the 3D triangular prisms in the FESOM ice shelf cavities. The prisms
+# can then be used with fesom_watermass_volumes for as many time indices as
+# you like.
+# Input: mesh = dictionary from fesom_mesh
+# Output: dictionary containing
+# sector = sector of each prism, from cavity_sectors
+# volume = volume of each prism
+# top, bottom = node ids (prism x 3) at the top and bottom of each prism
+def fesom_cavity_prisms (mesh):
+
+    prisms = element_prisms(mesh, mesh['cavity'])
+    # Figure out which sector each element falls into, and give each prism
+    # the sector of its element
+    elm_sector = cavity_sectors(mesh['lon_c'], mesh['lat_c'])
+    num_outside = count_nonzero(elm_sector[mesh['cavity']] < 0)
+    if num_outside > 0:
+        print 'Warning: ' + str(num_outside) + ' cavity elements are not in any sector'
+    return {'sector':elm_sector[prisms['element']], 'volume':prisms['volume'], 'top':prisms['top'], 'bottom':prisms['bottom']}
+
+
+# Calculate the volume of each water mass in each sector of the FESOM ice shelf
+# cavities.
+# Input:
+# prisms = dictionary from fesom_cavity_prisms
+# temp_nodes, salt_nodes = temperature and salinity at each node (node, or
+#                          time x node)
+# num_watermasses, num_sectors = as in watermass_sector_volumes
+# Output: fesom_vol_watermass = array (water mass x sector, or time x water mass
+#                               x sector) of volume
+def fesom_watermass_volumes (prisms, temp_nodes, salt_nodes, num_watermasses, num_sectors):
+
+    single = ndim(temp_nodes) == 1
+    temp_nodes = atleast_2d(ma.getdata(temp_nodes))
+    salt_nodes = atleast_2d(ma.getdata(salt_nodes))
+    # Average temperature and salinity over the 6 nodes of each prism
+    prism_temp = mean(concatenate((temp_nodes[:,prisms['top']], temp_nodes[:,prisms['bottom']]), axis=2), axis=2)
+    prism_salt = mean(concatenate((salt_nodes[:,prisms['top']], salt_nodes[:,prisms['bottom']]), axis=2), axis=2)
+    prism_tfrz = -0.0575*prism_salt + 1.7105e-3*sqrt(prism_salt**3) - 2.155e-4*prism_salt**2
+    wm_key = watermass_classes(prism_temp, prism_salt, prism_tfrz)
+    fesom_vol_watermass = watermass_sector_volumes(wm_key, prisms['sector'], prisms['volume'], num_watermasses, num_sectors)
+    if single:
+        return fesom_vol_watermass[0,:,:]
+    return fesom_vol_watermass
+
+
 # Command-line interface
 if __name__ == "__main__":
 
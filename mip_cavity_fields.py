@@ -13,6 +13,7 @@ from fesom_grid import *
 from patches import *
 from unrotate_vector import *
 from unrotate_grid import *
+from fesom_mesh import element_arrays, element_mean, elements_in_box
 
 # For each major ice shelf, make a 2x1 plot of the given field for MetROMS
 # (left) and FESOM (right), zoomed into that region. Current options are
@@ -141,6 +142,8 @@ def mip_cavity_fields (var_name, roms_grid, roms_file, fesom_mesh_path, fesom_fi
     elements, mask_patches = make_patches(fesom_mesh_path, circumpolar=True, mask_cavities=True)
     # Unmask ice shelves
     patches = iceshelf_mask(elements)
+    # Arrays for vectorised element calculations
+    mesh = element_arrays(elements)
     if var_name == 'draft':
         # Nothing more to read
         pass
@@ -250,21 +253,18 @@ def mip_cavity_fields (var_name, roms_grid, roms_file, fesom_mesh_path, fesom_fi
             # Calculate speed
             node_data = sqrt(node_u**2 + node_v**2)
         id.close()
-    # Calculate given field at each element
-    fesom_data = []
-    for elm in elements:
-        # For each element in an ice shelf cavity, append the mean value
-        # for the 3 component Nodes
-        if elm.cavity:
-            if var_name == 'draft':
-                # Ice shelf draft is depth of surface layer
-                fesom_data.append(mean([elm.nodes[0].depth, elm.nodes[1].depth, elm.nodes[2].depth]))
-            elif var_name in ['melt', 'vsfc', 'vavg']:
-                # Surface nodes (or 2D in the case of vavg)
-                fesom_data.append(mean([node_data[elm.nodes[0].id], node_data[elm.nodes[1].id], node_data[elm.nodes[2].id]]))
-            elif var_name in ['temp', 'salt']:
-                # Bottom nodes
-                fesom_data.append(mean([node_data[elm.nodes[0].find_bottom().id], node_data[elm.nodes[1].find_bottom().id], node_data[elm.nodes[2].find_bottom().id]]))
+    # Calculate given field at each element in an ice shelf cavity, averaged
+    # over the 3 corners
+    if var_name == 'draft':
+        # Ice shelf draft is depth of surface layer
+        fesom_data = element_mean(mesh, mesh['depth'])
+    elif var_name in ['melt', 'vsfc', 'vavg']:
+        # Surface nodes (or 2D in the case of vavg)
+        fesom_data = element_mean(mesh, node_data)
+    elif var_name in ['temp', 'salt']:
+        # Bottom nodes
+        fesom_data = element_mean(mesh, node_data, bottom=True)
+    fesom_data = fesom_data[mesh['cavity']]
 
     # Loop over ice shelves
     for index in range(num_shelves):
@@ -304,15 +304,10 @@ def mip_cavity_fields (var_name, roms_grid, roms_file, fesom_mesh_path, fesom_fi
         var_min = amin(roms_data[loc])
         var_max = amax(roms_data[loc])
         # Modify with FESOM
-        i = 0
-        for elm in elements:
-            if elm.cavity:
-                if any(elm.x >= x_min) and any(elm.x <= x_max) and any(elm.y >= y_min) and any(elm.y <= y_max):
-                    if fesom_data[i] < var_min:
-                        var_min = fesom_data[i]
-                    if fesom_data[i] > var_max:
-                        var_max = fesom_data[i]
-                i += 1
+        loc = elements_in_box(mesh, x_min, x_max, y_min, y_max)[mesh['cavity']]
+        if any(loc):
+            var_min = min(var_min, amin(fesom_data[loc]))
+            var_max = max(var_max, amax(fesom_data[loc]))
         if var_name == 'melt':
             # Special colour map
             if var_min < 0:
@@ -1,11 +1,12 @@
 from numpy import *
 from scipy.stats import linregress
+from timeseries_store import *
 
 # Calculate the mean Drake Passage transport over 2002-2016, as well as the
 # linear trend, for MetROMS, low-res FESOM, and high-res FESOM. Print the
 # results to the screen.
 # Input:
-# roms_log = logfile from timeseries_dpt.py for MetROMS
+# roms_log = timeseries store from timeseries_dpt.py for MetROMS
 # fesom_log_low, fesom_log_high = logfiles from timeseries_dpt.py in the
 #                                 fesomtools repository, for FESOM low-res and
 #                                 high-res respectively
@@ -19,23 +20,10 @@ def mip_dpt_calc (roms_log, fesom_log_low, fesom_log_high):
     calc_start = 2002
 
     # Read ROMS timeseries
-    roms_time = []
-    roms_dpt = []
-    f = open(roms_log, 'r')
-    # Skip first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            roms_time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break
-    for line in f:
-        roms_dpt.append(float(line))
-    f.close()
+    roms_time, data = read_timeseries(roms_log)
+    roms_dpt = dict(data)['Drake Passage Transport (Sv)']
     # Add start year to ROMS time array
-    roms_time = array(roms_time) + year_start
-    roms_dpt = array(roms_dpt)
+    roms_time = roms_time + year_start
 
     # Read FESOM low-res timeseries
     fesom_dpt_low = []
@@ -91,7 +79,7 @@ def mip_dpt_calc (roms_log, fesom_log_low, fesom_log_high):
 # Command-line interface
 if __name__ == "__main__":
 
-    roms_log = raw_input("Path to ROMS logfile from timeseries_dpt.py: ")
+    roms_log = raw_input("Path to ROMS timeseries store from timeseries_dpt.py: ")
     fesom_log_low = raw_input("Path to FESOM low-res logfile from timeseries_dpt.py: ")
     fesom_log_high = raw_input("Path to FESOM high-res logfile from timeseries_dpt.py: ")
     mip_dpt_calc(roms_log, fesom_log_low, fesom_log_high)
@@ -1,6 +1,5 @@
 from netCDF4 import Dataset
 from numpy import *
-from numpy.ma import MaskedArray
 from matplotlib.pyplot import *
 from matplotlib.patches import Polygon, Rectangle
 from matplotlib.collections import PatchCollection, LineCollection
@@ -20,6 +19,8 @@ from fesom_sidegrid import *
 from unrotate_vector import *
 from unrotate_grid import *
 from in_triangle import *
+from grid_stencils import *
+from fesom_mesh import element_arrays, element_mean, elements_in_box
 
 # This is the giant monster script to generate 8 multi-part figures showing
 # ice shelf processes in the 8 regions defined in the intercomparison paper.
@@ -65,26 +66,13 @@ def get_min_max (roms_data, fesom_data_lr, fesom_data_hr, x_min, x_max, y_min, y
     var_min = amin(roms_data[loc])
     var_max = amax(roms_data[loc])
     # Modify with FESOM
-    # Low-res
-    i = 0
-    for elm in elements_lr:
-        if (not cavity) or (cavity and elm.cavity):
-            if any(elm.x >= x_min) and any(elm.x <= x_max) and any(elm.y >= y_min) and any(elm.y <= y_max):
-                if fesom_data_lr[i] < var_min:
-                    var_min = fesom_data_lr[i]
-                if fesom_data_lr[i] > var_max:
-                    var_max = fesom_data_lr[i]
-            i += 1
-    # High-res
-    i = 0
-    for elm in elements_hr:
-        if (not cavity) or (cavity and elm.cavity):
-            if any(elm.x >= x_min) and any(elm.x <= x_max) and any(elm.y >= y_min) and any(elm.y <= y_max):
-                if fesom_data_hr[i] < var_min:
-                    var_min = fesom_data_hr[i]
-                if fesom_data_hr[i] > var_max:
-                    var_max = fesom_data_hr[i]
-            i += 1
+    for mesh, fesom_data in [(mesh_lr, fesom_data_lr), (mesh_hr, fesom_data_hr)]:
+        loc = elements_in_box(mesh, x_min, x_max, y_min, y_max)
+        if cavity:
+            loc = loc[mesh['cavity']]
+        if any(loc):
+            var_min = min(var_min, amin(fesom_data[loc]))
+            var_max = max(var_max, amax(fesom_data[loc]))
     return var_min, var_max
 
 
@@ -1112,6 +1100,8 @@ for elm in elements_lr:
     patches_all_lr.append(Polygon(coord, True, linewidth=0.))
 # Also make non-circumpolar set of elements for zonal slices
 elm2D_lr = fesom_grid(fesom_mesh_path_lr)
+# Arrays for vectorised element calculations
+mesh_lr = element_arrays(elements_lr)
 print 'Building FESOM high-res mesh'
 elements_hr, mask_patches_hr = make_patches(fesom_mesh_path_hr, circumpolar=True, mask_cavities=True)
 patches_hr = iceshelf_mask(elements_hr)
@@ -1120,6 +1110,7 @@ for elm in elements_hr:
     coord = transpose(vstack((elm.x, elm.y)))
     patches_all_hr.append(Polygon(coord, True, linewidth=0.))
 elm2D_hr = fesom_grid(fesom_mesh_path_hr)
+mesh_hr = element_arrays(elements_hr)
 
 print 'Building ice shelf front contours'
 # MetROMS
@@ -1169,16 +1160,10 @@ roms_draft = ma.masked_where(roms_zice==0, roms_draft)
 # FESOM low-res
 # Calculate draft at each element, averaged over 3 corners
 # Equivalent to depth of surface layer
-fesom_draft_lr = []
-for elm in elements_lr:
-    if elm.cavity:
-        fesom_draft_lr.append(mean([elm.nodes[0].depth, elm.nodes[1].depth, elm.nodes[2].depth]))
+fesom_draft_lr = element_mean(mesh_lr, mesh_lr['depth'])[mesh_lr['cavity']]
 
 # FESOM high-res
-fesom_draft_hr = []
-for elm in elements_hr:
-    if elm.cavity:
-        fesom_draft_hr.append(mean([elm.nodes[0].depth, elm.nodes[1].depth, elm.nodes[2].depth]))
+fesom_draft_hr = element_mean(mesh_hr, mesh_hr['depth'])[mesh_hr['cavity']]
 
 print 'Calculating water column thickness'
 
@@ -1191,16 +1176,10 @@ roms_wct = ma.masked_where(roms_zice==0, roms_wct)
 # FESOM low-res
 # Calculate wct at each element, averaged over 3 corners
 # Equivalent to depth of bottom layer minus depth of surface layer
-fesom_wct_lr = []
-for elm in elements_lr:
-    if elm.cavity:
-        fesom_wct_lr.append(mean([elm.nodes[0].find_bottom().depth - elm.nodes[0].depth, elm.nodes[1].find_bottom().depth - elm.nodes[1].depth, elm.nodes[2].find_bottom().depth - elm.nodes[2].depth]))
+fesom_wct_lr = (element_mean(mesh_lr, mesh_lr['depth'], bottom=True) - element_mean(mesh_lr, mesh_lr['depth']))[mesh_lr['cavity']]
 
 # FESOM high-res
-fesom_wct_hr = []
-for elm in elements_hr:
-    if elm.cavity:
-        fesom_wct_hr.append(mean([elm.nodes[0].find_bottom().depth - elm.nodes[0].depth, elm.nodes[1].find_bottom().depth - elm.nodes[1].depth, elm.nodes[2].find_bottom().depth - elm.nodes[2].depth]))
+fesom_wct_hr = (element_mean(mesh_hr, mesh_hr['depth'], bottom=True) - element_mean(mesh_hr, mesh_hr['depth']))[mesh_hr['cavity']]
 
 print 'Calculating ice shelf melt rate'
 
@@ -1218,19 +1197,13 @@ id = Dataset(fesom_file_lr_i, 'r')
 node_melt_lr = id.variables['wnet'][0,:]*sec_per_year
 id.close()
 # For each element, calculate average over 3 corners
-fesom_melt_lr = []
-for elm in elements_lr:
-    if elm.cavity:
-        fesom_melt_lr.append(mean([node_melt_lr[elm.nodes[0].id], node_melt_lr[elm.nodes[1].id], node_melt_lr[elm.nodes[2].id]]))
+fesom_melt_lr = element_mean(mesh_lr, node_melt_lr)[mesh_lr['cavity']]
 
 # FESOM high-res
 id = Dataset(fesom_file_hr_i, 'r')
 node_melt_hr = id.variables['wnet'][0,:]*sec_per_year
 id.close()
-fesom_melt_hr = []
-for elm in elements_hr:
-    if elm.cavity:
-        fesom_melt_hr.append(mean([node_melt_hr[elm.nodes[0].id], node_melt_hr[elm.nodes[1].id], node_melt_hr[elm.nodes[2].id]]))
+fesom_melt_hr = element_mean(mesh_hr, node_melt_hr)[mesh_hr['cavity']]
 
 print 'Calculating bottom water temperature'
 
@@ -1246,17 +1219,13 @@ id = Dataset(fesom_file_lr_o, 'r')
 node_bwtemp_lr = id.variables['temp'][0,:]
 id.close()
 # Calculate average over 3 corners of each bottom element
-fesom_bwtemp_lr = []
-for elm in elements_lr:
-    fesom_bwtemp_lr.append(mean([node_bwtemp_lr[elm.nodes[0].find_bottom().id], node_bwtemp_lr[elm.nodes[1].find_bottom().id], node_bwtemp_lr[elm.nodes[2].find_bottom().id]]))
+fesom_bwtemp_lr = element_mean(mesh_lr, node_bwtemp_lr, bottom=True)
 
 # FESOM high-res
 id = Dataset(fesom_file_hr_o, 'r')
 node_bwtemp_hr = id.variables['temp'][0,:]
 id.close()
-fesom_bwtemp_hr = []
-for elm in elements_hr:
-    fesom_bwtemp_hr.append(mean([node_bwtemp_hr[elm.nodes[0].find_bottom().id], node_bwtemp_hr[elm.nodes[1].find_bottom().id], node_bwtemp_hr[elm.nodes[2].find_bottom().id]]))    
+fesom_bwtemp_hr = element_mean(mesh_hr, node_bwtemp_hr, bottom=True)
 
 print 'Calculating bottom water salinity'
 
@@ -1272,17 +1241,13 @@ id = Dataset(fesom_file_lr_o, 'r')
 node_bwsalt_lr = id.variables['salt'][0,:]
 id.close()
 # Calculate average over 3 corners of each bottom element
-fesom_bwsalt_lr = []
-for elm in elements_lr:
-    fesom_bwsalt_lr.append(mean([node_bwsalt_lr[elm.nodes[0].find_bottom().id], node_bwsalt_lr[elm.nodes[1].find_bottom().id], node_bwsalt_lr[elm.nodes[2].find_bottom().id]]))
+fesom_bwsalt_lr = element_mean(mesh_lr, node_bwsalt_lr, bottom=True)
 
 # FESOM high-res
 id = Dataset(fesom_file_hr_o, 'r')
 node_bwsalt_hr = id.variables['salt'][0,:]
-fesom_bwsalt_hr = []
 id.close()
-for elm in elements_hr:
-    fesom_bwsalt_hr.append(mean([node_bwsalt_hr[elm.nodes[0].find_bottom().id], node_bwsalt_hr[elm.nodes[1].find_bottom().id], node_bwsalt_hr[elm.nodes[2].find_bottom().id]]))    
+fesom_bwsalt_hr = element_mean(mesh_hr, node_bwsalt_hr, bottom=True)
 
 print 'Calculating vertically averaged velocity'
 
@@ -1297,33 +1262,11 @@ dx, dy, dz, z = cartesian_grid_3d(roms_lon, roms_lat, roms_h, roms_zice, theta_s
 # Unrotate each vertical level
 u_3d = ma.empty(shape(dz))
 v_3d = ma.empty(shape(dz))
-num_lat_u = size(u_3d_tmp,1)
-num_lon_u = size(u_3d_tmp,2)
-num_lat_v = size(v_3d_tmp,1)
-num_lon_v = size(v_3d_tmp,2)
+# Extend into land mask before interpolation to rho-grid so
+# the land mask doesn't change in the final plot
+u_3d_tmp = neighbour_mean_fill(u_3d_tmp)
+v_3d_tmp = neighbour_mean_fill(v_3d_tmp)
 for k in range(N):
-    # Extend into land mask before interpolation to rho-grid so
-    # the land mask doesn't change in the final plot
-    for j in range(1,num_lat_u-1):
-        for i in range(1,num_lon_u-1):
-            # Check for masked points
-            if u_3d_tmp[k,j,i] is ma.masked:
-                # Look at 4 neighbours
-                neighbours = ma.array([u_3d_tmp[k,j-1,i], u_3d_tmp[k,j,i-1], u_3d_tmp[k,j+1,i], u_3d_tmp[k,j,i+1]])
-                # Find how many of them are unmasked
-                num_unmasked = MaskedArray.count(neighbours)
-                if num_unmasked > 0:
-                    # There is at least one unmasked neighbour;
-                    # set u_3d_tmp to their average
-                    u_3d_tmp[k,j,i] = sum(neighbours)/num_unmasked
-    # Repeat for v
-    for j in range(1,num_lat_v-1):
-        for i in range(1,num_lon_v-1):
-            if v_3d_tmp[k,j,i] is ma.masked:
-                neighbours = ma.array([v_3d_tmp[k,j-1,i], v_3d_tmp[k,j,i-1], v_3d_tmp[k,j+1,i], v_3d_tmp[k,j,i+1]])
-                num_unmasked = MaskedArray.count(neighbours)
-                if num_unmasked > 0:
-                    v_3d_tmp[k,j,i] = sum(neighbours)/num_unmasked
     # Interpolate to rho grid and rotate
     u_k, v_k = rotate_vector_roms(u_3d_tmp[k,:,:], v_3d_tmp[k,:,:], roms_angle)
     u_3d[k,:,:] = u_k
@@ -2,6 +2,7 @@ from netCDF4 import Dataset
 from numpy import *
 from matplotlib.pyplot import *
 from matplotlib import rcParams
+from timeseries_store import *
 
 # Make a 3x1 circumpolar Antarctic map of percentage error in mass loss for
 # each ice shelf, outside the bounds given by Rignot et al. (2013), in MetROMS,
@@ -9,7 +10,7 @@ from matplotlib import rcParams
 # values to the screen.
 # Input:
 # roms_grid = path to ROMS grid file
-# roms_logfile = path to ROMS logfile from timeseries_massloss.py
+# roms_logfile = path to ROMS timeseries store from timeseries_massloss.py
 # fesom_logfile_lr, fesom_logfile_hr = paths to FESOM logfiles from
 #                   timeseries_massloss.py in the fesomtools repository, for
 #                   low-res and high-res respectively
@@ -54,36 +55,10 @@ def mip_massloss_error_map (roms_grid, roms_logfile, fesom_logfile_lr, fesom_log
     min_zice = -10
 
     # Read ROMS logfile
-    roms_time = []
-    f = open(roms_logfile, 'r')
-    # Skip the first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            roms_time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break
-    # Skip the values for the entire continent
-    for line in f:
-        try:
-            tmp = float(line)
-        except(ValueError):
-            break
-    # Set up array for mass loss values at each ice shelf
-    roms_massloss_ts = empty([num_shelves, len(roms_time)])
-    index = 0
-    # Loop over ice shelves
-    while index < num_shelves:
-        t = 0
-        for line in f:
-            try:
-                roms_massloss_ts[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                # Reached the header for the next ice shelf
-                break
-        index +=1
+    roms_time, data = read_timeseries(roms_logfile)
+    data = dict(data)
+    # One timeseries for each ice shelf (skipping the entire continent)
+    roms_massloss_ts = array([data[names[index] + ' Basal Mass Loss'] for index in range(num_shelves)])
     # Add start year to ROMS time array
     roms_time = array(roms_time) + year_start
     # Average between observation years
@@ -308,7 +283,7 @@ def mip_massloss_error_map (roms_grid, roms_logfile, fesom_logfile_lr, fesom_log
 if __name__ == "__main__":
 
     roms_grid = raw_input("Path to ROMS grid file: ")
-    roms_logfile = raw_input("Path to ROMS mass loss logfile: ")
+    roms_logfile = raw_input("Path to ROMS mass loss timeseries store: ")
     fesom_logfile_lr = raw_input("Path to FESOM low-res mass loss logfile: ")
     fesom_logfile_hr = raw_input("Path to FESOM high-res mass loss logfile: ")
     action = raw_input("Save figure (s) or display in window (d)? ")
@@ -10,6 +10,8 @@ from patches import *
 # This will use the FESOM version of unesco.py for both MetROMS and FESOM,
 # luckily it's identical
 from unesco import *
+from fesom_mesh import element_arrays, element_mean
+from mld import mld_roms, mld_fesom
 
 # Input:
 # roms_grid = path to ROMS grid file
@@ -72,8 +74,6 @@ def mip_mld (roms_grid, roms_seasonal_file, fesom_mesh_path_lr, fesom_seasonal_f
     y_ticks = (lat_ticks+90)*sin(lon_ticks*deg2rad+pi/2)
     # Get a 3D array of z-coordinates; sc_r and Cs_r are unused in this script
     roms_z, sc_r, Cs_r = calc_z(roms_h, roms_zice, theta_s, theta_b, hc, N)
-    # Make depth positive
-    roms_z = -1*roms_z
     print 'Reading data'
     id = Dataset(roms_seasonal_file, 'r')
     roms_temp = id.variables['temp'][:,:,:,:]
@@ -82,32 +82,8 @@ def mip_mld (roms_grid, roms_seasonal_file, fesom_mesh_path_lr, fesom_seasonal_f
     print 'Calculating density'
     roms_density = unesco(roms_temp, roms_salt, zeros(shape(roms_temp)))
     print 'Calculating mixed layer depth'
-    roms_mld = ma.empty([4, size(roms_lon,0), size(roms_lon,1)])
-    # Awful triple loop here, can't find a cleaner way
-    for season in range(4):
-        print '...' + season_names[season]
-        for j in range(size(roms_lon,0)):
-            for i in range(size(roms_lon,1)):
-                # Get surface density
-                density_sfc = roms_density[season,-1,j,i]
-                # Get surface depth (only nonzero in ice shelf cavities)
-                depth_sfc = roms_z[-1,j,i]
-                if density_sfc is ma.masked:
-                    # Land
-                    roms_mld[season,j,i] = ma.masked
-                else:
-                    # Loop downward
-                    k = size(roms_density,1)-2
-                    while True:
-                        if k < 0:
-                            # Reached the bottom
-                            roms_mld[season,j,i] = roms_z[0,j,i]-depth_sfc
-                            break
-                        if roms_density[season,k,j,i] >= density_sfc + density_anom:
-                            # Reached the critical density anomaly
-                            roms_mld[season,j,i] = roms_z[k,j,i]-depth_sfc
-                            break
-                        k -= 1
+    # All seasons and water columns at once
+    roms_mld = mld_roms(roms_density, roms_z, density_anom)
 
     print 'Processing low-res FESOM:'
     print 'Building mesh'
@@ -120,36 +96,10 @@ def mip_mld (roms_grid, roms_seasonal_file, fesom_mesh_path_lr, fesom_seasonal_f
     print 'Calculating density'
     fesom_density_nodes_lr = unesco(fesom_temp_nodes_lr, fesom_salt_nodes_lr, zeros(shape(fesom_temp_nodes_lr)))
     print 'Calculating mixed layer depth'
-    # Set up array for mixed layer depth at each element, at each season
-    fesom_mld_lr = zeros([4, len(elements_lr)])
-    # Loop over seasons and elements to fill these in
-    for season in range(4):
-        print '...' + season_names[season]
-        mld_season = []
-        for elm in elements_lr:
-            # Get mixed layer depth at each node
-            mld_nodes = []
-            for i in range(3):
-                node = elm.nodes[i]
-                density_sfc = fesom_density_nodes_lr[season,node.id]
-                # Save surface depth (only nonzero in ice shelf cavities)
-                depth_sfc = node.depth
-                temp_depth = node.depth
-                curr_node = node.below
-                while True:
-                    if curr_node is None:
-                        # Reached the bottom
-                        mld_nodes.append(temp_depth-depth_sfc)
-                        break
-                    if fesom_density_nodes_lr[season,curr_node.id] >= density_sfc + density_anom:
-                        # Reached the critical density anomaly
-                        mld_nodes.append(curr_node.depth-depth_sfc)
-                        break
-                    temp_depth = curr_node.depth
-                    curr_node = curr_node.below
-            # For this element, save the mean mixed layer depth
-            mld_season.append(mean(array(mld_nodes)))
-        fesom_mld_lr[season,:] = array(mld_season)
+    # Mixed layer depth at each surface node for all seasons at once, then
+    # the mean over the 3 nodes of each element
+    mesh_lr = element_arrays(elements_lr)
+    fesom_mld_lr = element_mean(mesh_lr, mld_fesom(mesh_lr, fesom_density_nodes_lr, density_anom))
 
     print 'Processing high-res FESOM:'
     print 'Building mesh'
@@ -162,36 +112,10 @@ def mip_mld (roms_grid, roms_seasonal_file, fesom_mesh_path_lr, fesom_seasonal_f
     print 'Calculating density'
     fesom_density_nodes_hr = unesco(fesom_temp_nodes_hr, fesom_salt_nodes_hr, zeros(shape(fesom_temp_nodes_hr)))
     print 'Calculating mixed layer depth'
-    # Set up array for mixed layer depth at each element, at each season
-    fesom_mld_hr = zeros([4, len(elements_hr)])
-    # Loop over seasons and elements to fill these in
-    for season in range(4):
-        print '...' + season_names[season]
-        mld_season = []
-        for elm in elements_hr:
-            # Get mixed layer depth at each node
-            mld_nodes = []
-            for i in range(3):
-                node = elm.nodes[i]
-                density_sfc = fesom_density_nodes_hr[season,node.id]
-                # Save surface depth (only nonzero in ice shelf cavities)
-                depth_sfc = node.depth
-                temp_depth = node.depth
-                curr_node = node.below
-                while True:
-                    if curr_node is None:
-                        # Reached the bottom
-                        mld_nodes.append(temp_depth-depth_sfc)
-                        break
-                    if fesom_density_nodes_hr[season,curr_node.id] >= density_sfc + density_anom:
-                        # Reached the critical density anomaly
-                        mld_nodes.append(curr_node.depth-depth_sfc)
-                        break
-                    temp_depth = curr_node.depth
-                    curr_node = curr_node.below
-            # For this element, save the mean mixed layer depth
-            mld_season.append(mean(array(mld_nodes)))
-        fesom_mld_hr[season,:] = array(mld_season)
+    # Mixed layer depth at each surface node for all seasons at once, then
+    # the mean over the 3 nodes of each element
+    mesh_hr = element_arrays(elements_hr)
+    fesom_mld_hr = element_mean(mesh_hr, mld_fesom(mesh_hr, fesom_density_nodes_hr, density_anom))
 
     print 'Processing obs'
     # Read grid and monthly climatology
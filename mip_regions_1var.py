@@ -1,16 +1,13 @@
 from netCDF4 import Dataset
 from numpy import *
-from numpy.ma import MaskedArray
 from matplotlib.collections import PatchCollection
 from matplotlib.pyplot import *
 from matplotlib.cm import *
 from matplotlib.colors import LinearSegmentedColormap
 from rotate_vector_roms import *
-from cartesian_grid_3d import *
-# Import FESOM scripts (have to modify path first)
-import sys
-sys.path.insert(0, '/short/y99/kaa561/fesomtools')
-from fesom_grid import *
+from grid_cache import *
+from grid_stencils import *
+from fesom_mesh import *
 from matplotlib.patches import Polygon
 from unrotate_vector import *
 from unrotate_grid import *
@@ -95,28 +92,28 @@ def mip_regions_1var ():
     land_circle = ma.masked_where(sqrt((x_reg_roms-x_c)**2 + (y_reg_roms-y_c)**2) > radius, land_circle)
 
     print 'Building FESOM low-res mesh'
-    elements_lr = fesom_grid(fesom_mesh_path_lr, circumpolar=True)
+    mesh_lr = fesom_mesh(fesom_mesh_path_lr, circumpolar=True)
     # Make patches for all elements, ice shelf elements, and open ocean elements
     patches_lr = []
     patches_shelf_lr = []
     patches_ocn_lr = []
-    for elm in elements_lr:
-        coord = transpose(vstack((elm.x, elm.y)))
+    for e in range(size(mesh_lr['area'])):
+        coord = transpose(vstack((mesh_lr['x'][e,:], mesh_lr['y'][e,:])))
         patches_lr.append(Polygon(coord, True, linewidth=0.))
-        if elm.cavity:
+        if mesh_lr['cavity'][e]:
             patches_shelf_lr.append(Polygon(coord, True, linewidth=0.))
         else:
             patches_ocn_lr.append(Polygon(coord, True, linewidth=0.))
 
     print 'Building FESOM high-res mesh'
-    elements_hr = fesom_grid(fesom_mesh_path_hr, circumpolar=True)
+    mesh_hr = fesom_mesh(fesom_mesh_path_hr, circumpolar=True)
     patches_hr = []
     patches_shelf_hr = []
     patches_ocn_hr = []
-    for elm in elements_hr:
-        coord = transpose(vstack((elm.x, elm.y)))
+    for e in range(size(mesh_hr['area'])):
+        coord = transpose(vstack((mesh_hr['x'][e,:], mesh_hr['y'][e,:])))
         patches_hr.append(Polygon(coord, True, linewidth=0.))
-        if elm.cavity:
+        if mesh_hr['cavity'][e]:
             patches_shelf_hr.append(Polygon(coord, True, linewidth=0.))
         else:
             patches_ocn_hr.append(Polygon(coord, True, linewidth=0.))
@@ -146,38 +143,16 @@ def mip_regions_1var ():
                 # Read full 3D u and v
                 u_3d_tmp = id.variables['u'][0,:,:,:]
                 v_3d_tmp = id.variables['v'][0,:,:,:]
-                # Get integrands on 3D grid; we only care about dz
-                dx, dy, dz, z = cartesian_grid_3d(roms_lon, roms_lat, roms_h, roms_zice, theta_s, theta_b, hc, N)
+                # Get integrands on 3D grid (cached); we only care about dz
+                dz = grid_geometry(roms_grid, theta_s, theta_b, hc, N)['dz']
                 # Unrotate each vertical level
                 u_3d = ma.empty(shape(dz))
                 v_3d = ma.empty(shape(dz))
-                num_lat_u = size(u_3d_tmp,1)
-                num_lon_u = size(u_3d_tmp,2)
-                num_lat_v = size(v_3d_tmp,1)
-                num_lon_v = size(v_3d_tmp,2)
+                # Extend into land mask before interpolation to rho-grid so
+                # the land mask doesn't change in the final plot
+                u_3d_tmp = neighbour_mean_fill(u_3d_tmp)
+                v_3d_tmp = neighbour_mean_fill(v_3d_tmp)
                 for k in range(N):
-                    # Extend into land mask before interpolation to rho-grid so
-                    # the land mask doesn't change in the final plot
-                    for j in range(1,num_lat_u-1):
-                        for i in range(1,num_lon_u-1):
-                            # Check for masked points
-                            if u_3d_tmp[k,j,i] is ma.masked:
-                                # Look at 4 neighbours
-                                neighbours = ma.array([u_3d_tmp[k,j-1,i], u_3d_tmp[k,j,i-1], u_3d_tmp[k,j+1,i], u_3d_tmp[k,j,i+1]])
-                                # Find how many of them are unmasked
-                                num_unmasked = MaskedArray.count(neighbours)
-                                if num_unmasked > 0:
-                                    # There is at least one unmasked neighbour;
-                                    # set u_3d_tmp to their average
-                                    u_3d_tmp[k,j,i] = sum(neighbours)/num_unmasked
-                    # Repeat for v
-                    for j in range(1,num_lat_v-1):
-                        for i in range(1,num_lon_v-1):
-                            if v_3d_tmp[k,j,i] is ma.masked:
-                                neighbours = ma.array([v_3d_tmp[k,j-1,i], v_3d_tmp[k,j,i-1], v_3d_tmp[k,j+1,i], v_3d_tmp[k,j,i+1]])
-                                num_unmasked = MaskedArray.count(neighbours)
-                                if num_unmasked > 0:
-                                    v_3d_tmp[k,j,i] = sum(neighbours)/num_unmasked
                     # Interpolate to rho grid and rotate
                     u_k, v_k = rotate_vector_roms(u_3d_tmp[k,:,:], v_3d_tmp[k,:,:], roms_angle)
                     u_3d[k,:,:] = u_k
@@ -197,6 +172,8 @@ def mip_regions_1var ():
             roms_data = ma.masked_where(roms_zice==0, roms_data)
 
         print 'Reading FESOM low-res fields'
+        # Draft, bathymetry, and water column thickness come from the mesh
+        node_data_lr = None
         if var not in ['draft', 'bathy', 'wct']:
             if var == 'melt':
                 id = Dataset(fesom_file_lr_i, 'r')
@@ -296,30 +273,11 @@ def mip_regions_1var ():
                 node_data_lr = sqrt(node_u_lr**2 + node_v_lr**2)
             id.close()
         # Calculate given field at each element
-        fesom_data_lr = []
-        for elm in elements_lr:
-            # For each element, append the mean value for the 3 component Nodes
-            # Restrict to ice shelf cavities for draft, melt, wct
-            if elm.cavity or var not in ['draft', 'melt', 'wct']:
-                if var == 'draft':
-                    # Ice shelf draft is depth of surface layer
-                    fesom_data_lr.append(mean([elm.nodes[0].depth, elm.nodes[1].depth, elm.nodes[2].depth]))
-                elif var == 'bathy':
-                    # Bathymetry is depth of bottom layer
-                    fesom_data_lr.append(mean([elm.nodes[0].find_bottom().depth, elm.nodes[1].find_bottom().depth, elm.nodes[2].find_bottom().depth]))
-                elif var == 'wct':
-                    # Water column thickness is depth of bottom layer minus
-                    # depth of surface layer
-                    fesom_data_lr.append(mean([elm.nodes[0].find_bottom().depth - elm.nodes[0].depth, elm.nodes[1].find_bottom().depth - elm.nodes[1].depth, elm.nodes[2].find_bottom().depth - elm.nodes[2].depth]))
-                elif var in ['melt', 'vel']:
-                    # Surface nodes
-                    fesom_data_lr.append(mean([node_data_lr[elm.nodes[0].id], node_data_lr[elm.nodes[1].id], node_data_lr[elm.nodes[2].id]]))
-                elif var in ['temp', 'salt']:
-                    # Bottom nodes
-                    fesom_data_lr.append(mean([node_data_lr[elm.nodes[0].find_bottom().id], node_data_lr[elm.nodes[1].find_bottom().id], node_data_lr[elm.nodes[2].find_bottom().id]]))
+        fesom_data_lr = fesom_element_data(mesh_lr, var, node_data_lr)
 
         print 'Reading FESOM high-res fields'
         # As before
+        node_data_hr = None
         if var not in ['draft', 'bathy', 'wct']:
             if var == 'melt':
                 id = Dataset(fesom_file_hr_i, 'r')
@@ -396,19 +354,7 @@ def mip_regions_1var ():
                 node_u_hr, node_v_hr = unrotate_vector(rlon_hr, rlat_hr, node_ur_hr, node_vr_hr)
                 node_data_hr = sqrt(node_u_hr**2 + node_v_hr**2)
             id.close()
-        fesom_data_hr = []
-        for elm in elements_hr:
-            if elm.cavity or var not in ['draft', 'melt', 'wct']:
-                if var == 'draft':
-                    fesom_data_hr.append(mean([elm.nodes[0].depth, elm.nodes[1].depth, elm.nodes[2].depth]))
-                elif var == 'bathy':
-                    fesom_data_hr.append(mean([elm.nodes[0].find_bottom().depth, elm.nodes[1].find_bottom().depth, elm.nodes[2].find_bottom().depth]))
-                elif var == 'wct':
-                    fesom_data_hr.append(mean([elm.nodes[0].find_bottom().depth - elm.nodes[0].depth, elm.nodes[1].find_bottom().depth - elm.nodes[1].depth, elm.nodes[2].find_bottom().depth - elm.nodes[2].depth]))
-                elif var in ['melt', 'vel']:
-                    fesom_data_hr.append(mean([node_data_hr[elm.nodes[0].id], node_data_hr[elm.nodes[1].id], node_data_hr[elm.nodes[2].id]]))
-                elif var in ['temp', 'salt']:
-                    fesom_data_hr.append(mean([node_data_hr[elm.nodes[0].find_bottom().id], node_data_hr[elm.nodes[1].find_bottom().id], node_data_hr[elm.nodes[2].find_bottom().id]]))
+        fesom_data_hr = fesom_element_data(mesh_hr, var, node_data_hr)
 
         # Loop over regions
         for index in range(num_regions):
@@ -422,26 +368,13 @@ def mip_regions_1var ():
             var_min = amin(roms_data[loc])
             var_max = amax(roms_data[loc])
             # Modify with FESOM
-            # Low-res
-            i = 0
-            for elm in elements_lr:
-                if elm.cavity or var not in ['draft', 'melt', 'wct']:
-                    if any(elm.x >= x_min[index]) and any(elm.x <= x_max[index]) and any(elm.y >= y_min[index]) and any(elm.y <= y_max[index]):
-                        if fesom_data_lr[i] < var_min:
-                            var_min = fesom_data_lr[i]
-                        if fesom_data_lr[i] > var_max:
-                            var_max = fesom_data_lr[i]
-                    i += 1
-            # High-res
-            i = 0
-            for elm in elements_hr:
-                if elm.cavity or var not in ['draft', 'melt', 'wct']:
-                    if any(elm.x >= x_min[index]) and any(elm.x <= x_max[index]) and any(elm.y >= y_min[index]) and any(elm.y <= y_max[index]):
-                        if fesom_data_hr[i] < var_min:
-                            var_min = fesom_data_hr[i]
-                        if fesom_data_hr[i] > var_max:
-                            var_max = fesom_data_hr[i]
-                    i += 1
+            for mesh, fesom_data in [(mesh_lr, fesom_data_lr), (mesh_hr, fesom_data_hr)]:
+                loc = elements_in_box(mesh, x_min[index], x_max[index], y_min[index], y_max[index])
+                if var in ['draft', 'melt', 'wct']:
+                    loc = loc[mesh['cavity']]
+                if any(loc):
+                    var_min = min(var_min, amin(fesom_data[loc]))
+                    var_max = max(var_max, amax(fesom_data[loc]))
             if var == 'melt':
                 # Special colour map
                 if var_min < 0:
@@ -644,6 +577,38 @@ def mip_regions_1var ():
             fig.savefig(fig_heads[index] + '_' + var + '.png')
 
 
+# Calculate a variable at each FESOM element, averaged over the 3 corners.
+# Input:
+# mesh = dictionary from fesom_mesh
+# var = variable name, as in mip_regions_1var
+# node_data = field at the nodes (3D nodes for temp and salt, surface nodes
+#             for melt and vel; not used for draft, bathy, wct)
+# Output: array of values at each element; only ice shelf cavity elements for
+#         draft, melt, and wct
+def fesom_element_data (mesh, var, node_data=None):
+
+    if var == 'draft':
+        # Ice shelf draft is depth of surface layer
+        elm_data = element_mean(mesh, mesh['depth'])
+    elif var == 'bathy':
+        # Bathymetry is depth of bottom layer
+        elm_data = element_mean(mesh, mesh['depth'], bottom=True)
+    elif var == 'wct':
+        # Water column thickness is depth of bottom layer minus depth of
+        # surface layer
+        elm_data = element_mean(mesh, mesh['depth'], bottom=True) - element_mean(mesh, mesh['depth'])
+    elif var in ['melt', 'vel']:
+        # Surface nodes
+        elm_data = element_mean(mesh, node_data)
+    elif var in ['temp', 'salt']:
+        # Bottom nodes
+        elm_data = element_mean(mesh, node_data, bottom=True)
+    if var in ['draft', 'melt', 'wct']:
+        # Restrict to ice shelf cavities
+        elm_data = elm_data[mesh['cavity']]
+    return elm_data
+
+
 # Command-line interface
 if __name__ == "__main__":
 
@@ -1,5 +1,7 @@
 from numpy import *
 from matplotlib.pyplot import *
+from timeseries_store import *
+from ice_shelf_regions import ice_shelf_boxes
 
 def mip_scatterplot (roms_logfile, roms_logfile_bs, fesom_logfile_lr, fesom_logfile_bs_lr, fesom_logfile_hr, fesom_logfile_bs_hr):
 
@@ -27,38 +29,10 @@ def mip_scatterplot (roms_logfile, roms_logfile_bs, fesom_logfile_lr, fesom_logf
     order = [3, 21, 20, 19, 18, 17, 16, 15, 14, 13, 12, 11, 22, 10, 9, 8, 7, 6, 5, 4, 24, 25, 23, 1, 0]
 
     # Read ROMS logfile
-    roms_time = []
-    f = open(roms_logfile, 'r')
-    # Skip the first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            roms_time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break       
-    # Set up array for mass loss values at each ice shelf
-    roms_massloss_ts = empty([num_shelves, len(roms_time)])
-    # Skip total mass loss
-    for line in f:
-        try:
-            tmp = float(line)
-        except(ValueError):
-            # Reaced the header for the first ice shelf
-            break
-    index = 0
-    # Loop over ice shelves
-    while index < num_shelves:
-        t = 0
-        for line in f:
-            try:
-                roms_massloss_ts[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                # Reached the header for the next ice shelf
-                break
-        index +=1
-    f.close()
+    roms_time, data = read_timeseries(roms_logfile)
+    data = dict(data)
+    # One timeseries for each ice shelf (skipping total mass loss)
+    roms_massloss_ts = array([data[name + ' Basal Mass Loss'] for name in ice_shelf_boxes()[0][1:num_shelves+1]])
     # Add start year to ROMS time array
     roms_time = array(roms_time) + year_start
     # Average between given years
@@ -70,27 +44,10 @@ def mip_scatterplot (roms_logfile, roms_logfile_bs, fesom_logfile_lr, fesom_logf
     roms_massloss = mean(roms_massloss_ts[:,t_start:t_end], axis=1)
 
     # Repeat for Bellingshausen
-    f = open(roms_logfile_bs, 'r')
-    f.readline()
     # Skip the time values (should be the same)
-    for line in f:
-        try:
-            tmp = float(line)
-        except(ValueError):
-            # Reached the header for the next variable
-            break       
-    roms_massloss_bs_ts = empty([num_shelves_bs, len(roms_time)])
-    index = 0
-    while index < num_shelves_bs:
-        t = 0
-        for line in f:
-            try:
-                roms_massloss_bs_ts[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                break
-        index +=1
-    f.close()
+    tmp, data = read_timeseries(roms_logfile_bs)
+    data = dict(data)
+    roms_massloss_bs_ts = array([data[name + ' Basal Mass Loss'] for name in names_bs])
     t_start = nonzero(roms_time >= calc_start)[0][0]
     if calc_end == 2016:
         t_end = size(roms_time)
@@ -271,7 +228,7 @@ def mip_scatterplot (roms_logfile, roms_logfile_bs, fesom_logfile_lr, fesom_logf
 # Command-line interface
 if __name__ == "__main__":
 
-    roms_logfile = raw_input("Path to ROMS logfile from timeseries_massloss.py: ")
+    roms_logfile = raw_input("Path to ROMS timeseries store from timeseries_massloss.py: ")
     roms_logfile_bs = raw_input("Path to ROMS logfile from timeseries_massloss_bellingshausen.py: ")
     fesom_logfile_lr = raw_input("Path to FESOM low-res logfile from timeseries_massloss.py: ")
     fesom_logfile_bs_lr = raw_input("Path to FESOM low-res logfile from timeseries_massloss_bellingshausen.py: ")
@@ -1,4 +1,6 @@
 from numpy import *
+from timeseries_store import *
+from ice_shelf_regions import ice_shelf_boxes
 
 # Calculate the average amplitude of the seasonal cycle in total basal mass
 # loss over 2002-2016, in MetROMS, low-res FESOM, and high-res FESOM, for the
@@ -19,31 +21,10 @@ def mip_seasonal_cycle (roms_logfile, fesom_logfile_lr, fesom_logfile_hr):
     i_amery = 16
 
     # Read ROMS logfile
-    roms_time = []
-    f = open(roms_logfile, 'r')
-    # Skip the first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            roms_time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break
-    # Set up array for mass loss values at each ice shelf
-    roms_massloss = empty([num_shelves, len(roms_time)])
-    index = 0
-    # Loop over ice shelves
-    while index < num_shelves:
-        t = 0
-        for line in f:
-            try:
-                roms_massloss[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                # Reached the header for the next ice shelf
-                break
-        index +=1
-    f.close()
+    roms_time, data = read_timeseries(roms_logfile)
+    data = dict(data)
+    # One timeseries for each ice shelf, starting with the total
+    roms_massloss = array([data[name + ' Basal Mass Loss'] for name in ice_shelf_boxes()[0]])
     # Add start year to ROMS time array
     roms_time = array(roms_time) + year_start
     # Calculate amplitude for each year
@@ -206,7 +187,7 @@ def mip_seasonal_cycle (roms_logfile, fesom_logfile_lr, fesom_logfile_hr):
 # Command-line interface
 if __name__ == "__main__":
 
-    roms_logfile = raw_input("Path to ROMS logfile from timeseries_massloss.py: ")
+    roms_logfile = raw_input("Path to ROMS timeseries store from timeseries_massloss.py: ")
     fesom_logfile_lr = raw_input("Path to FESOM low-res logfile from timeseries_massloss.py: ")
     fesom_logfile_hr = raw_input("Path to FESOM high-res logfile from timeseries_massloss.py: ")
     mip_seasonal_cycle(roms_logfile, fesom_logfile_lr, fesom_logfile_hr)
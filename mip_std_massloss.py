@@ -1,4 +1,6 @@
 from numpy import *
+from timeseries_store import *
+from ice_shelf_regions import ice_shelf_boxes
 
 def mip_std_massloss (roms_logfile, roms_logfile_bs, fesom_logfile_lr, fesom_logfile_bs_lr, fesom_logfile_hr, fesom_logfile_bs_hr):
 
@@ -19,54 +21,16 @@ def mip_std_massloss (roms_logfile, roms_logfile_bs, fesom_logfile_lr, fesom_log
     num_years_calc = year_end-calc_start+1
 
     # Read ROMS logfile
-    roms_time = []
-    f = open(roms_logfile, 'r')
-    # Skip the first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            roms_time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break
+    roms_time, data = read_timeseries(roms_logfile)
     # Add start year to time array
-    roms_time = array(roms_time) + year_start
-    # Set up array for mass loss values at each ice shelf
-    roms_massloss = empty([num_shelves, len(roms_time)])
-    index = 0
-    # Loop over ice shelves
-    while index < num_shelves:
-        t = 0
-        for line in f:
-            try:
-                roms_massloss[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                # Reached the header for the next ice shelf
-                break
-        index +=1
-    f.close()
-    # Repeat for Bellingshausen
-    f = open(roms_logfile_bs, 'r')
-    f.readline()
-    # Skip the time values (should be the same)
-    for line in f:
-        try:
-            tmp = float(line)
-        except(ValueError):
-            # Reached the header for the next variable
-            break       
-    roms_massloss_bs = empty([num_shelves_bs, len(roms_time)])
-    index = 0
-    while index < num_shelves_bs:
-        t = 0
-        for line in f:
-            try:
-                roms_massloss_bs[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                break
-        index +=1
+    roms_time = roms_time + year_start
+    # Mass loss values at each ice shelf, starting with the total
+    data = dict(data)
+    roms_massloss = array([data[name + ' Basal Mass Loss'] for name in ice_shelf_boxes()[0]])
+    # Repeat for Bellingshausen (time values should be the same)
+    tmp, data = read_timeseries(roms_logfile_bs)
+    data = dict(data)
+    roms_massloss_bs = array([data[name + ' Basal Mass Loss'] for name in names_bs])
 
     # Read FESOM logfiles
     # Low-res
@@ -281,8 +245,8 @@ def fesom_annual_avg (data, days_per_output):
 # Command-line interface
 if __name__ == "__main__":
 
-    roms_logfile = raw_input("Path to ROMS logfile from timeseries_massloss.py: ")
-    roms_logfile_bs = raw_input("Path to ROMS logfile from timeseries_massloss_bellingshausen.py: ")
+    roms_logfile = raw_input("Path to ROMS timeseries store from timeseries_massloss.py: ")
+    roms_logfile_bs = raw_input("Path to ROMS timeseries store from timeseries_massloss_bellingshausen.py: ")
     fesom_logfile_lr = raw_input("Path to FESOM low-res logfile from timeseries_massloss.py: ")
     fesom_logfile_bs_lr = raw_input("Path to FESOM low-res logfile from timeseries_massloss_bellingshausen.py: ")
     fesom_logfile_hr = raw_input("Path to FESOM high-res logfile from timeseries_massloss.py: ")
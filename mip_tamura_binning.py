@@ -3,9 +3,8 @@ from numpy import *
 from matplotlib.pyplot import *
 from scipy.interpolate import griddata
 from cartesian_grid_2d import *
-import sys
-sys.path.insert(0, '/short/y99/kaa561/fesomtools')
-from fesom_grid import *
+from fesom_mesh import *
+from binned_integral import *
 
 def mip_seaice_tamura ():
 
@@ -38,7 +37,6 @@ def mip_seaice_tamura ():
     # Set up longitude bins
     bin_edges = arange(-180, 180+dlon_bin, dlon_bin)
     bin_centres = 0.5*(bin_edges[:-1] + bin_edges[1:])
-    num_bins = len(bin_centres)
 
     print 'Processing MetROMS'
     # Read CICE grid
@@ -58,75 +56,31 @@ def mip_seaice_tamura ():
     id = Dataset(roms_grid, 'r')
     cice_bathy = id.variables['h'][1:-1,1:-1]
     id.close()
-    # Set up integral
-    cice_data_bins = zeros(num_bins)
-    # Loop over all cells
-    num_lon = size(cice_lon,1)
-    num_lat = size(cice_lat,0)
-    for j in range(num_lat):
-        for i in range(num_lon):
-            # Check for land mask or ice shelves
-            if cice_data[j,i] is ma.masked:
-                continue
-            # Check for continental shelf
-            if cice_lat[j,i] < lat0 and cice_bathy[j,i] < h0:
-                # Find the right bin
-                bin_index = nonzero(bin_edges > cice_lon[j,i])[0][0] - 1
-                # Integrate (m^3/y)
-                cice_data_bins[bin_index] += cice_data[j,i]*dA[j,i]
+    # Integrate over the continental shelf (m^3/y); land and ice shelves are
+    # masked in cice_data
+    shelf = (cice_lat < lat0)*(cice_bathy < h0)
+    cice_data_bins = binned_integral(cice_data, cice_lon, bin_edges, weights=dA, mask=invert(shelf))
     # Convert to 10^9 m^3/y
     cice_data_bins *= 1e-9
 
     print 'Processing low-res FESOM'
-    # Build mesh
-    elements_lr = fesom_grid(fesom_mesh_path_lr, circumpolar=True, cross_180=False)
+    # Build mesh (cached)
+    mesh_lr = fesom_mesh(fesom_mesh_path_lr, circumpolar=True, cross_180=False)
     # Read sea ice production
     id = Dataset(fesom_lr_file, 'r')
     fesom_data_lr = id.variables['ice_prod'][:]
     id.close()
-    # Set up integral
-    fesom_data_bins_lr = zeros(num_bins)
-    # Loop over elements
-    for elm in elements_lr:
-        # Exclude ice shelf cavities
-        if not elm.cavity:
-            # Check for continental shelf in 2 steps
-            if all(elm.lat < lat0):
-                elm_bathy = mean([elm.nodes[0].find_bottom().depth, elm.nodes[1].find_bottom().depth, elm.nodes[2].find_bottom().depth])
-                if elm_bathy < h0:
-                    # Get element-averaged sea ice production
-                    elm_data = mean([fesom_data_lr[elm.nodes[0].id], fesom_data_lr[elm.nodes[1].id], fesom_data_lr[elm.nodes[2].id]])
-                    # Find the right bin
-                    elm_lon = mean(elm.lon)
-                    if elm_lon < -180:
-                        elm_lon += 360
-                    elif elm_lon > 180:
-                        elm_lon -= 360
-                    bin_index = nonzero(bin_edges > elm_lon)[0][0] - 1
-                    # Integrate (m^3/y)
-                    fesom_data_bins_lr[bin_index] += elm_data*elm.area()
+    # Integrate over the continental shelf outside the ice shelf cavities (m^3/y)
+    fesom_data_bins_lr = fesom_shelf_bins(mesh_lr, fesom_data_lr, bin_edges, lat0, h0)
     # Convert to 10^9 m^3/y
     fesom_data_bins_lr *= 1e-9
 
     print 'Processing high-res FESOM'
-    elements_hr = fesom_grid(fesom_mesh_path_hr, circumpolar=True, cross_180=False)
+    mesh_hr = fesom_mesh(fesom_mesh_path_hr, circumpolar=True, cross_180=False)
     id = Dataset(fesom_hr_file, 'r')
     fesom_data_hr = id.variables['ice_prod'][:]
     id.close()
-    fesom_data_bins_hr = zeros(num_bins)
-    for elm in elements_hr:
-        if not elm.cavity:
-            if all(elm.lat < lat0):
-                elm_bathy = mean([elm.nodes[0].find_bottom().depth, elm.nodes[1].find_bottom().depth, elm.nodes[2].find_bottom().depth])
-                if elm_bathy < h0:
-                    elm_data = mean([fesom_data_hr[elm.nodes[0].id], fesom_data_hr[elm.nodes[1].id], fesom_data_hr[elm.nodes[2].id]])
-                    elm_lon = mean(elm.lon)
-                    if elm_lon < -180:
-                        elm_lon += 360
-                    elif elm_lon > 180:
-                        elm_lon -= 360
-                    bin_index = nonzero(bin_edges > elm_lon)[0][0] - 1
-                    fesom_data_bins_hr[bin_index] += elm_data*elm.area()
+    fesom_data_bins_hr = fesom_shelf_bins(mesh_hr, fesom_data_hr, bin_edges, lat0, h0)
     fesom_data_bins_hr *= 1e-9
 
     print 'Processing Tamura obs'
@@ -200,14 +154,8 @@ def mip_seaice_tamura ():
     dA_reg = ma.masked_where(bathy_reg > h0, dA_reg)
     # Mask the land mask (and ice shelves) from tamura_data_reg
     tamura_data_reg = ma.masked_where(isnan(tamura_data_reg), tamura_data_reg)
-    # Set up integral
-    tamura_data_bins = zeros(num_bins)
-    # Loop over longitude only
-    for i in range(len(lon_reg)):
-        # Find the right bin
-        bin_index = nonzero(bin_edges > lon_reg[i])[0][0] - 1
-        # Integrate (m^3/y)
-        tamura_data_bins[bin_index] += sum(tamura_data_reg[:,i]*dA_reg[:,i])
+    # Integrate (m^3/y)
+    tamura_data_bins = binned_integral(tamura_data_reg, lon_reg_2d, bin_edges, weights=dA_reg)
     # Convert to 10^9 m^3/y
     tamura_data_bins *= 1e-9
 
@@ -232,3 +180,20 @@ def mip_seaice_tamura ():
     f.close()
     
     
+
+
+# Integrate a FESOM field over the continental shelf (outside the ice shelf
+# cavities) in longitude bins, for every element at once.
+# Input:
+# mesh = dictionary from fesom_mesh
+# node_data = field on the 2D surface nodes
+# bin_edges = 1D array of longitude bin edges (-180 to 180)
+# lat0, h0 = definition of continental shelf: elements entirely south of lat0,
+#            with mean bathymetry shallower than h0
+# Output: 1D array of the area integral of the element-averaged field in each
+#         bin
+def fesom_shelf_bins (mesh, node_data, bin_edges, lat0, h0):
+
+    elm_bathy = element_mean(mesh, mesh['depth'], bottom=True)
+    shelf = invert(mesh['cavity'])*all(mesh['lat'] < lat0, axis=1)*(elm_bathy < h0)
+    return element_lon_bins(mesh, element_mean(mesh, node_data), bin_edges, use=shelf)
@@ -1,5 +1,6 @@
 from numpy import *
 from matplotlib.pyplot import *
+from timeseries_store import *
 
 # Plot MetROMS and FESOM timeseries together, for Drake Passage transport, total
 # Antarctic sea ice area and volume, Antarctic sea ice extent, and basal mass
@@ -7,9 +8,10 @@ from matplotlib.pyplot import *
 # Include the range of observations for Drake Passage transport and ice shelf
 # mass loss.
 # Input:
-# roms_dir = path to ROMS directory containing logfiles from timeseries_dpt.py,
-#            timeseries_seaice.py, timeserires_seaice_extent.py, and 
-#            timeseries_massloss.py. It is assumed they are saved with the
+# roms_dir = path to ROMS directory containing timeseries stores from
+#            timeseries_dpt.py, timeseries_seaice.py,
+#            timeserires_seaice_extent.py, and timeseries_massloss.py (see
+#            timeseries_store.py). It is assumed they are saved with the
 #            filenames dpt.log, seaice.log, seaice_extent.log, and massloss.log.
 # fesom_dir = path to FESOM directory containing logfiles from the equivalent
 #             "fesomtools" scripts with the same names. It is assumed they are
@@ -51,20 +53,8 @@ def mip_timeseries (roms_dir, fesom_dir, annual=False):
 
     # Drake Passage transport
     # Read ROMS timeseries
-    roms_time = []
-    roms_dpt = []
-    f = open(roms_dir + 'dpt.log', 'r')
-    # Skip first line (header for time array)
-    f.readline()
-    for line in f:
-        try:
-            roms_time.append(float(line))
-        except(ValueError):
-            # Reached the header for the next variable
-            break
-    for line in f:
-        roms_dpt.append(float(line))
-    f.close()
+    roms_time, data = read_timeseries(roms_dir + 'dpt.log')
+    roms_dpt = dict(data)['Drake Passage Transport (Sv)']
     # Add start year to ROMS time array
     roms_time = array(roms_time) + year_start
     # Read FESOM timeseries
@@ -122,27 +112,11 @@ def mip_timeseries (roms_dir, fesom_dir, annual=False):
     # Sea ice area and volume
     if not annual:
         # Read ROMS timeseries
-        roms_icearea = []
-        roms_icevolume = []
-        f = open(roms_dir + 'seaice.log', 'r')
-        # Skip the first line (header for time array)
-        f.readline()
-        for line in f:
-            # Skip the time values (already have them from DPT)
-            try:
-                tmp = float(line)
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-        # Sea ice area
-        for line in f:
-            try:
-                roms_icearea.append(float(line))
-            except(ValueError):
-                break
-        # Sea ice volume
-            roms_icevolume.append(float(line))
-        f.close()
+        # Skip the time values (already have them from DPT)
+        tmp, data = read_timeseries(roms_dir + 'seaice.log')
+        data = dict(data)
+        roms_icearea = data['Total Sea Ice Area (million km^2)']
+        roms_icevolume = data['Total Sea Ice Volume (thousand km^3)']
         # Read FESOM timeseries
         fesom_icearea = []
         fesom_icevolume = []
@@ -186,21 +160,9 @@ def mip_timeseries (roms_dir, fesom_dir, annual=False):
     # Sea ice extent
     if not annual:
         # Read ROMS timeseries
-        roms_iceextent = []
-        f = open(roms_dir + 'seaice_extent.log', 'r')
-        # Skip the first line (header for time array)
-        f.readline()
-        for line in f:
-            # Skip the time values (already have them from DPT)
-            try:
-                tmp = float(line)
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-        # Sea ice extent
-        for line in f:
-            roms_iceextent.append(float(line))
-        f.close()
+        # Skip the time values (already have them from DPT)
+        tmp, data = read_timeseries(roms_dir + 'seaice_extent.log')
+        roms_iceextent = dict(data)['Sea Ice Extent (million km^2)']
         # Read FESOM timeseries
         fesom_iceextent = []
         f = open(fesom_dir + 'seaice_extent.log', 'r')
@@ -224,30 +186,11 @@ def mip_timeseries (roms_dir, fesom_dir, annual=False):
 
     # Ice shelf mass loss
     # Read ROMS timeseries
-    roms_massloss = empty([num_shelves, size(roms_time)])
-    f = open(roms_dir + 'massloss.log', 'r')
-    # Skip the first line (header for time array)
-    f.readline()
-    for line in f:
-        # Skip the time values (already have them from DPT)
-        try:
-            tmp = float(line)
-        except(ValueError):
-            # Reached the header for the next variable
-            break
-    # Loop over ice shelves
-    index = 0
-    while index < num_shelves:
-        t = 0
-        for line in f:
-            try:
-                roms_massloss[index, t] = float(line)
-                t += 1
-            except(ValueError):
-                # Reached the header for the next ice shelf
-                break
-        index += 1
-    f.close()
+    # Skip the time values (already have them from DPT); one timeseries for
+    # each ice shelf
+    tmp, data = read_timeseries(roms_dir + 'massloss.log')
+    data = dict(data)
+    roms_massloss = array([data[name + ' Basal Mass Loss'] for name in shelf_names])
     # Read FESOM timeseries
     fesom_massloss = empty([num_shelves, size(fesom_time)])
     f = open(fesom_dir + 'massloss.log', 'r')
@@ -2,9 +2,8 @@ from netCDF4 import Dataset
 from numpy import *
 from matplotlib.pyplot import *
 from cartesian_grid_3d import *
-import sys
-sys.path.insert(0, '/short/y99/kaa561/fesomtools')
-from fesom_grid import *
+from fesom_mesh import *
+from mip_calc_watermasses import fesom_cavity_prisms, watermass_sector_volumes
 
 def mip_watermass_barchart (roms_grid, roms_file, fesom_mesh_lr, fesom_mesh_hr, fesom_file_lr, fesom_file_hr):
 
@@ -119,74 +118,14 @@ def mip_watermass_barchart (roms_grid, roms_file, fesom_mesh_lr, fesom_mesh_hr,
             roms_percent_watermass[wm_key, sector] = roms_vol_watermass[wm_key, sector]/roms_vol_sectors[sector]*100                
 
     print 'Processing low-res FESOM'
-    # Build mesh
-    elements_lr = fesom_grid(fesom_mesh_lr, circumpolar, cross_180)
+    # Build mesh (cached) and find the prisms in the cavities
+    mesh_lr = fesom_mesh(fesom_mesh_lr, circumpolar, cross_180)
+    prisms_lr = fesom_cavity_prisms(mesh_lr)
     id = Dataset(fesom_file_lr, 'r')
     temp_nodes_lr = id.variables['temp'][0,:]
     salt_nodes_lr = id.variables['salt'][0,:]
     id.close()
-    fesom_vol_watermass_lr = zeros([num_watermasses, num_sectors])
-    for i in range(len(elements_lr)):
-        elm = elements_lr[i]
-        if elm.cavity:
-            lon = mean(elm.lon)
-            lat = mean(elm.lat)
-            if lon >= -85 and lon < -30 and lat < -74:
-                sector = 0
-            elif lon >= -30 and lon < 65:
-                sector = 1
-            elif lon >= 65 and lon < 76:
-                sector = 2
-            elif lon >= 76 and lon < 165 and lat >= -74:
-                sector = 3
-            elif (lon >= 155 and lon < 165 and lat < -74) or (lon >= 165) or (lon < -140):
-                sector = 4
-            elif (lon >= -140 and lon < -105) or (lon >= -105 and lon < -98 and lat < -73.1):
-                sector = 5
-            elif (lon >= -104 and lon < -98 and lat >= -73.1) or (lon >= -98 and lon < -66 and lat >= -75):
-                sector = 6
-            elif lon >= -66 and lon < -59 and lat >= -74:
-                sector = 7
-            else:
-                print 'No region found for lon=',str(lon),', lat=',str(lat)
-                break #return
-            # Get area of 2D element
-            area = elm.area()
-            nodes = [elm.nodes[0], elm.nodes[1], elm.nodes[2]]
-            # Loop downward
-            while True:
-                if nodes[0].below is None or nodes[1].below is None or nodes[2].below is None:
-                    # Reached the bottom
-                    break
-                # Calculate average temperature, salinity, and
-                # layer thickness for this 3D triangular prism
-                temp_vals = []
-                salt_vals = []
-                dz_vals = []
-                for n in range(3):
-                    temp_vals.append(temp_nodes_lr[nodes[n].id])
-                    salt_vals.append(salt_nodes_lr[nodes[n].id])
-                    temp_vals.append(temp_nodes_lr[nodes[n].below.id])
-                    salt_vals.append(salt_nodes_lr[nodes[n].below.id])
-                    dz_vals.append(abs(nodes[n].depth - nodes[n].below.depth))
-                    # Get ready for next iteration of loop
-                    nodes[n] = nodes[n].below
-                curr_temp = mean(array(temp_vals))
-                curr_salt = mean(array(salt_vals))
-                curr_volume = area*mean(array(dz_vals))
-                curr_tfrz = -0.0575*curr_salt + 1.7105e-3*sqrt(curr_salt**3) - 2.155e-4*curr_salt**2
-                if curr_temp < curr_tfrz:
-                    wm_key = 0
-                elif curr_salt < 34:
-                    wm_key = 4
-                elif curr_temp > -1.5:
-                    wm_key = 1
-                elif curr_salt < 34.5:
-                    wm_key = 3
-                else:
-                    wm_key = 2
-                fesom_vol_watermass_lr[wm_key, sector] += curr_volume
-                fesom_vol_watermass_lr[wm_key, -1] += curr_volume
+    fesom_vol_watermass_lr = fesom_barchart_volumes(prisms_lr, temp_nodes_lr, salt_nodes_lr, num_watermasses, num_sectors)
     fesom_vol_sectors_lr = sum(fesom_vol_watermass_lr, axis=0)
     fesom_percent_watermass_lr = zeros([num_watermasses, num_sectors])
     for wm_key in range(num_watermasses):
@@ -194,67 +133,13 @@ def mip_watermass_barchart (roms_grid, roms_file, fesom_mesh_lr, fesom_mesh_hr,
             fesom_percent_watermass_lr[wm_key, sector] = fesom_vol_watermass_lr[wm_key, sector]/fesom_vol_sectors_lr[sector]*100
 
     print 'Processing high-res FESOM'
-    elements_hr = fesom_grid(fesom_mesh_hr, circumpolar, cross_180)
-    fesom_vol_watermass_hr = zeros([num_watermasses, num_sectors])
+    mesh_hr = fesom_mesh(fesom_mesh_hr, circumpolar, cross_180)
+    prisms_hr = fesom_cavity_prisms(mesh_hr)
     id = Dataset(fesom_file_hr, 'r')
     temp_nodes_hr = id.variables['temp'][0,:]
     salt_nodes_hr = id.variables['salt'][0,:]
     id.close()
-    for i in range(len(elements_hr)):
-        elm = elements_hr[i]
-        if elm.cavity:
-            lon = mean(elm.lon)
-            lat = mean(elm.lat)
-            if lon >= -85 and lon < -30 and lat < -74:
-                sector = 0
-            elif lon >= -30 and lon < 65:
-                sector = 1
-            elif lon >= 65 and lon < 76:
-                sector = 2
-            elif lon >= 76 and lon < 165 and lat >= -74:
-                sector = 3
-            elif (lon >= 155 and lon < 165 and lat < -74) or (lon >= 165) or (lon < -140):
-                sector = 4
-            elif (lon >= -140 and lon < -105) or (lon >= -105 and lon < -98 and lat < -73.1):
-                sector = 5
-            elif (lon >= -104 and lon < -98 and lat >= -73.1) or (lon >= -98 and lon < -66 and lat >= -75):
-                sector = 6
-            elif lon >= -66 and lon < -59 and lat >= -74:
-                sector = 7
-            else:
-                print 'No region found for lon=',str(lon),', lat=',str(lat)
-                break #return
-            area = elm.area()
-            nodes = [elm.nodes[0], elm.nodes[1], elm.nodes[2]]
-            while True:
-                if nodes[0].below is None or nodes[1].below is None or nodes[2].below is None:
-                    break
-                temp_vals = []
-                salt_vals = []
-                dz_vals = []
-                for n in range(3):
-                    temp_vals.append(temp_nodes_hr[nodes[n].id])
-                    salt_vals.append(salt_nodes_hr[nodes[n].id])
-                    temp_vals.append(temp_nodes_hr[nodes[n].below.id])
-                    salt_vals.append(salt_nodes_hr[nodes[n].below.id])
-                    dz_vals.append(abs(nodes[n].depth - nodes[n].below.depth))
-                    nodes[n] = nodes[n].below
-                curr_temp = mean(array(temp_vals))
-                curr_salt = mean(array(salt_vals))
-                curr_volume = area*mean(array(dz_vals))
-                curr_tfrz = -0.0575*curr_salt + 1.7105e-3*sqrt(curr_salt**3) - 2.155e-4*curr_salt**2
-                if curr_temp < curr_tfrz:
-                    wm_key = 0
-                elif curr_salt < 34:
-                    wm_key = 4
-                elif curr_temp > -1.5:
-                    wm_key = 1
-                elif curr_salt < 34.5:
-                    wm_key = 3
-                else:
-                    wm_key = 2
-                fesom_vol_watermass_hr[wm_key, sector] += curr_volume
-                fesom_vol_watermass_hr[wm_key, -1] += curr_volume
+    fesom_vol_watermass_hr = fesom_barchart_volumes(prisms_hr, temp_nodes_hr, salt_nodes_hr, num_watermasses, num_sectors)
     fesom_vol_sectors_hr = sum(fesom_vol_watermass_hr, axis=0)
     fesom_percent_watermass_hr = zeros([num_watermasses, num_sectors])
     for wm_key in range(num_watermasses):
@@ -301,6 +186,28 @@ def mip_watermass_barchart (roms_grid, roms_file, fesom_mesh_lr, fesom_mesh_hr,
     fig.savefig('wm_barchart.png')
 
 
+# Calculate the volume of each water mass (as classified in this figure) in
+# each sector of the FESOM ice shelf cavities, for all the prisms at once.
+# Input:
+# prisms = dictionary from fesom_cavity_prisms in mip_calc_watermasses.py
+# temp_nodes, salt_nodes = temperature and salinity at each 3D node
+# num_watermasses, num_sectors = number of water masses and sectors
+#                                (including the last one for all cavities)
+# Output: array (water mass x sector) of volume
+def fesom_barchart_volumes (prisms, temp_nodes, salt_nodes, num_watermasses, num_sectors):
+
+    temp_nodes = ma.getdata(temp_nodes)
+    salt_nodes = ma.getdata(salt_nodes)
+    # Average temperature and salinity over the 6 nodes of each prism
+    temp = mean(concatenate((temp_nodes[prisms['top']], temp_nodes[prisms['bottom']]), axis=1), axis=1)
+    salt = mean(concatenate((salt_nodes[prisms['top']], salt_nodes[prisms['bottom']]), axis=1), axis=1)
+    # Surface freezing point at this salinity
+    tfrz = -0.0575*salt + 1.7105e-3*sqrt(salt**3) - 2.155e-4*salt**2
+    # ISW, AASW, MCDW, LSSW, otherwise HSSW
+    wm_key = select([temp < tfrz, salt < 34, temp > -1.5, salt < 34.5], [0, 4, 1, 3], default=2)
+    return watermass_sector_volumes(wm_key[None,:], prisms['sector'], prisms['volume'], num_watermasses, num_sectors)[0,:,:]
+
+
 # Command-line interface
 if __name__ == "__main__":
 
@@ -86,8 +86,11 @@ def mip_zonal_cavity_ts (roms_grid, roms_file, fesom_mesh_path_lr, fesom_file_lr
         if roms_lon0 < 0:
             roms_lon0 += 360
         # Interpolate to given longitude
-        roms_temp, roms_z, roms_lat = interp_lon_roms(roms_temp_3d, z_3d, lat_2d, lon_2d, roms_lon0)
-        roms_salt, roms_z, roms_lat = interp_lon_roms(roms_salt_3d, z_3d, lat_2d, lon_2d, roms_lon0)
+        section = lon_section(lon_2d, roms_lon0)
+        roms_temp = apply_lon_section(section, roms_temp_3d)
+        roms_salt = apply_lon_section(section, roms_salt_3d)
+        roms_z = apply_lon_section(section, z_3d)
+        roms_lat = tile(apply_lon_section(section, lat_2d), (N,1))
         # Figure out deepest depth
         flag = (roms_lat >= lat_min[index])*(roms_lat <= lat_max[index])
         depth_min_tmp = amin(roms_z[flag])
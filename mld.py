@@ -0,0 +1,127 @@
+from netCDF4 import Dataset
+from numpy import *
+from unesco import *
+
+# Mixed layer depth from a potential density threshold, for whole arrays of
+# water columns at once: ROMS fields (time x depth x lat x lon) or FESOM node
+# columns (from fesom_mesh). The mixed layer depth is the depth of the first
+# level below the surface where potential density exceeds surface density by
+# a given anomaly (0.03 kg/m^3 as in Sallee et al 2013), relative to the
+# surface (so it is the thickness of the mixed layer in ice shelf cavities),
+# or the depth of the bottom if the anomaly is never reached. The first
+# crossing in every column is found with a single argmax along the depth
+# axis, rather than scanning down each column in turn.
+
+# Default density anomaly (kg/m^3)
+density_anom = 0.03
+
+
+# Find the mixed layer depth of a set of water columns.
+# Input:
+# density = array of potential density (any dimension), with levels ordered
+#           from the surface downward along the given axis. Columns may be
+#           masked below their bottom (e.g. FESOM columns of different
+#           lengths); columns masked at the surface are land.
+# depth = array of depth of each level (positive, in m), broadcastable to
+#         density
+# anom = optional density anomaly (default density_anom)
+# axis = optional depth axis of density (default -1)
+# interpolate = optional boolean: linearly interpolate between the levels on
+#               either side of the crossing to find the depth where the
+#               anomaly is exactly reached, rather than taking the depth of
+#               the first level past it (default False, as in the original
+#               mip_mld)
+# Output: masked array of mixed layer depth, the shape of density without the
+#         depth axis; masked for land
+def mld_columns (density, depth, anom=density_anom, axis=-1, interpolate=False):
+
+    # Move depth to the last axis
+    depth = moveaxis(broadcast_to(depth, shape(density)), axis, -1)
+    density = moveaxis(density, axis, -1)
+    valid = invert(ma.getmaskarray(density))
+    density = ma.getdata(density)
+    threshold = density[...,0] + anom
+    cross = valid*(density >= threshold[...,None])
+    found = any(cross, axis=-1)
+    # First crossing; if there isn't one, the bottom (deepest valid level)
+    k = where(found, argmax(cross, axis=-1), maximum(sum(valid, axis=-1) - 1, 0))
+    mld_depth = take_along_axis(depth, k[...,None], axis=-1)[...,0]
+    if interpolate:
+        # Interpolate between the levels above and below the crossing (the
+        # level above is always lighter than the threshold)
+        k_above = maximum(k-1, 0)
+        depth_above = take_along_axis(depth, k_above[...,None], axis=-1)[...,0]
+        density_above = take_along_axis(density, k_above[...,None], axis=-1)[...,0]
+        density_below = take_along_axis(density, k[...,None], axis=-1)[...,0]
+        drho = density_below - density_above
+        frac = (threshold - density_above)/where(drho > 0, drho, 1)
+        mld_depth = where(found*(k > 0), depth_above + frac*(mld_depth - depth_above), mld_depth)
+    return ma.masked_where(invert(valid[...,0]), mld_depth - depth[...,0])
+
+
+# Mixed layer depth on the ROMS grid.
+# Input:
+# density = array of potential density, dimension (time x) depth x lat x lon,
+#           with the bottom level first as in ROMS
+# z = z-coordinates of each level (negative, e.g. from calc_z or
+#     grid_geometry), dimension depth x lat x lon
+# anom, interpolate = optional, as in mld_columns
+# Output: masked array of mixed layer depth, dimension (time x) lat x lon
+def mld_roms (density, z, anom=density_anom, interpolate=False):
+
+    axis = ndim(density) - 3
+    # Flip so the surface comes first
+    density = flip(density, axis=axis)
+    depth = flip(-z, axis=0)
+    return mld_columns(density, depth, anom, axis, interpolate)
+
+
+# Mixed layer depth at the FESOM surface nodes.
+# Input:
+# mesh = dictionary from fesom_mesh or element_arrays in fesom_mesh.py
+# density_nodes = array of potential density at the 3D nodes, dimension
+#                 (time x) node
+# anom, interpolate = optional, as in mld_columns
+# Output: masked array of mixed layer depth, dimension (time x) 2D node;
+#         average it over the elements with element_mean in fesom_mesh.py
+def mld_fesom (mesh, density_nodes, anom=density_anom, interpolate=False):
+
+    columns = mesh['columns']
+    below_bottom = columns < 0
+    # Gather each water column (padding points at node 0, then masked)
+    index = where(below_bottom, 0, columns)
+    density = ma.masked_where(broadcast_to(below_bottom, shape(density_nodes)[:-1] + shape(columns)), ma.getdata(density_nodes)[...,index])
+    depth = where(below_bottom, 0, mesh['depth'][index])
+    return mld_columns(density, depth, anom, -1, interpolate)
+
+
+# Calculate the mixed layer depth at every record of a ROMS history/averages
+# file, reading a block of records at a time so a whole run can be processed
+# without holding its 3D temperature and salinity in memory.
+# Input:
+# file_path = path to ROMS history/averages file
+# z = z-coordinates of each level (negative), dimension depth x lat x lon,
+#     covering the whole grid as stored in the file
+# anom, interpolate = optional, as in mld_columns
+# block_size = optional number of time records to read at once (default 10)
+# Output:
+# time = 1D array of time values, straight out of the file
+# mld = masked array of mixed layer depth, time x lat x lon
+def mld_roms_file (file_path, z, anom=density_anom, interpolate=False, block_size=10):
+
+    id = Dataset(file_path, 'r')
+    time = id.variables['ocean_time'][:]
+    num_time = size(time)
+    mld = ma.empty([num_time, size(z,1), size(z,2)])
+    start_t = 0
+    while start_t < num_time:
+        end_t = minimum(start_t+block_size, num_time)
+        print 'Processing time indices ' + str(start_t+1) + ' to ' + str(end_t)
+        temp = id.variables['temp'][start_t:end_t,:,:,:]
+        salt = id.variables['salt'][start_t:end_t,:,:,:]
+        # Potential density: pressure zero
+        density = unesco(temp, salt, zeros(shape(temp)))
+        mld[start_t:end_t,:,:] = mld_roms(density, z, anom, interpolate)
+        start_t = end_t
+    id.close()
+    return time, mld
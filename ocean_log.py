@@ -0,0 +1,182 @@
+from numpy import *
+from os import rename
+from os.path import basename, dirname, exists, getsize, join
+from zlib import crc32
+import re
+
+# Read the diagnostics which ROMS writes to ocean.log every few timesteps
+# (the first of the two lines of output for each timestep: step number,
+# model time, kinetic, potential, and total energy, and net volume), so they
+# can be plotted during a long run without re-parsing millions of lines each
+# time. The columns are saved in an index (npz file) next to the log along
+# with the byte offset which has been read up to, so each call only reads
+# and parses whatever ROMS has written since the last one. If the log has
+# been replaced (e.g. a new run writing to the same path) the index is
+# rebuilt from the start.
+
+# Columns in the index
+log_columns = ['step', 'time', 'ke', 'pe', 'te', 'volume']
+# First line of output for a timestep, e.g.
+#      1440    10 00:00:00  3.114523E-03  1.968475E+04  1.968475E+04  3.008306E+16  01
+# captured from the step number to the net volume. The second line (indices
+# in brackets, then CFL numbers and maximum speed) and messages about reading
+# forcing or writing history files don't match. Matching starts at a newline
+# rather than using ^, which is a lot faster on big logs.
+diag_line = re.compile(r'\n[ \t]*(\d+[ \t]+\d+[ \t]+\d+:\d+:[\d.]+(?:[ \t]+\S+){4})')
+# Header line which comes just before the timestepping starts
+step_header = re.compile(r'\n[ \t]*STEP\s')
+# Number of bytes at the start of the log used to check it hasn't been
+# replaced since the index was saved
+check_bytes = 4096
+# Maximum number of bytes to read and parse at once
+chunk_bytes = 64*1024*1024
+
+
+# Read diagnostics from an ocean.log file, updating its index first.
+# Input:
+# file_path = path to ocean.log
+# step_range = optional [start, end] list; only return timesteps in this
+#              range (inclusive)
+# cache_dir = optional path to a directory to keep the index in (default the
+#             same directory as the log)
+# Output: dictionary containing 1D arrays of
+# step = timestep number
+# time = model time in days
+# ke, pe, te = kinetic, potential, and total energy
+# volume = net volume (m^3)
+def read_log (file_path, step_range=None, cache_dir=None):
+
+    index = update_log_index(file_path, cache_dir)
+    start = 0
+    end = size(index['step'])
+    if step_range is not None:
+        # Steps are always increasing within one log, so search for the bounds
+        start = searchsorted(index['step'], step_range[0], side='left')
+        end = searchsorted(index['step'], step_range[1], side='right')
+    log = {}
+    for var in log_columns:
+        log[var] = index[var][start:end]
+    return log
+
+
+# Bring the index of an ocean.log file up to date, reading only the part of
+# the log written since it was last saved.
+# Input:
+# file_path = path to ocean.log
+# cache_dir = optional directory for the index, as in read_log
+# Output: dictionary containing the columns in log_columns, as well as
+# offset = number of bytes of the log which have been parsed (always the end
+#          of a complete line)
+# started = whether the STEP header has been found yet
+# check = checksum of the start of the log
+def update_log_index (file_path, cache_dir=None):
+
+    if cache_dir is None:
+        cache_dir = dirname(file_path)
+    index_file = join(cache_dir, basename(file_path) + '_index.npz')
+    file_size = getsize(file_path)
+    file = open(file_path, 'rb')
+    check = crc32(file.read(check_bytes)) & 0xffffffff
+
+    index = None
+    if exists(index_file):
+        npz = load(index_file)
+        index = {}
+        for var in npz.files:
+            index[var] = npz[var]
+        npz.close()
+        if index['offset'] > file_size or (index['offset'] >= check_bytes and index['check'] != check):
+            # The log has been replaced or truncated
+            print 'Rebuilding index for ' + file_path
+            index = None
+    if index is None:
+        index = {'offset':0, 'started':False, 'check':check}
+        for var in log_columns:
+            index[var] = array([])
+    offset = int(index['offset'])
+    started = bool(index['started'])
+
+    new_columns = []
+    file.seek(offset)
+    while offset < file_size:
+        chunk = file.read(chunk_bytes)
+        if len(chunk) == 0:
+            break
+        # Only parse up to the last complete line; ROMS may be partway
+        # through writing the next one
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            if len(chunk) < chunk_bytes:
+                break
+            # A single line longer than a whole chunk; skip over it
+            end = len(chunk)
+        # Each chunk starts at the beginning of a line
+        text = '\n' + chunk[:end].decode('ascii', 'replace')
+        offset += end
+        file.seek(offset)
+        if not started:
+            header = step_header.search(text)
+            if header is None:
+                continue
+            started = True
+            # Skip to the end of the header line
+            text = text[text.find('\n', header.end()):]
+        matches = diag_line.findall(text)
+        if len(matches) > 0:
+            new_columns.append(parse_diagnostics(matches))
+    file.close()
+
+    if offset != index['offset']:
+        for n in range(len(new_columns)):
+            for var in log_columns:
+                index[var] = concatenate((index[var], new_columns[n][var]))
+        index['offset'] = offset
+        index['started'] = started
+        index['check'] = check
+        # Write under a temporary name and rename, so that a plot running
+        # while the index is being saved never sees half of it
+        tmp_file = index_file[:-len('.npz')] + '.tmp.npz'
+        savez(tmp_file, **index)
+        rename(tmp_file, index_file)
+    return index
+
+
+# Convert the diagnostic lines matched by diag_line into columns.
+# Input: matches = list of strings from diag_line.findall
+# Output: dictionary of 1D arrays, one for each variable in log_columns
+def parse_diagnostics (matches):
+
+    # step, day, hours, minutes, seconds, KE, PE, total energy, volume
+    try:
+        fields = fromstring(' '.join(matches).replace(':', ' '), sep=' ')
+    except ValueError:
+        fields = array([])
+    if size(fields) != 9*len(matches):
+        # Something didn't convert (e.g. Fortran prints asterisks when a
+        # number overflows its format), so go word by word and make those
+        # values NaN
+        fields = []
+        for line in matches:
+            for word in line.replace(':', ' ').split():
+                try:
+                    fields.append(float(word))
+                except ValueError:
+                    fields.append(nan)
+        fields = array(fields)
+    fields = reshape(fields, (-1, 9))
+    time = fields[:,1] + fields[:,2]/24.0 + fields[:,3]/(24.0*60) + fields[:,4]/(24.0*60*60)
+    columns = {'step':fields[:,0], 'time':time}
+    for n in range(4):
+        columns[log_columns[n+2]] = fields[:,n+5]
+    return columns
+
+
+# Command-line interface
+if __name__ == "__main__":
+
+    file_path = raw_input("Path to ocean.log file: ")
+    log = read_log(file_path)
+    print str(size(log['step'])) + ' timesteps indexed'
+    if size(log['step']) > 0:
+        print 'Last timestep ' + str(int(log['step'][-1])) + ', day ' + str(log['time'][-1])
+        print 'Kinetic energy ' + str(log['ke'][-1]) + ', net volume ' + str(log['volume'][-1])
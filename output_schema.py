@@ -0,0 +1,188 @@
+from numpy import *
+
+# Shared output settings for the NetCDF files generated for ROMS/CICE
+# (atmospheric and other forcing, initial and boundary conditions, tides, and
+# derived fields). Every variable's metadata is declared once, in
+# var_attributes, and create_var sets up variables with zlib compression and
+# the shuffle filter, chunked one (or a few) time records at a time with the
+# whole of the other dimensions, since ROMS and CICE read forcing a record at
+# a time. Forcing fields can be stored in single precision and/or quantised
+# to a given number of decimal places (see forcing_storage), and records can
+# be buffered into multi-record slabs (see record_buffer) so that the file is
+# written to once per slab rather than once per record.
+
+# Attributes of each variable, by name. Files which use the same name with
+# different units (e.g. time) can override these in create_var.
+var_attributes = {
+    # Grid
+    'lon_rho': {'long_name':'longitude of rho-points', 'units':'degree_east'},
+    'lat_rho': {'long_name':'latitude of rho-points', 'units':'degree_north'},
+    'tstart': {'long_name':'start processing day', 'units':'day'},
+    'tend': {'long_name':'end processing day', 'units':'day'},
+    'theta_s': {'long_name':'S-coordinate surface control parameter'},
+    'theta_b': {'long_name':'S-coordinate bottom control parameter', 'units':'nondimensional'},
+    'Tcline': {'long_name':'S-coordinate surface/bottom layer width', 'units':'meter'},
+    'hc': {'long_name':'S-coordinate parameter, critical depth', 'units':'meter'},
+    'sc_r': {'long_name':'S-coordinate at rho-points', 'units':'nondimensional', 'valid_min':-1.0, 'valid_max':0.0},
+    'Cs_r': {'long_name':'S-coordinate stretching curves at RHO-points', 'units':'nondimensional', 'valid_min':-1.0, 'valid_max':0.0},
+    # Time
+    'time': {'units':'days since 1992-01-01 00:00:0.0'},
+    'ocean_time': {'long_name':'time since initialization', 'units':'seconds'},
+    'sss_time': {'long_name':'time since initialization', 'units':'days', 'cycle_length':365.25},
+    # Ocean state (initial conditions)
+    'u': {'long_name':'u-momentum component', 'units':'meter second-1'},
+    'v': {'long_name':'v-momentum component', 'units':'meter second-1'},
+    'ubar': {'long_name':'vertically integrated u-momentum component', 'units':'meter second-1'},
+    'vbar': {'long_name':'vertically integrated v-momentum component', 'units':'meter second-1'},
+    'zeta': {'long_name':'free-surface', 'units':'meter'},
+    'temp': {'long_name':'potential temperature', 'units':'Celsius'},
+    'salt': {'long_name':'salinity', 'units':'PSU'},
+    'rho': {'long_name':'density', 'units':'kg/m^3'},
+    # Northern boundary conditions
+    'temp_north': {'long_name':'northern boundary potential temperature', 'units':'Celsius'},
+    'salt_north': {'long_name':'northern boundary salinity', 'units':'PSU'},
+    'u_north': {'long_name':'northern boundary u-momentum component', 'units':'meter second-1'},
+    'v_north': {'long_name':'northern boundary v-momentum component', 'units':'meter second-1'},
+    'ubar_north': {'long_name':'northern boundary vertically integrated u-momentum component', 'units':'meter second-1'},
+    'vbar_north': {'long_name':'northern boundary vertically integrated v-momentum component', 'units':'meter second-1'},
+    'zeta_north': {'long_name':'northern boundary sea surface height', 'units':'meter'},
+    # Atmospheric forcing
+    'Pair': {'long_name':'surface air pressure', 'units':'Pascal'},
+    'Tair': {'long_name':'surface air temperature', 'units':'Celsius'},
+    'Qair': {'long_name':'surface relative humidity', 'units':'kg/kg'},
+    'cloud': {'long_name':'cloud fraction', 'units':'nondimensional'},
+    'Uwind': {'long_name':'surface u-wind component', 'units':'m/s'},
+    'Vwind': {'long_name':'surface v-wind component', 'units':'m/s'},
+    'rain': {'long_name':'rain fall rate', 'units':'m_per_12hr'},
+    'snow': {'long_name':'snow fall rate', 'units':'m_per_12hr'},
+    'evaporation': {'long_name':'evaporation rate', 'units':'m_per_12hr'},
+    # Other forcing
+    'icebergs': {'long_name':'freshwater flux from iceberg melt', 'units':'kg/m^2/s'},
+    'SSS': {'long_name':'surface salinity', 'units':'psu'},
+    'tide_period': {'long_name':'tide angular period', 'units':'seconds'},
+    'tide_Ephase': {'long_name':'tidal elevation phase angle', 'units':'degrees, time of maximum elevation with respect to chosen time origin'},
+    'tide_Eamp': {'long_name':'tidal elevation amplitude', 'units':'meter'},
+    # Fields on the common grid (common_grid.py)
+    'longitude': {'units':'degrees'},
+    'latitude': {'units':'degrees'},
+    'mask': {'units':'1'},
+    'sst': {'long_name':'sea surface temperature', 'units':'C'},
+    'sss': {'long_name':'sea surface salinity', 'units':'psu'},
+    'shflux': {'long_name':'surface heat flux into ocean', 'units':'W/m^2'},
+    'ssflux': {'long_name':'surface virtual salinity flux into ocean', 'units':'psu m/s'},
+    'aice': {'long_name':'sea ice concentration', 'units':'1'},
+    'hice': {'long_name':'sea ice thickness', 'units':'m'},
+    'uocn': {'long_name':'ocean surface velocity eastward', 'units':'m/s'},
+    'vocn': {'long_name':'ocean surface velocity northward', 'units':'m/s'},
+    'uice': {'long_name':'sea ice velocity eastward', 'units':'m/s'},
+    'vice': {'long_name':'sea ice velocity northward', 'units':'m/s'},
+    'sustr': {'long_name':'zonal surface stress', 'units':'N/m^2'},
+    'svstr': {'long_name':'meridional surface stress', 'units':'N/m^2'},
+    'curl_str': {'long_name':'curl of surface stress', 'units':'N/m^3'}
+    }
+
+# How to store forcing fields (variables created with forcing=True): dtype
+# 'f8' or 'f4', and digits = number of decimal places to keep (None for all).
+# Quantising (e.g. digits=2 for Celsius or m/s) makes the compression much
+# more effective. Coordinates, time, and initial/boundary conditions are
+# always stored exactly in double precision.
+forcing_storage = {'dtype':'f8', 'digits':None}
+
+
+# Create a variable with compression, chunking, and the attributes from
+# var_attributes.
+# Input:
+# id = Dataset open for writing, with the dimensions already defined
+# name = variable name
+# dims = tuple of dimension names
+# forcing = optional boolean: store as in forcing_storage (default False:
+#           double precision, exact)
+# dtype = optional dtype to store in, overriding the above (e.g. 'f4')
+# time_chunk = optional number of time records per chunk, if the first
+#              dimension is unlimited (default 1)
+# fill_value = optional fill value for masked points (default the NetCDF
+#              default)
+# Any other keyword arguments are attributes to set as well as (or instead
+# of) those in var_attributes.
+# Output: the new variable
+def create_var (id, name, dims, forcing=False, dtype=None, time_chunk=1, fill_value=None, **attributes):
+
+    digits = None
+    if forcing:
+        digits = forcing_storage['digits']
+        if dtype is None:
+            dtype = forcing_storage['dtype']
+    if dtype is None:
+        dtype = 'f8'
+    if isinstance(dims, str):
+        dims = (dims,)
+    chunksizes = None
+    if len(dims) > 0 and id.dimensions[dims[0]].isunlimited():
+        # A slab of time records, and everything else
+        chunksizes = [time_chunk] + [len(id.dimensions[dim]) for dim in dims[1:]]
+    var = id.createVariable(name, dtype, dims, zlib=True, shuffle=True, chunksizes=chunksizes, least_significant_digit=digits, fill_value=fill_value)
+    all_attributes = dict(var_attributes.get(name, {}))
+    all_attributes.update(attributes)
+    var.setncatts(all_attributes)
+    return var
+
+
+# Set up a buffer of time records, to be written to a file a slab at a time.
+# Input:
+# id = Dataset open for writing
+# var_names = list of time-dependent variables to write; put the time
+#             variable last so that num_records_written only counts
+#             complete records
+# start = optional time index of the first record to write (default 0)
+# slab_size = optional number of records per slab (default 12)
+# Output: buffer (dictionary) to pass to buffer_record and flush_buffer
+def record_buffer (id, var_names, start=0, slab_size=12):
+
+    return {'id':id, 'vars':var_names, 'start':start, 'slab_size':slab_size, 'records':[]}
+
+
+# Add a time record to a buffer, and write out the slab if it's full.
+# Input:
+# buffer = dictionary from record_buffer
+# record = list of values for this record, one for each variable in the
+#          buffer in the same order (scalars for time, arrays for fields)
+def buffer_record (buffer, record):
+
+    buffer['records'].append(record)
+    if len(buffer['records']) >= buffer['slab_size']:
+        flush_buffer(buffer)
+
+
+# Write any records left in a buffer to the file. Call this before closing
+# the file.
+# Input: buffer = dictionary from record_buffer
+def flush_buffer (buffer):
+
+    records = buffer['records']
+    if len(records) == 0:
+        return
+    t_start = buffer['start']
+    t_end = t_start + len(records)
+    for n in range(len(buffer['vars'])):
+        slab = ma.empty((len(records),) + shape(records[0][n]))
+        for t in range(len(records)):
+            slab[t,...] = records[t][n]
+        buffer['id'].variables[buffer['vars'][n]][t_start:t_end] = slab
+    buffer['id'].sync()
+    buffer['start'] = t_end
+    buffer['records'] = []
+
+
+# Find the number of time records which have been completely written to a
+# file (the time values are written last).
+# Input:
+# fid = open Dataset for the output file
+# time_var = optional name of time variable (default 'time')
+# Output: integer number of records; the next record to write
+def num_records_written (fid, time_var='time'):
+
+    time_mask = ma.getmaskarray(fid.variables[time_var][:])
+    if any(time_mask):
+        return nonzero(time_mask)[0][0]
+    else:
+        return size(time_mask)
@@ -0,0 +1,370 @@
+from netCDF4 import Dataset
+from numpy import *
+from multiprocessing import Pool, cpu_count
+from collections import deque
+from os.path import exists
+from interp_era2roms import *
+from output_schema import *
+
+# Generate ROMS-CICE atmospheric forcing files for many years at once, spread
+# across a pool of local processes. This does the same job as
+# romscice_atm_subdaily.py, romscice_evap.py, romscice_atm_monthly.py and
+# romscice_gpcp.py, but instead of one year, one variable, and one time
+# record at a time, the work is split into (year, variable, block of time
+# records) units which are interpolated in parallel. The interpolation weights
+# are calculated once per source grid and shared by all the workers, and the
+# main process is the only one which writes output, so the files are
+# assembled in order. If the script is killed partway through, running it
+# again carries on from the last complete block of records in each file.
+# Input:
+# product_names = list of strings containing the products to generate; any
+#                 of 'subdaily_atm', 'subdaily_ppt', 'monthly_atm',
+#                 'monthly_ppt', 'gpcp' (see forcing_products below)
+# first_year, last_year = integers containing the range of years to process
+# num_procs = optional integer containing the number of processes to use
+#             (default all the cores on this node)
+# block_size = optional integer containing the number of time records in each
+#              unit of work (default 20)
+def parallel_forcing (product_names, first_year, last_year, num_procs=None, block_size=20):
+
+    # Path to ROMS grid file; other users will need to change this
+    grid_file = '/short/m68/kaa561/metroms_iceshelf/apps/common/grid/circ30S_quarterdegree.nc'
+
+    if num_procs is None:
+        num_procs = cpu_count()
+    products = forcing_products()
+
+    print 'Reading ROMS grid'
+    id = Dataset(grid_file, 'r')
+    lon_roms = id.variables['lon_rho'][:,:]
+    lat_roms = id.variables['lat_rho'][:,:]
+    id.close()
+
+    # Calculate the weights for each source grid once, and save them to their
+    # files so the workers can read them
+    for name in product_names:
+        product = products[name]
+        print 'Calculating interpolation weights for ' + name
+        id = Dataset(product['input_file'](first_year), 'r')
+        lon_src = id.variables[product['lon_name']][:]
+        lat_src = id.variables[product['lat_name']][:]
+        id.close()
+        era2roms_weights(lon_src, lat_src, lon_roms, lat_roms, weight_file=product['weight_file'])
+
+    # Set up the output files (or find where to restart existing ones) and
+    # build the list of work units. Units for the same output file are
+    # consecutive and in time order.
+    units = []
+    times = {}
+    for name in product_names:
+        product = products[name]
+        for year in range(first_year, last_year+1):
+            path = product['output_file'](year)
+            time = product['time'](year)
+            times[path] = time
+            if exists(path):
+                id = Dataset(path, 'r')
+                start = num_records_written(id)
+                id.close()
+                if start == size(time):
+                    print path + ' is already complete'
+                elif start > 0:
+                    print 'Restarting ' + path + ' from record ' + str(start+1)
+            else:
+                setup_forcing_file(path, lon_roms, lat_roms, product['groups'])
+                start = 0
+            for t_start in range(start, size(time), block_size):
+                t_end = minimum(t_start+block_size, size(time))
+                for group in product['groups']:
+                    units.append((name, year, group[0], t_start, t_end))
+
+    print 'Processing ' + str(len(units)) + ' units of work on ' + str(num_procs) + ' processes'
+    pool = Pool(num_procs, init_forcing_worker, (grid_file, product_names))
+    # Only keep a few units per process submitted at once, so that if the
+    # workers get ahead of the writer the finished fields don't pile up
+    max_pending = 4*num_procs
+    pending = deque()
+    next_unit = 0
+    out_file = None
+    out_id = None
+    count = 0
+    while count < len(units):
+        while next_unit < len(units) and len(pending) < max_pending:
+            pending.append(pool.apply_async(process_forcing_unit, (units[next_unit],)))
+            next_unit += 1
+        # Results are written in the order the units were submitted, so only
+        # one output file needs to be open at once
+        unit, fields = pending.popleft().get()
+        name, year, group_name, t_start, t_end = unit
+        path = products[name]['output_file'](year)
+        if path != out_file:
+            if out_id is not None:
+                out_id.close()
+            print 'Writing ' + path
+            out_file = path
+            out_id = Dataset(out_file, 'a')
+        for var in fields:
+            out_id.variables[var][t_start:t_end,:,:] = fields[var]
+        if group_name == products[name]['groups'][-1][0]:
+            # This block of records is complete; write the time values last
+            # so that num_records_written only counts complete records
+            out_id.variables['time'][t_start:t_end] = times[path][t_start:t_end]
+            out_id.sync()
+        count += 1
+        if count % 50 == 0:
+            print 'Finished ' + str(count) + ' of ' + str(len(units)) + ' units'
+    if out_id is not None:
+        out_id.close()
+    pool.close()
+    pool.join()
+
+
+# Describe each forcing product this script can generate. Other users will
+# need to change the file paths.
+# Output: dictionary of products, each a dictionary containing
+#         input_file, output_file = functions of year giving file paths
+#         weight_file = path to file containing interpolation weights
+#         lon_name, lat_name = names of source grid variables
+#         time = function of year giving output time values (days since
+#                1992-01-01 00:00:0.0)
+#         groups = list of (group name, list of output variables); all output
+#                  variables in a group are computed together
+#         read = function of (product, year, t_start, t_end) giving a
+#                dictionary of input data for those records
+def forcing_products ():
+
+    era_dir = '/short/m68/kaa561/metroms_iceshelf/data/originals/ERA_Interim/'
+    out_dir = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/'
+    era_monthly_dir = '/short/y99/kaa561/FESOM/ERA_Interim_monthly/'
+    out_monthly_dir = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/monthly/historical/'
+    gpcp_dir = '/short/m68/kaa561/gpcp/'
+    out_gpcp_dir = '/short/m68/kaa561/metroms_iceshelf/data/GPCP/'
+
+    era_groups = [('Pair', ['Pair']), ('Tair', ['Tair']), ('Qair', ['Qair']), ('cloud', ['cloud'])]
+    monthly_time = lambda year: (year-1992)*365.25 + (arange(12) + 0.5)/12*365.25
+
+    products = {}
+    products['subdaily_atm'] = {
+        'input_file':lambda year: era_dir + 'AN_' + str(year) + '_subdaily_orig.nc',
+        'output_file':lambda year: out_dir + 'AN_' + str(year) + '_subdaily.nc',
+        'weight_file':out_dir + 'era2roms_weights.nc',
+        'lon_name':'longitude', 'lat_name':'latitude',
+        'time':lambda year: era_time(era_dir + 'AN_' + str(year) + '_subdaily_orig.nc', 0),
+        'groups':era_groups + [('wind', ['Uwind', 'Vwind'])],
+        'read':read_era}
+    products['subdaily_ppt'] = {
+        'input_file':lambda year: era_dir + 'FC_' + str(year) + '_subdaily_orig.nc',
+        'output_file':lambda year: out_dir + 'FC_' + str(year) + '_subdaily.nc',
+        'weight_file':out_dir + 'era2roms_weights.nc',
+        'lon_name':'longitude', 'lat_name':'latitude',
+        'time':lambda year: era_time(era_dir + 'FC_' + str(year) + '_subdaily_orig.nc', 0.5),
+        'groups':[('rain', ['rain']), ('snow', ['snow']), ('evaporation', ['evaporation'])],
+        'read':read_era}
+    # Monthly winds are not rotated, as in romscice_atm_monthly.py
+    products['monthly_atm'] = {
+        'input_file':lambda year: era_monthly_dir + 'AN_' + str(year) + '_monthly_orig.nc',
+        'output_file':lambda year: out_monthly_dir + 'AN_' + str(year) + '_monthly.nc',
+        'weight_file':out_monthly_dir + 'era2roms_weights.nc',
+        'lon_name':'lon', 'lat_name':'lat',
+        'time':monthly_time,
+        'groups':era_groups + [('Uwind', ['Uwind']), ('Vwind', ['Vwind'])],
+        'read':read_era}
+    products['monthly_ppt'] = {
+        'input_file':lambda year: era_monthly_dir + 'FC_' + str(year) + '_monthly_orig.nc',
+        'output_file':lambda year: out_monthly_dir + 'FC_' + str(year) + '_monthly.nc',
+        'weight_file':out_monthly_dir + 'era2roms_weights.nc',
+        'lon_name':'lon', 'lat_name':'lat',
+        'time':monthly_time,
+        'groups':[('rain', ['rain']), ('snow', ['snow'])],
+        'read':read_era}
+    products['gpcp'] = {
+        'input_file':lambda year: gpcp_dir + 'gpcp_cdr_v23rB1_y' + str(year) + '_m01.nc',
+        'output_file':lambda year: out_gpcp_dir + 'precip_' + str(year) + '_monthly.nc',
+        'weight_file':out_gpcp_dir + 'gpcp2roms_weights.nc',
+        'lon_name':'longitude', 'lat_name':'latitude',
+        'time':gpcp_time,
+        'groups':[('gpcp_rain', ['rain'])],
+        'read':read_gpcp}
+    return products
+
+
+# Read ERA-Interim time values and convert to days since 1992-01-01 00:00:0.0.
+# Input:
+# file_path = path to ERA-Interim file
+# shift = number of days to subtract (0.5 for precipitation, to switch from
+#         precipitation over the preceding 12 hours to the following 12 hours)
+# Output: time = 1D array of time values
+def era_time (file_path, shift):
+
+    id = Dataset(file_path, 'r')
+    time = id.variables['time'][:] # hours since 1900-01-01 00:00:0.0
+    id.close()
+    # Note that there were 22 leap years between 1900 and 1992
+    return time/24.0 - 92*365 - 22 - shift
+
+
+# Time values for GPCP monthly forcing: the 15th of each month at midnight,
+# in days since 1992-01-01 00:00:0.0.
+# Input: year = integer
+# Output: time = 1D array of length 12
+def gpcp_time (year):
+
+    days_per_month = array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+    if year % 4 == 0:
+        days_per_month[1] = 29
+    time_start = (year-1992)*365.0 + ceil((year-1992)/4.0)
+    return time_start + concatenate(([0], cumsum(days_per_month[:-1]))) + 14
+
+
+# Read a block of records out of an ERA-Interim file.
+# Input: product = dictionary describing the product (from forcing_products)
+#        year, t_start, t_end = year and range of records to read
+# Output: dictionary of masked arrays (time x latitude x longitude)
+def read_era (product, year, t_start, t_end):
+
+    id = Dataset(product['input_file'](year), 'r')
+    data = {}
+    for var in ['sp', 't2m', 'd2m', 'tcc', 'u10', 'v10', 'tp', 'sf', 'e']:
+        if var in id.variables:
+            data[var] = id.variables[var][t_start:t_end,:,:]
+    id.close()
+    return data
+
+
+# Read a block of months out of the GPCP files, converting to m/12h.
+# Input: as read_era; t_start and t_end are months (0-11)
+# Output: dictionary containing 'precip' (time x latitude x longitude)
+def read_gpcp (product, year, t_start, t_end):
+
+    conv_factor = 5e-4 # mm/day to m/12h
+    precip = []
+    for month in range(t_start, t_end):
+        path = product['input_file'](year).replace('_m01.nc', '_m' + str(month+1).zfill(2) + '.nc')
+        id = Dataset(path, 'r')
+        precip.append(id.variables['precip'][:,:]*conv_factor)
+        id.close()
+    return {'precip':ma.array(precip)}
+
+
+# Geometry shared by the worker processes, set up by init_forcing_worker
+worker_geometry = {}
+
+# Initialise a worker process: read the ROMS grid and the interpolation
+# weights for each product, once per process.
+# Input: grid_file = path to ROMS grid file
+#        product_names = list of products which will be processed
+def init_forcing_worker (grid_file, product_names):
+
+    id = Dataset(grid_file, 'r')
+    worker_geometry['angle'] = id.variables['angle'][:,:]
+    id.close()
+    worker_geometry['num_lat'] = size(worker_geometry['angle'], 0)
+    worker_geometry['num_lon'] = size(worker_geometry['angle'], 1)
+    products = forcing_products()
+    worker_geometry['products'] = products
+    # The weight files were written by the main process
+    for name in product_names:
+        worker_geometry[name] = read_era2roms_weights(products[name]['weight_file'])
+
+
+# Process one unit of work in a worker process.
+# Input: unit = tuple of (product name, year, group name, t_start, t_end)
+# Output: unit, and a dictionary of output variables on the ROMS grid
+#         (time x eta_rho x xi_rho)
+def process_forcing_unit (unit):
+
+    name, year, group_name, t_start, t_end = unit
+    product = worker_geometry['products'][name]
+    W = worker_geometry[name]
+    num_lat = worker_geometry['num_lat']
+    num_lon = worker_geometry['num_lon']
+    data = product['read'](product, year, t_start, t_end)
+    return unit, forcing_fields(group_name, data, W, num_lat, num_lon, worker_geometry['angle'])
+
+
+# Convert ERA-Interim (or GPCP) data for one group of output variables, with
+# the same conversions as romscice_atm_subdaily.py and romscice_gpcp.py.
+# Input:
+# group_name = string: 'Pair', 'Tair', 'Qair', 'cloud', 'wind' (rotated
+#              Uwind and Vwind), 'Uwind', 'Vwind' (not rotated), 'rain',
+#              'snow', 'evaporation', or 'gpcp_rain'
+# data = dictionary of input data from read_era or read_gpcp
+# W = sparse weight matrix
+# num_lat, num_lon = dimensions of ROMS grid
+# angle = ROMS grid angle, for rotating winds
+# Output: dictionary of output variables on the ROMS grid
+def forcing_fields (group_name, data, W, num_lat, num_lon, angle):
+
+    Lv = 2.5e6 # Latent heat of vapourisation, J/kg
+    Rv = 461.5 # Ideal gas constant for water vapour, J/K/kg
+
+    if group_name == 'Pair':
+        return {'Pair':apply_era2roms(W, data['sp'], num_lat, num_lon)}
+    elif group_name == 'Tair':
+        return {'Tair':apply_era2roms(W, data['t2m'], num_lat, num_lon)-273.15}
+    elif group_name == 'Qair':
+        # Calculate relative humidity from temperature and dew point
+        rh = exp(Lv/Rv*(data['t2m']**(-1) - data['d2m']**(-1)))
+        # Constrain humidity values to be between 0 and 1
+        return {'Qair':clip(apply_era2roms(W, rh, num_lat, num_lon), 0, 1)}
+    elif group_name == 'cloud':
+        return {'cloud':clip(apply_era2roms(W, data['tcc'], num_lat, num_lon), 0, 1)}
+    elif group_name == 'wind':
+        uwind_lonlat = apply_era2roms(W, data['u10'], num_lat, num_lon)
+        vwind_lonlat = apply_era2roms(W, data['v10'], num_lat, num_lon)
+        # Rotate winds to ROMS grid
+        uwind = uwind_lonlat*cos(angle) + vwind_lonlat*sin(angle)
+        vwind = vwind_lonlat*cos(angle) - uwind_lonlat*sin(angle)
+        return {'Uwind':uwind, 'Vwind':vwind}
+    elif group_name == 'Uwind':
+        return {'Uwind':apply_era2roms(W, data['u10'], num_lat, num_lon)}
+    elif group_name == 'Vwind':
+        return {'Vwind':apply_era2roms(W, data['v10'], num_lat, num_lon)}
+    elif group_name == 'rain':
+        # Make sure there are no negative values for precip
+        return {'rain':maximum(apply_era2roms(W, data['tp'], num_lat, num_lon), 0)}
+    elif group_name == 'snow':
+        return {'snow':maximum(apply_era2roms(W, data['sf'], num_lat, num_lon), 0)}
+    elif group_name == 'evaporation':
+        # Negative values are allowed for evaporation (they mean condensation)
+        return {'evaporation':apply_era2roms(W, -1*data['e'], num_lat, num_lon)}
+    elif group_name == 'gpcp_rain':
+        return {'rain':maximum(apply_era2roms(W, data['precip'], num_lat, num_lon), 0)}
+
+
+# Create a forcing file with the ROMS grid and empty variables for all the
+# output variables of a product. The time values are written as each block
+# of records is completed.
+# Input:
+# file_path = path to output file
+# lon_roms, lat_roms = ROMS grid
+# groups = list of (group name, list of output variables)
+def setup_forcing_file (file_path, lon_roms, lat_roms, groups):
+
+    id = Dataset(file_path, 'w')
+    id.createDimension('xi_rho', size(lon_roms,1))
+    id.createDimension('eta_rho', size(lon_roms,0))
+    id.createDimension('time', None)
+    create_var(id, 'lon_rho', ('eta_rho', 'xi_rho'))
+    id.variables['lon_rho'][:,:] = lon_roms
+    create_var(id, 'lat_rho', ('eta_rho', 'xi_rho'))
+    id.variables['lat_rho'][:,:] = lat_roms
+    create_var(id, 'time', ('time'))
+    for group in groups:
+        for var in group[1]:
+            create_var(id, var, ('time', 'eta_rho', 'xi_rho'), forcing=True)
+    id.close()
+
+
+# Command-line interface
+if __name__ == "__main__":
+
+    product_names = raw_input("Products to generate, separated by spaces (subdaily_atm, subdaily_ppt, monthly_atm, monthly_ppt, gpcp): ").split()
+    first_year = int(raw_input("First year: "))
+    last_year = int(raw_input("Last year: "))
+    num_procs = raw_input("Number of processes (press enter for all cores): ")
+    if num_procs == '':
+        num_procs = None
+    else:
+        num_procs = int(num_procs)
+    parallel_forcing(product_names, first_year, last_year, num_procs)
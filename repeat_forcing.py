@@ -1,13 +1,18 @@
 from netCDF4 import Dataset
 from numpy import *
+from os import rename
+from output_schema import *
 
 # Convert a 1-year dataset into an annually repeating dataset for ROMS-CICE.
 # The easiest way to do this is by making 4 identical files, and then for
 # the year in that 4 which is a leap year, make Feb 29th the average of
 # Feb 28th and March 1st. Set the cycle length attribute to 1461 days (4 years
 # where one is a leap year).
-# NB: This script assumes the first file has been copied three times to the
-#     correct names of the next three files.
+# The original file is left as it is (except for the cycle length), and each
+# of the next three files is written from it in one streaming pass, a block
+# of records at a time, with the time axis shifted and Feb 29th inserted as
+# it goes. Each file is written under a temporary name and only renamed when
+# it is complete, so a killed job never leaves a half-shifted file behind.
 # Sort of NB: This script uses the basic definition of leap year = year
 #             divisible by 4. This does not hold for all years ending in 00,
 #             e.g. 2000 was a leap year but 1900 wasn't. If you have sub-daily
@@ -20,55 +25,118 @@ from numpy import *
 #            AN_1995_unlim.nc through AN_1998_unlim.nc
 # year_start = integer containing the first year, which is also the year of
 #              the original data
-# perday = number of records per day (for ERA-Interim, either 2 or 4)
-# var_list = list of strings containing variable names for which Feb 29th
-#            will need to be interpolated (i.e. every NetCDF variable which
-#            depends on time, except for time itself).
-
-def process (directory, head, tail, year_start, perday, var_list):
-
-    # Loop through the four years
-    for year in range(year_start,year_start+4):
-
-        file = directory + head + str(year) + tail
-        print 'Processing ' + file
-        id = Dataset(file, 'a')
-        # Set the cycle_length to 4 years
-        id.variables['time'].cycle_length = 365.0*4 + 1
-
-        if year > year_start:
-            # For every year except the first year, alter the time axis
-            # to add on the correct number of days
-            days_to_add = 365.0*(year-year_start)            
-            for year_tmp in range(year_start, year):
-                if year_tmp % 4 == 0:
-                    # A leap year has occurred since year_start
-                    days_to_add = days_to_add+1
-            id.variables['time'][:] = id.variables['time'][:] + days_to_add
-
-            if year % 4 == 0:                
-                print 'This is a leap year'
-                # Add Feb 29th to the time axis
-                num_time = id.variables['time'].shape[0]
-                for i in range(perday):
-                    id.variables['time'][num_time+i] = id.variables['time'][num_time+i-perday] + 1.0
-                # Save indices of Feb 29th and March 1st in the new time axis
-                feb29 = (31+28)*perday
-                mar1 = feb29 + perday
-
-                for var in var_list:
-                    # Interpolate each variable on Feb 29th to be the mean of
-                    # the Feb 28th and March 1st values at the same time of day
-                    print 'Processing variable ' + var
-                    var_feb29 = zeros((perday, id.variables[var].shape[1], id.variables[var].shape[2]))
-                    for i in range(perday):
-                        var_feb29[i,:,:] = 0.5*(id.variables[var][feb29-perday+i,:,:] + id.variables[var][feb29+i,:,:])
-                    # Shift the existing March-December data along by perday
-                    # indices
-                    id.variables[var][mar1:,:,:] = id.variables[var][feb29:num_time,:,:]
-                    # Insert interpolated Feb 29th data into this space
-                    id.variables[var][feb29:mar1,:,:] = var_feb29
+# perday = optional number of records per day (for ERA-Interim, either 2 or
+#          4); by default, work it out from the time axis
+# Every variable which depends on time (except for time itself) gets Feb 29th
+# interpolated.
+
+def process (directory, head, tail, year_start, perday=None):
+
+    in_file = directory + head + str(year_start) + tail
+    print 'Processing ' + in_file
+    id = Dataset(in_file, 'a')
+    # Set the cycle_length to 4 years
+    id.variables['time'].cycle_length = 365.0*4 + 1
+    time = id.variables['time'][:]
     id.close()
+    if perday is None:
+        perday = int(round(1/median(time[1:]-time[:-1])))
+
+    # Build the next three years from the original
+    for year in range(year_start+1,year_start+4):
+        out_file = directory + head + str(year) + tail
+        print 'Writing ' + out_file
+        # Alter the time axis to add on the correct number of days
+        new_time = time + days_since(year_start, year)
+        feb29 = None
+        if year % 4 == 0:
+            print 'This is a leap year'
+            # Add Feb 29th to the time axis
+            feb29 = (31+28)*perday
+            new_time = concatenate((new_time[:feb29], new_time[feb29-perday:feb29]+1.0, new_time[feb29:]+1.0))
+        write_cycle_year(in_file, out_file, new_time, feb29, perday)
+
+
+# Find the number of days between Jan 1st of two years, with the basic
+# definition of leap year as above.
+# Input: year_start, year = integers
+# Output: number of days
+def days_since (year_start, year):
+
+    num_days = 365.0*(year-year_start)
+    for year_tmp in range(year_start, year):
+        if year_tmp % 4 == 0:
+            # A leap year has occurred since year_start
+            num_days += 1
+    return num_days
+
+
+# Write a copy of a 1-year forcing file with a new time axis and the
+# cycle_length set to 4 years, optionally inserting Feb 29th: the mean of the
+# Feb 28th and March 1st records at the same time of day. Variables which
+# don't depend on time are copied as they are. Time-dependent variables are
+# copied a block of records at a time, so memory use doesn't depend on the
+# length of the file.
+# Input:
+# in_file = path to original file
+# out_file = path to new file; it is written as out_file.tmp and renamed
+#            when complete
+# time = 1D array of new time values (including Feb 29th if it's inserted)
+# feb29 = optional index of the first record of Feb 29th in the new file (and
+#         of March 1st in the original), or None (default) to insert nothing
+# perday = number of records per day (only needed if feb29 is set)
+# block_size = optional number of records to copy at once (default 40)
+def write_cycle_year (in_file, out_file, time, feb29=None, perday=None, block_size=40):
+
+    in_id = Dataset(in_file, 'r')
+    out_id = Dataset(out_file + '.tmp', 'w')
+    time_dim = in_id.variables['time'].dimensions[0]
+    for name, dim in in_id.dimensions.iteritems():
+        if dim.isunlimited():
+            out_id.createDimension(name, None)
+        else:
+            out_id.createDimension(name, len(dim))
+    for name, in_var in in_id.variables.iteritems():
+        attributes = {}
+        for attr in in_var.ncattrs():
+            if attr != '_FillValue':
+                attributes[attr] = in_var.getncattr(attr)
+        fill_value = None
+        if '_FillValue' in in_var.ncattrs():
+            fill_value = in_var.getncattr('_FillValue')
+        create_var(out_id, name, in_var.dimensions, dtype=in_var.dtype, fill_value=fill_value, **attributes)
+    out_id.variables['time'].cycle_length = 365.0*4 + 1
+    out_id.variables['time'][:] = time
+
+    num_time = in_id.variables['time'].shape[0]
+    for name, in_var in in_id.variables.iteritems():
+        if name == 'time':
+            continue
+        out_var = out_id.variables[name]
+        if len(in_var.dimensions) == 0 or in_var.dimensions[0] != time_dim:
+            # Not time-dependent
+            out_var[:] = in_var[:]
+            continue
+        print 'Processing variable ' + name
+        if feb29 is not None:
+            # Interpolate Feb 29th to be the mean of the Feb 28th and March
+            # 1st values at the same time of day
+            out_var[feb29:feb29+perday] = 0.5*(in_var[feb29-perday:feb29] + in_var[feb29:feb29+perday])
+        for t_start in range(0, num_time, block_size):
+            t_end = minimum(t_start+block_size, num_time)
+            if feb29 is None or t_end <= feb29:
+                out_var[t_start:t_end] = in_var[t_start:t_end]
+            elif t_start >= feb29:
+                # March-December data is shifted along by perday indices
+                out_var[t_start+perday:t_end+perday] = in_var[t_start:t_end]
+            else:
+                # This block straddles Feb 29th
+                data = in_var[t_start:t_end]
+                out_var[t_start:feb29] = data[:feb29-t_start]
+                out_var[feb29+perday:t_end+perday] = data[feb29-t_start:]
+    in_id.close()
+    out_id.close()
+    rename(out_file + '.tmp', out_file)
 
 
 # Command-line interface
@@ -88,9 +156,6 @@ if __name__ == '__main__':
     # Number of records per day
     an_perday = 4
     fc_perday = 2
-    # Variables to interpolate Feb 29th for each file
-    an_var = ['Pair', 'Tair', 'Qair', 'cloud', 'Uwind', 'Vwind']
-    fc_var = ['rain', 'snow']
 
     if year_start % 4 == 0:
         # This script assumes year_start has 365 days and then the leap year
@@ -98,13 +163,8 @@ if __name__ == '__main__':
         # However you could rework this script to remove Feb 29th from year_start
         # and every following year except the leap year.
         print 'year_start cannot be a leap year. Either choose a different year_start or rework this script.'
-        exit
+        exit()
 
     # Run the actual script
-    process(directory, an_head, tail, year_start, an_perday, an_var)
-    process(directory, fc_head, tail, year_start, fc_perday, fc_var)
-                
-                
-                
-                
-    
+    process(directory, an_head, tail, year_start, an_perday)
+    process(directory, fc_head, tail, year_start, fc_perday)
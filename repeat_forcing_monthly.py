@@ -1,12 +1,14 @@
 from netCDF4 import Dataset
 from numpy import *
+from repeat_forcing import days_since, write_cycle_year
 
 # Convert a 1-year monthly dataset into an annually repeating dataset for 
 # ROMS-CICE. The easiest way to do this is by making 4 identical files, altering
 # the time axis so data is always on the 15th of a month, and setting the cycle
 # length attribute to 1461 days (4 years where one is a leap year).
-# NB: This script assumes the first file has been copied three times to the
-#     correct names of the next three files.
+# The time axis of the original file is altered in place, and each of the next
+# three files is written from it in one pass (see write_cycle_year in
+# repeat_forcing.py), so there's no need to copy it first.
 # Sort of NB: This script uses the basic definition of leap year = year
 #             divisible by 4. This does not hold for all years ending in 00,
 #             e.g. 2000 was a leap year but 1900 wasn't.
@@ -23,6 +25,7 @@ def process (directory, head, tail, year_start):
 
     days_per_month = array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
 
+    in_file = directory + head + str(year_start) + tail
     # Loop through the four years
     for year in range(year_start,year_start+4):
 
@@ -34,12 +37,7 @@ def process (directory, head, tail, year_start):
 
         # Make a time axis with data on the 15th of every month
         # First get the number of days between year_start and the current year
-        start_day = 365*(year-year_start)
-        if year > year_start:
-            for year_tmp in range(year_start, year):
-                if year_tmp % 4 == 0:
-                    # A leap year has occurred 
-                    start_day += 1
+        start_day = days_since(year_start, year)
         # Start on Jan 15th at midnight
         time = [start_day + 14]
         # Loop over months
@@ -48,11 +46,14 @@ def process (directory, head, tail, year_start):
 
         file = directory + head + str(year) + tail
         print 'Processing ' + file
-        id = Dataset(file, 'a')
-        id.variables['time'][:] = time
-        # Set the cycle_length to 4 years
-        id.variables['time'].cycle_length = 365.0*4 + 1
-        id.close()
+        if year == year_start:
+            id = Dataset(file, 'a')
+            id.variables['time'][:] = time
+            # Set the cycle_length to 4 years
+            id.variables['time'].cycle_length = 365.0*4 + 1
+            id.close()
+        else:
+            write_cycle_year(in_file, file, array(time))
 
 
 # Command-line interface
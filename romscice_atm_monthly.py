@@ -26,6 +26,8 @@ def convert_file (year):
     input_ppt_file = '/short/y99/kaa561/FESOM/ERA_Interim_monthly/FC_' + str(year) + '_monthly_orig.nc'
     output_atm_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/monthly/historical/AN_' + str(year) + '_monthly.nc'
     output_ppt_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/monthly/historical/FC_' + str(year) + '_monthly.nc'
+    # File to save interpolation weights in, so they are only calculated once
+    weight_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/monthly/era2roms_weights.nc'
 
     Lv = 2.5e6 # Latent heat of vapourisation, J/kg
     Rv = 461.5 # Ideal gas constant for water vapour, J/K/kg
@@ -46,6 +48,9 @@ def convert_file (year):
     lat_era = iatm_fid.variables['lat'][:]
     iatm_fid.close()
 
+    print 'Calculating interpolation weights'
+    W = era2roms_weights(lon_era, lat_era, lon_roms, lat_roms, weight_file=weight_file)
+
     # Create time axis: 12 equally spaced values throughout the year,
     # units of 'days since 1992-01-01 00:00:0.0'
     time = (year-1992)*365.25 + (arange(12) + 0.5)/12*365.25
@@ -96,33 +101,33 @@ def convert_file (year):
         oatm_fid.variables['time'][t] = time[t]
         # Read variables for this timestep
         iatm_fid = Dataset(input_atm_file, 'r')
-        sp = transpose(iatm_fid.variables['sp'][t,:,:])
-        t2m = transpose(iatm_fid.variables['t2m'][t,:,:])
-        d2m = transpose(iatm_fid.variables['d2m'][t,:,:])
-        tcc = transpose(iatm_fid.variables['tcc'][t,:,:])
-        u10 = transpose(iatm_fid.variables['u10'][t,:,:])
-        v10 = transpose(iatm_fid.variables['v10'][t,:,:])
+        sp = iatm_fid.variables['sp'][t,:,:]
+        t2m = iatm_fid.variables['t2m'][t,:,:]
+        d2m = iatm_fid.variables['d2m'][t,:,:]
+        tcc = iatm_fid.variables['tcc'][t,:,:]
+        u10 = iatm_fid.variables['u10'][t,:,:]
+        v10 = iatm_fid.variables['v10'][t,:,:]
         iatm_fid.close()
         # Calculate relative humidity from temperature and dew point
         rh = exp(Lv/Rv*(t2m**(-1) - d2m**(-1)))        
         # Interpolate each variable to ROMS grid and write to output AN file
-        pair = interp_era2roms(sp, lon_era, lat_era, lon_roms, lat_roms)
+        pair = apply_era2roms(W, sp, num_lat, num_lon)
         oatm_fid.variables['Pair'][t,:,:] = pair
-        tair = interp_era2roms(t2m, lon_era, lat_era, lon_roms, lat_roms)
+        tair = apply_era2roms(W, t2m, num_lat, num_lon)
         oatm_fid.variables['Tair'][t,:,:] = tair-273.15
-        qair = interp_era2roms(rh, lon_era, lat_era, lon_roms, lat_roms)
+        qair = apply_era2roms(W, rh, num_lat, num_lon)
         # Constrain humidity to be between 0 and 1
         qair[qair < 0] = 0.0
         qair[qair > 1] = 1.0
         oatm_fid.variables['Qair'][t,:,:] = qair
-        cloud = interp_era2roms(tcc, lon_era, lat_era, lon_roms, lat_roms)
+        cloud = apply_era2roms(W, tcc, num_lat, num_lon)
         # Constrain cloud fractions to be between 0 and 1
         cloud[cloud < 0] = 0.0
         cloud[cloud > 1] = 1.0
         oatm_fid.variables['cloud'][t,:,:] = cloud
-        uwind = interp_era2roms(u10, lon_era, lat_era, lon_roms, lat_roms)
+        uwind = apply_era2roms(W, u10, num_lat, num_lon)
         oatm_fid.variables['Uwind'][t,:,:] = uwind
-        vwind = interp_era2roms(v10, lon_era, lat_era, lon_roms, lat_roms)
+        vwind = apply_era2roms(W, v10, num_lat, num_lon)
         oatm_fid.variables['Vwind'][t,:,:] = vwind
         oatm_fid.close()
 
@@ -159,12 +164,12 @@ def convert_file (year):
         oppt_fid.variables['time'][t] = time[t]
         # Read data for this timestep
         ippt_fid = Dataset(input_ppt_file, 'r')
-        tp = transpose(ippt_fid.variables['tp'][t,:,:])
-        sf = transpose(ippt_fid.variables['sf'][t,:,:])
+        tp = ippt_fid.variables['tp'][t,:,:]
+        sf = ippt_fid.variables['sf'][t,:,:]
         ippt_fid.close()
         # Interpolate to ROMS grid and write to output FC file
-        rain = interp_era2roms(tp, lon_era, lat_era, lon_roms, lat_roms)
-        snow = interp_era2roms(sf, lon_era, lat_era, lon_roms, lat_roms)
+        rain = apply_era2roms(W, tp, num_lat, num_lon)
+        snow = apply_era2roms(W, sf, num_lat, num_lon)
         # Make sure there are no negative values
         rain[rain < 0] = 0.0
         oppt_fid.variables['rain'][t,:,:] = rain
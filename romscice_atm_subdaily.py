@@ -1,6 +1,8 @@
 from netCDF4 import Dataset
 from numpy import *
+from os.path import exists
 from interp_era2roms import *
+from output_schema import *
 
 # Convert two ERA-Interim files:
 # AN_yyyy_subdaily_orig.nc: one year of 6-hour measurements for surface pressure
@@ -18,18 +20,22 @@ from interp_era2roms import *
 # FC_yyyy_subdaily.nc: one year of 12-hour measurements for rainfall (rain),
 #                   snowfall (snow), and evaporation 
 # Input: year = integer containing the year to process
-#        count = time record in the given year to start with
+#        block_size = optional integer containing the number of time records
+#                     to read, interpolate, and write at once (default 40).
+#                     Memory use depends only on this, not on the length of
+#                     the year.
 
-# This script only processes 100 6-hour timesteps (50 12-hour timesteps) at
-# once to prevent memory overflow, and is designed to be called by a self-
-# submitting batch script. See convert_era.job for an example.
+# The whole year is processed in one call, streaming through the input files
+# block_size records at a time with each file opened only once. If the output
+# files already exist (eg the job was killed partway through), the conversion
+# restarts from the last record written.
 
-def convert_file (year, count):
+def convert_file (year, block_size=40):
 
     # Make sure input arguments are integers (sometimes the batch script likes
     # to pass them as strings)
     year = int(year)
-    count = int(count)
+    block_size = int(block_size)
 
     # Paths of ROMS grid file, input ERA-Interim files, and output ROMS-CICE
     # files; other users will need to change these
@@ -38,17 +44,15 @@ def convert_file (year, count):
     input_ppt_file = '/short/m68/kaa561/metroms_iceshelf/data/originals/ERA_Interim/FC_' + str(year) + '_subdaily_orig.nc'
     output_atm_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/AN_' + str(year) + '_subdaily.nc'
     output_ppt_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/FC_' + str(year) + '_subdaily.nc'
+    # File to save interpolation weights in, so they are only calculated once
+    weight_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/era2roms_weights.nc'
     logfile = str(year) + '.log'
 
     Lv = 2.5e6 # Latent heat of vapourisation, J/kg
     Rv = 461.5 # Ideal gas constant for water vapour, J/K/kg
 
-    if count == 0:
-        log = open(logfile, 'w')
-    else:
-        log = open(logfile, 'a')
-    log.write('Reading grids\n')
-    log.close()
+    log = open(logfile, 'a')
+    write_log(log, 'Reading grids')
 
     # Read ROMS latitude and longitude
     grid_fid = Dataset(grid_file, 'r')
@@ -68,13 +72,14 @@ def convert_file (year, count):
     # Also read ERA-Interim latitude and longitude
     lon_era = iatm_fid.variables['longitude'][:]
     lat_era = iatm_fid.variables['latitude'][:]
-    iatm_fid.close()
 
-    if count == 0:
-        log = open(logfile, 'a')
-        log.write('Setting up ' + output_atm_file + '\n')
-        log.close()
+    write_log(log, 'Calculating interpolation weights')
+    W = era2roms_weights(lon_era, lat_era, lon_roms, lat_roms, weight_file=weight_file)
 
+    if exists(output_atm_file):
+        oatm_fid = Dataset(output_atm_file, 'a')
+    else:
+        write_log(log, 'Setting up ' + output_atm_file)
         oatm_fid = Dataset(output_atm_file, 'w')
         # Define dimensions (note unlimited time dimension)
         oatm_fid.createDimension('xi_rho', num_lon)
@@ -82,84 +87,59 @@ def convert_file (year, count):
         oatm_fid.createDimension('time', None)
         # Define variables; write latitude and longitude since they are not
         # time-dependent
-        oatm_fid.createVariable('lon_rho', 'f8', ('eta_rho', 'xi_rho'))
-        oatm_fid.variables['lon_rho'].long_name = 'longitude of rho-points'
-        oatm_fid.variables['lon_rho'].units = 'degree_east'
+        create_var(oatm_fid, 'lon_rho', ('eta_rho', 'xi_rho'))
         oatm_fid.variables['lon_rho'][:,:] = lon_roms
-        oatm_fid.createVariable('lat_rho', 'f8', ('eta_rho', 'xi_rho'))
-        oatm_fid.variables['lat_rho'].long_name = 'latitude of rho-points'
-        oatm_fid.variables['lat_rho'].units = 'degree_north'
+        create_var(oatm_fid, 'lat_rho', ('eta_rho', 'xi_rho'))
         oatm_fid.variables['lat_rho'][:,:] = lat_roms
-        oatm_fid.createVariable('time', 'f8', ('time'))
-        oatm_fid.variables['time'].units = 'days since 1992-01-01 00:00:0.0'
-        oatm_fid.createVariable('Pair', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oatm_fid.variables['Pair'].long_name = 'surface air pressure'
-        oatm_fid.variables['Pair'].units = 'Pascal'
-        oatm_fid.createVariable('Tair', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oatm_fid.variables['Tair'].long_name = 'surface air temperature'
-        oatm_fid.variables['Tair'].units = 'Celsius'
-        oatm_fid.createVariable('Qair', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oatm_fid.variables['Qair'].long_name = 'surface relative humidity'
-        oatm_fid.variables['Qair'].units = 'kg/kg'
-        oatm_fid.createVariable('cloud', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oatm_fid.variables['cloud'].long_name = 'cloud fraction'
-        oatm_fid.variables['cloud'].units = 'nondimensional'
-        oatm_fid.createVariable('Uwind', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oatm_fid.variables['Uwind'].long_name = 'surface u-wind component'
-        oatm_fid.variables['Uwind'].units = 'm/s'
-        oatm_fid.createVariable('Vwind', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oatm_fid.variables['Vwind'].long_name = 'surface v-wind component'
-        oatm_fid.variables['Vwind'].units = 'm/s'
-        oatm_fid.close()
-
-    log = open(logfile, 'a')
-    log.write('Processing 6-hourly data\n')
-    log.close()
-
-    # Process one timestep at a time to minimise memory use
-    for t in range(count, count+100):
-        if t >= size(atm_time):
-            break
-        oatm_fid = Dataset(output_atm_file, 'a')
-        log = open(logfile, 'a')
-        log.write('Processing record ' + str(t+1) + ' of ' + str(size(atm_time)) + '\n')
-        log.close()
-        # Write the current time value to output AN file
-        oatm_fid.variables['time'][t] = atm_time[t]
-        # Read variables for this timestep
-        iatm_fid = Dataset(input_atm_file, 'r')
-        sp = transpose(iatm_fid.variables['sp'][t,:,:])
-        t2m = transpose(iatm_fid.variables['t2m'][t,:,:])
-        d2m = transpose(iatm_fid.variables['d2m'][t,:,:])
-        tcc = transpose(iatm_fid.variables['tcc'][t,:,:])
-        u10 = transpose(iatm_fid.variables['u10'][t,:,:])
-        v10 = transpose(iatm_fid.variables['v10'][t,:,:])
-        iatm_fid.close()
+        create_var(oatm_fid, 'time', ('time'))
+        for var in ['Pair', 'Tair', 'Qair', 'cloud', 'Uwind', 'Vwind']:
+            create_var(oatm_fid, var, ('time', 'eta_rho', 'xi_rho'), forcing=True)
+
+    start = num_records_written(oatm_fid)
+    if start > 0:
+        write_log(log, 'Restarting from record ' + str(start+1))
+
+    write_log(log, 'Processing 6-hourly data')
+    for t_start in range(start, size(atm_time), block_size):
+        t_end = minimum(t_start+block_size, size(atm_time))
+        write_log(log, 'Processing records ' + str(t_start+1) + ' to ' + str(t_end) + ' of ' + str(size(atm_time)))
+        # Read variables for this block of timesteps
+        sp = iatm_fid.variables['sp'][t_start:t_end,:,:]
+        t2m = iatm_fid.variables['t2m'][t_start:t_end,:,:]
+        d2m = iatm_fid.variables['d2m'][t_start:t_end,:,:]
+        tcc = iatm_fid.variables['tcc'][t_start:t_end,:,:]
+        u10 = iatm_fid.variables['u10'][t_start:t_end,:,:]
+        v10 = iatm_fid.variables['v10'][t_start:t_end,:,:]
         # Calculate relative humidity from temperature and dew point
         rh = exp(Lv/Rv*(t2m**(-1) - d2m**(-1)))
         # Interpolate each variable to ROMS grid and write to output AN file
-        pair = interp_era2roms(sp, lon_era, lat_era, lon_roms, lat_roms)
-        oatm_fid.variables['Pair'][t,:,:] = pair
-        tair = interp_era2roms(t2m, lon_era, lat_era, lon_roms, lat_roms)
-        oatm_fid.variables['Tair'][t,:,:] = tair-273.15
-        qair = interp_era2roms(rh, lon_era, lat_era, lon_roms, lat_roms)
+        pair = apply_era2roms(W, sp, num_lat, num_lon)
+        oatm_fid.variables['Pair'][t_start:t_end,:,:] = pair
+        tair = apply_era2roms(W, t2m, num_lat, num_lon)
+        oatm_fid.variables['Tair'][t_start:t_end,:,:] = tair-273.15
+        qair = apply_era2roms(W, rh, num_lat, num_lon)
         # Constrain humidity values to be between 0 and 1
         qair[qair < 0] = 0.0
         qair[qair > 1] = 1.0
-        oatm_fid.variables['Qair'][t,:,:] = qair
-        cloud = interp_era2roms(tcc, lon_era, lat_era, lon_roms, lat_roms)
+        oatm_fid.variables['Qair'][t_start:t_end,:,:] = qair
+        cloud = apply_era2roms(W, tcc, num_lat, num_lon)
         # Constrain cloud fractions to be between 0 and 1
         cloud[cloud < 0] = 0.0
         cloud[cloud > 1] = 1.0
-        oatm_fid.variables['cloud'][t,:,:] = cloud
-        uwind_lonlat = interp_era2roms(u10, lon_era, lat_era, lon_roms, lat_roms)
-        vwind_lonlat = interp_era2roms(v10, lon_era, lat_era, lon_roms, lat_roms)
+        oatm_fid.variables['cloud'][t_start:t_end,:,:] = cloud
+        uwind_lonlat = apply_era2roms(W, u10, num_lat, num_lon)
+        vwind_lonlat = apply_era2roms(W, v10, num_lat, num_lon)
         # Rotate winds to ROMS grid
         uwind = uwind_lonlat*cos(angle) + vwind_lonlat*sin(angle)
         vwind = vwind_lonlat*cos(angle) - uwind_lonlat*sin(angle)
-        oatm_fid.variables['Uwind'][t,:,:] = uwind
-        oatm_fid.variables['Vwind'][t,:,:] = vwind
-        oatm_fid.close()
+        oatm_fid.variables['Uwind'][t_start:t_end,:,:] = uwind
+        oatm_fid.variables['Vwind'][t_start:t_end,:,:] = vwind
+        # Write time values last, so that a killed job restarts from the
+        # first block which wasn't completely written
+        oatm_fid.variables['time'][t_start:t_end] = atm_time[t_start:t_end]
+        oatm_fid.sync()
+    iatm_fid.close()
+    oatm_fid.close()
 
     # Open input FC file and read time values
     ippt_fid = Dataset(input_ppt_file, 'r')
@@ -168,72 +148,70 @@ def convert_file (year, count):
     ppt_time = ppt_time/24.0 # days since 1900-01-01 00:00:0.0
     ppt_time = ppt_time - 92*365 - 22 # days since 1992-01-01 00:00:0.0; note that there were 22 leap years between 1900 and 1992
     ppt_time = ppt_time - 0.5 # switch from precipitation over the preceding 12 hours to precipitation over the following 12 hours; this is easier for ROMS
-    ippt_fid.close()
-
-    if count == 0:
-        log = open(logfile, 'a')
-        log.write('Setting up ' + output_ppt_file + '\n')
-        log.close()
 
+    if exists(output_ppt_file):
+        oppt_fid = Dataset(output_ppt_file, 'a')
+    else:
+        write_log(log, 'Setting up ' + output_ppt_file)
         oppt_fid = Dataset(output_ppt_file, 'w')
         # Define dimensions
         oppt_fid.createDimension('xi_rho', num_lon)
         oppt_fid.createDimension('eta_rho', num_lat)
         oppt_fid.createDimension('time', None)
         # Define variables
-        oppt_fid.createVariable('lon_rho', 'f8', ('eta_rho', 'xi_rho'))
-        oppt_fid.variables['lon_rho'].long_name = 'longitude of rho-points'
-        oppt_fid.variables['lon_rho'].units = 'degree_east'
+        create_var(oppt_fid, 'lon_rho', ('eta_rho', 'xi_rho'))
         oppt_fid.variables['lon_rho'][:,:] = lon_roms
-        oppt_fid.createVariable('lat_rho', 'f8', ('eta_rho', 'xi_rho'))
-        oppt_fid.variables['lat_rho'].long_name = 'latitude of rho-points'
-        oppt_fid.variables['lat_rho'].units = 'degree_north'
+        create_var(oppt_fid, 'lat_rho', ('eta_rho', 'xi_rho'))
         oppt_fid.variables['lat_rho'][:,:] = lat_roms
-        oppt_fid.createVariable('time', 'f8', ('time'))
-        oppt_fid.variables['time'].units = 'days since 1992-01-01 00:00:0.0'
-        oppt_fid.createVariable('rain', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oppt_fid.variables['rain'].long_name = 'rain fall rate'
-        oppt_fid.variables['rain'].units = 'm_per_12hr'
-        oppt_fid.createVariable('snow', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oppt_fid.variables['snow'].long_name = 'snow fall rate'
-        oppt_fid.variables['snow'].units = 'm_per_12hr'
-        oppt_fid.createVariable('evaporation', 'f8', ('time', 'eta_rho', 'xi_rho'))
-        oppt_fid.variables['evaporation'].long_name = 'evaporation rate'
-        oppt_fid.variables['evaporation'].units = 'm_per_12hr'
-        oppt_fid.close()
-
-    log = open(logfile, 'a')
-    log.write('Processing 12-hourly data\n')
-    log.close()
-
-    for t in range(count/2, (count+100)/2):
-        if t >= size(ppt_time):
-            break
-        oppt_fid = Dataset(output_ppt_file, 'a')
-        log = open(logfile, 'a')
-        log.write('Processing record ' + str(t+1) + ' of ' + str(size(ppt_time)) + '\n')
-        log.close()
-        # Write the current time value to output FC file
-        oppt_fid.variables['time'][t] = ppt_time[t]
-        # Read data for this timestep
-        ippt_fid = Dataset(input_ppt_file, 'r')
-        tp = transpose(ippt_fid.variables['tp'][t,:,:])
-        sf = transpose(ippt_fid.variables['sf'][t,:,:])
-        e = -1*transpose(ippt_fid.variables['e'][t,:,:])
-        ippt_fid.close()
+        create_var(oppt_fid, 'time', ('time'))
+        for var in ['rain', 'snow', 'evaporation']:
+            create_var(oppt_fid, var, ('time', 'eta_rho', 'xi_rho'), forcing=True)
+
+    start = num_records_written(oppt_fid)
+    if start > 0:
+        write_log(log, 'Restarting from record ' + str(start+1))
+
+    write_log(log, 'Processing 12-hourly data')
+    for t_start in range(start, size(ppt_time), block_size):
+        t_end = minimum(t_start+block_size, size(ppt_time))
+        write_log(log, 'Processing records ' + str(t_start+1) + ' to ' + str(t_end) + ' of ' + str(size(ppt_time)))
+        # Read data for this block of timesteps
+        tp = ippt_fid.variables['tp'][t_start:t_end,:,:]
+        sf = ippt_fid.variables['sf'][t_start:t_end,:,:]
+        e = -1*ippt_fid.variables['e'][t_start:t_end,:,:]
         # Interpolate to ROMS grid and write to output FC file
-        rain = interp_era2roms(tp, lon_era, lat_era, lon_roms, lat_roms)
-        snow = interp_era2roms(sf, lon_era, lat_era, lon_roms, lat_roms)
-        evap = interp_era2roms(e, lon_era, lat_era, lon_roms, lat_roms)
+        rain = apply_era2roms(W, tp, num_lat, num_lon)
+        snow = apply_era2roms(W, sf, num_lat, num_lon)
+        evap = apply_era2roms(W, e, num_lat, num_lon)
         # Make sure there are no negative values for precip
         rain[rain < 0] = 0.0
-        oppt_fid.variables['rain'][t,:,:] = rain
+        oppt_fid.variables['rain'][t_start:t_end,:,:] = rain
         snow[snow < 0] = 0.0
-        oppt_fid.variables['snow'][t,:,:] = snow
+        oppt_fid.variables['snow'][t_start:t_end,:,:] = snow
         # Negative values are allowed for evaporation (they mean condensation)
-        oppt_fid.variables['evaporation'][t,:,:] = evap
-        oppt_fid.close()
+        oppt_fid.variables['evaporation'][t_start:t_end,:,:] = evap
+        oppt_fid.variables['time'][t_start:t_end] = ppt_time[t_start:t_end]
+        oppt_fid.sync()
+    ippt_fid.close()
+    oppt_fid.close()
 
-    log = open(logfile, 'a')
-    log.write('Finished\n')
+    write_log(log, 'Finished')
     log.close()
+
+
+# Write a line to the log file, and flush it so progress can be followed while
+# the job is running.
+# Input:
+# log = open log file
+# message = string to write
+def write_log (log, message):
+
+    log.write(message + '\n')
+    log.flush()
+
+
+# Command-line interface
+if __name__ == "__main__":
+
+    year = raw_input("Year to process: ")
+    convert_file(year)
@@ -24,6 +24,8 @@ def convert_file (year, count):
     grid_file = '/short/m68/kaa561/metroms_iceshelf/apps/common/grid/circ30S_quarterdegree.nc'
     input_evap_file = '/short/m68/kaa561/metroms_iceshelf/data/subdaily_originals/ER_' + str(year)+ '_subdaily_orig.nc'
     output_evap_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/FC_' + str(year) + '_subdaily.nc'
+    # File to save interpolation weights in, so they are only calculated once
+    weight_file = '/short/m68/kaa561/metroms_iceshelf/data/ERA_Interim/era2roms_weights.nc'
     logfile = str(year) + '.log'
 
     if count == 0:
@@ -53,6 +55,11 @@ def convert_file (year, count):
     lat_era = i_fid.variables['latitude'][:]
     i_fid.close()
 
+    log = open(logfile, 'a')
+    log.write('Calculating interpolation weights\n')
+    log.close()
+    W = era2roms_weights(lon_era, lat_era, lon_roms, lat_roms, weight_file=weight_file)
+
     # Define the variable in the output NetCDF file on the first timestep
     if count == 0:
         log = open(logfile, 'a')
@@ -80,10 +87,10 @@ def convert_file (year, count):
         o_fid.variables['time'][t] = evap_time[t]
         # Read data for this timestep
         i_fid = Dataset(input_evap_file, 'r')
-        e = -1*transpose(i_fid.variables['e'][t,:,:])
+        e = -1*i_fid.variables['e'][t,:,:]
         i_fid.close()
         # Interpolate to ROMS grid and write to output FC file
-        evap = interp_era2roms(e, lon_era, lat_era, lon_roms, lat_roms)
+        evap = apply_era2roms(W, e, num_lat, num_lon)
         o_fid.variables['evaporation'][t,:,:] = evap
         o_fid.close()
 
@@ -17,6 +17,7 @@ from numpy import *
 from scipy.interpolate import RegularGridInterpolator
 from scipy.spatial import KDTree
 from calc_z import *
+from extrapolate_cavity import *
 
 
 # Main routine
@@ -214,11 +215,6 @@ def run (grid_file, theta_file, salt_file, output_file, theta_s, theta_b, hc, N,
 #     latitude x longitude)
 def interp_ecco2roms_ini (A, lon_ecco, lat_ecco, depth_ecco, lon_roms_3d, lat_roms_3d, z_roms_3d, mask_rho, mask_zice):
 
-    # Radius of the Earth in m
-    r = 6.371e6
-    # Degrees to radians conversion factor
-    deg2rad = pi/180.0
-
     # Calculate N based on size of ROMS grid
     N = size(lon_roms_3d, 0)
 
@@ -251,62 +247,8 @@ def interp_ecco2roms_ini (A, lon_ecco, lat_ecco, depth_ecco, lon_roms_3d, lat_ro
         # Save this depth level
         B[k,:,:] = tmp
 
-    print '...selecting the ice shelf front'
-    # Find the ice shelf front
-    front = zeros(shape(lon_roms_3d))
-    # Find northernmost latitude with ice shelves
-    nbdry_zice = where(sum(mask_zice, axis=1) > 0)[-1][-1] + 2
-    # Loop over all cells; can't find a cleaner way to do this
-    for j in range(nbdry_zice):
-        for i in range(size(mask_zice,1)):
-            # First make sure this is an ocean point
-            if mask_rho[j,i] == 1:
-                # Find bounds on window of radius 1
-                j_min = max(j-1,0)
-                j_max = min(j+2, size(mask_zice,0))
-                i_min = max(i-1,0)
-                i_max = min(i+2, size(mask_zice,1))
-                # Points at the ice shelf front are not ice shelf points, but
-                # have at least one neighbour that is
-                if mask_zice[j,i] == 0 and any(mask_zice[j_min:j_max,i_min:i_max] == 1):
-                    front[:,j,i] = 1
-
     print '...extrapolating under ice shelves'
-    mask_zice_3d = tile(mask_zice, (N,1,1))
-    for j in range(nbdry_zice, -1, -1):
-        print '...latitude index ' + str(nbdry_zice-j+1) + ' of ' + str(nbdry_zice+1)
-        # Find coordinates of ice shelf front points
-        lon_front = lon_roms_3d[front==1]
-        lat_front = lat_roms_3d[front==1]
-        z_front = z_roms_3d[front==1]
-        # Also find the values of the given variable here
-        B_front = B[front==1]
-        for i in range(size(mask_zice,1)):
-            if mask_zice[j,i] == 1:
-                for k in range(N):
-                    # Calculate Cartesian distance from this point to each point
-                    # at the ice shelf front
-                    dlon = lon_front - lon_roms_3d[k,j,i]
-                    index = dlon > 300
-                    dlon[index] -= 360
-                    index = dlon < -300
-                    dlon[index] += 360
-                    dlon = abs(dlon)
-                    dlat = abs(lat_front - lat_roms_3d[k,j,i])
-                    dz = abs(z_front - z_roms_3d[k,j,i])
-                    dx = r*cos(lat_roms_3d[k,j,i]*deg2rad)*dlon*deg2rad
-                    dy = r*dlat*deg2rad
-                    dist = sqrt(dx**2 + dy**2 + dz**2)
-                    # Find the index with the minimum distance: this is the
-                    # nearest-neighbour
-                    nearest = argmin(dist)
-                    B[k,j,i] = B_front[nearest]
-        # Update the ice shelf front points to include the new points we've just
-        # extrapolated to
-        front_tmp = front[:,j,:]
-        mask_zice_tmp = mask_zice_3d[:,j,:]
-        front_tmp[mask_zice_tmp==1] = 1
-        front[:,j,:] = front_tmp
+    B = extrapolate_cavity(B, lon_roms_3d, lat_roms_3d, z_roms_3d, mask_rho, mask_zice)
         
     return B
 
@@ -14,6 +14,8 @@ from netCDF4 import Dataset
 from numpy import *
 from scipy.interpolate import RegularGridInterpolator
 from calc_z import *
+from extrapolate_cavity import *
+from output_schema import *
 
 
 # Main routine
@@ -78,72 +80,37 @@ def run (grid_file, woa_file, output_file, Tcline, theta_s, theta_b, hc, N, nbdr
     out_id.createDimension('ocean_time', None)
     out_id.createDimension('one', 1);
     # Define variables and assign values
-    out_id.createVariable('tstart', 'f8', ('one'))
-    out_id.variables['tstart'].long_name = 'start processing day'
-    out_id.variables['tstart'].units = 'day'
+    create_var(out_id, 'tstart', ('one'))
     out_id.variables['tstart'][:] = 0.0
-    out_id.createVariable('tend', 'f8', ('one'))
-    out_id.variables['tend'].long_name = 'end processing day'
-    out_id.variables['tend'].units = 'day'
+    create_var(out_id, 'tend', ('one'))
     out_id.variables['tend'][:] = 0.0
-    out_id.createVariable('theta_s', 'f8', ('one'))
-    out_id.variables['theta_s'].long_name = 'S-coordinate surface control parameter'
+    create_var(out_id, 'theta_s', ('one'))
     out_id.variables['theta_s'][:] = theta_s
-    out_id.createVariable('theta_b', 'f8', ('one'))
-    out_id.variables['theta_b'].long_name = 'S-coordinate bottom control parameter'
-    out_id.variables['theta_b'].units = 'nondimensional'
+    create_var(out_id, 'theta_b', ('one'))
     out_id.variables['theta_b'][:] = theta_b
-    out_id.createVariable('Tcline', 'f8', ('one'))
-    out_id.variables['Tcline'].long_name = 'S-coordinate surface/bottom layer width'
-    out_id.variables['Tcline'].units = 'meter'
+    create_var(out_id, 'Tcline', ('one'))
     out_id.variables['Tcline'][:] = Tcline
-    out_id.createVariable('hc', 'f8', ('one'))
-    out_id.variables['hc'].long_name = 'S-coordinate parameter, critical depth'
-    out_id.variables['hc'].units = 'meter'
+    create_var(out_id, 'hc', ('one'))
     out_id.variables['hc'][:] = hc
-    out_id.createVariable('Cs_r', 'f8', ('s_rho'))
-    out_id.variables['Cs_r'].long_name = 'S-coordinate stretching curves at RHO-points'
-    out_id.variables['Cs_r'].units = 'nondimensional'
-    out_id.variables['Cs_r'].valid_min = -1.0
-    out_id.variables['Cs_r'].valid_max = 0.0
+    create_var(out_id, 'Cs_r', ('s_rho'))
     out_id.variables['Cs_r'][:] = Cs_r
-    out_id.createVariable('ocean_time', 'f8', ('ocean_time'))
-    out_id.variables['ocean_time'].long_name = 'time since initialization'
-    out_id.variables['ocean_time'].units = 'seconds'
+    create_var(out_id, 'ocean_time', ('ocean_time'))
     out_id.variables['ocean_time'][0] = 0.0
-    out_id.createVariable('u', 'f8', ('ocean_time', 's_rho', 'eta_u', 'xi_u'))
-    out_id.variables['u'].long_name = 'u-momentum component'
-    out_id.variables['u'].units = 'meter second-1'
+    create_var(out_id, 'u', ('ocean_time', 's_rho', 'eta_u', 'xi_u'))
     out_id.variables['u'][0,:,:,:] = u
-    out_id.createVariable('v', 'f8', ('ocean_time', 's_rho', 'eta_v', 'xi_v'))
-    out_id.variables['v'].long_name = 'v-momentum component'
-    out_id.variables['v'].units = 'meter second-1'
+    create_var(out_id, 'v', ('ocean_time', 's_rho', 'eta_v', 'xi_v'))
     out_id.variables['v'][0,:,:,:] = v
-    out_id.createVariable('ubar', 'f8', ('ocean_time', 'eta_u', 'xi_u'))
-    out_id.variables['ubar'].long_name = 'vertically integrated u-momentum component'
-    out_id.variables['ubar'].units = 'meter second-1'
+    create_var(out_id, 'ubar', ('ocean_time', 'eta_u', 'xi_u'))
     out_id.variables['ubar'][0,:,:] = ubar
-    out_id.createVariable('vbar', 'f8', ('ocean_time', 'eta_v', 'xi_v'))
-    out_id.variables['vbar'].long_name = 'vertically integrated v-momentum component'
-    out_id.variables['vbar'].units = 'meter second-1'
+    create_var(out_id, 'vbar', ('ocean_time', 'eta_v', 'xi_v'))
     out_id.variables['vbar'][0,:,:] = vbar
-    out_id.createVariable('zeta', 'f8', ('ocean_time', 'eta_rho', 'xi_rho'))
-    out_id.variables['zeta'].long_name = 'free-surface'
-    out_id.variables['zeta'].units = 'meter'
+    create_var(out_id, 'zeta', ('ocean_time', 'eta_rho', 'xi_rho'))
     out_id.variables['zeta'][0,:,:] = zeta
-    out_id.createVariable('temp', 'f8', ('ocean_time', 's_rho', 'eta_rho', 'xi_rho'))
-    out_id.variables['temp'].long_name = 'potential temperature'
-    out_id.variables['temp'].units = 'Celsius'
+    create_var(out_id, 'temp', ('ocean_time', 's_rho', 'eta_rho', 'xi_rho'))
     out_id.variables['temp'][0,:,:,:] = temp
-    out_id.createVariable('salt', 'f8', ('ocean_time', 's_rho', 'eta_rho', 'xi_rho'))
-    out_id.variables['salt'].long_name = 'salinity'
-    out_id.variables['salt'].units = 'PSU'
+    create_var(out_id, 'salt', ('ocean_time', 's_rho', 'eta_rho', 'xi_rho'))
     out_id.variables['salt'][0,:,:,:] = salt
-    out_id.createVariable('sc_r', 'f8', ('s_rho'))
-    out_id.variables['sc_r'].long_name = 'S-coordinate at rho-points'
-    out_id.variables['sc_r'].units = 'nondimensional'
-    out_id.variables['sc_r'].valid_min = -1.0
-    out_id.variables['sc_r'].valid_max = 0.0
+    create_var(out_id, 'sc_r', ('s_rho'))
     out_id.variables['sc_r'][:] = sc_r
     out_id.close()
 
@@ -173,11 +140,6 @@ def run (grid_file, woa_file, output_file, Tcline, theta_s, theta_b, hc, N, nbdr
 #     latitude x longitude)
 def interp_woa2roms (A, lon_woa, lat_woa, depth_woa, lon_roms_3d, lat_roms_3d, z_roms_3d, mask_rho, mask_zice, fill):
 
-    # Radius of the Earth in m
-    r = 6.371e6
-    # Degrees to radians conversion factor
-    deg2rad = pi/180.0
-
     # Calculate N based on size of ROMS grid
     N = size(lon_roms_3d, 0)
 
@@ -196,62 +158,8 @@ def interp_woa2roms (A, lon_woa, lat_woa, depth_woa, lon_roms_3d, lat_roms_3d, z
         # Save this depth level
         B[k,:,:] = tmp
 
-    print '...selecting ice shelf front'
-    # Find the ice shelf front
-    front = zeros(shape(lon_roms_3d))
-    # Find northernmost latitude with ice shelves
-    nbdry_zice = where(sum(mask_zice, axis=1) > 0)[-1][-1] + 2
-    # Loop over all cells; can't find a cleaner way to do this
-    for j in range(nbdry_zice):
-        for i in range(size(mask_zice,1)):
-            # First make sure this is an ocean point
-            if mask_rho[j,i] == 1:
-                # Find bounds on window of radius 1
-                j_min = max(j-1,0)
-                j_max = min(j+2, size(mask_zice,0))
-                i_min = max(i-1,0)
-                i_max = min(i+2, size(mask_zice,1))
-                # Points at the ice shelf front are not ice shelf points, but have at least one
-                # neighbour that is
-                if mask_zice[j,i] == 0 and any(mask_zice[j_min:j_max,i_min:i_max] == 1):
-                    front[:,j,i] = 1
-
     print '...extrapolating under ice shelves'
-    mask_zice_3d = tile(mask_zice, (N,1,1))
-    for j in range(nbdry_zice, -1, -1):
-        print '...latitude index ' + str(nbdry_zice-j+1) + ' of ' + str(nbdry_zice+1)
-        # Find coordinates of ice shelf front points
-        lon_front = lon_roms_3d[front==1]
-        lat_front = lat_roms_3d[front==1]
-        z_front = z_roms_3d[front==1]
-        # Also find the values of the given variable here
-        B_front = B[front==1]
-        for i in range(size(mask_zice,1)):
-            if mask_zice[j,i] == 1:
-                for k in range(N):
-                    # Calculate Cartesian distance from this point to each point
-                    # at the ice shelf front
-                    dlon = lon_front - lon_roms_3d[k,j,i]
-                    index = dlon > 300
-                    dlon[index] -= 360
-                    index = dlon < -300
-                    dlon[index] += 360
-                    dlon = abs(dlon)
-                    dlat = abs(lat_front - lat_roms_3d[k,j,i])
-                    dz = abs(z_front - z_roms_3d[k,j,i])
-                    dx = r*cos(lat_roms_3d[k,j,i]*deg2rad)*dlon*deg2rad
-                    dy = r*dlat*deg2rad
-                    dist = sqrt(dx**2 + dy**2 + dz**2)
-                    # Find the index with the minimum distance: this is the
-                    # nearest-neighbour
-                    nearest = argmin(dist)
-                    B[k,j,i] = B_front[nearest]
-        # Update the ice shelf front points to include the new points we've just
-        # extrapolated to
-        front_tmp = front[:,j,:]
-        mask_zice_tmp = mask_zice_3d[:,j,:]
-        front_tmp[mask_zice_tmp==1] = 1
-        front[:,j,:] = front_tmp
+    B = extrapolate_cavity(B, lon_roms_3d, lat_roms_3d, z_roms_3d, mask_rho, mask_zice)
 
     # Enforce the periodic boundary
     B[:,:,0] = B[:,:,-2]
@@ -3,6 +3,7 @@ from numpy import *
 from scipy.interpolate import RegularGridInterpolator
 from cartesian_grid_3d import *
 from calc_z import *
+from output_schema import *
 
 # Build a ROMS lateral boundary condition file from ECCO2 temperature, salinity,
 # and velocity output, containing boundary conditions at the northern boundary.
@@ -148,58 +149,28 @@ def convert_file (year):
     out_fid.createDimension('s_rho', N)
     out_fid.createDimension('ocean_time', None)
     out_fid.createDimension('one', 1);
-    out_fid.createVariable('theta_s', 'f8', ('one'))
-    out_fid.variables['theta_s'].long_name = 'S-coordinate surface control parameter'
+    create_var(out_fid, 'theta_s', ('one'))
     out_fid.variables['theta_s'][:] = theta_s
-    out_fid.createVariable('theta_b', 'f8', ('one'))
-    out_fid.variables['theta_b'].long_name = 'S-coordinate bottom control parameter'
-    out_fid.variables['theta_b'].units = 'nondimensional'
+    create_var(out_fid, 'theta_b', ('one'))
     out_fid.variables['theta_b'][:] = theta_b
-    out_fid.createVariable('Tcline', 'f8', ('one'))
-    out_fid.variables['Tcline'].long_name = 'S-coordinate surface/bottom layer width'
-    out_fid.variables['Tcline'].units = 'meter'
+    create_var(out_fid, 'Tcline', ('one'))
     out_fid.variables['Tcline'][:] = hc
-    out_fid.createVariable('hc', 'f8', ('one'))
-    out_fid.variables['hc'].long_name = 'S-coordinate parameter, critical depth'
-    out_fid.variables['hc'].units = 'meter'
+    create_var(out_fid, 'hc', ('one'))
     out_fid.variables['hc'][:] = hc
-    out_fid.createVariable('sc_r', 'f8', ('s_rho'))
-    out_fid.variables['sc_r'].long_name = 'S-coordinate at rho-points'
-    out_fid.variables['sc_r'].units = 'nondimensional'
-    out_fid.variables['sc_r'].valid_min = -1
-    out_fid.variables['sc_r'].valid_max = 0
+    create_var(out_fid, 'sc_r', ('s_rho'))
     out_fid.variables['sc_r'][:] = sc_r
-    out_fid.createVariable('Cs_r', 'f8', ('s_rho'))
-    out_fid.variables['Cs_r'].long_name = 'S-coordinate stretching curves at RHO-points'
-    out_fid.variables['Cs_r'].units = 'nondimensional'
-    out_fid.variables['Cs_r'].valid_min = -1
-    out_fid.variables['Cs_r'].valid_max = 0
+    create_var(out_fid, 'Cs_r', ('s_rho'))
     out_fid.variables['Cs_r'][:] = Cs_r
-    out_fid.createVariable('ocean_time', 'f8', ('ocean_time'))
-    out_fid.variables['ocean_time'].long_name = 'time since initialization'
-    out_fid.variables['ocean_time'].units = 'days'
-    out_fid.createVariable('temp_north', 'f8', ('ocean_time', 's_rho', 'xi_rho'))
-    out_fid.variables['temp_north'].long_name = 'northern boundary potential temperature'
-    out_fid.variables['temp_north'].units = 'Celsius'
-    out_fid.createVariable('salt_north', 'f8', ('ocean_time', 's_rho', 'xi_rho'))
-    out_fid.variables['salt_north'].long_name = 'northern boundary salinity'
-    out_fid.variables['salt_north'].units = 'PSU'
-    out_fid.createVariable('u_north', 'f8', ('ocean_time', 's_rho', 'xi_u'))
-    out_fid.variables['u_north'].long_name = 'northern boundary u-momentum component'
-    out_fid.variables['u_north'].units = 'meter second-1'
-    out_fid.createVariable('v_north', 'f8', ('ocean_time', 's_rho', 'xi_v'))
-    out_fid.variables['v_north'].long_name = 'northern boundary v-momentum component'
-    out_fid.variables['v_north'].units = 'meter second-1'
-    out_fid.createVariable('ubar_north', 'f8', ('ocean_time', 'xi_u'))
-    out_fid.variables['ubar_north'].long_name = 'northern boundary vertically integrated u-momentum component'
-    out_fid.variables['ubar_north'].units = 'meter second-1'
-    out_fid.createVariable('vbar_north', 'f8', ('ocean_time', 'xi_v'))
-    out_fid.variables['vbar_north'].long_name = 'northern boundary vertically integrated v-momentum component'
-    out_fid.variables['vbar_north'].units = 'meter second-1'
-    out_fid.createVariable('zeta_north', 'f8', ('ocean_time', 'xi_rho'))
-    out_fid.variables['zeta_north'].long_name = 'northern boundary sea surface height'
-    out_fid.variables['zeta_north'].units = 'meter'
-    out_fid.close()
+    create_var(out_fid, 'ocean_time', ('ocean_time'), units='days')
+    create_var(out_fid, 'temp_north', ('ocean_time', 's_rho', 'xi_rho'))
+    create_var(out_fid, 'salt_north', ('ocean_time', 's_rho', 'xi_rho'))
+    create_var(out_fid, 'u_north', ('ocean_time', 's_rho', 'xi_u'))
+    create_var(out_fid, 'v_north', ('ocean_time', 's_rho', 'xi_v'))
+    create_var(out_fid, 'ubar_north', ('ocean_time', 'xi_u'))
+    create_var(out_fid, 'vbar_north', ('ocean_time', 'xi_v'))
+    create_var(out_fid, 'zeta_north', ('ocean_time', 'xi_rho'))
+    # Save the whole year in one slab at the end, with time last
+    buffer = record_buffer(out_fid, ['temp_north', 'salt_north', 'u_north', 'v_north', 'ubar_north', 'vbar_north', 'zeta_north', 'ocean_time'])
 
     # Loop through each month of this year
     for month in range(12):
@@ -263,19 +234,11 @@ def convert_file (year):
         # relative to 1992
         time = 365.25*(year-1992) + 365.25/12*(month+0.5)
 
-        # Save data to NetCDF file
-        out_fid = Dataset(output_file, 'a')
-        out_fid.variables['ocean_time'][month] = time
-        out_fid.variables['temp_north'][month,:,:] = temp_interp
-        out_fid.variables['salt_north'][month,:,:] = salt_interp
-        # Clamp u to zero
-        out_fid.variables['u_north'][month,:,:] = 0.0
-        out_fid.variables['v_north'][month,:,:] = v_interp
-        # Clamp ubar to zero
-        out_fid.variables['ubar_north'][month,:] = 0.0
-        out_fid.variables['vbar_north'][month,:] = vbar_interp
-        out_fid.variables['zeta_north'][month,:] = 0.0
-        out_fid.close()
+        # Save data to the buffer; clamp u and ubar to zero, and zeta too
+        buffer_record(buffer, [temp_interp, salt_interp, zeros((N, num_lon_u)), v_interp, zeros(num_lon_u), vbar_interp, zeros(num_lon_rho), time])
+
+    flush_buffer(buffer)
+    out_fid.close()
 
 
 # Given an array on the ECCO2 grid, fill the land mask with constant values,
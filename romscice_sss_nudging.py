@@ -2,6 +2,7 @@ from netCDF4 import Dataset
 from numpy import *
 from scipy.interpolate import RegularGridInterpolator
 from scipy.spatial import KDTree
+from output_schema import *
 
 # Interpolate the World Ocean Atlas 2013 monthly climatology of sea surface
 # salinity to the ROMS grid, for use in surface salinity restoring.
@@ -67,13 +68,10 @@ def romscice_sss_nudging ():
     out_id.createDimension('xi_rho', num_lon)
     out_id.createDimension('eta_rho', num_lat)
     out_id.createDimension('sss_time', None)
-    out_id.createVariable('sss_time', 'f8', ('sss_time'))
-    out_id.variables['sss_time'].long_name = 'time since initialization'
-    out_id.variables['sss_time'].units = 'days'
-    out_id.variables['sss_time'].cycle_length = 365.25
-    out_id.createVariable('SSS', 'f8', ('sss_time', 'eta_rho', 'xi_rho'))
-    out_id.variables['SSS'].long_name = 'surface salinity'
-    out_id.variables['SSS'].units = 'psu'
+    create_var(out_id, 'sss_time', ('sss_time'))
+    create_var(out_id, 'SSS', ('sss_time', 'eta_rho', 'xi_rho'), forcing=True)
+    # Save the whole year in one slab at the end
+    buffer = record_buffer(out_id, ['SSS', 'sss_time'])
 
     # Loop over months
     for month in range(12):
@@ -97,10 +95,10 @@ def romscice_sss_nudging ():
 
         # Calculate time value: 12 values equally spaced throughout the year
         time = 365.25/12*(month+0.5)
-        # Save to file
-        out_id.variables['sss_time'][month] = time        
-        out_id.variables['SSS'][month,:,:] = sss_interp
+        # Save to buffer
+        buffer_record(buffer, [sss_interp, time])
 
+    flush_buffer(buffer)
     out_id.close()
 
 
@@ -2,6 +2,7 @@ from netCDF4 import Dataset
 from numpy import *
 from scipy.interpolate import RegularGridInterpolator
 from scipy.spatial import KDTree
+from output_schema import *
 
 # Create a ROMS tide file containing the first 10 tidal components interpolated
 # from TPXO 7.2. 
@@ -84,17 +85,11 @@ def romscice_tides ():
     id.createDimension('xi_rho', num_lon)
     id.createDimension('eta_rho', num_lat)
     id.createDimension('tide_period', num_cmp)
-    id.createVariable('tide_period', 'f8', ('tide_period'))
-    id.variables['tide_period'].long_name = 'tide angular period'
-    id.variables['tide_period'].units = 'seconds'
+    create_var(id, 'tide_period', ('tide_period'))
     id.variables['tide_period'][:] = period #_1yr
-    id.createVariable('tide_Ephase', 'f8', ('tide_period', 'eta_rho', 'xi_rho'))
-    id.variables['tide_Ephase'].long_name = 'tidal elevation phase angle'
-    id.variables['tide_Ephase'].units = 'degrees, time of maximum elevation with respect to chosen time origin'
+    create_var(id, 'tide_Ephase', ('tide_period', 'eta_rho', 'xi_rho'), forcing=True)
     id.variables['tide_Ephase'][:,:,:] = Ephase_interp
-    id.createVariable('tide_Eamp', 'f8', ('tide_period', 'eta_rho', 'xi_rho'))
-    id.variables['tide_Eamp'].long_name = 'tidal elevation amplitude'
-    id.variables['tide_Eamp'].units = 'meter'
+    create_var(id, 'tide_Eamp', ('tide_period', 'eta_rho', 'xi_rho'), forcing=True)
     id.variables['tide_Eamp'][:,:,:] = Eamp_interp
     id.components = cmp_names
     id.close()
@@ -0,0 +1,279 @@
+from netCDF4 import Dataset
+from numpy import *
+from collections import OrderedDict
+from grid_cache import *
+from lon_sections import lon_section, apply_lon_section
+from timeseries_store import *
+
+# Volume, heat, and salt transport through any number of transects (lines of
+# constant longitude between two latitudes) during a ROMS simulation, in one
+# pass through the output file. The geometry of each transect is found once:
+# the small window of the grid around it, the interpolation coefficients, the
+# rotation angle, and the width dy of each point (and the cell thicknesses, for
+# full-depth transports). Records are then streamed a block at a time, and only
+# the window of each variable is read, rather than the whole domain: velocity
+# is interpolated to the rho-grid and rotated to lon-lat space inside the
+# window, then interpolated to the transect and integrated.
+
+# Reference density (kg/m^3) and specific heat of polar seawater (J/K/kg), as
+# in timeseries_3D.py
+rho0 = 1000.0
+Cp = 3974
+# Named transects: longitude, and southern and northern latitude bounds. The
+# gyre and slope current sections are rough, and meant to be edited.
+transects = OrderedDict([('Drake Passage', (-67, -68, -54.5)), ('Weddell Gyre', (-30, -77, -62)), ('Ross Gyre', (-150, -78, -66)), ('Antarctic Slope Current', (0, -71, -68))])
+
+
+# Find the geometry of a transect.
+# Input:
+# grid_path = path to ROMS grid file
+# lon0 = longitude of transect
+# lat_min, lat_max = latitude bounds of transect
+# N = optional number of vertical levels, for full-depth (not just
+#     barotropic) transports
+# theta_s, theta_b, hc = optional vertical grid parameters (default 7.0, 2.0,
+#                        250, as used throughout this repository)
+# Output: dictionary containing
+# j0, j1 = range of rows of the window (on the rho-grid, counting from the
+#          southern boundary of the grid file)
+# c0, c1 = range of columns of the window (on the rho-grid, including the
+#          overlapping periodic boundary)
+# local = indices and coefficients (as from lon_section) to interpolate from
+#         the window to the transect
+# lat = latitude of each point in the transect
+# dy = Cartesian width of each point in metres
+# angle = rotation angle in the window
+# wct = static water column thickness (h + zice) in the window
+# geom = if N is set, dictionary from grid_geometry sliced to the window
+def transect_geometry (grid_path, lon0, lat_min, lat_max, N=None, theta_s=7.0, theta_b=2.0, hc=250):
+
+    # Radius of the Earth in metres
+    r = 6.371e6
+    # Degrees to radians conversion factor
+    deg2rad = pi/180.0
+
+    id = Dataset(grid_path, 'r')
+    h = id.variables['h'][:-15,:]
+    zice = id.variables['zice'][:-15,:]
+    lon = id.variables['lon_rho'][:-15,:]
+    lat = id.variables['lat_rho'][:-15,:]
+    angle = id.variables['angle'][:-15,:]
+    id.close()
+
+    # Interpolate on the grid without the overlapping periodic boundary, so
+    # the window never needs velocity from outside the grid
+    section = lon_section(lon[:,1:-1], lon0)
+    lat_sec = apply_lon_section(section, lat[:,1:-1])
+    # Find indices for latitude bounds
+    if lat_sec[0] > lat_min or lat_sec[-1] <= lat_max:
+        print 'Error: transect at ' + str(lon0) + ' goes beyond the grid'
+        return None
+    jS = nonzero(lat_sec > lat_min)[0][0]
+    jN = nonzero(lat_sec > lat_max)[0][0]
+    rows = section['rows'][jS:jN]
+    # Columns on the grid with the periodic boundary
+    ie = section['ie'][jS:jN] + 1
+    iw = section['iw'][jS:jN] + 1
+    lat_sec = lat_sec[jS:jN]
+    # The window; if lon0 is between the last and first columns, this will
+    # be the whole width of the grid
+    j0 = rows[0]
+    j1 = rows[-1] + 1
+    c0 = amin(minimum(ie, iw))
+    c1 = amax(maximum(ie, iw)) + 1
+    local = {'rows':rows-j0, 'ie':ie-c0, 'iw':iw-c0, 'coeffe':section['coeffe'][jS:jN], 'coeffw':section['coeffw'][jS:jN]}
+
+    # Calculate dy: first calculate latitude on edges of each cell
+    middle_lat = 0.5*(lat_sec[:-1] + lat_sec[1:])
+    lat_edges = zeros(size(lat_sec)+1)
+    lat_edges[0] = 2*lat_sec[0] - middle_lat[0]
+    lat_edges[1:-1] = middle_lat
+    lat_edges[-1] = 2*lat_sec[-1] - middle_lat[-1]
+    # Convert difference in latitude across each cell to Cartesian space
+    dy = r*(lat_edges[1:] - lat_edges[:-1])*deg2rad
+
+    transect = {'j0':j0, 'j1':j1, 'c0':c0, 'c1':c1, 'local':local, 'lat':lat_sec, 'dy':dy, 'angle':angle[j0:j1,c0:c1], 'wct':(h+zice)[j0:j1,c0:c1]}
+    if N is not None:
+        full_geom = grid_geometry(grid_path, theta_s, theta_b, hc, N)
+        geom = {}
+        for var in ['h', 'wct', 'dA', 'z_rho', 'z_w', 'dz']:
+            geom[var] = full_geom[var][...,j0:j1,c0:c1]
+        transect['geom'] = geom
+    return transect
+
+
+# Geometry of a list of named transects.
+# Input:
+# grid_path = path to ROMS grid file
+# names = optional list of names in transects (default all of them)
+# N, theta_s, theta_b, hc = optional, as in transect_geometry
+# Output: list of (name, dictionary from transect_geometry), leaving out any
+#         transects which don't fit on the grid
+def named_transects (grid_path, names=None, N=None, theta_s=7.0, theta_b=2.0, hc=250):
+
+    if names is None:
+        names = transects.keys()
+    transect_list = []
+    for name in names:
+        lon0, lat_min, lat_max = transects[name]
+        transect = transect_geometry(grid_path, lon0, lat_min, lat_max, N, theta_s, theta_b, hc)
+        if transect is None:
+            print 'Skipping ' + name
+        else:
+            transect_list.append((name, transect))
+    return transect_list
+
+
+# Interpolate velocity from the u- and v-grids to the rho-grid, and rotate
+# it to lon-lat space, as in rotate_vector_roms but inside a window, for any
+# number of time records or depth levels at once.
+# Input:
+# u = x-component on the u-grid, ... x rows x columns+1 (the columns from c0-1
+#     to c1-1 of the u-grid, which surround the rho-grid columns c0 to c1-1)
+# v = y-component on the v-grid, ... x rows+1 x columns (the rows from j0-1
+#     to j1-1 of the v-grid)
+# angle = rotation angle on the rho-grid in the window, rows x columns
+# Output: eastward component on the rho-grid, ... x rows x columns
+def east_velocity (u, v, angle):
+
+    u_rho = 0.5*(u[...,:-1] + u[...,1:])
+    v_rho = 0.5*(v[...,:-1,:] + v[...,1:,:])
+    return u_rho*cos(-angle) + v_rho*sin(-angle)
+
+
+# Barotropic transport through a transect.
+# Input:
+# transect = dictionary from transect_geometry
+# zeta = sea surface height in the window, time x rows x columns
+# ubar, vbar = barotropic velocity around the window (as in east_velocity),
+#              time x ...
+# Output: 1D array of transport in Sv for each time
+def barotropic_transport (transect, zeta, ubar, vbar):
+
+    local = transect['local']
+    ubar_sec = apply_lon_section(local, east_velocity(ubar, vbar, transect['angle']))
+    wct_sec = apply_lon_section(local, transect['wct'] + zeta)
+    # Integrate ubar*wct*dy and convert to Sv
+    return ma.filled(sum(ubar_sec*wct_sec*transect['dy'], axis=-1), 0)*1e-6
+
+
+# Full-depth volume, heat, and salt transport through a transect.
+# Input:
+# transect = dictionary from transect_geometry, with N set
+# zeta = sea surface height in the window, time x rows x columns
+# u, v = velocity around the window (as in east_velocity), time x depth x ...
+# temp, salt = temperature and salinity in the window, time x depth x rows x
+#              columns
+# Output: 1D arrays for each time of volume transport (Sv), heat transport
+#         relative to 0C (PW), and salt transport (Sv psu)
+def full_transport (transect, zeta, u, v, temp, salt):
+
+    local = transect['local']
+    # Cell thickness for this sea surface height
+    z_rho, z_w, dz, dV = geometry_zeta(transect['geom'], zeta)
+    u_sec = apply_lon_section(local, east_velocity(u, v, transect['angle']))
+    # Flux through each cell in m^3/s
+    flux = u_sec*apply_lon_section(local, dz)*transect['dy']
+    axes = (1,2)
+    volume = ma.filled(sum(flux, axis=axes), 0)*1e-6
+    heat = ma.filled(sum(flux*apply_lon_section(local, temp), axis=axes), 0)*rho0*Cp*1e-15
+    salt_transport = ma.filled(sum(flux*apply_lon_section(local, salt), axis=axes), 0)*1e-6
+    return volume, heat, salt_transport
+
+
+# Read the window around a transect for a range of time records.
+# Input:
+# id = open Dataset of ROMS history/averages file
+# transect = dictionary from transect_geometry
+# var = variable name
+# t_start, t_end = range of time records to read
+# Output: array of values, time x (depth x) rows x columns, with the extra
+#         column or row needed by east_velocity for u- and v-grid variables
+def read_window (id, transect, var, t_start, t_end):
+
+    j0 = transect['j0']
+    j1 = transect['j1']
+    c0 = transect['c0']
+    c1 = transect['c1']
+    dims = id.variables[var].dimensions
+    if dims[-1] == 'xi_u':
+        j_range = slice(j0, j1)
+        i_range = slice(c0-1, c1)
+    elif dims[-2] == 'eta_v':
+        j_range = slice(j0-1, j1)
+        i_range = slice(c0, c1)
+    else:
+        j_range = slice(j0, j1)
+        i_range = slice(c0, c1)
+    if len(dims) == 4:
+        return id.variables[var][t_start:t_end,:,j_range,i_range]
+    return id.variables[var][t_start:t_end,j_range,i_range]
+
+
+# Calculate transport through every transect in a list, for every record in
+# a ROMS history/averages file.
+# Input:
+# file_path = path to ROMS history/averages file
+# transect_list = list of (name, dictionary from transect_geometry)
+# barotropic = optional boolean: only calculate volume transport, from the
+#              barotropic velocity (default False; otherwise every transect
+#              needs N set)
+# block_size = optional number of time records to read at once (default 10)
+# Output:
+# time = 1D array of time values, straight out of the file
+# data = list of (timeseries name, 1D array): for each transect, "name
+#        Transport (Sv)", and unless barotropic, "name Heat Transport (PW)" and
+#        "name Salt Transport (Sv psu)"
+def scan_transports (file_path, transect_list, barotropic=False, block_size=10):
+
+    id = Dataset(file_path, 'r')
+    time = id.variables['ocean_time'][:]
+    num_time = size(time)
+    results = OrderedDict()
+    start_t = 0
+    while start_t < num_time:
+        end_t = minimum(start_t+block_size, num_time)
+        print 'Processing time indices ' + str(start_t+1) + ' to ' + str(end_t)
+        for name, transect in transect_list:
+            zeta = read_window(id, transect, 'zeta', start_t, end_t)
+            if barotropic:
+                new_data = [(name + ' Transport (Sv)', barotropic_transport(transect, zeta, read_window(id, transect, 'ubar', start_t, end_t), read_window(id, transect, 'vbar', start_t, end_t)))]
+            else:
+                volume, heat, salt = full_transport(transect, zeta, read_window(id, transect, 'u', start_t, end_t), read_window(id, transect, 'v', start_t, end_t), read_window(id, transect, 'temp', start_t, end_t), read_window(id, transect, 'salt', start_t, end_t))
+                new_data = [(name + ' Transport (Sv)', volume), (name + ' Heat Transport (PW)', heat), (name + ' Salt Transport (Sv psu)', salt)]
+            for series, values in new_data:
+                results.setdefault(series, []).append(values)
+        start_t = end_t
+    id.close()
+    return time, [(series, concatenate(results[series])) for series in results]
+
+
+# Calculate transport through all the named transects and append it to a
+# timeseries store.
+# Input:
+# grid_path = path to ROMS grid file
+# file_path = path to ROMS history/averages file
+# log_path = path to timeseries store (see timeseries_store.py)
+# barotropic = optional boolean, as in scan_transports
+# N = optional number of vertical levels (default 31)
+def section_transport (grid_path, file_path, log_path, barotropic=False, N=31):
+
+    print 'Analysing grid'
+    if barotropic:
+        N = None
+    transect_list = named_transects(grid_path, N=N)
+    time, data = scan_transports(file_path, transect_list, barotropic)
+    # Convert time from seconds to years
+    time = time/(60*60*24*365.25)
+    print 'Saving results to timeseries store'
+    append_timeseries(log_path, time, data)
+
+
+# Command-line interface
+if __name__ == "__main__":
+
+    grid_path = raw_input("Path to ROMS grid file: ")
+    file_path = raw_input("Path to ROMS history/averages file: ")
+    log_path = raw_input("Path to timeseries store to save values to: ")
+    action = raw_input("Full-depth volume, heat, and salt transport (f) or barotropic volume transport only (b)? ")
+    section_transport(grid_path, file_path, log_path, barotropic=(action == 'b'))
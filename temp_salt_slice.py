@@ -60,9 +60,13 @@ def temp_salt_slice (file_path, tstep, lon0, depth_min, save=False, fig_name=Non
     if lon0 < 0:
         lon0 += 360
 
-    # Interpolate temperature, salinity, z, and latitude to lon0
-    temp, z, lat = interp_lon_roms(temp_3d, z_3d, lat_2d, lon_2d, lon0)
-    salt, z, lat = interp_lon_roms(salt_3d, z_3d, lat_2d, lon_2d, lon0)
+    # Interpolate temperature, salinity, z, and latitude to lon0, finding the
+    # interpolation indices and coefficients once
+    section = lon_section(lon_2d, lon0)
+    temp = apply_lon_section(section, temp_3d)
+    salt = apply_lon_section(section, salt_3d)
+    z = apply_lon_section(section, z_3d)
+    lat = tile(apply_lon_section(section, lat_2d), (N,1))
 
     # Choose latitude bounds based on land mask
     temp_sum = sum(temp, axis=0)    
@@ -0,0 +1,152 @@
+from numpy import *
+from grid_stencils import *
+
+# Tests for grid_stencils.py, comparing against the loops it replaced. Run
+# with pytest, or directly with python test_grid_stencils.py
+
+
+# Small land mask with a few islands and channels, and an ice shelf mask
+def sample_masks ():
+
+    mask_rho = ones([7, 9])
+    mask_rho[0,:] = 0
+    mask_rho[2,3] = 0
+    mask_rho[3,2:5] = 0
+    mask_rho[4,3] = 0
+    mask_rho[5,0] = 0
+    mask_rho[5,8] = 0
+    mask_rho[6,7:] = 0
+    mask_zice = zeros([7, 9])
+    mask_zice[1,1:3] = 1
+    mask_zice[1,8] = 1
+    mask_zice[5,5] = 1
+    mask_zice = mask_zice*mask_rho
+    return mask_rho, mask_zice
+
+
+def test_neighbour_periodic ():
+
+    A = arange(12).reshape(3, 4)
+    # Neighbour to the east: the last column wraps around to the first
+    B = neighbour(A, 0, 1)
+    assert array_equal(B[:,:-1], A[:,1:])
+    assert array_equal(B[:,-1], A[:,0])
+    # Neighbour to the west: the first column wraps around to the last
+    B = neighbour(A, 0, -1)
+    assert array_equal(B[:,0], A[:,-1])
+    # Diagonal: wraps in longitude but not in latitude
+    B = neighbour(A, 1, 1, fill=-1)
+    assert array_equal(B[:-1,-1], A[1:,0])
+    assert all(B[-1,:] == -1)
+    # Not periodic: edges get the fill value
+    B = neighbour(A, 0, 1, periodic=False, fill=-1)
+    assert array_equal(B[:,:-1], A[:,1:])
+    assert all(B[:,-1] == -1)
+    # Leading dimensions are left alone
+    A3 = array([A, A+100])
+    assert array_equal(neighbour(A3, 0, 1)[1], neighbour(A+100, 0, 1))
+
+
+def test_ice_shelf_front ():
+
+    mask_rho, mask_zice = sample_masks()
+    num_lat = size(mask_zice,0)
+    num_lon = size(mask_zice,1)
+    # Old loop from extrapolate_cavity.py
+    front = zeros([num_lat, num_lon], dtype=bool)
+    for j in range(num_lat):
+        for i in range(num_lon):
+            if mask_rho[j,i] == 1 and mask_zice[j,i] == 0:
+                window = mask_zice[maximum(j-1,0):j+2, maximum(i-1,0):i+2]
+                front[j,i] = any(window == 1)
+    assert array_equal(ice_shelf_front(mask_rho, mask_zice), front)
+    assert count_nonzero(front) > 0
+
+
+def test_isolated_points ():
+
+    kmt = zeros([4, 6])
+    kmt[1,:] = [1, 1, 0, 0, 0, 1]
+    kmt[2,:] = [0, 0, 0, 1, 0, 1]
+    kmt[3,3] = 1
+    num_i = size(kmt,1)
+    num_j = size(kmt,0)
+    # Old loop from find_isolated_points.py, over the interior rows
+    old = zeros([num_j, num_i], dtype=bool)
+    for j in range(1, num_j-1):
+        for i in range(num_i):
+            if kmt[j,i] == 1:
+                if i == num_i-1:
+                    neighbours = array([kmt[j,i-1], kmt[j,0], kmt[j-1,i], kmt[j+1,i]])
+                else:
+                    neighbours = array([kmt[j,i-1], kmt[j,i+1], kmt[j-1,i], kmt[j+1,i]])
+                if sum(neighbours) < 2:
+                    old[j,i] = True
+    isolated = isolated_points(kmt)
+    assert array_equal(isolated[1:-1,:], old[1:-1,:])
+    assert array_equal(nonzero(isolated[1:-1,:]), ([0, 1, 1], [1, 3, 5]))
+    # Without the periodic boundary, the first point in the row loses its
+    # neighbour to the west
+    assert isolated_points(kmt, periodic=False)[1,0]
+
+
+def test_neighbour_mean_fill ():
+
+    mask_rho, mask_zice = sample_masks()
+    data = ma.masked_where(mask_rho == 0, arange(mask_rho.size, dtype=float).reshape(shape(mask_rho)))
+    num_lat = size(data,0)
+    num_lon = size(data,1)
+    # Old loop from mip_regions_1var.py, reading only the original values
+    old = ma.copy(data)
+    for j in range(1, num_lat-1):
+        for i in range(1, num_lon-1):
+            if data[j,i] is ma.masked:
+                neighbours = ma.array([data[j-1,i], data[j,i-1], data[j+1,i], data[j,i+1]])
+                num_unmasked = ma.count(neighbours)
+                if num_unmasked > 0:
+                    old[j,i] = sum(neighbours)/num_unmasked
+    filled = neighbour_mean_fill(data)
+    assert array_equal(ma.getmaskarray(filled), ma.getmaskarray(old))
+    assert ma.allclose(filled, old)
+    # The middle of the island has no unmasked neighbours
+    assert filled[3,3] is ma.masked
+    # Every depth at once gives the same as one at a time
+    data3 = ma.array([data, 2*data])
+    filled3 = neighbour_mean_fill(data3)
+    assert ma.allclose(filled3[1], neighbour_mean_fill(2*data))
+
+
+def test_laplacian_fill ():
+
+    # Values increasing linearly in longitude, masked in the middle: the
+    # solution to Laplace's equation is the same straight line
+    data = ma.array(tile(arange(9)*2, (5,1)))
+    data[1:4,2:7] = ma.masked
+    filled = laplacian_fill(data, num_iter=5000, tol=1e-10, periodic=False)
+    assert ma.count_masked(filled) == 0
+    assert allclose(filled, tile(arange(9)*2.0, (5,1)), atol=1e-6)
+    # Integer and floating point input give the same answer
+    filled_float = laplacian_fill(data.astype(float), num_iter=5000, tol=1e-10, periodic=False)
+    assert allclose(filled, filled_float)
+
+    # Masked field on the sample grid: unmasked values are kept and each
+    # filled value is the average of its neighbours
+    mask_rho, mask_zice = sample_masks()
+    data = ma.masked_where(mask_rho == 0, (arange(mask_rho.size) % 7).reshape(shape(mask_rho)))
+    filled = laplacian_fill(data, num_iter=5000, tol=1e-10)
+    assert allclose(filled[mask_rho == 1], data[mask_rho == 1])
+    total = zeros(shape(filled))
+    for dj, di in edge_neighbours:
+        total += neighbour(filled, dj, di)
+    count = neighbour_count(ones(shape(filled), dtype=bool))
+    assert allclose(filled[mask_rho == 0], (total/count)[mask_rho == 0], atol=1e-6)
+
+
+if __name__ == "__main__":
+
+    test_neighbour_periodic()
+    test_ice_shelf_front()
+    test_isolated_points()
+    test_neighbour_mean_fill()
+    test_laplacian_fill()
+    print 'All tests passed'
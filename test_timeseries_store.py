@@ -0,0 +1,72 @@
+from netCDF4 import Dataset
+from numpy import *
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeseries_store import *
+
+# Tests for timeseries_store.py. Run with pytest, or directly with
+# python test_timeseries_store.py
+
+
+# Simulate an append which was killed after the timeseries values were
+# written but before the time values: the partial records should be ignored
+# when reading, and overwritten by the next append.
+def test_killed_append ():
+
+    tmp_dir = mkdtemp()
+    try:
+        store_path = join(tmp_dir, 'massloss.nc')
+        append_timeseries(store_path, [1.0, 2.0], [('Mass Loss', [10.0, 20.0])], sources=[('a.nc', 0, 1), ('a.nc', 1, 2)])
+
+        # Write the values for two more records, as write_records does, then
+        # stop before writing time
+        id = Dataset(store_path, 'a')
+        write_records(id, arange(2, 4), [('Mass Loss', array([30.0, 40.0]))], [('b.nc', 0, 3), ('b.nc', 1, 4)])
+        id.close()
+        id = Dataset(store_path, 'r')
+        assert len(id.dimensions['time']) == 4
+        id.close()
+
+        # Readers only see the complete records
+        time, data = read_timeseries(store_path)
+        assert list(time) == [1.0, 2.0]
+        assert data[0][0] == 'Mass Loss'
+        assert list(data[0][1]) == [10.0, 20.0]
+        assert sorted(read_provenance(store_path).keys()) == [('a.nc', 0), ('a.nc', 1)]
+
+        # Updating a partial record is refused
+        update_timeseries(store_path, [2], [('Mass Loss', [0.0])])
+        time, data = read_timeseries(store_path)
+        assert list(time) == [1.0, 2.0]
+
+        # Rerunning the append overwrites the partial records rather than
+        # leaving them in the middle of the timeseries
+        num_new = append_timeseries(store_path, [3.0, 4.0], [('Mass Loss', [31.0, 41.0])])
+        assert num_new == 2
+        time, data = read_timeseries(store_path)
+        assert list(time) == [1.0, 2.0, 3.0, 4.0]
+        assert list(data[0][1]) == [10.0, 20.0, 31.0, 41.0]
+        id = Dataset(store_path, 'r')
+        assert len(id.dimensions['time']) == 4
+        id.close()
+
+        # A shorter append after an interruption leaves the rest of the
+        # partial records ignored
+        id = Dataset(store_path, 'a')
+        write_records(id, arange(4, 7), [('Mass Loss', array([50.0, 60.0, 70.0]))], None)
+        id.close()
+        append_timeseries(store_path, [5.0], [('Mass Loss', [51.0])])
+        time, data = read_timeseries(store_path)
+        assert list(time) == [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert list(data[0][1]) == [10.0, 20.0, 31.0, 41.0, 51.0]
+        time, data = read_timeseries(store_path, time_range=[4.5, 10.0])
+        assert list(time) == [5.0]
+    finally:
+        rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+
+    test_killed_append()
+    print 'All tests passed'
@@ -0,0 +1,231 @@
+from netCDF4 import Dataset, num2date
+from numpy import *
+from collections import OrderedDict
+from datetime import timedelta
+from os.path import getmtime, getsize
+
+# Calendar-aware averaging of ROMS and CICE 5-day averages over months,
+# seasons, and years. Rather than searching the time axis for the records at
+# the start and end of each month (with rules for how much each 5-day average
+# overlaps it) for every variable, each file is indexed once: every day in
+# every record's averaging period is labelled with its date. From this index,
+# each month (or season, or year) is a bin containing the records which touch
+# it and how many of their days fall inside it. The averaging engine then reads
+# each record once, for every variable at once, and adds it to every bin it
+# touches, weighted by days. Leap years come straight from the calendar.
+
+# Maximum number of files to keep indexed in memory at once
+max_cached_files = 8
+# In-memory cache, most recently used last
+index_cache = OrderedDict()
+
+# Names of seasons and months
+season_names = ['DJF', 'MAM', 'JJA', 'SON']
+month_names = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+
+# Label every day averaged in a ROMS or CICE file with its date, using the
+# cache if possible.
+# Input:
+# file_path = path to ROMS output file (time variable ocean_time; 5-day
+#             averages marked with the middle day's date) or CICE history file
+#             (time variable time; 5-day averages marked with the next day's
+#             date)
+# cice = optional boolean, True for a CICE file (default False)
+# Output: index = dictionary containing
+# time = array of dates of each record, from num2date
+# record, year, month = 1D integer arrays with one value for each day
+#                       averaged: the record which contains it, and its year
+#                       and month (1-based)
+# before, after = (year, month) of the day before the first day in the file,
+#                 and of the day after the last day
+def time_bin_index (file_path, cice=False):
+
+    # Include the file's size and modification time in the key so that an
+    # extended file isn't matched to a stale index
+    key = (file_path, getsize(file_path), getmtime(file_path), cice)
+    if key in index_cache:
+        # Move to the end (most recently used)
+        index = index_cache.pop(key)
+        index_cache[key] = index
+        return index
+
+    id = Dataset(file_path, 'r')
+    if cice:
+        time_id = id.variables['time']
+        offsets = range(-5, 0)
+    else:
+        time_id = id.variables['ocean_time']
+        offsets = range(-2, 3)
+    calendar = getattr(time_id, 'calendar', 'standard').lower()
+    time = num2date(time_id[:], units=time_id.units, calendar=calendar)
+    id.close()
+
+    num_time = size(time)
+    record = repeat(arange(num_time), len(offsets))
+    days = [time[t] + timedelta(days=offset) for t in range(num_time) for offset in offsets]
+    year = array([day.year for day in days])
+    month = array([day.month for day in days])
+    before = days[0] - timedelta(days=1)
+    after = days[-1] + timedelta(days=1)
+    index = {'time':time, 'record':record, 'year':year, 'month':month, 'before':(before.year, before.month), 'after':(after.year, after.month)}
+
+    index_cache[key] = index
+    while len(index_cache) > max_cached_files:
+        index_cache.popitem(last=False)
+    return index
+
+
+# Group the days in an index into bins.
+# Input:
+# index = dictionary from time_bin_index
+# key = function of (year, month) giving the bin
+# use = optional boolean array (one value for each record): only count the
+#       records where True
+# Output: bins = OrderedDict mapping each bin to a dictionary containing
+# records = 1D array of records which touch the bin
+# days = 1D array of how many days of each record are inside the bin
+# complete = boolean, whether the whole bin is inside the file
+def calendar_bins (index, key, use=None):
+
+    keys = [key(year, month) for year, month in zip(index['year'], index['month'])]
+    members = OrderedDict()
+    for n in range(len(keys)):
+        if use is None or use[index['record'][n]]:
+            members.setdefault(keys[n], []).append(index['record'][n])
+    # Bins which carry on past either end of the file are incomplete
+    ends = [key(*index['before']), key(*index['after'])]
+    bins = OrderedDict()
+    for bin_key in members:
+        records, days = unique(members[bin_key], return_counts=True)
+        bins[bin_key] = {'records':records, 'days':days, 'complete':bin_key not in ends}
+    return bins
+
+
+# Bins for each month, keyed by (year, month) with 1-based month.
+def month_bins (index, use=None):
+
+    return calendar_bins(index, lambda year, month: (year, month), use)
+
+
+# Bins for each season, keyed by (year, season) with season 0-3 for DJF, MAM,
+# JJA, SON. December counts towards DJF of the next year, so that a
+# Dec-Nov period has the same year in all 4 seasons.
+def season_bins (index, use=None):
+
+    return calendar_bins(index, lambda year, month: (year + (month == 12), season_of(month)), use)
+
+
+# Bins for each year, keyed by year.
+def year_bins (index, use=None):
+
+    return calendar_bins(index, lambda year, month: year, use)
+
+
+# Bins for a seasonal climatology, keyed by season 0-3 (all years together).
+def season_climatology_bins (index, use=None):
+
+    return calendar_bins(index, lambda year, month: season_of(month), use)
+
+
+# Bins for a monthly climatology, keyed by 1-based month (all years together).
+def month_climatology_bins (index, use=None):
+
+    return calendar_bins(index, lambda year, month: month, use)
+
+
+# Season (0-3 for DJF, MAM, JJA, SON) of a 1-based month.
+def season_of (month):
+
+    return (month % 12)//3
+
+
+# Find a given instance of a month in a file.
+# Input:
+# bins = bins from month_bins
+# month = month (0-11)
+# instance = optional integer: which complete instance of the month to use,
+#            from 1 for the first; -1 (the default) for the last
+# Output: key of the bin, or None if there isn't one
+def find_month (bins, month, instance=-1):
+
+    keys = [key for key in bins if key[1] == month+1 and bins[key]['complete']]
+    if instance == -1:
+        instance = len(keys)
+    if instance < 1 or instance > len(keys):
+        return None
+    return keys[instance-1]
+
+
+# Read a range of records of a field.
+# Input:
+# id = open Dataset
+# field = variable name, or (variable name, depth index) for a single level
+#         of a 3D variable
+# t_start, t_end = range of records to read
+def read_bin_field (id, field, t_start, t_end):
+
+    if isinstance(field, tuple):
+        var, level = field
+        return id.variables[var][t_start:t_end,level,:]
+    return id.variables[field][t_start:t_end,:]
+
+
+# Sum fields over bins, weighted by the number of days of each record inside
+# each bin. Each record is read once, for all the fields, and added to every
+# bin it touches.
+# Input:
+# file_path = path to ROMS or CICE output file
+# fields = list of fields, as in read_bin_field
+# bins = list of bins (values of the dictionaries from month_bins etc.)
+# block_size = optional number of records to read at once (default 10)
+# Output:
+# sums = dictionary mapping each field to a masked array (bin x ...) of sums;
+#        a point is masked in a bin if it is masked in any record of the bin
+# num_days = 1D array of the number of days in each bin
+def bin_sums (file_path, fields, bins, block_size=10):
+
+    num_bins = len(bins)
+    num_records = amax([amax(b['records']) for b in bins]) + 1
+    weights = zeros([num_bins, num_records])
+    for n in range(num_bins):
+        weights[n, bins[n]['records']] = bins[n]['days']
+    needed = nonzero(amax(weights, axis=0) > 0)[0]
+
+    sums = {}
+    masks = {}
+    id = Dataset(file_path, 'r')
+    t_start = needed[0]
+    while True:
+        t_end = minimum(t_start+block_size, num_records)
+        w = weights[:,t_start:t_end]
+        touched = nonzero(amax(w, axis=1) > 0)[0]
+        for field in fields:
+            data = read_bin_field(id, field, t_start, t_end)
+            if field not in sums:
+                sums[field] = zeros([num_bins] + list(shape(data)[1:]))
+                masks[field] = zeros([num_bins] + list(shape(data)[1:]), dtype=bool)
+            sums[field][touched] += tensordot(w[touched,:], ma.filled(data, 0), axes=1)
+            if ma.is_masked(data):
+                masks[field][touched] += tensordot((w[touched,:] > 0).astype(int), ma.getmaskarray(data).astype(int), axes=1) > 0
+        # Skip ahead to the next record we need
+        later = needed[needed >= t_end]
+        if size(later) == 0:
+            break
+        t_start = later[0]
+    id.close()
+
+    sums = dict([(field, ma.array(sums[field], mask=masks[field])) for field in fields])
+    return sums, sum(weights, axis=1)
+
+
+# Average fields over bins; see bin_sums for input.
+# Output: dictionary mapping each field to a masked array (bin x ...) of
+#         averages
+def bin_averages (file_path, fields, bins, block_size=10):
+
+    sums, num_days = bin_sums(file_path, fields, bins, block_size)
+    averages = {}
+    for field in fields:
+        averages[field] = sums[field]/num_days.reshape([len(bins)] + [1]*(sums[field].ndim-1))
+    return averages
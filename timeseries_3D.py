@@ -2,8 +2,9 @@ from netCDF4 import Dataset
 from numpy import *
 from matplotlib.pyplot import *
 from os.path import *
-from cartesian_grid_3d import *
+from grid_cache import *
 from rotate_vector_roms import *
+from timeseries_store import *
 
 # Calculate and plot timeseries of total ocean heat content, average salinity, 
 # and total kinetic energy during a ROMS simulation.
@@ -11,9 +12,9 @@ from rotate_vector_roms import *
 # Input:
 # grid_path = path to ROMS grid file
 # file_path = path to ROMS history/averages file
-# log_path = path to log file (if it exists, previously calculated values will
-#            be read from it; regardless, it will be overwritten with all
-#            calculated values following computation)
+# log_path = path to timeseries store (see timeseries_store.py; if it exists,
+#            previously calculated values will be read from it, and new
+#            values will be appended to it)
 def timeseries_3D (grid_path, file_path, log_path):
 
     # Grid parameters
@@ -25,43 +26,19 @@ def timeseries_3D (grid_path, file_path, log_path):
     Cp = 3974        # Specific heat of polar seawater (J/K/kg)
     C2K = 273.15     # Celsius to Kelvin conversion
 
-    time = []
 #    ohc = []
     avgsalt = []
 #    tke = []
-    # Check if the log file exists
-    if exists(log_path):
-        print 'Reading previously calculated values'
-        f = open(log_path, 'r')
-        # Skip first line (header for time array)
-        f.readline()
-        for line in f:
-            try:
-                time.append(float(line))
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-#        for line in f:
-#            try:
-#                ohc.append(float(line))
-#            except(ValueError):
-#                break
-        for line in f:
-            try:
-                avgsalt.append(float(line))
-            except(ValueError):
-                break
-#        for line in f:
-#            tke.append(float(line))
-        f.close()
 
     print 'Analysing grid'
+    # Get static geometry (computed once per grid and cached) and slice it
+    # to the region we want
+    geom = {}
+    full_geom = grid_geometry(grid_path, theta_s, theta_b, hc, N)
+    for var in ['h', 'wct', 'dA', 'z_rho', 'z_w', 'dz']:
+        geom[var] = full_geom[var][...,:-15,1:-1]
+    mask = full_geom['mask'][:-15,1:-1]
     id = Dataset(grid_path, 'r')
-    h = id.variables['h'][:-15,1:-1]
-    zice = id.variables['zice'][:-15,1:-1]    
-    lon = id.variables['lon_rho'][:-15,1:-1]
-    lat = id.variables['lat_rho'][:-15,1:-1]
-    mask = id.variables['mask_rho'][:-15,1:-1]
     # Keep the overlapping periodic boundary on "angle" for now
     angle = id.variables['angle'][:-15,:]
     id.close()
@@ -70,31 +47,21 @@ def timeseries_3D (grid_path, file_path, log_path):
     # Read time values and convert from seconds to years
     new_time = id.variables['ocean_time'][:]/(60*60*24*365.25)
     num_time = size(new_time)
-    # Concatenate with time values from log file
-    for t in range(num_time):        
-        time.append(new_time[t])
 
     # Process 10 time indices at a time so we don't use too much memory
     start_t = 0
     while True:
         end_t = min(start_t+10, num_time)
         print 'Processing time indices ' + str(start_t+1) + ' to ' + str(end_t)
-        num_time_curr = end_t-start_t
 
         print 'Calculating time-dependent dV'
         # Read time-dependent sea surface height
         zeta = id.variables['zeta'][start_t:end_t,:-15,1:-1]
-        # Calculate time-dependent dz
-        dz = ma.empty([num_time_curr, N, size(lon,0), size(lon,1)])
-        for t in range(num_time_curr):
-            # dx and dy will be recomputed unnecessarily each timestep
-            # but that's ok
-            dx, dy, dz_tmp, z = cartesian_grid_3d(lon, lat, h, zice, theta_s, theta_b, hc, N, zeta[t,:,:])
-            dz[t,:,:,:] = dz_tmp
-        # Calculate time-dependent dV and mask with land mask
-        # Here mask, dx, dy are all copied into arrays of dimension
-        # time x depth x lat x lon
-        dV = ma.masked_where(tile(mask, (num_time_curr,N,1,1))==0, tile(dx, (num_time_curr,1,1,1))*tile(dy, (num_time_curr,1,1,1))*dz)
+        # Calculate time-dependent dV for all time indices at once by
+        # rescaling the static geometry
+        z_rho, z_w, dz, dV = geometry_zeta(geom, zeta)
+        # Mask with land mask (broadcast, not copied, over time and depth)
+        dV = ma.masked_where(broadcast_to(mask==0, dV.shape), dV)
 
         print 'Reading data'
 #        temp = id.variables['temp'][start_t:end_t,:,:-15,1:-1]
@@ -117,13 +84,14 @@ def timeseries_3D (grid_path, file_path, log_path):
 #                v[t,k,:,:] = v_tmp[:,1:-1]
 
         print 'Building timeseries'
-        for t in range(num_time_curr):
-            # Integrate temp*rho*Cp*dV to get OHC
-#            ohc.append(sum((temp[t,:,:,:]+C2K)*rho[t,:,:,:]*Cp*dV[t,:,:,:]))
-            # Average salinity (weighted with rho*dV)
-            avgsalt.append(sum(salt[t,:,:,:]*rho[t,:,:,:]*dV[t,:,:,:])/sum(rho[t,:,:,:]*dV[t,:,:,:]))
-            # Integrate 0.5*rho*speed^2*dV to get TKE
-#            tke.append(sum(0.5*rho[t,:,:,:]*(u[t,:,:,:]**2 + v[t,:,:,:]**2)*dV[t,:,:,:]))
+        # Sum over depth, latitude, and longitude for all time indices at once
+        axes = (1,2,3)
+        # Integrate temp*rho*Cp*dV to get OHC
+#        ohc.extend(sum((temp+C2K)*rho*Cp*dV, axis=axes))
+        # Average salinity (weighted with rho*dV)
+        avgsalt.extend(sum(salt*rho*dV, axis=axes)/sum(rho*dV, axis=axes))
+        # Integrate 0.5*rho*speed^2*dV to get TKE
+#        tke.extend(sum(0.5*rho*(u**2 + v**2)*dV, axis=axes))
 
         # Get ready for next 10 time indices
         if end_t == num_time:
@@ -132,6 +100,13 @@ def timeseries_3D (grid_path, file_path, log_path):
 
     id.close()
 
+    print 'Saving results to timeseries store'
+    append_timeseries(log_path, new_time, [('Southern Ocean Average Salinity (psu)', avgsalt)])
+    # Read back the whole timeseries, including previously calculated values
+    time, data = read_timeseries(log_path)
+    data = dict(data)
+    avgsalt = data['Southern Ocean Average Salinity (psu)']
+
 #    print 'Plotting ocean heat content'
 #    clf()
 #    plot(time, ohc)
@@ -156,29 +131,13 @@ def timeseries_3D (grid_path, file_path, log_path):
 #    grid(True)
 #    savefig('tke.png')
 
-    print 'Saving results to log file'
-    f = open(log_path, 'w')
-    f.write('Time (years):\n')
-    for elm in time:
-        f.write(str(elm) + '\n')
-#    f.write('Southern Ocean Heat Content (J):\n')
-#    for elm in ohc:
-#        f.write(str(elm) + '\n')
-    f.write('Southern Ocean Average Salinity (psu):\n')
-    for elm in avgsalt:
-        f.write(str(elm) + '\n')
-#    f.write('Southern Ocean Total Kinetic Energy (J):\n')
-#    for elm in tke:
-#        f.write(str(elm) + '\n')
-    f.close()
-
 
 # Command-line interface
 if __name__ == "__main__":
 
     grid_path = raw_input("Path to ROMS grid file: ")
     file_path = raw_input("Path to ROMS history/averages file: ")
-    log_path = raw_input("Path to logfile to save values and/or read previously calculated values: ")
+    log_path = raw_input("Path to timeseries store to save values and/or read previously calculated values: ")
     timeseries_3D(grid_path, file_path, log_path)
 
     
@@ -0,0 +1,272 @@
+from netCDF4 import Dataset
+from numpy import *
+from os.path import abspath
+from zlib import crc32
+from grid_cache import *
+from cartesian_grid_2d import *
+from history_scanner import *
+from timeseries_massloss import calc_grid
+from ice_shelf_regions import *
+from timeseries_store import *
+
+# Incrementally update timeseries of several diagnostics (ice shelf mass loss,
+# Drake Passage transport, average salinity, sea surface salinity and salt
+# fluxes, sea ice area and volume) from a
+# list of output files, e.g. after each segment of a long spinup. Each record
+# in the timeseries store remembers which file and record it was calculated
+# from, and a checksum of that record. Each diagnostic is only calculated at
+# the records which need it: records which aren't in the store yet, records
+# which are but where the diagnostic is missing (e.g. it was added to the
+# list after the store was started), and records whose source has changed
+# since (e.g. the segment was rerun), which are recalculated. Records in the
+# store which have no provenance are left alone. All the diagnostics needed
+# for a block of records are calculated in the same pass, reading each
+# variable only once (see history_scanner.py). The values are the same as
+# from timeseries_massloss.py, timeseries_dpt.py, timeseries_3D.py,
+# timeseries_sss.py, and timeseries_seaice.py.
+# Input:
+# grid_path = path to ROMS grid file
+# file_paths = list of paths to ROMS history/averages files (or CICE history
+#              files, for the sea ice diagnostics) in chronological order
+# store_path = path to timeseries store (see timeseries_store.py), created if
+#              it doesn't exist
+# diag_names = optional list of diagnostics to calculate (see
+#              incremental_diagnostics below); they must all use the same type
+#              of file. Default all the ROMS diagnostics.
+# add_years = optional number of years to add to time array (multiple of 14
+#             for repeating 1992-2005 spinup)
+# block_size = optional number of records to process at once (default 10)
+def timeseries_incremental (grid_path, file_paths, store_path, diag_names=None, add_years=0, block_size=10):
+
+    diagnostics = incremental_diagnostics()
+    if diag_names is None:
+        diag_names = [name for name in sorted(diagnostics.keys()) if diagnostics[name]['file_type'] == 'roms']
+    file_type = diagnostics[diag_names[0]]['file_type']
+    for name in diag_names:
+        if diagnostics[name]['file_type'] != file_type:
+            print 'Error: diagnostics from ROMS and CICE files must be saved in separate stores'
+            return
+    time_var, time_factor, check_var = file_types()[file_type]
+
+    # Reducers for each diagnostic, set up from the first file
+    reducers = None
+    for file_path in file_paths:
+        file_path = abspath(file_path)
+        id = Dataset(file_path, 'r')
+        file_time = id.variables[time_var][:]/time_factor + add_years
+        num_time = size(file_time)
+
+        if reducers is None:
+            print 'Setting up diagnostics'
+            reducers = {}
+            for name in diag_names:
+                reducers[name] = diagnostics[name]['setup'](grid_path, file_path)
+
+        # Find out what's already in the store (including anything from the
+        # previous files)
+        provenance = read_provenance(store_path)
+        store_time, data = read_timeseries(store_path)
+        stored = dict(data)
+        if size(store_time) > 0:
+            last_time = store_time[-1]
+        else:
+            last_time = -inf
+        # Which diagnostics are missing at each record of the store
+        missing = {}
+        for name in diag_names:
+            missing[name] = zeros(size(store_time), dtype=bool)
+            for reducer in reducers[name]:
+                for series in reducer['names']:
+                    if series in stored:
+                        missing[name] = missing[name] | isnan(stored[series])
+                    else:
+                        missing[name][:] = True
+
+        num_new = 0
+        num_filled = 0
+        num_changed = 0
+        for start_t in range(0, num_time, block_size):
+            end_t = minimum(start_t+block_size, num_time)
+            done = [t for t in range(start_t, end_t) if (file_path, t) in provenance]
+            if len(done) > 0:
+                # Check the records already processed haven't changed
+                check = read_field(id, check_var, start_t, end_t)
+            # Work out which diagnostics each record needs: (record, index in
+            # store, diagnostics) for records already in the store, and
+            # records which are new
+            update = []
+            new = []
+            for t in range(start_t, end_t):
+                if (file_path, t) in provenance:
+                    s = searchsorted(store_time, provenance[(file_path, t)][0])
+                    if record_checksum(file_time[t], check[t-start_t,:,:]) != provenance[(file_path, t)][1]:
+                        update.append((t, s, diag_names))
+                        num_changed += 1
+                    else:
+                        needed = [name for name in diag_names if missing[name][s]]
+                        if len(needed) > 0:
+                            update.append((t, s, needed))
+                            num_filled += 1
+                elif file_time[t] > last_time:
+                    new.append(t)
+                    num_new += 1
+            if len(update) == 0 and len(new) == 0:
+                continue
+
+            needed = [name for name in diag_names if len(new) > 0 or any([name in u[2] for u in update])]
+            block_reducers = []
+            for name in needed:
+                block_reducers += reducers[name]
+            # Also read the field we checksum, in the same pass
+            fields = slab_fields(block_reducers)
+            if (check_var, None) not in fields:
+                fields.append((check_var, None))
+            t0 = min([u[0] for u in update] + new)
+            t1 = max([u[0] for u in update] + new) + 1
+            print 'Processing records ' + str(t0+1) + ' to ' + str(t1) + ' of ' + file_path
+            slab = read_slab(id, fields, t0, t1, slab_geometry(block_reducers))
+            new_data = reduce_slab(slab, block_reducers)
+            check = slab[(check_var, None)]
+            # Save each block as we go, so an interrupted run can carry on
+            # from where it left off
+            if len(update) > 0:
+                index = array([u[0] for u in update]) - t0
+                sources = [(file_path, u[0], record_checksum(file_time[u[0]], check[u[0]-t0,:,:])) for u in update]
+                update_timeseries(store_path, [u[1] for u in update], [(series, values[index]) for series, values in new_data], sources)
+            if len(new) > 0:
+                index = array(new) - t0
+                sources = [(file_path, t, record_checksum(file_time[t], check[t-t0,:,:])) for t in new]
+                append_timeseries(store_path, file_time[new], [(series, values[index]) for series, values in new_data], sources)
+                last_time = file_time[new[-1]]
+        id.close()
+        if num_new + num_filled + num_changed == 0:
+            print 'Nothing to do for ' + file_path
+        else:
+            print file_path + ': ' + str(num_new) + ' new records, ' + str(num_filled) + ' records with diagnostics filled in, ' + str(num_changed) + ' changed records recalculated'
+
+
+# Describe the types of output file the diagnostics use.
+# Output: dictionary mapping file type to [name of time variable, factor to
+#         divide it by to convert to years, name of 2D variable to checksum]
+def file_types ():
+
+    return {'roms':['ocean_time', 365.25*24*60*60, 'zeta'], 'cice':['time', 365.25, 'aice']}
+
+
+# Checksum a single record of an output file.
+# Input:
+# time = time value of the record
+# field = 2D field at that record
+# Output: CRC-32 checksum of the time value and the field, as a non-negative
+#         integer
+def record_checksum (time, field):
+
+    checksum = crc32(array(time, dtype=float64).tobytes())
+    checksum = crc32(ascontiguousarray(ma.getdata(field)).tobytes(), checksum)
+    return checksum & 0xffffffff
+
+
+# Describe each diagnostic this script can calculate.
+# Output: dictionary of diagnostics, each a dictionary containing
+#         file_type = type of output file it's calculated from (see file_types)
+#         setup = function of (grid path, file path) giving a list of
+#                 reducers (see history_scanner.py) for the diagnostic
+def incremental_diagnostics ():
+
+    return {'massloss':{'file_type':'roms', 'setup':setup_massloss}, 'dpt':{'file_type':'roms', 'setup':setup_dpt}, 'avgsalt':{'file_type':'roms', 'setup':setup_avgsalt}, 'sss':{'file_type':'roms', 'setup':setup_sss}, 'seaice':{'file_type':'cice', 'setup':setup_seaice}}
+
+
+# Ice shelf basal mass loss, as in timeseries_massloss.py
+def setup_massloss (grid_path, file_path):
+
+    # Density of ice in kg/m^3
+    rho_ice = 916
+    names = ice_shelf_boxes()[0]
+    dA, lon, lat = calc_grid(file_path)
+    R = region_matrix(ice_shelf_members(file_path)[:,:-15,1:-1], dA)
+    # Integrate melt rate (converted from m/s to m/y) over each ice shelf,
+    # and convert to mass loss in Gt/y
+    return [area_integral_reducer([name + ' Basal Mass Loss' for name in names], [('m', None)], R, factor=1e-12*rho_ice*365.25*24*60*60)]
+
+
+# Drake Passage transport, as in timeseries_dpt.py
+def setup_dpt (grid_path, file_path):
+
+    # Longitude of Drake Passage zonal slice (convert to ROMS bounds 0-360)
+    lon0 = -67 + 360
+    # Latitude bounds on Drake Passage zonal slice
+    lat_min = -68
+    lat_max = -54.5
+    return [section_transport_reducer('Drake Passage Transport (Sv)', zonal_section(grid_path, lon0, lat_min, lat_max))]
+
+
+# Southern Ocean average salinity, as in timeseries_3D.py
+def setup_avgsalt (grid_path, file_path):
+
+    # Grid parameters
+    theta_s = 7.0
+    theta_b = 2.0
+    hc = 250
+    N = 31
+    # Reference density (kg/m^3)
+    rho0 = 1000.0
+
+    geom = {}
+    full_geom = grid_geometry(grid_path, theta_s, theta_b, hc, N)
+    for var in ['h', 'wct', 'dA', 'z_rho', 'z_w', 'dz']:
+        geom[var] = full_geom[var][...,:-15,1:-1]
+    geom['mask'] = full_geom['mask'][:-15,1:-1]
+    # Average salinity, weighted with rho*dV
+    return [volume_mean_reducer('Southern Ocean Average Salinity (psu)', 'salt', geom, weight_var='rho', weight_offset=rho0)]
+
+
+# Area-averaged sea surface salinity and salt fluxes, as in timeseries_sss.py
+def setup_sss (grid_path, file_path):
+
+    id = Dataset(file_path, 'r')
+    lon = id.variables['lon_rho'][:-15,1:-1]
+    lat = id.variables['lat_rho'][:-15,1:-1]
+    zice = id.variables['zice'][:-15,1:-1]
+    id.close()
+    # Calculate area on the tracer grid and mask ice shelves
+    dx, dy = cartesian_grid_2d(lon, lat)
+    dA = ma.masked_where(zice!=0, dx*dy)
+    reducers = []
+    for name, field in [('Average sea surface salinity (psu)', ('salt', -1)), ('Average surface salt flux (kg/m^2/s)', ('ssflux', None)), ('Average surface salt flux from salinity restoring (kg/m^2/s)', ('ssflux_restoring', None))]:
+        reducers.append(area_integral_reducer([name], [field], dA[None,:,:], average=True))
+    return reducers
+
+
+# Total sea ice area and volume, as in timeseries_seaice.py; grid comes from
+# the CICE file
+def setup_seaice (grid_path, file_path):
+
+    id = Dataset(file_path, 'r')
+    lon = id.variables['TLON'][:-15,:]
+    lat = id.variables['TLAT'][:-15,:]
+    id.close()
+    dx, dy = cartesian_grid_2d(lon, lat)
+    dA = (dx*dy)[None,:,:]
+    # Integrate area and convert to million km^2; integrate volume and
+    # convert to thousand km^3
+    return [area_integral_reducer(['Total Sea Ice Area (million km^2)'], [('aice', None)], dA, factor=1e-12), area_integral_reducer(['Total Sea Ice Volume (thousand km^3)'], [('aice', None), ('hi', None)], dA, factor=1e-12)]
+
+
+# Command-line interface
+if __name__ == "__main__":
+
+    grid_path = raw_input("Path to ROMS grid file: ")
+    store_path = raw_input("Path to timeseries store: ")
+    action = raw_input("Ocean diagnostics from ROMS files (o) or sea ice diagnostics from CICE files (i)? ")
+    if action == 'o':
+        diag_names = ['massloss', 'dpt', 'avgsalt', 'sss']
+    elif action == 'i':
+        diag_names = ['seaice']
+    file_paths = []
+    file_paths.append(raw_input("Path to first output file: "))
+    while True:
+        file_path = raw_input("Path to next output file, or enter if finished: ")
+        if len(file_path) == 0:
+            break
+        file_paths.append(file_path)
+    timeseries_incremental(grid_path, file_paths, store_path, diag_names)
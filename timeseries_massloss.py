@@ -3,30 +3,25 @@ from numpy import *
 from matplotlib.pyplot import *
 from os.path import *
 from cartesian_grid_2d import *
+from timeseries_store import *
+from ice_shelf_regions import *
 
 # Calculate and plot timeseries of basal mass loss and area-averaged ice shelf
 # melt rates from major ice shelves and from the entire continent during a 
 # ROMS simulation.
 # Input:
 # file_path = path to ocean history/averages file
-# log_path = path to log file (if it exists, previously calculated values will
-#            be read from it; regardless, it will be overwritten with all
-#            calculated values following computation)
+# log_path = path to timeseries store (see timeseries_store.py; if it exists,
+#            previously calculated values will be read from it, and new
+#            values will be appended to it)
 # add_years = optional number of years to add to time array (multiple of 14
 #             for repeating 1992-2005 spinup)
 def timeseries_massloss (file_path, log_path, add_years=0):
 
-    # Titles and figure names for each ice shelf
-    names = ['All Ice Shelves', 'Larsen D Ice Shelf', 'Larsen C Ice Shelf', 'Wilkins & George VI & Stange Ice Shelves', 'Ronne-Filchner Ice Shelf', 'Abbot Ice Shelf', 'Pine Island Glacier Ice Shelf', 'Thwaites Ice Shelf', 'Dotson Ice Shelf', 'Getz Ice Shelf', 'Nickerson Ice Shelf', 'Sulzberger Ice Shelf', 'Mertz Ice Shelf', 'Totten & Moscow University Ice Shelves', 'Shackleton Ice Shelf', 'West Ice Shelf', 'Amery Ice Shelf', 'Prince Harald Ice Shelf', 'Baudouin & Borchgrevink Ice Shelves', 'Lazarev Ice Shelf', 'Nivl Ice Shelf', 'Fimbul & Jelbart & Ekstrom Ice Shelves', 'Brunt & Riiser-Larsen Ice Shelves', 'Ross Ice Shelf']
+    # Titles for each ice shelf
+    names = ice_shelf_boxes()[0]
+    # Figure names for each ice shelf
     fig_names = ['total_massloss.png', 'larsen_d.png', 'larsen_c.png', 'wilkins_georgevi_stange.png', 'ronne_filchner.png', 'abbot.png', 'pig.png', 'thwaites.png', 'dotson.png', 'getz.png', 'nickerson.png', 'sulzberger.png', 'mertz.png', 'totten_moscowuni.png', 'shackleton.png', 'west.png', 'amery.png', 'princeharald.png', 'baudouin_borchgrevink.png', 'lazarev.png', 'nivl.png', 'fimbul_jelbart_ekstrom.png', 'brunt_riiserlarsen.png', 'ross.png']
-    # Limits on longitude and latitude for each ice shelf
-    # These depend on the source geometry, in this case RTopo 1.05
-    # Note there is one extra index at the end of each array; this is because
-    # the Ross region crosses the line 180W and therefore is split into two
-    lon_min = [-180, -62.67, -65.5, -79.17, -85, -104.17, -102.5, -108.33, -114.5, -135.67, -149.17, -155, 144, 115, 94.17, 80.83, 65, 33.83, 19, 12.9, 9.33, -10.05, -28.33, -180, 158.33]
-    lon_max = [180, -59.33, -60, -66.67, -28.33, -88.83, -99.17, -103.33, -111.5, -114.33, -140, -145, 146.62, 123.33, 102.5, 89.17, 75, 37.67, 33.33, 16.17, 12.88, 7.6, -10.33, -146.67, 180]
-    lat_min = [-90, -73.03, -69.35, -74.17, -83.5, -73.28, -75.5, -75.5, -75.33, -74.9, -76.42, -78, -67.83, -67.17, -66.67, -67.83, -73.67, -69.83, -71.67, -70.5, -70.75, -71.83, -76.33, -85, -84.5]
-    lat_max = [-30, -69.37, -66.13, -69.5, -74.67, -71.67, -74.17, -74.67, -73.67, -73, -75.17, -76.41, -66.67, -66.5, -64.83, -66.17, -68.33, -68.67, -68.33, -69.33, -69.83, -69.33, -71.5, -77.77, -77]
     # Observed mass loss (Rignot 2013) and uncertainty for each ice shelf, in Gt/y
     obs_massloss = [1325, 1.4, 20.7, 135.4, 155.4, 51.8, 101.2, 97.5, 45.2, 144.9, 4.2, 18.2, 7.9, 90.6, 72.6, 27.2, 35.5, -2, 21.6, 6.3, 3.9, 26.8, 9.7, 47.7]
     obs_massloss_error = [235, 14, 67, 40, 45, 19, 8, 7, 4, 14, 2, 3, 3, 8, 15, 10, 23, 3, 18, 2, 2, 14, 16, 34]
@@ -36,35 +31,6 @@ def timeseries_massloss (file_path, log_path, add_years=0):
     # Density of ice in kg/m^3
     rho_ice = 916
 
-    old_time = []
-    # Check if the log file exists
-    if exists(log_path):
-        print 'Reading previously calculated values'
-        f = open(log_path, 'r')
-        # Skip the first line (header for time array)
-        f.readline()
-        for line in f:
-            try:
-                old_time.append(float(line))
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-        # Set up array for mass loss values at each ice shelf
-        old_massloss = empty([len(names), len(old_time)])
-        index = 0
-        # Loop over ice shelves
-        while index < len(names):
-            t = 0
-            for line in f:
-                try:
-                    old_massloss[index, t] = float(line)
-                    t += 1
-                except(ValueError):
-                    # Reached the header for the next ice shelf
-                    break
-            index += 1
-        f.close()
-
     # Calculate dA (masked with ice shelf mask) and lon and lat coordinates
     print 'Analysing grid'
     dA, lon, lat = calc_grid(file_path)
@@ -72,21 +38,6 @@ def timeseries_massloss (file_path, log_path, add_years=0):
     # Read time data and convert from seconds to years
     id = Dataset(file_path, 'r')
     new_time = id.variables['ocean_time'][:]/(365.25*24*60*60) + add_years
-    if exists(log_path):
-        # Concatenate with time values from log file
-        start_t = len(old_time)
-        time = old_time
-        for t in range(size(new_time)):
-            time.append(new_time[t])
-        time = array(time)
-    else:
-        start_t = 0
-        time = new_time
-    # Set up array of mass loss values
-    massloss = empty([len(names), size(time)])
-    if exists(log_path):
-        # Fill first start_t timesteps with existing values
-        massloss[:,0:start_t] = old_massloss[:,:]
 
     print 'Reading data'
     # Read melt rate and convert from m/s to m/y
@@ -94,36 +45,28 @@ def timeseries_massloss (file_path, log_path, add_years=0):
     id.close()
 
     print 'Setting up arrays'
-    # Set up array of masked area values for each ice shelf
-    dA_masked = ma.empty([len(names), size(dA,0), size(dA,1)])
+    # Sparse matrix which integrates over every ice shelf at once
+    R = region_matrix(ice_shelf_members(file_path)[:,:-15,1:-1], dA)
+    # Calculate area of each ice shelf
+    areas = R.dot(ones(R.shape[1]))
     # Set up array of conversion factors from mass loss to area-averaged melt
     # rate for each ice shelf
-    factors = empty(len(names))
+    factors = 1e12/(rho_ice*areas)
     for index in range(len(names)):
-        # Mask dA for the current ice shelf (note dA is already masked
-        # with the global ice shelf mask, so just restrict the indices
-        # to isolate the given ice shelf)
-        if index == len(names)-1:
-            # Ross region is split into two
-            dA_tmp = ma.masked_where(((lon < lon_min[index]) + (lon > lon_max[index]) + (lat < lat_min[index]) + (lat > lat_max[index]))*((lon < lon_min[index+1]) + (lon > lon_max[index+1]) + (lat < lat_min[index+1]) + (lat > lat_max[index+1])), dA)
-        else:
-            dA_tmp = ma.masked_where((lon < lon_min[index]) + (lon > lon_max[index]) + (lat < lat_min[index]) + (lat > lat_max[index]), dA)
-        dA_masked[index,:,:] = dA_tmp[:,:]
-        # Calculate area of this ice shelf
-        area_tmp = sum(dA_masked[index,:,:])
-        # Calculate conversion factor
-        factors[index] = 1e12/(rho_ice*area_tmp)
-        print 'Area of ' + names[index] + ': ' + str(area_tmp) + ' m^2'
+        print 'Area of ' + names[index] + ': ' + str(areas[index]) + ' m^2'
 
     # Build timeseries
     print 'Calculating variables'
-    for t in range(start_t, size(time)):
-        # Loop over ice shelves
-        for index in range(len(names)):
-            # Integrate ice shelf melt rate over area to get volume loss
-            volumeloss = sum(ismr[t-start_t,:,:]*dA_masked[index,:,:])
-            # Convert to mass loss in Gt/y
-            massloss[index, t] = 1e-12*rho_ice*volumeloss
+    # Integrate ice shelf melt rate over area to get volume loss, for every
+    # ice shelf and time index at once, and convert to mass loss in Gt/y
+    new_massloss = 1e-12*rho_ice*region_integrals(R, ismr)
+
+    print 'Saving results to timeseries store'
+    append_timeseries(log_path, new_time, [(names[index] + ' Basal Mass Loss', new_massloss[index,:]) for index in range(len(names))])
+    # Read back the whole timeseries, including previously calculated values
+    time, data = read_timeseries(log_path)
+    data = dict(data)
+    massloss = array([data[names[index] + ' Basal Mass Loss'] for index in range(len(names))])
 
     # Plot each timeseries
     print 'Plotting'
@@ -178,17 +121,6 @@ def timeseries_massloss (file_path, log_path, add_years=0):
         # Name of the ice shelf for the main title
         title(names[index])
         fig.savefig(fig_names[index])
-        
-    print 'Saving results to log file'
-    f = open(log_path, 'w')
-    f.write('Time (years):\n')
-    for t in range(size(time)):
-        f.write(str(time[t]) + '\n')
-    for index in range(len(names)):
-        f.write(names[index] + ' Basal Mass Loss\n')
-        for t in range(size(time)):
-            f.write(str(massloss[index, t]) + '\n')
-    f.close()
 
 
 # Given the path to a ROMS grid file, calculate differential of area and
@@ -228,7 +160,7 @@ def calc_grid (file_path):
 if __name__ == "__main__":
 
     file_path = raw_input('Enter path to ocean history/averages file: ')
-    log_path = raw_input('Enter path to log file to save values and/or read previously calculated values: ')
+    log_path = raw_input('Enter path to timeseries store to save values and/or read previously calculated values: ')
 
     timeseries_massloss(file_path, log_path)
 
@@ -4,6 +4,7 @@ from matplotlib.pyplot import *
 from os.path import *
 from cartesian_grid_2d import *
 from timeseries_massloss import calc_grid
+from ice_shelf_regions import label_sums
 
 # Plot timeseries of total basal mass loss and area-averaged ice shelf melt
 # rates split up into 3 different depth classes for the ice shelf draft. 
@@ -86,30 +87,25 @@ def timeseries_massloss_depth (file_path, log_path):
     id.close()
 
     print 'Setting up arrays'
-    # Set up array of masked area values for each depth class
-    dA_masked = ma.empty([num_classes, size(dA,0), size(dA,1)])
+    # Label each ice shelf point with its depth class (from 1; 0 is outside
+    # the ice shelves or the depth classes)
+    classes = zeros([size(dA,0), size(dA,1)], dtype=int)
+    for n in range(num_classes):
+        classes[(zice > draft_min[n])*(zice <= draft_max[n])*invert(ma.getmaskarray(dA))] = n+1
+    # Calculate area of each depth class
+    areas = label_sums(classes, dA, num_classes+1)[1:]
     # Set up array of conversion factors from mass loss to area-averaged melt
     # rate for each depth class
-    factors = empty(num_classes)
+    factors = 1e12/(rho_ice*areas)
     for n in range(num_classes):
-        # Mask dA for the current depth class
-        dA_tmp = ma.masked_where((zice <= draft_min[n]) + (zice > draft_max[n]), dA)
-        dA_masked[n,:,:] = dA_tmp
-        # Calculate area of this depth class
-        area_tmp = sum(dA_masked[n,:,:])
-        print 'Area of ice shelf draft between '+str(draft_min[n])+' and '+str(draft_max[n])+'m: '+str(area_tmp)+' m^2'
-        # Calculate conversion factor
-        factors[n] = 1e12/(rho_ice*area_tmp)
+        print 'Area of ice shelf draft between '+str(draft_min[n])+' and '+str(draft_max[n])+'m: '+str(areas[n])+' m^2'
 
     # Build timeseries
     print 'Calculating timeseries'
-    for t in range(start_t, size(time)):
-        # Loop over depth classes
-        for n in range(num_classes):
-            # Integrate ice shelf melt rate over area to get volume loss
-            volumeloss = sum(ismr[t-start_t,:,:]*dA_masked[n,:,:])
-            # Convert to mass loss in Gt/y
-            massloss[n,t] = 1e-12*rho_ice*volumeloss
+    # Integrate ice shelf melt rate over area to get volume loss, for every
+    # depth class and time index at once, and convert to mass loss in Gt/y
+    volumeloss = label_sums(classes, ismr, num_classes+1, weights=dA)
+    massloss[:,start_t:] = 1e-12*rho_ice*transpose(volumeloss[:,1:])
 
     print 'Plotting'
 
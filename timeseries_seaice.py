@@ -3,6 +3,7 @@ from numpy import *
 from matplotlib.pyplot import *
 from os.path import *
 from cartesian_grid_2d import *
+from timeseries_store import *
 
 # WARNING: An earlier version of the script said the output sea ice volume
 # was in million km^3. This is not true, it's thousand km^3!
@@ -11,36 +12,15 @@ from cartesian_grid_2d import *
 # ROMS-CICE simulation.
 # Input:
 # file_path = path to CICE history file
-# log_path = path to log file (if it exists, previously calculated values will
-#            be read from it; regardless, it will be overwritten with all
-#            calculated values following computation)
+# log_path = path to timeseries store (see timeseries_store.py; if it exists,
+#            previously calculated values will be read from it, and new
+#            values will be appended to it)
 # add_years = optional number of years to add to time array (multiple of 14
 #             for repeating 1992-2005 spinup)
 def timeseries_seaice (file_path, log_path, add_years=0):
 
-    time = []
     total_area = []
     total_volume = []
-    # Check if the log file exists
-    if exists(log_path):
-        print 'Reading previously calculated values'
-        f = open(log_path, 'r')
-        # Skip first line (header for time array)
-        f.readline()
-        for line in f:
-            try:
-                time.append(float(line))
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-        for line in f:
-            try:
-                total_area.append(float(line))
-            except(ValueError):
-                break
-        for line in f:
-            total_volume.append(float(line))
-        f.close()
 
     print 'Analysing grid'
     id = Dataset(file_path, 'r')
@@ -51,9 +31,6 @@ def timeseries_seaice (file_path, log_path, add_years=0):
     dA = dx*dy
     # Read time values and convert from days to years
     new_time = id.variables['time'][:]/365.25 + add_years
-    # Concatenate with time values from log file
-    for t in range(size(new_time)):
-        time.append(new_time[t])
 
     print 'Reading data'
     # Read sea ice concentration and height
@@ -76,6 +53,14 @@ def timeseries_seaice (file_path, log_path, add_years=0):
         # Integrate volume and convert to thousand km^3
         total_volume.append(sum(aice_nomask[t,:,:]*hi_nomask[t,:,:]*dA)*1e-12)
 
+    print 'Saving results to timeseries store'
+    append_timeseries(log_path, new_time, [('Total Sea Ice Area (million km^2)', total_area), ('Total Sea Ice Volume (thousand km^3)', total_volume)])
+    # Read back the whole timeseries, including previously calculated values
+    time, data = read_timeseries(log_path)
+    data = dict(data)
+    total_area = data['Total Sea Ice Area (million km^2)']
+    total_volume = data['Total Sea Ice Volume (thousand km^3)']
+
     print 'Plotting total sea ice area'
     clf()
     plot(time, total_area)
@@ -92,25 +77,12 @@ def timeseries_seaice (file_path, log_path, add_years=0):
     grid(True)
     savefig('seaice_volume.png')
 
-    print 'Saving results to log file'
-    f = open(log_path, 'w')
-    f.write('Time (years):\n')
-    for elm in time:
-        f.write(str(elm) + '\n')
-    f.write('Total Sea Ice Area (million km^2):\n')
-    for elm in total_area:
-        f.write(str(elm) + '\n')
-    f.write('Total Sea Ice Volume (thousand km^3):\n')
-    for elm in total_volume:
-        f.write(str(elm) + '\n')
-    f.close()
-
 
 # Command-line interface
 if __name__ == "__main__":
 
     file_path = raw_input("Path to CICE history file: ")
-    log_path = raw_input("Path to logfile to save values and/or read previously calculated values: ")
+    log_path = raw_input("Path to timeseries store to save values and/or read previously calculated values: ")
     timeseries_seaice(file_path, log_path)
 
     
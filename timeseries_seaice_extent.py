@@ -3,33 +3,18 @@ from numpy import *
 from matplotlib.pyplot import *
 from os.path import *
 from cartesian_grid_2d import *
+from timeseries_store import *
 
 # Calculate and plot timeseries of sea ice extent (area of ice with
 # concentration >= 15%) during a ROMS-CICE simulation.
 # Input:
 # file_path = path to CICE history file
-# log_path = path to log file (if it exists, previously calculated values will
-#            be read from it; regardless, it will be overwritten with all
-#            calculated values following computation)
+# log_path = path to timeseries store (see timeseries_store.py; if it exists,
+#            previously calculated values will be read from it, and new
+#            values will be appended to it)
 def timeseries_seaice_extent (file_path, log_path):
 
-    time = []
     extent = []
-    # Check if the log file exists
-    if exists(log_path):
-        print 'Reading previously calculated values'
-        f = open(log_path, 'r')
-        # Skip first line (header for time array)
-        f.readline()
-        for line in f:
-            try:
-                time.append(float(line))
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-        for line in f:
-            extent.append(float(line))
-        f.close()
 
     print 'Analysing grid'
     id = Dataset(file_path, 'r')
@@ -40,9 +25,6 @@ def timeseries_seaice_extent (file_path, log_path):
     dA = dx*dy
     # Read time values and convert from days to years
     new_time = id.variables['time'][:]/365.25
-    # Concatenate with time values from log file
-    for t in range(size(new_time)):
-        time.append(new_time[t])
 
     print 'Reading data'
     # Read sea ice concentration
@@ -57,6 +39,13 @@ def timeseries_seaice_extent (file_path, log_path):
         # Integrate extent and convert to million km^2
         extent.append(sum(flag[t,:,:]*dA)*1e-12)
 
+    print 'Saving results to timeseries store'
+    append_timeseries(log_path, new_time, [('Sea Ice Extent (million km^2)', extent)])
+    # Read back the whole timeseries, including previously calculated values
+    time, data = read_timeseries(log_path)
+    data = dict(data)
+    extent = data['Sea Ice Extent (million km^2)']
+
     print 'Plotting'
     clf()
     plot(time, extent)
@@ -65,22 +54,12 @@ def timeseries_seaice_extent (file_path, log_path):
     grid(True)
     savefig('seaice_extent.png')
 
-    print 'Saving results to log file'
-    f = open(log_path, 'w')
-    f.write('Time (years):\n')
-    for elm in time:
-        f.write(str(elm) + '\n')
-    f.write('Sea Ice Extent (million km^2):\n')
-    for elm in extent:
-        f.write(str(elm) + '\n')
-    f.close()
-
 
 # Command-line interface
 if __name__ == "__main__":
 
     file_path = raw_input("Path to CICE history file: ")
-    log_path = raw_input("Path to logfile to save values and/or read previously calculated values: ")
+    log_path = raw_input("Path to timeseries store to save values and/or read previously calculated values: ")
     timeseries_seaice_extent(file_path, log_path)
 
     
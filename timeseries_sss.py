@@ -3,46 +3,21 @@ from numpy import *
 from matplotlib.pyplot import *
 from os.path import *
 from cartesian_grid_2d import *
+from timeseries_store import *
 
 # Calculate and plot timeseries of area-averaged sea surface salinity, surface
 # salt flux, and surface salt flux due to salinity restoring during a ROMS
 # simulation.
 # Input:
 # file_path = path to ROMS averages file
-# log_path = path to log file (if it exists, previously calculated values will
-#            be read from it; regardless, it will be overwritten with all
-#            calculated values following computation)
+# log_path = path to timeseries store (see timeseries_store.py; if it exists,
+#            previously calculated values will be read from it, and new
+#            values will be appended to it)
 def timeseries_sss (file_path, log_path):
 
-    time = []
     avg_sss = []
     avg_ssflux = []
     avg_restore = []
-    # Check if the log file exists
-    if exists(log_path):
-        print 'Reading previously calculated values'
-        f = open(log_path, 'r')
-        # Skip first line (header for time array)
-        f.readline()
-        for line in f:
-            try:
-                time.append(float(line))
-            except(ValueError):
-                # Reached the header for the next variable
-                break
-        for line in f:
-            try:
-                avg_sss.append(float(line))
-            except(ValueError):
-                break
-        for line in f:
-            try:
-                avg_ssflux.append(float(line))
-            except(ValueError):
-                break
-        for line in f:
-            avg_restore.append(float(line))
-        f.close()
 
     print 'Analysing grid'
     id = Dataset(file_path, 'r')
@@ -54,9 +29,6 @@ def timeseries_sss (file_path, log_path):
     dA = ma.masked_where(zice!=0, dx*dy)
     # Read time values and convert from seconds to years
     new_time = id.variables['ocean_time'][:]/(365.25*24*60*60)
-    # Concatenate with time values from log file
-    for t in range(size(new_time)):
-        time.append(new_time[t])
 
     print 'Reading data'
     # Read surface salinity, salt flux, and restoring flux
@@ -72,6 +44,15 @@ def timeseries_sss (file_path, log_path):
         avg_ssflux.append(sum(ssflux[t,:,:]*dA)/sum(dA))
         avg_restore.append(sum(ssflux_restoring[t,:,:]*dA)/sum(dA))
 
+    print 'Saving results to timeseries store'
+    append_timeseries(log_path, new_time, [('Average sea surface salinity (psu)', avg_sss), ('Average surface salt flux (kg/m^2/s)', avg_ssflux), ('Average surface salt flux from salinity restoring (kg/m^2/s)', avg_restore)])
+    # Read back the whole timeseries, including previously calculated values
+    time, data = read_timeseries(log_path)
+    data = dict(data)
+    avg_sss = data['Average sea surface salinity (psu)']
+    avg_ssflux = data['Average surface salt flux (kg/m^2/s)']
+    avg_restore = data['Average surface salt flux from salinity restoring (kg/m^2/s)']
+
     print 'Plotting'
     clf()
     plot(time, avg_sss)
@@ -94,28 +75,12 @@ def timeseries_sss (file_path, log_path):
     grid(True)
     savefig('avg_restore.png')
 
-    print 'Saving results to log file'
-    f = open(log_path, 'w')
-    f.write('Time (years):\n')
-    for elm in time:
-        f.write(str(elm) + '\n')
-    f.write('Average sea surface salinity (psu):\n')
-    for elm in avg_sss:
-        f.write(str(elm) + '\n')
-    f.write('Average surface salt flux (kg/m^2/s):\n')
-    for elm in avg_ssflux:
-        f.write(str(elm) + '\n')
-    f.write('Average surface salt flux from salinity restoring (kg/m^2/s):\n')
-    for elm in avg_restore:
-        f.write(str(elm) + '\n')
-    f.close()
-
 
 # Command-line interface
 if __name__ == "__main__":
 
     file_path = raw_input("Path to ocean history/averages file: ")
-    log_path = raw_input("Path to logfile to save values and/or read previously calculated values: ")
+    log_path = raw_input("Path to timeseries store to save values and/or read previously calculated values: ")
     timeseries_sss(file_path, log_path)
     
 
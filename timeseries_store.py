@@ -0,0 +1,321 @@
+from netCDF4 import Dataset
+from numpy import *
+from os import remove, rename
+from os.path import exists, getsize
+from netCDF4 import chartostring
+from output_schema import num_records_written
+
+# Append-only store for timeseries calculated by the timeseries_*.py scripts,
+# replacing their plain-text logfiles. Each store is a NetCDF file with an
+# unlimited time axis and one variable per timeseries, so new records are
+# appended without rewriting the whole history, any time range can be read
+# without parsing everything before it, and the file can be read by other
+# scripts (eg mip_timeseries.py) while a timeseries script is appending to it.
+# The long_name of each variable is the header it had in the old logfiles.
+# Stores can also record where each record came from (see read_provenance),
+# and existing records can be overwritten (see update_timeseries). A record
+# only counts as stored once its time value has been written, so records left
+# partly written by an interrupted append are ignored by readers and
+# overwritten by the next append.
+
+# Variables holding the source file, record number, and checksum of each
+# record; these aren't timeseries so read_timeseries skips them
+provenance_vars = ['source_file', 'source_record', 'source_checksum']
+# Maximum length of source file paths
+max_path_len = 512
+
+
+# Read timeseries from a store. Also reads old plain-text logfiles (a header
+# line for each variable, followed by one value per line), so scripts which
+# use this function work with either.
+# Input:
+# store_path = path to store (or old logfile)
+# names = optional list of timeseries names (headers) to read; default all
+# time_range = optional [start, end] list; only read records with time values
+#              in this range (inclusive)
+# Output:
+# time = 1D array of time values (empty if the store doesn't exist)
+# data = list of (name, 1D array) pairs in the order they were stored
+def read_timeseries (store_path, names=None, time_range=None):
+
+    if not exists(store_path):
+        return array([]), []
+    if not is_store(store_path):
+        time, data = read_text_log(store_path)
+        if names is not None:
+            data = [pair for pair in data if pair[0] in names]
+        if time_range is not None:
+            index = (time >= time_range[0])*(time <= time_range[1])
+            time = time[index]
+            data = [(name, values[index]) for name, values in data]
+        return time, data
+
+    id = Dataset(store_path, 'r')
+    # Skip any partly written records at the end
+    time = id.variables['time'][:num_records_written(id)]
+    t_start = 0
+    t_end = size(time)
+    if time_range is not None:
+        # Time values are always increasing, so search for the bounds
+        t_start = searchsorted(time, time_range[0], side='left')
+        t_end = searchsorted(time, time_range[1], side='right')
+    time = array(time[t_start:t_end])
+    data = []
+    for var in id.variables:
+        if var == 'time' or var in provenance_vars:
+            continue
+        name = id.variables[var].long_name
+        if names is None or name in names:
+            data.append((name, array(id.variables[var][t_start:t_end])))
+    id.close()
+    return time, data
+
+
+# Append new records to a store, creating it if it doesn't exist. Records with
+# time values no later than the last stored time are skipped, so running a
+# script on the same output file twice doesn't duplicate anything. If
+# store_path is an old plain-text logfile (e.g. from before a timeseries
+# script used stores), it is converted to a store first.
+# Input:
+# store_path = path to store
+# time = 1D array of new time values (increasing)
+# data = list of (name, 1D array) pairs, one for each timeseries, each the
+#        same length as time
+# sources = optional list of (file path, record number, checksum) tuples, one
+#           for each time value, saying where each record was calculated from
+# Output: number of records appended
+def append_timeseries (store_path, time, data, sources=None):
+
+    time = array(time, dtype=float)
+    if exists(store_path) and getsize(store_path) > 0 and not is_store(store_path):
+        # Convert the old logfile under a temporary name, so it is never lost
+        # if this is interrupted
+        print 'Converting ' + store_path + ' from a text logfile to a store'
+        if exists(store_path + '.tmp'):
+            # Left over from an interrupted conversion
+            remove(store_path + '.tmp')
+        import_text_log(store_path, store_path + '.tmp')
+        rename(store_path + '.tmp', store_path)
+    if exists(store_path) and getsize(store_path) > 0:
+        id = Dataset(store_path, 'a')
+    else:
+        id = Dataset(store_path, 'w', format='NETCDF3_64BIT_OFFSET')
+        id.createDimension('time', None)
+        id.createVariable('time', 'f8', ('time'))
+        id.variables['time'].long_name = 'Time (years)'
+
+    # Start after the last complete record, overwriting any records left
+    # partly written by an interrupted append
+    num_old = num_records_written(id)
+    if num_old > 0:
+        index = time > id.variables['time'][num_old-1]
+    else:
+        index = ones(size(time), dtype=bool)
+    num_new = count_nonzero(index)
+
+    if num_new > 0:
+        new_sources = None
+        if sources is not None:
+            new_sources = [sources[t] for t in nonzero(index)[0]]
+        write_records(id, arange(num_old, num_old+num_new), [(name, array(values, dtype=float)[index]) for name, values in data], new_sources)
+        # Write time values last. Writing the values already extends the time
+        # dimension, but until the time values are written these records
+        # have masked time, so readers (and the next append, if this is
+        # interrupted) treat them as not written yet.
+        id.variables['time'][num_old:num_old+num_new] = time[index]
+    id.close()
+    return num_new
+
+
+# Overwrite some timeseries at records which are already in a store, e.g. to
+# fill in a timeseries which was added to the store later, or to recalculate
+# records whose source has changed. Timeseries which aren't in the store yet
+# are added (with NaN at every other record); timeseries which aren't in
+# data are left as they are.
+# Input:
+# store_path = path to existing store
+# records = 1D array of record indices (from 0, increasing) to overwrite
+# data = list of (name, 1D array) pairs, each the same length as records
+# sources = optional list of (file path, record number, checksum) tuples as
+#           in append_timeseries, one for each record
+def update_timeseries (store_path, records, data, sources=None):
+
+    id = Dataset(store_path, 'a')
+    records = array(records)
+    if size(records) > 0 and records[-1] >= num_records_written(id):
+        print 'Error: record ' + str(records[-1]) + ' has not been written to ' + store_path + ' yet'
+        id.close()
+        return
+    write_records(id, records, [(name, array(values, dtype=float)) for name, values in data], sources)
+    id.close()
+
+
+# Write timeseries values and provenance at the given records of an open
+# store, adding variables for any new timeseries (and for provenance, if
+# it's the first time there is any).
+# Input:
+# id = Dataset open for appending
+# records = 1D array of record indices
+# data = list of (name, 1D array) pairs, each the same length as records
+# sources = list of (file path, record number, checksum) tuples, or None
+def write_records (id, records, data, sources):
+
+    num = size(records)
+    if all(records[1:] - records[:-1] == 1):
+        # Consecutive records (e.g. appending), which can be written as one
+        # slice even beyond the current end of the time axis
+        records = slice(records[0], records[-1]+1)
+    # Map names to variables, adding any timeseries we haven't seen yet
+    var_names = {}
+    for var in id.variables:
+        if var != 'time' and var not in provenance_vars:
+            var_names[id.variables[var].long_name] = var
+    for name, values in data:
+        if name not in var_names:
+            var = store_var_name(name, var_names.values())
+            id.createVariable(var, 'f8', ('time'), fill_value=nan)
+            id.variables[var].long_name = name
+            var_names[name] = var
+        id.variables[var_names[name]][records] = values
+    if sources is not None:
+        if 'source_file' not in id.variables:
+            id.createDimension('path_len', max_path_len)
+            id.createVariable('source_file', 'S1', ('time', 'path_len'))
+            id.variables['source_file'].long_name = 'file each record was calculated from'
+            id.createVariable('source_record', 'i4', ('time'), fill_value=-1)
+            id.variables['source_record'].long_name = 'record number (from 0) within source file'
+            id.createVariable('source_checksum', 'f8', ('time'), fill_value=-1)
+            id.variables['source_checksum'].long_name = 'CRC-32 checksum of source record'
+        # Split each path into characters
+        id.variables['source_file'][records,:] = array([s[0] for s in sources], dtype='S'+str(max_path_len)).view('S1').reshape(num, max_path_len)
+        id.variables['source_record'][records] = array([s[1] for s in sources])
+        id.variables['source_checksum'][records] = array([s[2] for s in sources], dtype=float)
+
+
+# Read the provenance of each record in a store: the file, record number, and
+# checksum it was calculated from, as saved by append_timeseries.
+# Input: store_path = path to store
+# Output: dictionary mapping (file path, record number) to (time value,
+#         checksum), for every record with saved provenance; empty if the
+#         store doesn't exist or has no provenance
+def read_provenance (store_path):
+
+    provenance = {}
+    if not exists(store_path) or not is_store(store_path):
+        return provenance
+    id = Dataset(store_path, 'r')
+    if 'source_file' in id.variables:
+        time = id.variables['time'][:num_records_written(id)]
+        files = chartostring(id.variables['source_file'][:,:])
+        records = id.variables['source_record'][:]
+        checksums = id.variables['source_checksum'][:]
+        for t in range(size(time)):
+            # Records appended without provenance have fill values
+            if ma.is_masked(records[t]) or records[t] < 0:
+                continue
+            provenance[(str(files[t]), int(records[t]))] = (float(time[t]), int(checksums[t]))
+    id.close()
+    return provenance
+
+
+# Check whether a file is a timeseries store (rather than an old logfile).
+# Input: file_path = path to file
+# Output: True or False
+def is_store (file_path):
+
+    f = open(file_path, 'rb')
+    magic = f.read(4)
+    f.close()
+    # NetCDF classic/64-bit offset files start with CDF; NetCDF4 with HDF
+    return magic[0:3] == b'CDF' or magic[1:4] == b'HDF'
+
+
+# Make a valid NetCDF variable name from a timeseries name.
+# Input:
+# name = timeseries name, eg 'Larsen D Ice Shelf Basal Mass Loss'
+# existing = names of variables already in the store
+# Output: variable name, eg 'Larsen_D_Ice_Shelf_Basal_Mass_Loss'
+def store_var_name (name, existing):
+
+    var = ''
+    for c in name:
+        if c.isalnum():
+            var += c
+        elif not var.endswith('_'):
+            var += '_'
+    var = var.strip('_')
+    if var == '' or var[0].isdigit():
+        var = 'ts_' + var
+    # Make sure it's unique
+    base = var
+    count = 2
+    while var in existing or var == 'time' or var in provenance_vars:
+        var = base + '_' + str(count)
+        count += 1
+    return var
+
+
+# Read an old plain-text logfile: a header line for the time axis and each
+# variable, followed by one value per line.
+# Input: log_path = path to logfile
+# Output: time, data as in read_timeseries
+def read_text_log (log_path):
+
+    f = open(log_path, 'r')
+    names = []
+    columns = []
+    for line in f:
+        try:
+            columns[-1].append(float(line))
+        except(ValueError, IndexError):
+            # Reached the header for the next variable
+            names.append(line.strip().rstrip(':'))
+            columns.append([])
+    f.close()
+    time = array(columns[0])
+    data = [(names[n], array(columns[n])) for n in range(1, len(names))]
+    return time, data
+
+
+# Convert an old plain-text logfile to a store, so that a timeseries script
+# can carry on from where it left off.
+# Input:
+# log_path = path to existing logfile
+# store_path = path to store to create (or append to)
+def import_text_log (log_path, store_path):
+
+    time, data = read_text_log(log_path)
+    append_timeseries(store_path, time, data)
+
+
+# Write the contents of a store to a plain-text logfile in the old format,
+# for scripts which still read logfiles directly.
+# Input:
+# store_path = path to store
+# log_path = path to logfile to create (will be overwritten)
+def export_text_log (store_path, log_path):
+
+    time, data = read_timeseries(store_path)
+    f = open(log_path, 'w')
+    f.write('Time (years):\n')
+    for elm in time:
+        f.write(str(elm) + '\n')
+    for name, values in data:
+        f.write(name + ':\n')
+        for elm in values:
+            f.write(str(elm) + '\n')
+    f.close()
+
+
+# Command-line interface
+if __name__ == "__main__":
+
+    action = raw_input("Import logfile to store (i) or export store to logfile (e)? ")
+    if action == 'i':
+        log_path = raw_input("Path to existing logfile: ")
+        store_path = raw_input("Path to store to create: ")
+        import_text_log(log_path, store_path)
+    elif action == 'e':
+        store_path = raw_input("Path to existing store: ")
+        log_path = raw_input("Path to logfile to create: ")
+        export_text_log(store_path, log_path)
@@ -2,10 +2,7 @@ from numpy import *
 from netCDF4 import Dataset
 
 from cartesian_grid_2d import *
-# Import FESOM scripts (have to modify path first)
-import sys
-sys.path.insert(0, '/short/y99/kaa561/fesomtools')
-from fesom_grid import *
+from fesom_mesh import *
 
 def total_iceshelf_area (roms_grid_file, fesom_mesh_path_lr, fesom_mesh_path_hr):
 
@@ -18,21 +15,11 @@ def total_iceshelf_area (roms_grid_file, fesom_mesh_path_lr, fesom_mesh_path_hr)
     dA = ma.masked_where(zice==0, dx*dy)
     print 'MetROMS: ' + str(sum(dA)) + ' m^2'
 
-    elements_lr = fesom_grid(fesom_mesh_path_lr, circumpolar=True, cross_180=False)
-    area_elm_lr = zeros(len(elements_lr))
-    for i in range(len(elements_lr)):
-        elm = elements_lr[i]
-        if elm.cavity:
-            area_elm_lr[i] = elm.area()
-    print 'FESOM (low-res): ' + str(sum(area_elm_lr)) + ' m^2'
-
-    elements_hr = fesom_grid(fesom_mesh_path_hr, circumpolar=True, cross_180=False)
-    area_elm_hr = zeros(len(elements_hr))
-    for i in range(len(elements_hr)):
-        elm = elements_hr[i]
-        if elm.cavity:
-            area_elm_hr[i] = elm.area()
-    print 'FESOM (high-res): ' + str(sum(area_elm_hr)) + ' m^2'
+    mesh_lr = fesom_mesh(fesom_mesh_path_lr, circumpolar=True, cross_180=False)
+    print 'FESOM (low-res): ' + str(sum(mesh_lr['area'][mesh_lr['cavity']])) + ' m^2'
+
+    mesh_hr = fesom_mesh(fesom_mesh_path_hr, circumpolar=True, cross_180=False)
+    print 'FESOM (high-res): ' + str(sum(mesh_hr['area'][mesh_hr['cavity']])) + ' m^2'
 
 
 if __name__ == "__main__":
@@ -58,15 +58,24 @@ def unesco (temp, salt, press):
     k1 = -6.12293e-6
     k2 = 5.2787e-8
 
-    rho_0 = a0 + a1*temp + a2*temp**2 + a3*temp**3 + a4*temp**4 + a5*temp**5 + \
-            (b0 + b1*temp + b2*temp**2 + b3*temp**3 + b4*temp**4)*salt + \
-            (c0 + c1*temp + c2*temp**2)*salt**1.5 + d0*salt**2
-    A = h0 + h1*temp + h2*temp**2 + h3*temp**3 + \
-        (i0 + i1*temp + i2*temp**2)*salt + j0*salt**1.5
-    B = k0 + k1*temp + k2*temp**2 + (m0 + m1*temp + m2*temp**2)*salt
-    K = e0 + e1*temp + e2*temp**2 + e3*temp**3 + e4*temp**4 + \
-        (f0 + f1*temp + f2*temp**2 + f3*temp**3)*salt + \
-        (g0 + g1*temp + g2*temp**2)*salt**1.5 + A*press + B*press**2
+    # Work in double precision (this is plenty: every polynomial below is
+    # evaluated in Horner form, so there are no high powers of temperature
+    # to lose precision in), and find the powers of salinity just once
+    temp = asanyarray(temp, dtype=float64)
+    salt = asanyarray(salt, dtype=float64)
+    press = asanyarray(press, dtype=float64)
+    salt_sqrt = sqrt(salt)
+    salt_15 = salt*salt_sqrt
+
+    rho_0 = a0 + temp*(a1 + temp*(a2 + temp*(a3 + temp*(a4 + temp*a5)))) + \
+            (b0 + temp*(b1 + temp*(b2 + temp*(b3 + temp*b4))))*salt + \
+            (c0 + temp*(c1 + temp*c2))*salt_15 + d0*salt*salt
+    A = h0 + temp*(h1 + temp*(h2 + temp*h3)) + \
+        (i0 + temp*(i1 + temp*i2))*salt + j0*salt_15
+    B = k0 + temp*(k1 + temp*k2) + (m0 + temp*(m1 + temp*m2))*salt
+    K = e0 + temp*(e1 + temp*(e2 + temp*(e3 + temp*e4))) + \
+        (f0 + temp*(f1 + temp*(f2 + temp*f3)))*salt + \
+        (g0 + temp*(g1 + temp*g2))*salt_15 + press*(A + press*B)
     rho = rho_0/(1 - press/K)
 
     return rho
@@ -205,7 +205,7 @@ def zonal_plot (file_path, var_name, tstep, lon_key, lon0, lon_bounds, depth_min
 # data_3d = array of data, dimension depth x lat x lon
 # z_3d = array of depth values (negative, in metres), dimension depth x lat x lon
 # lat_2d = array of latitude values, dimension lat x lon
-# lon_2d = array of longitude values, dimension lat x lon (between -180 and 180)
+# lon_2d = array of longitude values, dimension lat x lon
 # lon_bounds = longitudes to average between, stored as an array of size 2 with
 #              the western bound first
 # Output:
@@ -215,108 +215,12 @@ def zonal_plot (file_path, var_name, tstep, lon_key, lon0, lon_bounds, depth_min
 #       depth x lat
 def average_btw_lons (data_3d, z_3d, lat_2d, lon_2d, lon_bounds):
 
-    dlon = 0.25 # Regular lon spacing: change this for new grids
-
-    # Save horizontal dimensions
-    num_depth = size(data_3d, 0)
-    num_lat = size(data_3d, 1)
-    num_lon = size(data_3d, 2)
-    # Set up output arrays
-    data = ma.empty([num_depth, num_lat])
-    z = ma.empty([num_depth, num_lat])
-    lat = ma.empty([num_depth, num_lat])
-    # Unpack lon_bounds
-    lon0_w = lon_bounds[0]
-    lon0_e = lon_bounds[1]
-
-    # Loop over latitudes; can't find a cleaner way to do this
-    for j in range(num_lat):
-
-        # Extract the longitude values of this slice
-        lon_tmp = lon_2d[j,:]
-        # Initialise integrals for data, z, and lon
-        data_int = zeros([num_depth])
-        z_int = zeros([num_depth])
-        lat_int = 0.0
-        lon_int = 0.0
-
-        # Linearly interpolate data, z, and lat to lon0_w
-        ie, iw, coeffe, coeffw = interp_lon_helper(lon_tmp, lon0_w)
-        data_w = coeffe*data_3d[:,j,ie] + coeffw*data_3d[:,j,iw]
-        z_w = coeffe*z_3d[:,j,ie] + coeffw*z_3d[:,j,iw]
-        lat_w = coeffe*lat_2d[j,ie] + coeffw*lat_2d[j,iw]
-
-        # Integrate data, z, lat, and lon between lon0_w and the nearest point to the east
-        if all(data_3d[:,j,ie].mask):
-            # We're on a land point; skip this integration
-            pass
-        else:
-            dlon_w = lon_tmp[ie] - lon0_w
-            # Take mod 360 if needed
-            if dlon_w > 300:
-                dlon_w -= 360
-            elif dlon_w < -60:
-                dlon_w += 360
-            data_int += 0.5*(data_w + data_3d[:,j,ie])*dlon_w # Trapezoidal rule
-            z_int += 0.5*(z_w + z_3d[:,j,ie])*dlon_w
-            lat_int += 0.5*(lat_w + lat_2d[j,ie])*dlon_w
-            lon_int += dlon_w
-        # Save the index to start normal (non-interpolated) integration later
-        istart = ie
-
-        # Linearly interpolate data, z, and lat to lon0_e
-        ie, iw, coeffe, coeffw = interp_lon_helper(lon_tmp, lon0_e)
-        data_e = coeffe*data_3d[:,j,ie] + coeffw*data_3d[:,j,iw]
-        z_e = coeffe*z_3d[:,j,ie] + coeffw*z_3d[:,j,iw]
-        lat_e = coeffe*lat_2d[j,ie] + coeffw*lat_2d[j,iw]
-
-        # Integrate data, z, lat, and lon between lon0_e and the nearest point to the west (iw)
-        if all(data_3d[:,j,iw].mask):
-            # We're on a land point; skip this integration
-            pass
-        else:
-            dlon_e = lon0_e - lon_tmp[iw]
-            # Take mod 360 if needed
-            if dlon_e > 300:
-                dlon_e -= 360
-            elif dlon_e < -60:
-                dlon_e += 360
-            data_int += 0.5*(data_3d[:,j,iw] + data_e)*dlon_e # Trapezoidal rule
-            z_int += 0.5*(z_3d[:,j,iw] + z_e)*dlon_e
-            lat_int += 0.5*(lat_2d[j,iw] + lat_e)*dlon_e
-            lon_int += dlon_e
-        # Save the index which normal (non-interpolated) integration should stop before
-        iend = ie
-
-        # Normal integration between istart and iend
-        if istart <= iend:
-            # Normal case
-            i_list = range(istart, iend)
-        elif istart > iend:
-            # lon_bounds crosses the periodic boundary
-            i_list = range(istart, num_lon) + range(0, iend)
-        # Have to loop over i values because of masking checks
-        for i in i_list:
-            if all(data_3d[:,j,i].mask):
-                # We're on a land point; skip this integration
-                pass
-            else:
-                data_int += data_3d[:,j,i]*dlon
-                z_int += z_3d[:,j,i]*dlon
-                lat_int += lat_2d[j,i]*dlon
-                lon_int += dlon
-
-        if lon_int == 0:
-            # There weren't any ocean points between lon_bounds
-            data[:,j] = ma.masked
-            z[:,j] = ma.masked
-            lat[:,j] = ma.masked
-        else:
-            # Divide integrals of data, z, and lat by lon_int to get averages
-            data[:,j] = data_int/lon_int
-            z[:,j] = z_int/lon_int
-            lat[:,j] = lat_int/lon_int
-
+    band = lon_band(lon_2d, lon_bounds)
+    data = apply_lon_band(band, data_3d)
+    # Average z and latitude over the same (unmasked) points as data
+    gate_mask = ma.getmaskarray(data_3d)
+    z = apply_lon_band(band, z_3d, gate_mask)
+    lat = apply_lon_band(band, broadcast_to(lat_2d, shape(data_3d)), gate_mask)
     return data, z, lat
 
 